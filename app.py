@@ -6,11 +6,16 @@ from text2viz import Text2Viz
 import re
 import logging
 import gradio as gr
-from language_utils import language_detector, multilingual_keywords
+from language_utils import language_detector, multilingual_keywords, RequestContext
 from ui_translations import ui_translations
+from ui_render_cache import ui_render_cache
 from memory_manager import MemoryManager
 from history_service import HistoryService
+from history_retention import HistoryRetention
 from history_ui import HistoryUI
+from config import Config
+from tracing import tracer
+from metrics import start_metrics_server
 import time
 import os
 
@@ -18,7 +23,12 @@ import os
 text2sql = Text2SQL()
 text2viz = Text2Viz()
 memory_manager = MemoryManager()
-history_service = HistoryService(memory_manager)
+# 历史记录以write-behind方式异步落盘，不阻塞回答
+history_service = HistoryService(memory_manager, async_write=Config.HISTORY_ASYNC_WRITE)
+# 后台维护任务：按保留策略归档过期历史记录并回收数据库空间
+history_retention = HistoryRetention(memory_manager, on_rows_removed=history_service.rebuild_query_index)
+if Config.HISTORY_MAINTENANCE_INTERVAL > 0:
+    history_retention.start()
 history_ui = HistoryUI(history_service)
 
 # 检测是否是可视化请求的函数（支持多语言）
@@ -31,9 +41,11 @@ def is_visualization_query(query):
 def process_query(message, history):
     """处理用户查询并返回回答"""
     start_time = time.time()
+    # 语言和意图每个请求只计算一次
+    context = RequestContext.from_question(message)
     
     try:
-        if is_visualization_query(message):
+        if context.is_visualization:
             # 使用Text2Viz处理可视化查询
             df, viz_path, clean_query = text2viz.visualize(message)
             
@@ -45,6 +57,7 @@ def process_query(message, history):
                 # 记录查询历史
                 history_service.record_query(
                     user_query=message,
+                    language=context.language,
                     query_type="visualization",
                     result_summary=summary,
                     success=True,
@@ -57,12 +70,13 @@ def process_query(message, history):
                 return [(message, summary)]
             else:
                 # 可视化失败，使用Text2SQL回退
-                response = text2sql.query(message)
+                response = text2sql.query(message, context)
                 execution_time = time.time() - start_time
                 
                 # 记录查询历史
                 history_service.record_query(
                     user_query=message,
+                    language=context.language,
                     query_type="sql",
                     result_summary=response,
                     success=True,
@@ -72,12 +86,13 @@ def process_query(message, history):
                 return [(message, response)]
         else:
             # 使用Text2SQL处理普通查询
-            response = text2sql.query(message)
+            response = text2sql.query(message, context)
             execution_time = time.time() - start_time
             
             # 记录查询历史
             history_service.record_query(
                 user_query=message,
+                language=context.language,
                 query_type="sql",
                 result_summary=response,
                 success=True,
@@ -93,6 +108,7 @@ def process_query(message, history):
         # 记录失败的查询
         history_service.record_query(
             user_query=message,
+            language=context.language,
             query_type="unknown",
             result_summary=error_message,
             success=False,
@@ -140,56 +156,128 @@ def generate_data_summary(df):
     
     return summary
 
+def bot_response(history):
+    """回答对话中的最后一条用户消息
+
+    Returns:
+        tuple: (更新后的对话历史, 生成的SQL, 查询结果)
+    """
+    # 每个请求一个trace，各阶段span随历史记录保存
+    with tracer.start_trace('bot_response') as trace:
+        return traced_bot_response(history, trace)
+
+def traced_bot_response(history, trace):
+    """在给定的trace内回答（trace为None时不记录span）"""
+    start_time = time.time()
+    user_message = ""
+    context = None
+    try:
+        # 获取最后一条用户消息
+        user_message = history[-1]["content"]
+        # 语言和意图每个请求只计算一次，沿分类、回答生成和历史记录传递
+        context = RequestContext.from_question(user_message)
+        
+        # 使用LLM判断对话类型并获取回答
+        with tracer.span('classify', **{'query.language': context.language}):
+            conv_type, answer = text2sql.llm.classify_conversation(user_message, context)
+        
+        # 如果是普通对话，直接返回回答
+        if conv_type == "general":
+            history.append({"role": "assistant", "content": answer})
+            history_service.record_query(
+                user_query=user_message,
+                language=context.language,
+                query_type="general",
+                result_summary=answer,
+                execution_time=time.time() - start_time,
+                trace=trace
+            )
+            return history, "", ""
+        
+        # 如果是数据查询，继续原有的处理逻辑
+        if context.is_visualization:
+            # 处理可视化查询
+            df, viz_path, sql_query = text2viz.visualize(user_message)
+            
+            if viz_path and os.path.exists(viz_path):
+                summary = generate_data_summary(df)
+                db_result = df.head(10).to_string(index=False) if not df.empty else "无数据"
+                
+                # 添加文本摘要回复
+                history.append({"role": "assistant", "content": summary})
+                
+                # 追加图片消息
+                history.append({"role": "assistant", "content": {"path": viz_path}})
+                
+                history_service.record_query(
+                    user_query=user_message,
+                    language=context.language,
+                    query_type="visualization",
+                    sql_generated=sql_query,
+                    result_summary=summary,
+                    execution_time=time.time() - start_time,
+                    trace=trace
+                )
+                return history, sql_query, db_result
+            else:
+                # 可视化失败，使用Text2SQL回退
+                response, sql_query, db_result = text2sql.query(user_message, context)
+                # 添加文本回复
+                history.append({"role": "assistant", "content": response})
+                history_service.record_query(
+                    user_query=user_message,
+                    language=context.language,
+                    query_type="sql",
+                    sql_generated=sql_query,
+                    result_summary=response,
+                    execution_time=time.time() - start_time,
+                    trace=trace
+                )
+                return history, sql_query, db_result
+        else:
+            # 处理普通文本查询
+            response, sql_query, db_result = text2sql.query(user_message, context)
+            # 添加回复
+            history.append({"role": "assistant", "content": response})
+            history_service.record_query(
+                user_query=user_message,
+                language=context.language,
+                query_type="sql",
+                sql_generated=sql_query,
+                result_summary=response,
+                execution_time=time.time() - start_time,
+                trace=trace
+            )
+            return history, sql_query, db_result
+            
+    except Exception as e:
+        # 错误处理 - 多语言支持
+        current_lang = ui_translations.get_current_language()
+        if current_lang == 'en':
+            error_msg = f"Sorry, an error occurred while processing your request: {str(e)}"
+        else:
+            error_msg = f"抱歉，处理您的请求时发生错误：{str(e)}"
+        
+        history.append({"role": "assistant", "content": error_msg})
+        logging.error(f"Bot response error: {str(e)}")
+        if trace:
+            trace.root.record_error(e)
+        if user_message:
+            history_service.record_query(
+                user_query=user_message,
+                language=context.language if context else None,
+                query_type="unknown",
+                result_summary=error_msg,
+                success=False,
+                execution_time=time.time() - start_time,
+                trace=trace
+            )
+        return history, "", ""
+
 # 创建界面组件
 def create_interface_components():
-    """创建多语言界面组件"""
-    current_lang = ui_translations.get_current_language()
-    
-    # 返回界面文本字典
-    return {
-        'app_title': ui_translations.get_text('app_title', current_lang),
-        'app_description': ui_translations.get_text('app_description', current_lang),
-        'smart_query_title': ui_translations.get_text('smart_query_title', current_lang),
-        'smart_query_desc': ui_translations.get_text('smart_query_desc', current_lang),
-        'data_viz_title': ui_translations.get_text('data_viz_title', current_lang),
-        'data_viz_desc': ui_translations.get_text('data_viz_desc', current_lang),
-        'smart_insight_title': ui_translations.get_text('smart_insight_title', current_lang),
-        'smart_insight_desc': ui_translations.get_text('smart_insight_desc', current_lang),
-        'chat_history': ui_translations.get_text('chat_history', current_lang),
-        'input_placeholder': ui_translations.get_text('input_placeholder', current_lang),
-        'send_button': ui_translations.get_text('send_button', current_lang),
-        'clear_button': ui_translations.get_text('clear_button', current_lang),
-        'tech_details': ui_translations.get_text('tech_details', current_lang),
-        'sql_query_label': ui_translations.get_text('sql_query_label', current_lang),
-        'sql_placeholder': ui_translations.get_text('sql_placeholder', current_lang),
-        'result_label': ui_translations.get_text('result_label', current_lang),
-        'result_placeholder': ui_translations.get_text('result_placeholder', current_lang),
-        'precise_query': ui_translations.get_text('precise_query', current_lang),
-        'visual_display': ui_translations.get_text('visual_display', current_lang),
-        'smart_insights': ui_translations.get_text('smart_insights', current_lang),
-        'examples_precise': ui_translations.get_text('examples_precise', current_lang),
-        'examples_visual': ui_translations.get_text('examples_visual', current_lang),
-        'examples_insights': ui_translations.get_text('examples_insights', current_lang),
-        'language_setting': ui_translations.get_text('language_setting', current_lang),
-        'theme_setting': ui_translations.get_text('theme_setting', current_lang),
-        'light_theme': ui_translations.get_text('light_theme', current_lang),
-        'dark_theme': ui_translations.get_text('dark_theme', current_lang),
-        'system_theme': ui_translations.get_text('system_theme', current_lang),
-        # 历史记录相关
-        'history_title': ui_translations.get_text('history_title', current_lang),
-        'search_placeholder': ui_translations.get_text('search_placeholder', current_lang),
-        'search_button': ui_translations.get_text('search_button', current_lang),
-        'refresh_button': ui_translations.get_text('refresh_button', current_lang),
-        'export_history': ui_translations.get_text('export_history', current_lang),
-        'clear_history': ui_translations.get_text('clear_history', current_lang),
-        'back_to_chat': ui_translations.get_text('back_to_chat', current_lang),
-        'query_time': ui_translations.get_text('query_time', current_lang),
-        'query_type': ui_translations.get_text('query_type', current_lang),
-        'total_queries': ui_translations.get_text('total_queries', current_lang),
-        'success': ui_translations.get_text('success', current_lang),
-        'failed': ui_translations.get_text('failed', current_lang),
-        'avg_time': ui_translations.get_text('avg_time', current_lang)
-    }
+    """获取当前语言的界面文本（启动时已按语言预先生成，只读）"""
+    return ui_render_cache.get(ui_translations.get_current_language()).texts
 
 # 创建Gradio界面
 def create_combined_interface():
@@ -932,8 +1020,9 @@ def create_combined_interface():
     }
     """
     
-    # 获取界面文本
-    texts = create_interface_components()
+    # 获取界面文本和预渲染的HTML片段
+    fragments = ui_render_cache.get(ui_translations.get_current_language())
+    texts = fragments.texts
     
     with gr.Blocks(title=texts['app_title'], theme=gr.themes.Soft(), css=custom_css) as interface:
         # 语言设置状态
@@ -956,34 +1045,10 @@ def create_combined_interface():
         # 主界面内容
         
         # 主标题区域 - 紧凑设计
-        main_header = gr.HTML(
-            f"""
-            <div class="main-header">
-                <h1 style="margin: 0; font-size: 2rem; font-weight: 700;">{texts['app_title']}</h1>
-                <p style="margin: 0.5rem 0 0 0; font-size: 1rem; opacity: 0.9;">{texts['app_description']}</p>
-            </div>
-            """
-        )
+        main_header = gr.HTML(fragments.main_header)
         
         # 功能介绍卡片 - 简洁设计
-        feature_cards = gr.HTML(
-            f"""
-            <div style="display: flex; gap: 1rem; margin: 1rem 0;">
-                <div class="feature-card" style="flex: 1;">
-                    <h3 style="margin-top: 0; margin-bottom: 0.5rem; font-size: 1.1rem;">{texts['smart_query_title']}</h3>
-                    <p style="margin: 0; font-size: 0.9rem;">{texts['smart_query_desc']}</p>
-                </div>
-                <div class="feature-card" style="flex: 1;">
-                    <h3 style="margin-top: 0; margin-bottom: 0.5rem; font-size: 1.1rem;">{texts['data_viz_title']}</h3>
-                    <p style="margin: 0; font-size: 0.9rem;">{texts['data_viz_desc']}</p>
-                </div>
-                <div class="feature-card" style="flex: 1;">
-                    <h3 style="margin-top: 0; margin-bottom: 0.5rem; font-size: 1.1rem;">{texts['smart_insight_title']}</h3>
-                    <p style="margin: 0; font-size: 0.9rem;">{texts['smart_insight_desc']}</p>
-                </div>
-            </div>
-            """
-        )
+        feature_cards = gr.HTML(fragments.feature_cards)
         
         # 主要交互区域 - 使用标签页
         with gr.Tabs() as main_tabs:
@@ -1044,14 +1109,7 @@ def create_combined_interface():
                 with gr.Row():
                     with gr.Column():
                         # 页面标题
-                        history_page_title = gr.HTML(
-                            f"""
-                            <div style="text-align: center; margin-bottom: 30px; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 15px; color: white;">
-                                <h1 style="margin: 0; font-size: 2.5rem; font-weight: 700;">📊 {texts['history_title']}</h1>
-                                <p style="margin: 10px 0 0 0; font-size: 1.1rem; opacity: 0.9;">实时同步 • 智能搜索 • 数据导出</p>
-                            </div>
-                            """
-                        )
+                        history_page_title = gr.HTML(fragments.history_page_title)
                         
                         # 控制面板
                         with gr.Row():
@@ -1064,6 +1122,7 @@ def create_combined_interface():
                             with gr.Column(scale=1):
                                 with gr.Row():
                                     refresh_btn = gr.Button(f"🔄 刷新", size="sm")
+                                    next_page_btn = gr.Button("➡️ 下一页", size="sm")
                                     export_btn = gr.Button(f"📥 {texts['export_history']}", size="sm")
                                     clear_history_btn = gr.Button(f"🗑️ {texts['clear_history']}", size="sm", variant="stop")
                         
@@ -1077,19 +1136,13 @@ def create_combined_interface():
                         )
                         
                         # 统计信息
-                        stats_display = gr.HTML(
-                            f"""
-                            <div style="margin-top: 20px; padding: 15px; background: #f8f9fa; border-radius: 10px; font-size: 1rem;">
-                                <span style="margin-right: 30px;">📊 {texts['total_queries']}: 0</span>
-                                <span style="margin-right: 30px;">✅ {texts['success']}: 0</span>
-                                <span style="margin-right: 30px;">❌ {texts['failed']}: 0</span>
-                                <span>⏱️ {texts['avg_time']}: 0.0s</span>
-                            </div>
-                            """
-                        )
+                        stats_display = gr.HTML(fragments.stats_display)
                         
                         # 操作结果显示
                         operation_result = gr.HTML(visible=False)
+                        
+                        # 下一页游标（keyset分页）
+                        history_cursor = gr.State(None)
         
         # 示例查询区域 - 优化设计
         with gr.Row():
@@ -1097,25 +1150,25 @@ def create_combined_interface():
                 # 示例查询 - 保留必要示例
                 with gr.Row():
                     with gr.Column(scale=1):
-                        precise_title = gr.HTML(f"<h4 style='margin-bottom: 1rem; color: var(--loreal-gold); font-size: 1.1rem;'>{texts['precise_query']}</h4>")
+                        precise_title = gr.HTML(fragments.precise_title)
                         precise_examples = gr.Examples(
-                            examples=texts['examples_precise'],
+                            examples=list(texts['examples_precise']),
                             inputs=msg,
                             elem_id="precise_examples"
                         )
                     
                     with gr.Column(scale=1):
-                        visual_title = gr.HTML(f"<h4 style='margin-bottom: 1rem; color: var(--loreal-gold); font-size: 1.1rem;'>{texts['visual_display']}</h4>")
+                        visual_title = gr.HTML(fragments.visual_title)
                         visual_examples = gr.Examples(
-                            examples=texts['examples_visual'],
+                            examples=list(texts['examples_visual']),
                             inputs=msg,
                             elem_id="visual_examples"
                         )
                     
                     with gr.Column(scale=1):
-                        insights_title = gr.HTML(f"<h4 style='margin-bottom: 1rem; color: var(--loreal-gold); font-size: 1.1rem;'>{texts['smart_insights']}</h4>")
+                        insights_title = gr.HTML(fragments.insights_title)
                         insights_examples = gr.Examples(
-                            examples=texts['examples_insights'],
+                            examples=list(texts['examples_insights']),
                             inputs=msg,
                             elem_id="insights_examples"
                         )
@@ -1130,156 +1183,66 @@ def create_combined_interface():
             # 处理用户输入 - 使用messages格式
             return "", history + [{"role": "user", "content": user_message}]
         
-        # 定义回调函数
-        def bot_response(history):
-            try:
-                # 获取最后一条用户消息
-                user_message = history[-1]["content"]
-                
-                # 使用LLM判断对话类型并获取回答
-                conv_type, answer = text2sql.llm.classify_conversation(user_message)
-                
-                # 如果是普通对话，直接返回回答
-                if conv_type == "general":
-                    history.append({"role": "assistant", "content": answer})
-                    return history, "", ""
-                
-                # 如果是数据查询，继续原有的处理逻辑
-                if is_visualization_query(user_message):
-                    # 处理可视化查询
-                    df, viz_path, sql_query = text2viz.visualize(user_message)
-                    
-                    if viz_path and os.path.exists(viz_path):
-                        summary = generate_data_summary(df)
-                        db_result = df.head(10).to_string(index=False) if not df.empty else "无数据"
-                        
-                        # 添加文本摘要回复
-                        history.append({"role": "assistant", "content": summary})
-                        
-                        # 追加图片消息
-                        history.append({"role": "assistant", "content": {"path": viz_path}})
-                        
-                        return history, sql_query, db_result
-                    else:
-                        # 可视化失败，使用Text2SQL回退
-                        response, sql_query, db_result = text2sql.query(user_message)
-                        # 添加文本回复
-                        history.append({"role": "assistant", "content": response})
-                        return history, sql_query, db_result
-                else:
-                    # 处理普通文本查询
-                    response, sql_query, db_result = text2sql.query(user_message)
-                    # 添加回复
-                    history.append({"role": "assistant", "content": response})
-                    return history, sql_query, db_result
-                    
-            except Exception as e:
-                # 错误处理 - 多语言支持
-                current_lang = ui_translations.get_current_language()
-                if current_lang == 'en':
-                    error_msg = f"Sorry, an error occurred while processing your request: {str(e)}"
-                else:
-                    error_msg = f"抱歉，处理您的请求时发生错误：{str(e)}"
-                
-                history.append({"role": "assistant", "content": error_msg})
-                logging.error(f"Bot response error: {str(e)}")
-                return history, "", ""
-        
         # 语言切换处理函数
-        def update_interface_language(language):
-            """更新界面语言"""
+        def update_interface_language(language, current_language=None):
+            """更新界面语言：直接返回启动时预渲染的片段，语言未变化时不发送任何片段"""
             ui_translations.set_language(language)
-            new_texts = create_interface_components()
-            
-            # 返回更新后的界面组件
-            return (
-                # 主标题
-                f"""
-                <div class="main-header">
-                    <h1 style="margin: 0; font-size: 2rem; font-weight: 700;">{new_texts['app_title']}</h1>
-                    <p style="margin: 0.5rem 0 0 0; font-size: 1rem; opacity: 0.9;">{new_texts['app_description']}</p>
-                </div>
-                """,
-                # 功能卡片
-                f"""
-                <div style="display: flex; gap: 1rem; margin: 1rem 0;">
-                    <div class="feature-card" style="flex: 1;">
-                        <h3 style="margin-top: 0; margin-bottom: 0.5rem; font-size: 1.1rem;">{new_texts['smart_query_title']}</h3>
-                        <p style="margin: 0; font-size: 0.9rem;">{new_texts['smart_query_desc']}</p>
-                    </div>
-                    <div class="feature-card" style="flex: 1;">
-                        <h3 style="margin-top: 0; margin-bottom: 0.5rem; font-size: 1.1rem;">{new_texts['data_viz_title']}</h3>
-                        <p style="margin: 0; font-size: 0.9rem;">{new_texts['data_viz_desc']}</p>
-                    </div>
-                    <div class="feature-card" style="flex: 1;">
-                        <h3 style="margin-top: 0; margin-bottom: 0.5rem; font-size: 1.1rem;">{new_texts['smart_insight_title']}</h3>
-                        <p style="margin: 0; font-size: 0.9rem;">{new_texts['smart_insight_desc']}</p>
-                    </div>
-                </div>
-                """,
-                # 示例查询标题
-                f"<h4 style='margin-bottom: 1rem; color: var(--loreal-gold); font-size: 1.1rem;'>{new_texts['precise_query']}</h4>",
-                f"<h4 style='margin-bottom: 1rem; color: var(--loreal-gold); font-size: 1.1rem;'>{new_texts['visual_display']}</h4>",
-                f"<h4 style='margin-bottom: 1rem; color: var(--loreal-gold); font-size: 1.1rem;'>{new_texts['smart_insights']}</h4>",
-                # 历史记录页面标题
-                f"""
-                <div style="text-align: center; margin-bottom: 30px; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 15px; color: white;">
-                    <h1 style="margin: 0; font-size: 2.5rem; font-weight: 700;">📊 {new_texts['history_title']}</h1>
-                    <p style="margin: 10px 0 0 0; font-size: 1.1rem; opacity: 0.9;">实时同步 • 智能搜索 • 数据导出</p>
-                </div>
-                """,
-                # 历史记录统计信息
-                f"""
-                <div style="margin-top: 20px; padding: 15px; background: #f8f9fa; border-radius: 10px; font-size: 1rem;">
-                    <span style="margin-right: 30px;">📊 {new_texts['total_queries']}: 0</span>
-                    <span style="margin-right: 30px;">✅ {new_texts['success']}: 0</span>
-                    <span style="margin-right: 30px;">❌ {new_texts['failed']}: 0</span>
-                    <span>⏱️ {new_texts['avg_time']}: 0.0s</span>
-                </div>
-                """,
-                # 更新语言状态
-                language
-            )
+            if language == current_language:
+                return (gr.skip(),) * 7 + (language,)
+            return ui_render_cache.get(language).language_outputs() + (language,)
         
         # 清空对话功能
         def clear_conversation():
             return [], "", "", ""
         
         # 历史记录相关功能函数
-        def get_history_data(search_query=""):
-            """获取历史记录数据"""
+        def get_history_data(search_query="", cursor=None):
+            """获取历史记录数据
+            
+            Args:
+                search_query: 搜索关键词，非空时使用全文搜索
+                cursor: 分页游标，None表示第一页
+                
+            Returns:
+                tuple: (表格数据, 统计信息HTML, 下一页游标)
+            """
             try:
                 current_lang = ui_translations.get_current_language()
                 
-                # 获取最近的历史记录
-                history_records = history_service.get_recent_queries(days=30, limit=100)
+                next_cursor = None
+                if search_query:
+                    history_records = history_service.search_queries(search_query, limit=Config.HISTORY_PAGE_SIZE)
+                else:
+                    page = history_service.get_recent_queries_page(
+                        days=30, limit=Config.HISTORY_PAGE_SIZE, cursor=cursor
+                    )
+                    history_records = page['items']
+                    next_cursor = page['next_cursor']
                 
                 if not history_records:
                     no_history_text = ui_translations.get_text('no_history', current_lang)
-                    return [], f"<div style='padding: 10px; background: #f8f9fa; border-radius: 5px; font-size: 0.9rem;'>📊 {no_history_text}</div>"
+                    return [], f"<div style='padding: 10px; background: #f8f9fa; border-radius: 5px; font-size: 0.9rem;'>📊 {no_history_text}</div>", None
                 
                 # 转换为表格数据
                 table_data = []
                 for record in history_records:
-                    # 搜索过滤
-                    if search_query and search_query.lower() not in record.user_query.lower():
-                        continue
-                        
                     # 根据语言显示状态文本
-                    status_text = ui_translations.get_text('success', current_lang) if record.success else ui_translations.get_text('failed', current_lang)
+                    status_text = ui_translations.get_text('success', current_lang) if record['success'] else ui_translations.get_text('failed', current_lang)
+                    query_text = record['query']
                     
                     table_data.append([
-                        record.timestamp.strftime("%Y-%m-%d %H:%M"),
-                        record.user_query[:100] + "..." if len(record.user_query) > 100 else record.user_query,
-                        record.query_type,
+                        record['timestamp'][:16],
+                        query_text[:100] + "..." if len(query_text) > 100 else query_text,
+                        record['type'],
                         status_text
                     ])
                 
-                # 生成统计信息
-                total_count = len(history_records)
-                success_count = sum(1 for r in history_records if r.success)
-                fail_count = total_count - success_count
-                avg_time = sum(r.execution_time for r in history_records if r.execution_time) / total_count if total_count > 0 else 0
+                # 统计信息读取物化计数器，不随分页和搜索结果重新计算
+                stats = history_service.get_history_stats()
+                total_count = stats['total_queries']
+                success_count = stats['successful_queries']
+                fail_count = stats['failed_queries']
+                avg_time = stats['avg_execution_time']
                 
                 # 获取多语言文本
                 total_queries_text = ui_translations.get_text('total_queries', current_lang)
@@ -1296,7 +1259,7 @@ def create_combined_interface():
                 </div>
                 """
                 
-                return table_data, stats_html
+                return table_data, stats_html, next_cursor
                 
             except Exception as e:
                 current_lang = ui_translations.get_current_language()
@@ -1304,16 +1267,22 @@ def create_combined_interface():
                     error_msg = f"Error getting history: {str(e)}"
                 else:
                     error_msg = f"获取历史记录时出错: {str(e)}"
-                return [], f"<div style='padding: 10px; background: #ffe6e6; border-radius: 5px; color: #d63384;'>❌ {error_msg}</div>"
+                return [], f"<div style='padding: 10px; background: #ffe6e6; border-radius: 5px; color: #d63384;'>❌ {error_msg}</div>", None
         
         def refresh_history():
-            """刷新历史记录"""
+            """刷新历史记录（回到第一页）"""
             return get_history_data()
         
         def search_history(search_query):
             """搜索历史记录"""
             return get_history_data(search_query)
         
+        def next_history_page(cursor):
+            """加载下一页历史记录，已是最后一页时保持不变"""
+            if not cursor:
+                return gr.skip(), gr.skip(), None
+            return get_history_data(cursor=cursor)
+        
         def export_history():
             """导出历史记录"""
             try:
@@ -1345,14 +1314,14 @@ def create_combined_interface():
                     success_msg = "✅ History cleared"
                 else:
                     success_msg = "✅ 历史记录已清空"
-                return [], f"<div style='padding: 10px; background: #d1ecf1; border-radius: 5px; color: #0c5460;'>{success_msg}</div>"
+                return [], f"<div style='padding: 10px; background: #d1ecf1; border-radius: 5px; color: #0c5460;'>{success_msg}</div>", None
             except Exception as e:
                 current_lang = ui_translations.get_current_language()
                 if current_lang == 'en':
                     error_msg = f"Error clearing history: {str(e)}"
                 else:
                     error_msg = f"清空历史记录时出错: {str(e)}"
-                return [], f"<div style='padding: 10px; background: #ffe6e6; border-radius: 5px; color: #d63384;'>❌ {error_msg}</div>"
+                return [], f"<div style='padding: 10px; background: #ffe6e6; border-radius: 5px; color: #d63384;'>❌ {error_msg}</div>", None
         
         def toggle_history_panel():
             """切换历史记录面板显示状态"""
@@ -1361,22 +1330,21 @@ def create_combined_interface():
         
         # 设置事件处理
         # 语言切换事件
-        def update_examples_and_interface(language):
+        def update_examples_and_interface(language, current_language):
             """更新界面语言和示例查询"""
-            ui_translations.set_language(language)
-            new_texts = create_interface_components()
+            new_texts = ui_render_cache.get(language).texts
             
             # 更新示例查询
-            precise_examples.examples = new_texts['examples_precise']
-            visual_examples.examples = new_texts['examples_visual']
-            insights_examples.examples = new_texts['examples_insights']
+            precise_examples.examples = list(new_texts['examples_precise'])
+            visual_examples.examples = list(new_texts['examples_visual'])
+            insights_examples.examples = list(new_texts['examples_insights'])
             
             # 调用原有的界面更新函数
-            return update_interface_language(language)
+            return update_interface_language(language, current_language)
         
         language_dropdown.change(
             update_examples_and_interface,
-            inputs=[language_dropdown],
+            inputs=[language_dropdown, language_state],
             outputs=[main_header, feature_cards, precise_title, visual_title, insights_title, history_page_title, stats_display, language_state]
         )
         
@@ -1395,19 +1363,18 @@ def create_combined_interface():
         # 标签页切换函数
         def switch_to_history_tab():
             """切换到历史记录标签页并刷新数据"""
-            table_data, stats_html = get_history_data()
-            return gr.Tabs(selected=1), table_data, stats_html
+            table_data, stats_html, next_cursor = get_history_data()
+            return gr.Tabs(selected=1), table_data, stats_html, next_cursor
         
         # 初始化历史记录数据
         def load_initial_history():
             """页面加载时初始化历史记录数据"""
-            table_data, stats_html = get_history_data()
-            return table_data, stats_html
+            return get_history_data()
         
         # 页面加载时初始化历史记录
         interface.load(
             load_initial_history,
-            outputs=[history_table, stats_display]
+            outputs=[history_table, stats_display, history_cursor]
         )
         
         # 历史记录相关事件处理
@@ -1415,14 +1382,21 @@ def create_combined_interface():
         # 刷新按钮事件
         refresh_btn.click(
             refresh_history,
-            outputs=[history_table, stats_display]
+            outputs=[history_table, stats_display, history_cursor]
+        )
+        
+        # 下一页事件
+        next_page_btn.click(
+            next_history_page,
+            inputs=[history_cursor],
+            outputs=[history_table, stats_display, history_cursor]
         )
         
         # 搜索事件
         search_input.submit(
             search_history,
             inputs=[search_input],
-            outputs=[history_table, stats_display]
+            outputs=[history_table, stats_display, history_cursor]
         )
         
         # 导出按钮事件
@@ -1438,7 +1412,7 @@ def create_combined_interface():
         # 清空历史记录按钮事件
         clear_history_btn.click(
             clear_all_history,
-            outputs=[history_table, stats_display]
+            outputs=[history_table, stats_display, history_cursor]
         )
     
     return interface
@@ -1456,6 +1430,13 @@ def main():
     )
     logging.info("=== 应用启动 ===")
     
+    # 在Gradio旁启动Prometheus指标端点
+    if Config.METRICS_PORT:
+        try:
+            start_metrics_server(Config.METRICS_PORT, Config.METRICS_HOST)
+        except OSError as e:
+            logging.warning(f"Metrics endpoint not started on port {Config.METRICS_PORT}: {e}")
+    
     # 创建界面
     interface = create_combined_interface()
     # 启动服务
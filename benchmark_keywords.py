@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+关键词意图匹配微基准
+对比原先的逐关键词子串判断（每次调用新建语言检测器、每个意图单独扫描）与编译后的匹配器（一次调用返回全部意图）
+
+用法:
+    python benchmark_keywords.py --iterations 20000
+"""
+
+import argparse
+import time
+from typing import List, Dict, Callable, Optional
+
+from language_utils import LanguageDetector, multilingual_keywords
+
+# 中英文、命中/未命中、长短不一的查询
+QUERIES = [
+    "请帮我可视化2024年各省份的销售趋势",
+    "查询销售总额",
+    "各品牌销售额排名前十的省份有哪些",
+    "Show me a chart of monthly sales by brand",
+    "What is the total sales amount in Shanghai for 2024?",
+    "你好，请问你能做什么？",
+    "Hello, who are you?",
+    "Count orders by province and channel, sorted by order count descending",
+    "兰蔻和欧莱雅在华东地区的销量对比",
+    "Plot the distribution of order quantity for skincare products",
+]
+
+def legacy_match(query: str, keywords: Dict[str, List[str]], language: Optional[str] = None) -> bool:
+    """原实现：未指定语言时新建检测器，逐个关键词做子串判断"""
+    if language is None:
+        language = LanguageDetector().detect_language(query)
+    query_lower = query.lower()
+    if language in ['zh', 'mixed'] and any(keyword in query_lower for keyword in keywords['zh']):
+        return True
+    if language in ['en', 'mixed'] and any(keyword in query_lower for keyword in keywords['en']):
+        return True
+    return False
+
+def legacy_intents(query: str) -> frozenset:
+    """原实现下判断两种意图需要两次独立调用"""
+    intents = set()
+    if legacy_match(query, multilingual_keywords.viz_keywords):
+        intents.add('visualization')
+    if legacy_match(query, multilingual_keywords.general_keywords):
+        intents.add('general')
+    return frozenset(intents)
+
+def compiled_intents(query: str) -> frozenset:
+    """编译匹配器：一次调用返回全部意图"""
+    return multilingual_keywords.match_intents(query)
+
+def measure(function: Callable[[str], frozenset], iterations: int) -> float:
+    """返回每个查询的平均耗时（微秒）"""
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        for query in QUERIES:
+            function(query)
+    return (time.perf_counter() - start_time) / (iterations * len(QUERIES)) * 1e6
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="关键词意图匹配微基准")
+    parser.add_argument('--iterations', type=int, default=20000, help='每个查询的重复次数')
+    args = parser.parse_args(argv)
+
+    mismatches = [query for query in QUERIES if legacy_intents(query) != compiled_intents(query)]
+    if mismatches:
+        raise SystemExit(f"结果不一致: {mismatches}")
+
+    legacy = measure(legacy_intents, args.iterations)
+    compiled = measure(compiled_intents, args.iterations)
+    print(f"逐关键词子串判断: {legacy:.2f} µs/查询")
+    print(f"编译匹配器:       {compiled:.2f} µs/查询")
+    print(f"加速: {legacy / compiled:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对话流水线端到端基准
+用固定的中英文问题集驱动 app.bot_response：LLM由进程内的 llm_stub 按问题给出确定性回答（可注入延迟），
+业务库由 data_generator 按多个规模生成。报告各处理阶段耗时分位数、N个并发会话下的吞吐量、
+内存增长和图表渲染耗时，结果写入JSON文件，可与基线结果对比找出性能回退
+
+用法:
+    python benchmark_pipeline.py --scales 10000,100000 --concurrency 1,4,8 --output benchmark.json
+    python benchmark_pipeline.py --scales 10000 --baseline benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from llm_stub import Cassette, LLMStub, start_stub_server
+from sql_log_analyzer import latency_percentiles
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class BenchmarkQuestion:
+    """基准问题及桩LLM对它给出的SQL（普通对话为None）"""
+    question: str
+    sql: Optional[str] = None
+
+    @property
+    def is_general(self) -> bool:
+        return self.sql is None
+
+# 中英文的数据查询、可视化和普通对话
+CORPUS = [
+    BenchmarkQuestion("各省份的销售总额是多少",
+                      "SELECT province, SUM(sales_amount) AS total_sales FROM sales_data "
+                      "GROUP BY province ORDER BY total_sales DESC"),
+    BenchmarkQuestion("2024年各品牌的订单数量",
+                      "SELECT brand, COUNT(*) AS order_count FROM sales_data "
+                      "WHERE strftime('%Y', order_date) = '2024' GROUP BY brand ORDER BY order_count DESC"),
+    BenchmarkQuestion("上海市销售额最高的10个商品",
+                      "SELECT product_name, SUM(sales_amount) AS total_sales FROM sales_data "
+                      "WHERE province = '上海市' GROUP BY product_name ORDER BY total_sales DESC LIMIT 10"),
+    BenchmarkQuestion("护肤品每月的平均折扣金额",
+                      "SELECT strftime('%Y-%m', order_date) AS month, AVG(discount_amount) AS avg_discount "
+                      "FROM sales_data WHERE category = '护肤品' GROUP BY month ORDER BY month"),
+    BenchmarkQuestion("可视化各品类的销售额",
+                      "SELECT category, SUM(sales_amount) AS total_sales FROM sales_data GROUP BY category"),
+    BenchmarkQuestion("用图表展示2024年每月销售趋势",
+                      "SELECT strftime('%Y-%m', order_date) AS month, SUM(sales_amount) AS total_sales "
+                      "FROM sales_data WHERE order_date BETWEEN '2024-01-01' AND '2024-12-31' "
+                      "GROUP BY month ORDER BY month"),
+    BenchmarkQuestion("What is the total sales amount by province?",
+                      "SELECT province, SUM(sales_amount) AS total_sales FROM sales_data "
+                      "GROUP BY province ORDER BY total_sales DESC"),
+    BenchmarkQuestion("How many orders did each brand have in 2023?",
+                      "SELECT brand, COUNT(*) AS order_count FROM sales_data "
+                      "WHERE strftime('%Y', order_date) = '2023' GROUP BY brand ORDER BY order_count DESC"),
+    BenchmarkQuestion("Which 5 cities have the highest sales quantity?",
+                      "SELECT city, SUM(quantity) AS total_quantity FROM sales_data "
+                      "GROUP BY city ORDER BY total_quantity DESC LIMIT 5"),
+    BenchmarkQuestion("Visualize sales by category",
+                      "SELECT category, SUM(sales_amount) AS total_sales FROM sales_data GROUP BY category"),
+    BenchmarkQuestion("Plot monthly sales for Lancome brand",
+                      "SELECT strftime('%Y-%m', order_date) AS month, SUM(sales_amount) AS total_sales "
+                      "FROM sales_data WHERE brand = '兰蔻' GROUP BY month ORDER BY month"),
+    BenchmarkQuestion("你好，你能做什么？"),
+    BenchmarkQuestion("Hello, who are you?"),
+]
+
+# 识别提示类型的标记（见 language_utils.MultilingualPrompts）
+_CLASSIFY_MARKER = 'general_conversation'
+_CHAT_MARKER = 'BeautyInsight'
+_ANSWER_MARKERS = ('SQL查询:', 'SQL Query:')
+
+class CorpusResponder:
+    """按提示中出现的基准问题给出确定性回答，供 LLMStub 使用"""
+
+    def __init__(self, corpus: List[BenchmarkQuestion]):
+        # 较长的问题优先匹配，避免一个问题是另一个问题的子串时误判
+        self.corpus = sorted(corpus, key=lambda item: len(item.question), reverse=True)
+
+    def find(self, prompt: str) -> Optional[BenchmarkQuestion]:
+        return next((item for item in self.corpus if item.question in prompt), None)
+
+    def __call__(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        prompt = str(messages[-1].get('content', '')) if messages else ''
+        item = self.find(prompt)
+        if item is None:
+            return None
+        if _CLASSIFY_MARKER in prompt:
+            return 'general_conversation' if item.is_general else 'data_query'
+        if _CHAT_MARKER in prompt:
+            return f"您好！我是BeautyInsight，可以帮您分析销售数据并生成图表。({item.question})"
+        if any(marker in prompt for marker in _ANSWER_MARKERS):
+            return f"根据查询结果，已完成对“{item.question}”的统计，重点数据见上方结果。"
+        if item.is_general:
+            return None
+        return f"SQLQuery: {item.sql}"
+
+def use_database(app_module, db_path: str, work_dir: str):
+    """替换 app 的 text2sql / text2viz / history_service，改用给定的业务库，历史记录和图表写入工作目录"""
+    from text2sql import Text2SQL
+    from text2viz import Text2Viz
+    from memory_manager import MemoryManager
+    from history_service import HistoryService
+    from config import Config
+
+    uri = f"sqlite:///{db_path}"
+    app_module.text2sql = Text2SQL(uri)
+    app_module.text2viz = Text2Viz(uri)
+    app_module.text2viz.img_dir = os.path.join(work_dir, 'viz_images')
+    os.makedirs(app_module.text2viz.img_dir, exist_ok=True)
+    if getattr(app_module, 'history_service', None) is not None:
+        app_module.history_service.close()
+    app_module.history_service = HistoryService(MemoryManager(os.path.join(work_dir, 'chat_history.db')),
+                                                async_write=Config.HISTORY_ASYNC_WRITE)
+
+def start_llm_stub(work_dir: str, llm_latency: float = 0.0, corpus: List[BenchmarkQuestion] = CORPUS):
+    """启动按问题集给出确定性回答的进程内桩LLM，并让 llm_client 使用它
+
+    Returns:
+        ThreadingHTTPServer: 桩服务（shutdown() 停止）
+    """
+    server = start_stub_server(
+        LLMStub(Cassette(os.path.join(work_dir, 'llm_cassette.jsonl')), latency=llm_latency,
+                responder=CorpusResponder(corpus)), port=0)
+    # llm_client 每次调用时读取 BASE_URL / API_KEY
+    os.environ['BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ['API_KEY'] = 'benchmark'
+    return server
+
+def current_rss_mb() -> float:
+    """当前进程的常驻内存（MB），不支持 /proc 的平台返回峰值常驻内存，Windows 上返回0"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows 没有 resource 模块
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KB为单位
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+class PipelineBenchmark:
+    """在一个规模的业务库上按不同并发数运行问题集"""
+
+    def __init__(self, app_module, corpus: List[BenchmarkQuestion] = CORPUS, iterations: int = 1):
+        """初始化基准
+
+        Args:
+            app_module: 已导入的 app 模块（替换其中的 text2sql / text2viz / history_service）
+            corpus: 问题集
+            iterations: 每个会话把问题集完整运行的次数
+        """
+        self.app = app_module
+        self.corpus = corpus
+        self.iterations = iterations
+        self._lock = threading.Lock()
+
+    def prepare(self, db_path: str, work_dir: str):
+        """让 app 使用给定的业务库，历史记录和图表写入工作目录"""
+        use_database(self.app, db_path, work_dir)
+
+    def run_request(self, history: List[Dict[str, Any]], question: str, samples: Dict[str, List]):
+        """运行一个问题，记录端到端耗时和各span耗时"""
+        from tracing import tracer
+
+        history.append({"role": "user", "content": question})
+        start_time = time.perf_counter()
+        with tracer.start_trace('bot_response') as trace:
+            self.app.traced_bot_response(history, trace)
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        spans = trace.finish() if trace is not None else []
+        with self._lock:
+            samples['request'].append(latency_ms)
+            for span in spans:
+                samples[f"stage:{span['name']}"].append((span['end_time_ns'] - span['start_time_ns']) / 1e6)
+                if span['status'] == 'ERROR' and span['parent_span_id'] is None:
+                    samples['errors'].append(question)
+
+    def run_session(self, session_index: int, samples: Dict[str, List]):
+        """一个会话：从不同的起点轮流提问，对话历史随会话增长"""
+        history: List[Dict[str, Any]] = []
+        offset = session_index % len(self.corpus)
+        questions = self.corpus[offset:] + self.corpus[:offset]
+        for _ in range(self.iterations):
+            for item in questions:
+                self.run_request(history, item.question, samples)
+
+    def run_level(self, concurrency: int) -> Dict[str, Any]:
+        """以 concurrency 个并发会话运行问题集"""
+        samples: Dict[str, List] = defaultdict(list)
+        rss_before = current_rss_mb()
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(self.run_session, index, samples) for index in range(concurrency)]:
+                future.result()
+        duration = time.perf_counter() - start_time
+        self.app.history_service.flush(timeout=30)
+        rss_after = current_rss_mb()
+
+        requests = len(samples['request'])
+        stages = {key.split(':', 1)[1]: summarize(values) for key, values in sorted(samples.items())
+                  if key.startswith('stage:')}
+        return {
+            'concurrency': concurrency,
+            'requests': requests,
+            'errors': len(samples['errors']),
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(requests / duration, 3) if duration > 0 else None,
+            'latency_ms': summarize(samples['request']),
+            'stages': stages,
+            'rss_mb_before': round(rss_before, 1),
+            'rss_mb_after': round(rss_after, 1),
+            'rss_growth_mb': round(rss_after - rss_before, 1),
+        }
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """耗时样本（毫秒）的次数、均值和分位数"""
+    result = {'count': len(values), 'mean': round(sum(values) / len(values), 3) if values else None}
+    result.update(latency_percentiles(sorted(values)))
+    return result
+
+def build_database(db_path: str, rows: int, seed: int) -> float:
+    """生成指定规模的业务库，返回耗时（秒）"""
+    from data_generator import SyntheticDataGenerator, load_synthetic_data
+
+    start_time = time.perf_counter()
+    load_synthetic_data(db_path, rows, generator=SyntheticDataGenerator(seed=seed), replace=True)
+    return time.perf_counter() - start_time
+
+def run_benchmark(scales: List[int], concurrency_levels: List[int], iterations: int = 1,
+                  llm_latency: float = 0.0, seed: int = 42, work_dir: Optional[str] = None,
+                  corpus: List[BenchmarkQuestion] = CORPUS) -> Dict[str, Any]:
+    """运行全部规模和并发数，返回可写入JSON的结果
+
+    Args:
+        scales: 业务库的销售明细行数
+        concurrency_levels: 并发会话数
+        iterations: 每个会话运行问题集的次数
+        llm_latency: 桩LLM每次调用注入的延迟（秒）
+        seed: 数据生成的随机种子
+        work_dir: 存放生成的数据库、历史库和图表的目录，默认使用临时目录并在结束后删除
+        corpus: 问题集
+    """
+    cleanup = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='loreal_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    stub_server = start_llm_stub(work_dir, llm_latency, corpus)
+
+    try:
+        import app
+        from tracing import tracer
+        tracer.enabled = True
+        # 基准只关心耗时，关闭各模块的INFO/WARNING日志
+        logging.disable(logging.WARNING)
+
+        benchmark = PipelineBenchmark(app, corpus, iterations)
+        results = []
+        for rows in scales:
+            scale_dir = os.path.join(work_dir, f"rows_{rows}")
+            os.makedirs(scale_dir, exist_ok=True)
+            db_path = os.path.join(scale_dir, 'bench.db')
+            build_seconds = build_database(db_path, rows, seed)
+            benchmark.prepare(db_path, scale_dir)
+            # 预热：载入统计信息、编译处理链，不计入结果
+            benchmark.run_request([], corpus[0].question, defaultdict(list))
+
+            levels = []
+            for concurrency in concurrency_levels:
+                level = benchmark.run_level(concurrency)
+                levels.append(level)
+                print(f"rows={rows} concurrency={concurrency}: {level['throughput_rps']} req/s, "
+                      f"p95={level['latency_ms']['p95']}ms, errors={level['errors']}, "
+                      f"rss +{level['rss_growth_mb']}MB")
+            # 图表渲染耗时取第一个并发级别（通常为单会话，不含CPU争用）
+            charts = [level['stages']['viz.render'] for level in levels if 'viz.render' in level['stages']]
+            results.append({
+                'rows': rows,
+                'db_build_s': round(build_seconds, 3),
+                'db_size_mb': round(os.path.getsize(db_path) / 1024 / 1024, 2),
+                'levels': levels,
+                'chart_render_ms': charts[0] if charts else None,
+            })
+        app.history_service.close()
+    finally:
+        logging.disable(logging.NOTSET)
+        stub_server.shutdown()
+        stub_server.server_close()
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'corpus_size': len(corpus),
+            'iterations': iterations,
+            'llm_latency_s': llm_latency,
+            'seed': seed,
+        },
+        'scales': results,
+    }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """对比两次结果，返回超出容差的回退（p95耗时上升或吞吐量下降超过 tolerance 比例）"""
+    def index(result):
+        return {(scale['rows'], level['concurrency']): level
+                for scale in result['scales'] for level in scale['levels']}
+
+    regressions = []
+    baseline_levels = index(baseline)
+    for key, level in sorted(index(current).items()):
+        base = baseline_levels.get(key)
+        if base is None:
+            continue
+        rows, concurrency = key
+        checks = [('p95', base['latency_ms']['p95'], level['latency_ms']['p95'], 1)]
+        checks += [(f"{stage} p95", base['stages'][stage]['p95'], stats['p95'], 1)
+                   for stage, stats in level['stages'].items() if stage in base['stages']]
+        checks.append(('throughput', base['throughput_rps'], level['throughput_rps'], -1))
+        for name, old, new, direction in checks:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append(f"rows={rows} concurrency={concurrency} {name}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+def build_result_path(output_dir: Optional[str] = None) -> str:
+    """生成带时间戳的结果文件路径"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(output_dir or os.getcwd(), f"benchmark_{timestamp}.json")
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="对话流水线端到端基准（本地确定性LLM + 生成的业务库）")
+    parser.add_argument('--scales', type=_int_list, default=[10000, 100000], help='业务库行数，逗号分隔')
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 4], help='并发会话数，逗号分隔')
+    parser.add_argument('--iterations', type=int, default=1, help='每个会话运行问题集的次数')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='桩LLM每次调用注入的延迟（秒）')
+    parser.add_argument('--seed', type=int, default=42, help='数据生成的随机种子')
+    parser.add_argument('--work-dir', default=None, help='保留生成的数据库和图表的目录（默认临时目录）')
+    parser.add_argument('--output', default=None, help='结果JSON路径，默认在当前目录按时间戳命名')
+    parser.add_argument('--baseline', default=None, help='与之对比的基线结果JSON，有回退时以非零状态退出')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='判定回退的相对变化阈值')
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.scales, args.concurrency, iterations=args.iterations,
+                           llm_latency=args.llm_latency, seed=args.seed, work_dir=args.work_dir)
+    output = args.output or build_result_path()
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_results(json.load(f), result, args.tolerance)
+        if regressions:
+            print("性能回退:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("与基线相比没有超出容差的回退。")
+
+if __name__ == "__main__":
+    main()
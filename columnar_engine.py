@@ -0,0 +1,1086 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式内存分析引擎模块
+将订单事实表载入NumPy列数组（字符串列字典编码、订单日期按日期类型存储），
+用向量化算子直接回答简单的过滤/分组/聚合查询，不支持的查询交回SQLite执行
+"""
+
+import math
+import re
+import sqlite3
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Dict, Optional, Any, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from metrics import metrics
+from stats_catalog import sqlite_path_from_uri
+from rollups import tokenize_sql, SqlToken
+
+logger = logging.getLogger(__name__)
+
+_DATE_VALUE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_NUMERIC_TEXT = re.compile(r'^\s*[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?\s*$')
+_STRFTIME_FORMAT = re.compile(r'%[Ymd%]|[^%]')
+_DATE_MODIFIER = re.compile(r'^\s*([+-]?\d+)\s+days?\s*$', re.IGNORECASE)
+_AGGREGATES = {'SUM', 'TOTAL', 'COUNT', 'AVG', 'MIN', 'MAX'}
+_COMPARISONS = {'=': 'eq', '==': 'eq', '!=': 'ne', '<>': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge'}
+_FLIPPED = {'eq': 'eq', 'ne': 'ne', 'lt': 'gt', 'le': 'ge', 'gt': 'lt', 'ge': 'le'}
+_STOP_WORDS = {'FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'AND', 'OR', 'ASC', 'DESC',
+               'JOIN', 'INNER', 'LEFT', 'RIGHT', 'CROSS', 'NATURAL', 'ON', 'USING', 'UNION', 'EXCEPT',
+               'INTERSECT', 'WINDOW', 'AS', 'BY'}
+_OPERATORS = {
+    'eq': lambda a, b: a == b, 'ne': lambda a, b: a != b, 'lt': lambda a, b: a < b,
+    'le': lambda a, b: a <= b, 'gt': lambda a, b: a > b, 'ge': lambda a, b: a >= b,
+}
+
+def column_affinity(declared_type: str) -> str:
+    """按SQLite规则由声明类型确定列亲和性"""
+    declared = (declared_type or '').upper()
+    if 'INT' in declared:
+        return 'INTEGER'
+    if any(word in declared for word in ('CHAR', 'CLOB', 'TEXT')):
+        return 'TEXT'
+    if not declared or 'BLOB' in declared:
+        return 'BLOB'
+    if any(word in declared for word in ('REAL', 'FLOA', 'DOUB')):
+        return 'REAL'
+    return 'NUMERIC'
+
+def sqlite_round(value: Optional[float], digits: int = 0) -> Optional[float]:
+    """与SQLite round() 一致的四舍五入
+
+    SQLite 先按15位有效数字格式化再四舍五入（远离零方向进位），结果总是浮点数。
+    """
+    if value is None:
+        return None
+    quantum = Decimal(1).scaleb(-min(max(digits, 0), 30))
+    return float(Decimal(format(value, '.15g')).quantize(quantum, rounding=ROUND_HALF_UP))
+
+def format_result_rows(rows: List[tuple], max_string_length: int = 300) -> str:
+    """按 SQLDatabase.run 的格式输出结果（元组列表的字符串，过长字符串截断）"""
+    def truncate(value):
+        if not isinstance(value, str) or max_string_length <= 0 or len(value) <= max_string_length:
+            return value
+        return value[:max_string_length - 3].rsplit(" ", 1)[0] + "..."
+    if not rows:
+        return ""
+    return str([tuple(truncate(value) for value in row) for row in rows])
+
+class _Unsupported(Exception):
+    """查询超出列式引擎支持的范围，交回SQLite执行"""
+
+# ---------------------------------------------------------------------------
+# 列存储
+# ---------------------------------------------------------------------------
+
+@dataclass
+class DictColumn:
+    """字典编码的字符串列：codes 为类别下标（-1 表示NULL），categories 按SQLite BINARY顺序排序"""
+    codes: np.ndarray
+    categories: List[str]
+    affinity: Optional[str] = 'TEXT'  # 函数结果没有亲和性
+    is_date: bool = False  # 类别均为规范的 YYYY-MM-DD 日期
+
+@dataclass
+class NumericColumn:
+    """数值列：values 为 int64（全部为整数）或 float64，nulls 标记NULL"""
+    values: np.ndarray
+    nulls: np.ndarray
+    affinity: str = 'NUMERIC'
+
+    @property
+    def integral(self) -> np.ndarray:
+        """每个值在SQLite中是否以整数存储"""
+        if self.values.dtype.kind == 'i':
+            return np.ones(len(self.values), dtype=bool)
+        if self.affinity in ('INTEGER', 'NUMERIC'):
+            # 数值亲和性会把可无损转换的实数存为整数
+            return (self.values == np.floor(self.values)) & (np.abs(self.values) < 2 ** 63)
+        return np.zeros(len(self.values), dtype=bool)
+
+@dataclass
+class DateColumn:
+    """日期列：days 为距1970-01-01的天数（datetime64[D]），nulls 标记NULL"""
+    days: np.ndarray
+    nulls: np.ndarray
+    affinity: str = 'NUMERIC'
+    _dict_view: Optional[DictColumn] = field(default=None, repr=False)
+
+    def as_dict(self) -> DictColumn:
+        """按天编码的字典视图（类别为区间内每一天的ISO日期）"""
+        if self._dict_view is None:
+            valid = self.days[~self.nulls].astype(np.int64)
+            start = int(valid.min()) if len(valid) else 0
+            end = int(valid.max()) if len(valid) else -1
+            categories = [str(day) for day in np.arange(start, end + 1).astype('datetime64[D]')]
+            codes = np.where(self.nulls, -1, self.days.astype(np.int64) - start).astype(np.int32)
+            self._dict_view = DictColumn(codes, categories, self.affinity, is_date=True)
+        return self._dict_view
+
+Column = Union[DictColumn, NumericColumn, DateColumn]
+
+@dataclass
+class ColumnarTable:
+    """载入内存的表"""
+    name: str
+    row_count: int
+    columns: Dict[str, Column]  # 小写列名 -> 列
+    unsupported: List[str] = field(default_factory=list)  # 混合存储类型、不能载入的列
+    loaded_at: Optional[str] = None
+
+    def nbytes(self) -> int:
+        total = 0
+        for column in self.columns.values():
+            if isinstance(column, DictColumn):
+                total += column.codes.nbytes + sum(len(c.encode('utf-8')) for c in column.categories)
+            elif isinstance(column, NumericColumn):
+                total += column.values.nbytes + column.nulls.nbytes
+            else:
+                total += column.days.nbytes + column.nulls.nbytes
+        return total
+
+class _ColumnBuilder:
+    """分块累积一列数据，记录出现过的存储类型"""
+
+    def __init__(self, affinity: str):
+        self.affinity = affinity
+        self.storage = set()  # 'text' / 'integer' / 'real' / 'other'
+        self.text_chunks: List[Tuple[np.ndarray, np.ndarray]] = []  # (块内编码, 块内类别)
+        self.numeric_chunks: List[np.ndarray] = []
+
+    def add(self, values: np.ndarray):
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        if kind == 'empty':
+            # 全部为NULL的块按已出现的存储类型处理
+            self.text_chunks.append((np.full(len(values), -1, dtype=np.int64), np.empty(0, dtype=object)))
+            self.numeric_chunks.append(values)
+        elif kind == 'string':
+            self.storage.add('text')
+            codes, uniques = pd.factorize(values)
+            self.text_chunks.append((codes, np.asarray(uniques, dtype=object)))
+        elif kind in ('integer', 'floating', 'mixed-integer-float'):
+            self.storage.add('integer' if kind == 'integer' else 'real')
+            if kind == 'mixed-integer-float':
+                self.storage.add('integer')
+            self.numeric_chunks.append(values)
+        else:
+            self.storage.add('other')
+
+    def supported(self) -> bool:
+        if 'other' in self.storage or ('text' in self.storage and len(self.storage) > 1):
+            return False
+        # 无类型列中整数和实数混存时无法从数组还原每个值的存储类型
+        return not ({'integer', 'real'} <= self.storage and self.affinity == 'BLOB')
+
+    def build(self) -> Column:
+        if 'text' in self.storage:
+            return self._build_text()
+        raw = np.concatenate(self.numeric_chunks) if self.numeric_chunks else np.empty(0, dtype=object)
+        nulls = pd.isna(raw).astype(bool)
+        filled = np.where(nulls, 0, raw)
+        values = filled.astype(np.float64 if 'real' in self.storage else np.int64)
+        return NumericColumn(values, nulls, self.affinity)
+
+    def _build_text(self) -> Column:
+        # 合并各块的类别：np.unique 按码点排序，与SQLite BINARY（UTF-8字节序）一致
+        all_uniques = np.concatenate([uniques for _, uniques in self.text_chunks])
+        categories, inverse = np.unique(all_uniques, return_inverse=True)
+        parts, offset = [], 0
+        for codes, uniques in self.text_chunks:
+            mapping = np.append(inverse[offset:offset + len(uniques)], -1)
+            parts.append(mapping[codes].astype(np.int32))  # 块内编码-1（NULL）映射到末尾的-1
+            offset += len(uniques)
+        codes = np.concatenate(parts)
+        categories = categories.tolist()
+        if categories and all(_DATE_VALUE.match(value) for value in categories):
+            try:
+                days = np.array(categories, dtype='datetime64[D]').astype(np.int32)
+                nulls = codes < 0
+                return DateColumn(np.where(nulls, 0, days[np.maximum(codes, 0)]).astype(np.int32), nulls, self.affinity)
+            except ValueError:
+                pass  # 形如日期但不合法（如2024-02-30），按字符串处理
+        return DictColumn(codes, categories, self.affinity)
+
+def load_table(conn: sqlite3.Connection, table: str, chunk_size: int = 200000,
+               max_rows: Optional[int] = None) -> Optional[ColumnarTable]:
+    """将一张表载入为列数组
+
+    按读到的值判断每列的存储类型：全部为文本的列字典编码（全部为规范日期时存为日期列），
+    全部为数值的列存为数组，混合类型的列不载入（引用这些列的查询交回SQLite）。
+
+    Returns:
+        Optional[ColumnarTable]: 行数超过 max_rows 时返回None
+    """
+    quoted_table = '"' + table.replace('"', '""') + '"'
+    row_count = conn.execute(f'SELECT COUNT(*) FROM {quoted_table}').fetchone()[0]
+    if max_rows and row_count > max_rows:
+        logger.warning(f"Table {table} has {row_count} rows (> {max_rows}), not loaded into columnar engine")
+        return None
+
+    info = conn.execute(f'PRAGMA table_info({quoted_table})').fetchall()
+    builders = {row[1]: _ColumnBuilder(column_affinity(row[2])) for row in info}
+    select = ", ".join('"' + name.replace('"', '""') + '"' for name in builders)
+    cursor = conn.execute(f'SELECT {select} FROM {quoted_table}')
+    row_count = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        row_count += len(rows)
+        for builder, values in zip(builders.values(), zip(*rows)):
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+            builder.add(array)
+
+    columns: Dict[str, Column] = {}
+    unsupported = []
+    for name, builder in builders.items():
+        if builder.supported():
+            columns[name.lower()] = builder.build()
+        else:
+            unsupported.append(name.lower())
+    return ColumnarTable(table, row_count, columns, unsupported, datetime.now().isoformat())
+
+# ---------------------------------------------------------------------------
+# SQL解析（只接受单表的过滤/分组/聚合查询）
+# ---------------------------------------------------------------------------
+
+# 表达式用可哈希的元组表示，便于判断 SELECT / GROUP BY / ORDER BY 中的表达式是否相同：
+#   ('col', 名称) ('lit', 值) ('star',) ('fn', 函数名, 参数元组) ('agg', 函数名, 参数, 是否DISTINCT)
+
+@dataclass
+class _Query:
+    table: str
+    items: List[Tuple[tuple, Optional[str]]]
+    where: List[tuple] = field(default_factory=list)
+    group: List[tuple] = field(default_factory=list)
+    having: List[tuple] = field(default_factory=list)
+    order: List[Tuple[tuple, bool]] = field(default_factory=list)
+    limit: Optional[int] = None
+    offset: int = 0
+
+class _Parser:
+    """递归下降解析器"""
+
+    def __init__(self, tokens: List[SqlToken]):
+        self.tokens = tokens
+        self.position = 0
+        self.qualifiers = set()
+
+    def peek(self, offset: int = 0) -> Optional[SqlToken]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def next(self) -> SqlToken:
+        token = self.peek()
+        if token is None:
+            raise _Unsupported("unexpected end of query")
+        self.position += 1
+        return token
+
+    def accept(self, text: str) -> bool:
+        token = self.peek()
+        if token is not None and (token.upper == text or (token.kind == 'op' and token.text == text)):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text: str):
+        if not self.accept(text):
+            raise _Unsupported(f"expected {text}")
+
+    def parse(self) -> _Query:
+        self.qualifiers = self.scan_qualifiers()
+        self.expect('SELECT')
+        if self.accept('DISTINCT'):
+            raise _Unsupported("DISTINCT")
+        self.accept('ALL')
+        items = [self.parse_item()]
+        while self.accept(','):
+            items.append(self.parse_item())
+
+        self.expect('FROM')
+        table = self.next()
+        if not table.is_identifier():
+            raise _Unsupported("FROM must name a table")
+        if self.accept('AS') or (self.peek() is not None and self.peek().is_identifier()
+                                 and self.peek().upper not in _STOP_WORDS):
+            self.next()
+        query = _Query(table=table.name, items=items)
+
+        if self.accept('WHERE'):
+            query.where = self.parse_condition()
+        if self.accept('GROUP'):
+            self.expect('BY')
+            query.group = [self.parse_expr()]
+            while self.accept(','):
+                query.group.append(self.parse_expr())
+        if self.accept('HAVING'):
+            query.having = self.parse_condition()
+        if self.accept('ORDER'):
+            self.expect('BY')
+            query.order = [self.parse_order_item()]
+            while self.accept(','):
+                query.order.append(self.parse_order_item())
+        if self.accept('LIMIT'):
+            query.limit = self.parse_integer()
+            if self.accept('OFFSET'):
+                query.offset = self.parse_integer()
+            elif self.accept(','):
+                query.offset, query.limit = query.limit, self.parse_integer()
+        self.accept(';')
+        if self.peek() is not None:
+            raise _Unsupported(f"unexpected token {self.peek().text}")
+        return query
+
+    def scan_qualifiers(self) -> set:
+        """预先找出 FROM 后的表名和别名（SELECT 列表中的 别名.列 出现在 FROM 之前）"""
+        depth = 0
+        for i, token in enumerate(self.tokens):
+            depth += (token.text == '(') - (token.text == ')')
+            if depth == 0 and token.upper == 'FROM' and i + 1 < len(self.tokens):
+                names = {self.tokens[i + 1].name}
+                following = self.tokens[i + 2:i + 4]
+                if following and following[0].upper == 'AS' and len(following) > 1:
+                    names.add(following[1].name)
+                elif following and following[0].is_identifier() and following[0].upper not in _STOP_WORDS:
+                    names.add(following[0].name)
+                return names
+        return set()
+
+    def parse_item(self) -> Tuple[tuple, Optional[str]]:
+        if self.peek() is not None and self.peek().text == '*':
+            raise _Unsupported("SELECT *")
+        expr = self.parse_expr()
+        alias = None
+        if self.accept('AS'):
+            alias = self.next().name
+        elif self.peek() is not None and self.peek().is_identifier() and self.peek().upper not in _STOP_WORDS:
+            alias = self.next().name
+        return expr, alias
+
+    def parse_order_item(self) -> Tuple[tuple, bool]:
+        expr = self.parse_expr()
+        descending = False
+        if self.accept('DESC'):
+            descending = True
+        else:
+            self.accept('ASC')
+        if self.peek() is not None and self.peek().upper in ('NULLS', 'COLLATE'):
+            raise _Unsupported("NULLS / COLLATE")
+        return expr, descending
+
+    def parse_integer(self) -> int:
+        negative = self.accept('-')
+        token = self.next()
+        if token.kind != 'number' or not token.text.isdigit():
+            raise _Unsupported("LIMIT / OFFSET must be an integer literal")
+        return -int(token.text) if negative else int(token.text)
+
+    def parse_expr(self) -> tuple:
+        expr = self.parse_primary()
+        token = self.peek()
+        if token is not None and token.kind == 'op' and token.text in ('+', '-', '*', '/', '%', '||'):
+            raise _Unsupported("arithmetic expressions")
+        return expr
+
+    def parse_primary(self) -> tuple:
+        token = self.next()
+        if token.kind == 'number':
+            return ('lit', self.number(token.text))
+        if token.kind == 'op' and token.text == '-' and self.peek() is not None and self.peek().kind == 'number':
+            return ('lit', -self.number(self.next().text))
+        if token.kind == 'string':
+            return ('lit', token.text[1:-1].replace("''", "'"))
+        if token.kind == 'op' and token.text == '(':
+            expr = self.parse_expr()
+            self.expect(')')
+            return expr
+        if token.upper == 'NULL':
+            return ('lit', None)
+        if token.kind == 'word' and self.peek() is not None and self.peek().text == '(':
+            self.next()
+            name = token.upper
+            if self.accept('*'):
+                self.expect(')')
+                return ('agg', name, ('star',), False) if name == 'COUNT' else self.unsupported(name)
+            distinct = self.accept('DISTINCT')
+            args = []
+            if not self.accept(')'):
+                args.append(self.parse_expr())
+                while self.accept(','):
+                    args.append(self.parse_expr())
+                self.expect(')')
+            if name in _AGGREGATES:
+                if len(args) != 1:
+                    raise _Unsupported(f"{name} with {len(args)} arguments")
+                return ('agg', name, args[0], distinct)
+            if distinct:
+                raise _Unsupported("DISTINCT outside aggregate")
+            return self.constant_function(name, args) or ('fn', name, tuple(args))
+        if token.is_identifier():
+            if self.peek() is not None and self.peek().text == '.':
+                if token.name not in self.qualifiers:
+                    raise _Unsupported(f"unknown qualifier {token.text}")
+                self.next()
+                column = self.next()
+                if not column.is_identifier():
+                    raise _Unsupported("qualified *")
+                return ('col', column.name)
+            return ('col', token.name)
+        raise _Unsupported(f"unexpected token {token.text}")
+
+    @staticmethod
+    def number(text: str) -> Union[int, float]:
+        return int(text) if text.isdigit() else float(text)
+
+    @staticmethod
+    def unsupported(name: str):
+        raise _Unsupported(f"{name}(*)")
+
+    @staticmethod
+    def constant_function(name: str, args: List[tuple]) -> Optional[tuple]:
+        """在查询时求值 date('now', '±N days') 这类常量表达式（UTC日期，与SQLite一致）"""
+        if name != 'DATE' or not args or args[0] != ('lit', 'now'):
+            return None
+        day = datetime.now(timezone.utc).date()
+        for arg in args[1:]:
+            match = _DATE_MODIFIER.match(arg[1]) if arg[0] == 'lit' and isinstance(arg[1], str) else None
+            if not match:
+                raise _Unsupported("date() modifier")
+            day += timedelta(days=int(match.group(1)))
+        return ('lit', day.isoformat())
+
+    def parse_condition(self) -> List[tuple]:
+        predicates = self.parse_predicate()
+        while self.accept('AND'):
+            predicates += self.parse_predicate()
+        if self.peek() is not None and self.peek().upper == 'OR':
+            raise _Unsupported("OR")
+        return predicates
+
+    def parse_predicate(self) -> List[tuple]:
+        token = self.peek()
+        if token is not None and token.text == '(' and not self.is_parenthesized_expr():
+            self.next()
+            predicates = self.parse_condition()
+            self.expect(')')
+            return predicates
+        if token is not None and token.upper == 'NOT':
+            raise _Unsupported("NOT")
+
+        left = self.parse_expr()
+        negate = self.accept('NOT')
+        if not negate and self.accept('IS'):
+            is_not = self.accept('NOT')
+            self.expect('NULL')
+            return [('null', left, not is_not)]
+        if self.accept('BETWEEN'):
+            low = self.parse_literal()
+            self.expect('AND')
+            high = self.parse_literal()
+            if negate:
+                return [('not_between', left, low, high)]
+            return [('cmp', left, 'ge', low), ('cmp', left, 'le', high)]
+        if self.accept('IN'):
+            self.expect('(')
+            values = [self.parse_literal()]
+            while self.accept(','):
+                values.append(self.parse_literal())
+            self.expect(')')
+            return [('in', left, tuple(values), negate)]
+        if self.accept('LIKE'):
+            pattern = self.parse_literal()
+            if self.peek() is not None and self.peek().upper == 'ESCAPE':
+                raise _Unsupported("LIKE ESCAPE")
+            if not isinstance(pattern, str):
+                raise _Unsupported("LIKE with non-text pattern")
+            return [('like', left, pattern, negate)]
+        if negate:
+            raise _Unsupported("NOT")
+
+        token = self.next()
+        if token.kind != 'op' or token.text not in _COMPARISONS:
+            raise _Unsupported(f"operator {token.text}")
+        operator = _COMPARISONS[token.text]
+        right = self.parse_expr()
+        if right[0] == 'lit' and left[0] != 'lit':
+            return [('cmp', left, operator, right[1])]
+        if left[0] == 'lit' and right[0] != 'lit':
+            return [('cmp', right, _FLIPPED[operator], left[1])]
+        raise _Unsupported("comparison must be between an expression and a literal")
+
+    def parse_literal(self):
+        expr = self.parse_expr()
+        if expr[0] != 'lit' or expr[1] is None:
+            raise _Unsupported("expected a literal")
+        return expr[1]
+
+    def is_parenthesized_expr(self) -> bool:
+        """判断左括号开始的是表达式（如 (col) = 1）还是条件分组"""
+        depth = 0
+        for i in range(self.position, len(self.tokens)):
+            text = self.tokens[i].text
+            if text == '(':
+                depth += 1
+            elif text == ')':
+                depth -= 1
+                if depth == 0:
+                    following = self.tokens[i + 1] if i + 1 < len(self.tokens) else None
+                    return following is not None and (following.text in _COMPARISONS
+                                                      or following.upper in ('IS', 'IN', 'LIKE', 'BETWEEN', 'NOT'))
+        return False
+
+# ---------------------------------------------------------------------------
+# 向量化执行
+# ---------------------------------------------------------------------------
+
+Vector = Union[DictColumn, NumericColumn]
+
+class _Executor:
+    """在一张列式表上执行解析后的查询"""
+
+    def __init__(self, table: ColumnarTable):
+        self.table = table
+        self._cache: Dict[tuple, Vector] = {}
+
+    def run(self, query: _Query) -> List[tuple]:
+        mask = None
+        for predicate in query.where:
+            predicate_mask = self.predicate_mask(predicate)
+            mask = predicate_mask if mask is None else mask & predicate_mask
+        rows = np.flatnonzero(mask) if mask is not None else None
+
+        aliases = {alias: expr for expr, alias in query.items if alias}
+        group = [self.resolve(expr, query.items, aliases) for expr in query.group]
+        if not group and not any(self.has_aggregate(expr) for expr, _ in query.items):
+            raise _Unsupported("plain projection")
+
+        # 输出列：SELECT 各项 + ORDER BY / HAVING 中额外需要的表达式
+        outputs = [expr for expr, _ in query.items]
+        order = []
+        for expr, descending in query.order:
+            resolved = self.resolve(expr, query.items, aliases)
+            if resolved not in outputs:
+                outputs.append(resolved)
+            order.append((outputs.index(resolved), descending))
+        having = []
+        for predicate in query.having:
+            if predicate[0] != 'cmp' or isinstance(predicate[3], str):
+                raise _Unsupported("HAVING predicate")
+            resolved = self.resolve(predicate[1], query.items, aliases)
+            if resolved not in outputs:
+                outputs.append(resolved)
+            having.append((outputs.index(resolved), predicate[2], predicate[3]))
+
+        group_index, group_count, key_values = self.group_rows(group, rows)
+        columns = [self.output_column(expr, group, key_values, group_index, group_count, rows) for expr in outputs]
+        result = [list(row) for row in zip(*columns)] if columns else []
+
+        for position, operator, value in having:
+            result = [row for row in result if row[position] is not None and isinstance(row[position], (int, float))
+                      and _OPERATORS[operator](row[position], value)]
+        for position, descending in reversed(order):
+            # SQLite 中 NULL 最小：升序在前、降序在后
+            result.sort(key=lambda row: (row[position] is not None, row[position] if row[position] is not None else 0),
+                        reverse=descending)
+        if query.offset:
+            result = result[query.offset:]
+        if query.limit is not None and query.limit >= 0:
+            result = result[:query.limit]
+        width = len(query.items)
+        return [tuple(row[:width]) for row in result]
+
+    @staticmethod
+    def has_aggregate(expr: tuple) -> bool:
+        if expr[0] == 'agg':
+            return True
+        if expr[0] == 'fn':
+            return any(_Executor.has_aggregate(arg) for arg in expr[2])
+        return False
+
+    def resolve(self, expr: tuple, items: List[Tuple[tuple, Optional[str]]], aliases: Dict[str, tuple]) -> tuple:
+        """解析 GROUP BY / ORDER BY 中的序号和别名"""
+        if expr[0] == 'lit' and isinstance(expr[1], int) and not isinstance(expr[1], bool):
+            if not 1 <= expr[1] <= len(items):
+                raise _Unsupported("column ordinal out of range")
+            return items[expr[1] - 1][0]
+        if expr[0] == 'col' and expr[1] not in self.table.columns and expr[1] in aliases:
+            return aliases[expr[1]]
+        if expr[0] == 'col' and expr[1] in aliases and aliases[expr[1]] != expr:
+            raise _Unsupported("alias shadows a column")
+        return expr
+
+    def vector(self, expr: tuple) -> Vector:
+        """求值非聚合表达式（列或作用于字符串/日期列的函数）"""
+        if expr in self._cache:
+            return self._cache[expr]
+        if expr[0] == 'col':
+            if expr[1] in self.table.unsupported or expr[1] not in self.table.columns:
+                raise _Unsupported(f"column {expr[1]}")
+            column = self.table.columns[expr[1]]
+            result = column.as_dict() if isinstance(column, DateColumn) else column
+        elif expr[0] == 'fn':
+            result = self.function(expr[1], expr[2])
+        else:
+            raise _Unsupported(f"expression {expr[0]}")
+        self._cache[expr] = result
+        return result
+
+    def function(self, name: str, args: Tuple[tuple, ...]) -> DictColumn:
+        """对字典的每个类别求值标量函数，得到新的字典编码列"""
+        if name == 'STRFTIME' and len(args) == 2 and args[0][0] == 'lit' and isinstance(args[0][1], str):
+            source = self.dict_vector(args[1], require_date=True)
+            parts = _STRFTIME_FORMAT.findall(args[0][1])
+            if ''.join(parts) != args[0][1]:
+                raise _Unsupported("strftime format")
+            slices = {'%Y': slice(0, 4), '%m': slice(5, 7), '%d': slice(8, 10)}
+
+            def transform(value):
+                return ''.join(value[slices[part]] if part in slices else '%' if part == '%%' else part
+                               for part in parts)
+        elif name == 'DATE' and len(args) == 1:
+            source = self.dict_vector(args[0], require_date=True)
+
+            def transform(value):
+                return value
+        elif name in ('SUBSTR', 'SUBSTRING') and len(args) in (2, 3):
+            source = self.dict_vector(args[0])
+            bounds = [arg[1] for arg in args[1:] if arg[0] == 'lit' and isinstance(arg[1], int)]
+            if len(bounds) != len(args) - 1 or bounds[0] < 1 or (len(bounds) == 2 and bounds[1] < 0):
+                raise _Unsupported("substr arguments")
+            start = bounds[0] - 1
+            stop = start + bounds[1] if len(bounds) == 2 else None
+
+            def transform(value):
+                return value[start:stop]
+        elif name in ('UPPER', 'LOWER') and len(args) == 1:
+            source = self.dict_vector(args[0])
+            # SQLite 内置的 upper/lower 只转换ASCII字母
+            table = (str.maketrans('abcdefghijklmnopqrstuvwxyz', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ') if name == 'UPPER'
+                     else str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'))
+
+            def transform(value):
+                return value.translate(table)
+        else:
+            raise _Unsupported(f"function {name}")
+
+        mapped = [transform(value) for value in source.categories]
+        categories = sorted(set(mapped))
+        position = {value: i for i, value in enumerate(categories)}
+        remap = np.array([position[value] for value in mapped] + [-1], dtype=np.int32)
+        is_date = source.is_date and name == 'DATE'
+        return DictColumn(remap[source.codes], categories, affinity=None, is_date=is_date)
+
+    def dict_vector(self, expr: tuple, require_date: bool = False) -> DictColumn:
+        vector = self.vector(expr)
+        if not isinstance(vector, DictColumn) or (require_date and not vector.is_date):
+            raise _Unsupported("function argument must be a text/date column")
+        return vector
+
+    # ----- 过滤 -----
+
+    def predicate_mask(self, predicate: tuple) -> np.ndarray:
+        kind, expr = predicate[0], predicate[1]
+        vector = self.vector(expr)
+        if kind == 'null':
+            nulls = vector.codes < 0 if isinstance(vector, DictColumn) else vector.nulls
+            return nulls if predicate[2] else ~nulls
+        if kind == 'cmp':
+            return self.compare(vector, predicate[2], predicate[3])
+        if kind == 'not_between':
+            return self.compare(vector, 'lt', predicate[2]) | self.compare(vector, 'gt', predicate[3])
+        if kind == 'in':
+            mask = np.zeros(self.length(vector), dtype=bool)
+            for value in predicate[2]:
+                mask |= self.compare(vector, 'eq', value)
+            if predicate[3]:
+                not_null = vector.codes >= 0 if isinstance(vector, DictColumn) else ~vector.nulls
+                mask = ~mask & not_null
+            return mask
+        if kind == 'like':
+            if not isinstance(vector, DictColumn):
+                raise _Unsupported("LIKE on numeric column")
+            regex = self.like_regex(predicate[2])
+            matches = [bool(regex.match(value)) != predicate[3] for value in vector.categories]
+            return np.array(matches + [False], dtype=bool)[vector.codes]
+        raise _Unsupported(f"predicate {kind}")
+
+    @staticmethod
+    def length(vector: Vector) -> int:
+        return len(vector.codes) if isinstance(vector, DictColumn) else len(vector.values)
+
+    @staticmethod
+    def like_regex(pattern: str):
+        """LIKE 模式转正则：% 任意串、_ 任意单字符，只对ASCII字母不区分大小写"""
+        parts = ['.*' if ch == '%' else '.' if ch == '_' else re.escape(ch) for ch in pattern]
+        return re.compile(''.join(parts) + r'\Z', re.IGNORECASE | re.ASCII | re.DOTALL)
+
+    def compare(self, vector: Vector, operator: str, value) -> np.ndarray:
+        """列与常量比较（遵循SQLite的亲和性转换，无法确定语义时交回SQLite）"""
+        if value is None:
+            return np.zeros(self.length(vector), dtype=bool)
+        function = _OPERATORS[operator]
+        if isinstance(vector, DictColumn):
+            if isinstance(value, str):
+                if vector.affinity not in (None, 'TEXT', 'BLOB') and _NUMERIC_TEXT.match(value):
+                    raise _Unsupported("numeric-looking literal against text stored in numeric column")
+            elif vector.affinity == 'TEXT' and isinstance(value, int):
+                value = str(value)
+            else:
+                raise _Unsupported("numeric literal against text values")
+            lookup = np.array([function(category, value) for category in vector.categories] + [False], dtype=bool)
+            return lookup[vector.codes]
+
+        if isinstance(value, str):
+            if vector.affinity in ('INTEGER', 'REAL', 'NUMERIC') and _NUMERIC_TEXT.match(value):
+                number = float(value)
+                value = int(number) if number.is_integer() and abs(number) < 2 ** 53 else number
+            else:
+                raise _Unsupported("text literal against numeric column")
+        return function(vector.values, value) & ~vector.nulls
+
+    # ----- 分组和聚合 -----
+
+    def group_rows(self, group: List[tuple], rows: Optional[np.ndarray]):
+        """计算每个（过滤后）行所属的分组
+
+        Returns:
+            (分组下标数组, 分组数, 每个分组键的值列表)
+        """
+        count = self.table.row_count if rows is None else len(rows)
+        if not group:
+            return np.zeros(count, dtype=np.int64), 1, []
+
+        ids, decoders, radices = [], [], []
+        for expr in group:
+            vector = self.vector(expr)
+            if self.has_aggregate(expr):
+                raise _Unsupported("aggregate in GROUP BY")
+            if isinstance(vector, DictColumn):
+                codes = vector.codes if rows is None else vector.codes[rows]
+                ids.append(codes.astype(np.int64) + 1)  # NULL 编码为0，排在最前
+                radices.append(len(vector.categories) + 1)
+                decoders.append([None] + list(vector.categories))
+            else:
+                values = vector.values if rows is None else vector.values[rows]
+                nulls = vector.nulls if rows is None else vector.nulls[rows]
+                uniques, inverse = np.unique(values[~nulls], return_inverse=True)
+                key = np.zeros(len(values), dtype=np.int64)
+                key[~nulls] = inverse + 1
+                ids.append(key)
+                radices.append(len(uniques) + 1)
+                decoders.append([None] + self.typed_values(uniques, vector.affinity))
+
+        if math.prod(radices) < 2 ** 62:
+            combined = np.zeros(count, dtype=np.int64)
+            for key, radix in zip(ids, radices):
+                combined = combined * radix + key
+            unique_keys, group_index = np.unique(combined, return_inverse=True)
+            components = []
+            for radix in reversed(radices):
+                components.append(unique_keys % radix)
+                unique_keys = unique_keys // radix
+            components.reverse()
+        else:
+            stacked = np.stack(ids, axis=1)
+            unique_rows, group_index = np.unique(stacked, axis=0, return_inverse=True)
+            components = [unique_rows[:, i] for i in range(len(ids))]
+
+        key_values = [[decoder[int(i)] for i in component] for decoder, component in zip(decoders, components)]
+        group_count = len(key_values[0]) if key_values else 0
+        return group_index.reshape(-1).astype(np.int64), group_count, key_values
+
+    def output_column(self, expr: tuple, group: List[tuple], key_values: List[list], group_index: np.ndarray,
+                      group_count: int, rows: Optional[np.ndarray]) -> list:
+        """计算每个分组的一列输出值"""
+        if expr in group:
+            return key_values[group.index(expr)]
+        if expr[0] == 'lit':
+            return [expr[1]] * group_count
+        if expr[0] == 'agg':
+            return self.aggregate(expr, group_index, group_count, rows)
+        if expr[0] == 'fn' and expr[1] == 'ROUND' and len(expr[2]) in (1, 2):
+            inner = self.output_column(expr[2][0], group, key_values, group_index, group_count, rows)
+            digits = 0
+            if len(expr[2]) == 2:
+                if expr[2][1][0] != 'lit' or not isinstance(expr[2][1][1], int):
+                    raise _Unsupported("ROUND digits")
+                digits = expr[2][1][1]
+            if any(value is not None and not isinstance(value, (int, float)) for value in inner):
+                raise _Unsupported("ROUND of text")
+            return [sqlite_round(value, digits) for value in inner]
+        raise _Unsupported("non-aggregate expression not in GROUP BY")
+
+    def aggregate(self, expr: tuple, group_index: np.ndarray, group_count: int, rows: Optional[np.ndarray]) -> list:
+        _, name, arg, distinct = expr
+        if arg == ('star',) or (arg[0] == 'lit' and arg[1] is not None and not distinct):
+            if name != 'COUNT':
+                raise _Unsupported(f"{name} of a constant")
+            return np.bincount(group_index, minlength=group_count).tolist()
+
+        vector = self.vector(arg)
+        if isinstance(vector, DictColumn):
+            codes = vector.codes if rows is None else vector.codes[rows]
+            valid = codes >= 0
+            if name == 'COUNT':
+                return self.count(group_index, group_count, valid, codes, len(vector.categories), distinct)
+            if name in ('MIN', 'MAX') and not distinct:
+                best = self.extreme(group_index[valid], codes[valid].astype(np.int64), group_count, name)
+                return [None if code is None else vector.categories[code] for code in best]
+            raise _Unsupported(f"{name} of text")
+
+        values = vector.values if rows is None else vector.values[rows]
+        valid = ~(vector.nulls if rows is None else vector.nulls[rows])
+        if name == 'COUNT':
+            if distinct:
+                uniques, inverse = np.unique(values[valid], return_inverse=True)
+                codes = np.full(len(values), -1, dtype=np.int64)
+                codes[valid] = inverse
+                return self.count(group_index, group_count, valid, codes, len(uniques), True)
+            return np.bincount(group_index[valid], minlength=group_count).tolist()
+        if distinct:
+            raise _Unsupported(f"{name}(DISTINCT)")
+
+        indexes = group_index[valid]
+        counts = np.bincount(indexes, minlength=group_count)
+        if name in ('MIN', 'MAX'):
+            best = self.extreme(indexes, values[valid], group_count, name)
+            if values.dtype.kind == 'i':
+                return best
+            present = [b for b in best if b is not None]
+            typed = iter(self.typed_values(np.array(present, dtype=np.float64), vector.affinity))
+            return [None if b is None else next(typed) for b in best]
+
+        # 与SQLite一致：按行顺序累加浮点和；分组内全部为整数时结果为整数
+        sums = np.bincount(indexes, weights=values[valid].astype(np.float64), minlength=group_count)
+        if name == 'AVG':
+            return [float(s / c) if c else None for s, c in zip(sums, counts)]
+        if name == 'TOTAL':
+            return [float(s) for s in sums]
+        non_integral = np.bincount(indexes, weights=(~vector.integral[rows if rows is not None else slice(None)]
+                                                     [valid]).astype(np.float64), minlength=group_count)
+        if values.dtype.kind == 'i' and np.abs(sums).max(initial=0) >= 2 ** 53:
+            exact = np.zeros(group_count, dtype=np.int64)
+            np.add.at(exact, indexes, values[valid])
+            sums = exact
+        return [None if not c else int(s) if not n else float(s) for s, c, n in zip(sums, counts, non_integral)]
+
+    @staticmethod
+    def typed_values(values: np.ndarray, affinity: str) -> list:
+        """数值数组转为SQLite返回的Python值（按亲和性区分整数和实数）"""
+        if values.dtype.kind == 'i':
+            return values.tolist()
+        integral = NumericColumn(values, np.zeros(len(values), dtype=bool), affinity).integral
+        return [int(v) if is_int else v for v, is_int in zip(values.tolist(), integral)]
+
+    @staticmethod
+    def count(group_index: np.ndarray, group_count: int, valid: np.ndarray, codes: np.ndarray,
+              cardinality: int, distinct: bool) -> list:
+        if not distinct:
+            return np.bincount(group_index[valid], minlength=group_count).tolist()
+        pairs = np.unique(group_index[valid] * (cardinality + 1) + codes[valid])
+        return np.bincount(pairs // (cardinality + 1), minlength=group_count).tolist()
+
+    @staticmethod
+    def extreme(indexes: np.ndarray, values: np.ndarray, group_count: int, name: str) -> list:
+        """每个分组的最小/最大值，空分组为None"""
+        if values.dtype.kind == 'f':
+            initial = np.inf if name == 'MIN' else -np.inf
+        else:
+            info = np.iinfo(np.int64)
+            initial = info.max if name == 'MIN' else info.min
+        result = np.full(group_count, initial, dtype=values.dtype)
+        (np.minimum if name == 'MIN' else np.maximum).at(result, indexes, values)
+        present = np.bincount(indexes, minlength=group_count) > 0
+        return [value if has else None for value, has in zip(result.tolist(), present)]
+
+# ---------------------------------------------------------------------------
+# 引擎
+# ---------------------------------------------------------------------------
+
+class ColumnarEngine:
+    """列式内存分析引擎
+
+    持有一个只读连接，每次查询前检查 PRAGMA data_version：数据库被其他连接修改后
+    当前数据不再使用（查询交回SQLite），并在后台线程重新载入。
+    """
+
+    def __init__(self, db_path: str, tables: Optional[List[str]] = None, max_rows: Optional[int] = None):
+        """初始化引擎（不立即载入数据）
+
+        Args:
+            db_path: 数据库文件路径或 sqlite:/// 连接URI
+            tables: 要载入的表，默认使用配置
+            max_rows: 单表最大载入行数，默认使用配置
+        """
+        self.db_path = sqlite_path_from_uri(db_path)
+        self.table_names = [name.lower() for name in (tables or Config.COLUMNAR_TABLES)]
+        self.max_rows = max_rows if max_rows is not None else Config.COLUMNAR_MAX_ROWS
+
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tables: Dict[str, ColumnarTable] = {}
+        self._data_version: Optional[int] = None
+        self._failed_version: Optional[int] = None
+        self._reload_thread: Optional[threading.Thread] = None
+        self._metrics = {'hits': 0, 'fallbacks': 0, 'stale': 0, 'reloads': 0, 'load_seconds': 0.0}
+        metrics.register_cache('columnar_engine', self.cache_stats)
+
+    def load(self) -> bool:
+        """同步载入（或重新载入）配置的表
+
+        Returns:
+            bool: 是否载入成功
+        """
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                start_time = time.perf_counter()
+                existing = {row[0].lower(): row[0] for row in self._conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'")}
+                tables = {}
+                for name in self.table_names:
+                    if name in existing:
+                        table = load_table(self._conn, existing[name], max_rows=self.max_rows)
+                        if table is not None:
+                            tables[name] = table
+                # 载入期间数据又被修改时，沿用载入前的版本号，下次查询会再次触发载入
+                self._tables = tables
+                self._data_version = data_version
+                self._failed_version = None
+                elapsed = time.perf_counter() - start_time
+                self._metrics['reloads'] += 1
+                self._metrics['load_seconds'] = elapsed
+                logger.info(f"Columnar engine loaded {[(t.name, t.row_count) for t in tables.values()]} "
+                            f"from {self.db_path} in {elapsed:.2f}s "
+                            f"({sum(t.nbytes() for t in tables.values()) / 1e6:.1f} MB)")
+                return True
+            except (sqlite3.Error, ValueError, MemoryError) as e:
+                self._failed_version = self._current_version()
+                logger.warning(f"Columnar engine failed to load {self.db_path}: {e}")
+                return False
+
+    def is_fresh(self) -> bool:
+        """已载入的数据是否与数据库一致"""
+        with self._lock:
+            return self._data_version is not None and self._current_version() == self._data_version
+
+    def query(self, sql: str) -> Optional[List[tuple]]:
+        """用已载入的数据回答查询
+
+        Returns:
+            Optional[List[tuple]]: 结果行；查询不受支持、表未载入或数据已过期时返回None
+        """
+        if not isinstance(sql, str):
+            return None
+        tokens = tokenize_sql(sql.strip())
+        if not tokens:
+            return None
+        try:
+            parsed = _Parser(tokens).parse()
+        except _Unsupported as e:
+            logger.debug(f"Columnar engine cannot parse query ({e}): {sql}")
+            return None
+
+        with self._lock:
+            table = self._tables.get(parsed.table)
+            if table is None or not self.is_fresh():
+                return None
+        try:
+            return _Executor(table).run(parsed)
+        except _Unsupported as e:
+            logger.debug(f"Columnar engine fallback ({e}): {sql}")
+            return None
+
+    def execute(self, sql: str) -> Optional[str]:
+        """Text2SQL / Text2Viz 执行步骤的入口：返回与 SQLDatabase.run 相同格式的结果字符串
+
+        引擎未启用、查询不受支持或数据过期时返回None（由调用方交回SQLite执行）；
+        数据过期时在后台重新载入。
+        """
+        if not Config.COLUMNAR_ENGINE:
+            return None
+        if not self.is_fresh():
+            self._metrics['stale'] += 1
+            self.reload_async()
+            return None
+        start_time = time.perf_counter()
+        try:
+            rows = self.query(sql)
+        except Exception as e:  # 引擎异常不能影响查询，交回SQLite
+            logger.warning(f"Columnar engine error, falling back to SQLite: {e}", exc_info=True)
+            rows = None
+        if rows is None:
+            self._metrics['fallbacks'] += 1
+            return None
+        self._metrics['hits'] += 1
+        logger.info(f"Columnar engine answered query in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        return format_result_rows(rows)
+
+    def reload_async(self):
+        """在后台线程重新载入（已有载入任务或本版本已载入失败时不重复启动）"""
+        with self._lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return
+            if self._failed_version is not None and self._failed_version == self._current_version():
+                return
+            self._reload_thread = threading.Thread(target=self.load, name="columnar-reload", daemon=True)
+            self._reload_thread.start()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取命中、回退和载入指标"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['tables'] = {name: table.row_count for name, table in self._tables.items()}
+            return metrics
+
+    def cache_stats(self) -> Tuple[int, int]:
+        """由内存列回答的查询数和交回SQLite的查询数（不支持或数据过期）"""
+        with self._lock:
+            return self._metrics['hits'], self._metrics['fallbacks'] + self._metrics['stale']
+
+    def close(self):
+        """释放载入的数据和连接"""
+        with self._lock:
+            self._tables = {}
+            self._data_version = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _current_version(self) -> Optional[int]:
+        if self._conn is None:
+            return None
+        try:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+_engines: Dict[str, ColumnarEngine] = {}
+_engines_lock = threading.Lock()
+
+def get_columnar_engine(db_path: str) -> ColumnarEngine:
+    """获取（按数据库路径共享的）列式引擎实例，启用时在后台开始载入
+
+    Args:
+        db_path: 数据库文件路径或 sqlite:/// 连接URI
+    """
+    path = sqlite_path_from_uri(db_path)
+    with _engines_lock:
+        if path not in _engines:
+            _engines[path] = ColumnarEngine(path)
+            if Config.COLUMNAR_ENGINE:
+                _engines[path].reload_async()
+        return _engines[path]
@@ -20,10 +20,20 @@ class Config:
     
     # 数据库配置
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///data/order_database.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))  # DatabaseManager连接池大小
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "128"))  # 每个连接缓存的预编译语句数
+    ROLLUP_REWRITE: bool = os.getenv("ROLLUP_REWRITE", "True").lower() == "true"  # 聚合查询改写到汇总表
+    INGEST_CHUNK_SIZE: int = int(os.getenv("INGEST_CHUNK_SIZE", "50000"))  # 批量导入每块读取的行数
+    INGEST_DATE_FORMAT: str = os.getenv("INGEST_DATE_FORMAT", "")  # 订单日期格式（如 %Y/%m/%d），为空时逐行识别
+    COLUMNAR_ENGINE: bool = os.getenv("COLUMNAR_ENGINE", "False").lower() == "true"  # 用列式内存引擎回答简单聚合查询
+    COLUMNAR_TABLES: list = [t.strip() for t in os.getenv("COLUMNAR_TABLES", "new_fact_order_detail,sales_data").split(",") if t.strip()]  # 载入列式引擎的表
+    COLUMNAR_MAX_ROWS: int = int(os.getenv("COLUMNAR_MAX_ROWS", "5000000"))  # 列式引擎单表最大载入行数
     
     # 应用配置
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    SQL_LOG_PATH: str = os.getenv("SQL_LOG_PATH", "logs/sql_queries.jsonl")  # SQL执行日志（JSONL，后台线程写入）
+    SQL_LOG_RESULT_PREVIEW: int = int(os.getenv("SQL_LOG_RESULT_PREVIEW", "200"))  # SQL日志中结果预览的最大字符数
     
     # 可视化配置
     VIZ_IMAGE_DIR: str = os.getenv("VIZ_IMAGE_DIR", "viz_images")
@@ -33,7 +43,29 @@ class Config:
     # Gradio配置
     GRADIO_SHARE: bool = os.getenv("GRADIO_SHARE", "False").lower() == "true"
     GRADIO_PORT: Optional[int] = int(os.getenv("GRADIO_PORT", "7860")) if os.getenv("GRADIO_PORT") else None
-    
+
+    # 历史记录写入配置（异步批量写入）
+    HISTORY_ASYNC_WRITE: bool = os.getenv("HISTORY_ASYNC_WRITE", "True").lower() == "true"
+    HISTORY_QUEUE_SIZE: int = int(os.getenv("HISTORY_QUEUE_SIZE", "1000"))
+    HISTORY_BATCH_SIZE: int = int(os.getenv("HISTORY_BATCH_SIZE", "50"))
+    HISTORY_FLUSH_INTERVAL: float = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.2"))
+    HISTORY_QUEUE_POLICY: str = os.getenv("HISTORY_QUEUE_POLICY", "drop_oldest")  # block / drop_newest / drop_oldest
+    HISTORY_PAGE_SIZE: int = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+    HISTORY_POLL_INTERVAL: float = float(os.getenv("HISTORY_POLL_INTERVAL", "2"))  # 历史记录页面检查变更的间隔（秒）
+    SUGGESTION_INDEX_SIZE: int = int(os.getenv("SUGGESTION_INDEX_SIZE", "5000"))  # 启动时载入相似度索引的历史查询数
+    SUGGESTION_INDEX_MAX_SIZE: int = int(os.getenv("SUGGESTION_INDEX_MAX_SIZE", "20000"))  # 相似度索引最大记录数（0表示不限）
+    # 历史记录保留策略（0表示不限）
+    HISTORY_RETENTION_DAYS: int = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+    HISTORY_MAX_ROWS: int = int(os.getenv("HISTORY_MAX_ROWS", "100000"))
+    HISTORY_ARCHIVE_DIR: str = os.getenv("HISTORY_ARCHIVE_DIR", "data/history_archive")  # 为空表示不归档直接删除
+    HISTORY_STATS_RETENTION_DAYS: int = int(os.getenv("HISTORY_STATS_RETENTION_DAYS", "180"))
+    HISTORY_MAINTENANCE_INTERVAL: float = float(os.getenv("HISTORY_MAINTENANCE_INTERVAL", "0"))  # 维护任务间隔（秒），0表示不启动（默认不归档）
+
+    # 追踪与监控指标配置
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "True").lower() == "true"  # 记录查询流水线各阶段span并随历史记录保存
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))  # Prometheus /metrics 端口（与Gradio分开监听），0表示不启动
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")  # /metrics 监听地址（端点无认证，默认只监听本机）
+
     @classmethod
     def validate(cls) -> bool:
         """验证配置是否完整"""
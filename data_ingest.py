@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+销售数据批量导入模块
+分块读取CSV/Parquet订单文件，向量化校验和类型转换后按 order_id 幂等写入 sales_data
+
+用法:
+    python data_ingest.py data/incoming/ --db data/loreal_insight.db
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Iterator, Tuple, Set
+
+import pandas as pd
+
+from config import Config
+from database_manager import SCHEMA_SQL, upgrade_schema, bump_data_version
+from rollups import rebuild_rollups, set_rollups_deferred
+from exceptions import ConfigurationError, DataProcessingError
+
+logger = logging.getLogger(__name__)
+
+# sales_data 导入列及类型：str / date / float / int
+INGEST_SCHEMA = {
+    'order_id': 'str',
+    'order_date': 'date',
+    'product_id': 'str',
+    'product_name': 'str',
+    'category': 'str',
+    'brand': 'str',
+    'customer_id': 'str',
+    'customer_name': 'str',
+    'city': 'str',
+    'province': 'str',
+    'sales_amount': 'float',
+    'quantity': 'int',
+    'discount_amount': 'float',
+}
+REQUIRED_COLUMNS = ('order_id', 'order_date', 'sales_amount')
+# 文件中缺失时使用的默认值
+COLUMN_DEFAULTS = {'discount_amount': 0.0}
+
+CSV_EXTENSIONS = ('.csv', '.csv.gz')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+@dataclass
+class IngestResult:
+    """单个文件的导入结果"""
+    path: str
+    rows_read: int = 0
+    rows_loaded: int = 0
+    rows_rejected: int = 0
+    rejects: Dict[str, int] = field(default_factory=dict)  # 拒绝原因 -> 行数
+    data_version: Optional[int] = None
+    seconds: float = 0.0
+
+def parse_dates(raw: pd.Series, date_format: Optional[str] = None) -> pd.Series:
+    """解析日期列，无法解析的值为NaT
+
+    未指定格式时先按ISO 8601整列解析（向量化），其余非空值再逐个识别格式，
+    同一文件中混用 2019-03-05 和 2020/1/2 等写法时不会因首行推断的格式而被拒绝。
+
+    Args:
+        raw: 原始日期列
+        date_format: strftime格式，为空时自动识别
+    """
+    if date_format:
+        return pd.to_datetime(raw, format=date_format, errors='coerce')
+    parsed = pd.to_datetime(raw, format='ISO8601', errors='coerce')
+    retry = parsed.isna() & raw.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(raw[retry], format='mixed', errors='coerce')
+    return parsed
+
+def prepare_chunk(df: pd.DataFrame, date_format: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """校验并转换一块数据
+
+    所有转换均为列级向量运算。必填列为空或任意列类型转换失败的行被拒绝；
+    同一块中重复的 order_id 只保留最后一行。
+
+    Args:
+        df: 原始数据（列名与 sales_data 一致，多余列被忽略）
+        date_format: 日期列的strftime格式，为空时自动识别
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, int]]: (可写入的数据, 拒绝原因计数)
+
+    Raises:
+        DataProcessingError: 缺少必填列
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise DataProcessingError(f"导入文件缺少必填列: {', '.join(missing)}")
+
+    clean = pd.DataFrame(index=df.index)
+    rejected = pd.Series(False, index=df.index)
+    rejects: Dict[str, int] = {}
+
+    def reject(mask: pd.Series, reason: str):
+        new = mask & ~rejected
+        count = int(new.sum())
+        if count:
+            rejects[reason] = rejects.get(reason, 0) + count
+            rejected.loc[new] = True
+
+    for column, kind in INGEST_SCHEMA.items():
+        if column not in df.columns:
+            clean[column] = COLUMN_DEFAULTS.get(column)
+            continue
+
+        raw = df[column]
+        if pd.api.types.is_object_dtype(raw) or pd.api.types.is_string_dtype(raw):
+            raw = raw.astype('string').str.strip()
+            present = raw.notna() & (raw != '')
+            raw = raw.mask(~present)
+        else:
+            present = raw.notna()
+
+        if kind == 'str':
+            values = raw.astype('string')
+        elif kind == 'date':
+            values = parse_dates(raw, date_format).dt.strftime('%Y-%m-%d')
+        else:
+            values = pd.to_numeric(raw, errors='coerce')
+            if kind == 'int':
+                reject(values.notna() & (values != values.round()), f"{column}: not an integer")
+                values = values.round().astype('Int64')
+            else:
+                values = values.round(2)
+
+        reject(present & values.isna(), f"{column}: invalid {kind}")
+        if column in REQUIRED_COLUMNS:
+            reject(~present, f"{column}: missing")
+        if column in COLUMN_DEFAULTS:
+            values = values.fillna(COLUMN_DEFAULTS[column])
+        clean[column] = values
+
+    clean = clean[~rejected]
+    duplicates = clean.duplicated('order_id', keep='last')
+    if duplicates.any():
+        rejects['order_id: duplicate'] = int(duplicates.sum())
+        clean = clean[~duplicates]
+    return clean, rejects
+
+class SalesIngestor:
+    """销售数据批量导入器
+
+    每个文件在一个事务内分块 executemany 写入，失败时整文件回滚；
+    写入使用 INSERT ... ON CONFLICT(order_id) DO UPDATE，重复导入同一文件结果不变。
+    导入期间暂停汇总表触发器，提交前只重建文件涉及的月份（新行及被更新行原来所在的月份）；
+    写入了数据的文件提交时递增 data_meta 中的 data_version，全部文件完成后执行一次抽样ANALYZE。
+    """
+
+    def __init__(self, db_path: str = "data/loreal_insight.db", chunk_size: Optional[int] = None,
+                 date_format: Optional[str] = None):
+        """初始化导入器
+
+        Args:
+            db_path: 目标数据库路径
+            chunk_size: 每块读取的行数，默认使用配置
+            date_format: 订单日期的strftime格式，默认使用配置（为空时逐行识别）
+        """
+        self.db_path = db_path
+        self.chunk_size = chunk_size or Config.INGEST_CHUNK_SIZE
+        self.date_format = date_format or Config.INGEST_DATE_FORMAT or None
+
+        columns = list(INGEST_SCHEMA)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'order_id')
+        self._upsert_sql = (
+            f"INSERT INTO sales_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(order_id) DO UPDATE SET {updates}"
+        )
+
+    def ingest(self, paths: List[str]) -> List[IngestResult]:
+        """导入多个文件或目录（目录中的CSV/Parquet文件按文件名顺序导入）
+
+        Args:
+            paths: 文件或目录路径
+
+        Returns:
+            List[IngestResult]: 每个文件的导入结果
+        """
+        files = expand_paths(paths)
+        conn = self._connect()
+        try:
+            results = [self._ingest_file(conn, path) for path in files]
+            if any(result.rows_loaded for result in results):
+                conn.execute("PRAGMA analysis_limit = 1000")
+                conn.execute("ANALYZE")
+        finally:
+            conn.close()
+        return results
+
+    def ingest_file(self, path: str) -> IngestResult:
+        """导入单个文件"""
+        return self.ingest([path])[0]
+
+    def iter_chunks(self, path: str) -> Iterator[pd.DataFrame]:
+        """分块读取文件
+
+        Args:
+            path: CSV（可gzip压缩）或Parquet文件路径
+
+        Yields:
+            pd.DataFrame: 一块原始数据
+        """
+        lower = path.lower()
+        if lower.endswith(PARQUET_EXTENSIONS):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ConfigurationError("导入Parquet格式需要安装pyarrow: pip install pyarrow") from e
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=self.chunk_size):
+                yield batch.to_pandas()
+        elif lower.endswith(CSV_EXTENSIONS):
+            # 全部按字符串读取，类型转换统一在 prepare_chunk 中完成
+            yield from pd.read_csv(path, dtype=str, chunksize=self.chunk_size, encoding='utf-8-sig')
+        else:
+            raise DataProcessingError(f"不支持的导入文件格式: {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开写入连接并确保表结构为最新版本"""
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(SCHEMA_SQL)
+        upgrade_schema(conn)
+        conn.commit()
+        conn.execute("PRAGMA cache_size = -65536")
+        return conn
+
+    def _ingest_file(self, conn: sqlite3.Connection, path: str) -> IngestResult:
+        """在一个事务中导入一个文件"""
+        result = IngestResult(path=path)
+        start_time = time.perf_counter()
+        columns = list(INGEST_SCHEMA)
+
+        months: Set[str] = set()
+
+        conn.execute("BEGIN")
+        try:
+            set_rollups_deferred(conn, True)
+            for chunk in self.iter_chunks(path):
+                result.rows_read += len(chunk)
+                clean, rejects = prepare_chunk(chunk, self.date_format)
+                for reason, count in rejects.items():
+                    result.rejects[reason] = result.rejects.get(reason, 0) + count
+                    result.rows_rejected += count
+
+                months.update(self._existing_months(conn, clean['order_id']))
+                months.update(clean['order_date'].str[:7].dropna().unique())
+                rows = clean[columns].astype(object).where(clean[columns].notna(), None)
+                conn.executemany(self._upsert_sql, rows.itertuples(index=False, name=None))
+                result.rows_loaded += len(clean)
+
+            rebuild_rollups(conn, months=months)
+            set_rollups_deferred(conn, False)
+            # 没有写入任何行时不递增版本，避免依赖版本号的缓存无谓地重新统计
+            if result.rows_loaded:
+                result.data_version = bump_data_version(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Ingest failed, rolled back: {path}", exc_info=True)
+            raise
+
+        result.seconds = time.perf_counter() - start_time
+        logger.info(f"Ingested {path}: {result.rows_loaded}/{result.rows_read} rows "
+                    f"in {result.seconds:.2f}s (rejected {result.rows_rejected}: {result.rejects})")
+        return result
+
+    @staticmethod
+    def _existing_months(conn: sqlite3.Connection, order_ids: pd.Series) -> Set[str]:
+        """查询将被更新的已有订单所在的月份"""
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_order_ids (order_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM ingest_order_ids")
+        conn.executemany("INSERT OR IGNORE INTO ingest_order_ids VALUES (?)", ((v,) for v in order_ids.tolist()))
+        rows = conn.execute("""
+            SELECT DISTINCT substr(s.order_date, 1, 7)
+            FROM ingest_order_ids i JOIN sales_data s ON s.order_id = i.order_id
+        """).fetchall()
+        return {row[0] for row in rows}
+
+def expand_paths(paths: List[str]) -> List[str]:
+    """展开目录为其中的CSV/Parquet文件列表"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(CSV_EXTENSIONS + PARQUET_EXTENSIONS)
+            ))
+        else:
+            files.append(path)
+    return files
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量导入CSV/Parquet销售数据到SQLite")
+    parser.add_argument('paths', nargs='+', help='导入文件或目录')
+    parser.add_argument('--db', default='data/loreal_insight.db', help='目标数据库路径')
+    parser.add_argument('--chunk-size', type=int, default=None, help='每块读取的行数')
+    parser.add_argument('--date-format', default=None, help='订单日期格式（如 %%Y/%%m/%%d），默认逐行识别')
+    args = parser.parse_args(argv)
+
+    results = SalesIngestor(args.db, chunk_size=args.chunk_size, date_format=args.date_format).ingest(args.paths)
+    for result in results:
+        print(f"{result.path}: 导入 {result.rows_loaded:,}/{result.rows_read:,} 行，"
+              f"拒绝 {result.rows_rejected:,} 行，用时 {result.seconds:.1f} 秒，数据版本 {result.data_version}")
+        for reason, count in result.rejects.items():
+            print(f"  - {reason}: {count:,}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -6,6 +6,8 @@ import time
 import logging
 from typing import Dict, Any
 
+from language_utils import multilingual_keywords
+
 logger = logging.getLogger(__name__)
 
 class FastDataService:
@@ -17,14 +19,7 @@ class FastDataService:
     
     def is_visualization_query(self, query: str) -> bool:
         """快速判断是否为可视化查询"""
-        viz_keywords = [
-            '图表', '图形', '可视化', '趋势', '对比', '排名', '分布', 
-            '柱状图', '折线图', '饼图', '绘制', '画图',
-            'chart', 'graph', 'plot', 'trend', 'comparison', 'visualize'
-        ]
-        
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in viz_keywords)
+        return multilingual_keywords.is_visualization_query(query)
     
     def get_optimized_examples(self) -> Dict[str, list]:
         """获取基于实际数据的优化示例"""
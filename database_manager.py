@@ -8,149 +8,298 @@ import pandas as pd
 import json
 import hashlib
 import logging
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Union, Tuple
 import os
+from config import Config
+from exceptions import DatabaseError
+from metrics import metrics
+from stats_catalog import get_stats_catalog, install_change_counters
+from rollups import SALES_ROLLUPS, install_rollups, get_rollup_manager
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 业务数据库表结构
+SCHEMA_SQL = """
+-- 1. 用户管理表
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) UNIQUE NOT NULL DEFAULT 'default_user',
+    email VARCHAR(100),
+    role VARCHAR(20) DEFAULT 'user',
+    department VARCHAR(50) DEFAULT 'L''Oréal',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP,
+    is_active BOOLEAN DEFAULT 1
+);
+
+-- 2. 数据源配置表
+CREATE TABLE IF NOT EXISTS data_sources (
+    source_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_name VARCHAR(100) NOT NULL,
+    source_type VARCHAR(20) NOT NULL DEFAULT 'sqlite',
+    connection_string TEXT,
+    description TEXT,
+    is_active BOOLEAN DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 3. 优化的查询历史表
+CREATE TABLE IF NOT EXISTS query_history (
+    query_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER DEFAULT 1,
+    session_id VARCHAR(50),
+    query_type VARCHAR(20) DEFAULT 'natural_language',
+    original_query TEXT NOT NULL,
+    generated_sql TEXT,
+    query_intent VARCHAR(100),
+    execution_time_ms INTEGER DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'success',
+    error_message TEXT,
+    result_rows INTEGER DEFAULT 0,
+    result_size_kb REAL DEFAULT 0,
+    data_source_id INTEGER DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(user_id),
+    FOREIGN KEY (data_source_id) REFERENCES data_sources(source_id)
+);
+
+-- 4. 业务数据表 - 销售数据 (修复版)
+CREATE TABLE IF NOT EXISTS sales_data (
+    sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id VARCHAR(32),
+    order_date DATE NOT NULL,
+    product_id VARCHAR(20),
+    product_name VARCHAR(100),
+    category VARCHAR(50),
+    brand VARCHAR(50),
+    customer_id VARCHAR(20),
+    customer_name VARCHAR(100),
+    city VARCHAR(50),
+    province VARCHAR(50),
+    sales_amount DECIMAL(10,2),
+    quantity INTEGER,
+    discount_amount DECIMAL(10,2) DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 5. 产品主数据表
+CREATE TABLE IF NOT EXISTS products (
+    product_id VARCHAR(20) PRIMARY KEY,
+    product_name VARCHAR(100) NOT NULL,
+    category VARCHAR(50),
+    sub_category VARCHAR(50),
+    brand VARCHAR(50),
+    unit_price DECIMAL(10,2),
+    cost_price DECIMAL(10,2),
+    launch_date DATE,
+    is_active BOOLEAN DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 6. 客户主数据表
+CREATE TABLE IF NOT EXISTS customers (
+    customer_id VARCHAR(20) PRIMARY KEY,
+    customer_name VARCHAR(100) NOT NULL,
+    customer_type VARCHAR(20) DEFAULT 'B2C',
+    city VARCHAR(50),
+    province VARCHAR(50),
+    registration_date DATE,
+    total_orders INTEGER DEFAULT 0,
+    total_amount DECIMAL(12,2) DEFAULT 0,
+    is_active BOOLEAN DEFAULT 1
+);
+
+-- 7. AI对话上下文表
+CREATE TABLE IF NOT EXISTS conversation_context (
+    context_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id VARCHAR(50),
+    user_id INTEGER DEFAULT 1,
+    context_data TEXT,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+
+-- 8. 数据版本表（批量导入完成后递增 data_version）
+CREATE TABLE IF NOT EXISTS data_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO data_meta (key, value) VALUES ('data_version', 0), ('rollup_deferred', 0);
+
+-- 9. 插入默认用户
+INSERT OR IGNORE INTO users (user_id, username, department) VALUES (1, 'loreal_user', 'L''Oréal Analytics');
+
+-- 10. 插入默认数据源
+INSERT OR IGNORE INTO data_sources (source_id, source_name, source_type, description) 
+VALUES (1, 'L''Oréal Business Database', 'sqlite', 'Main business data source');
+"""
+
+def upgrade_schema(conn: sqlite3.Connection):
+    """升级旧版本数据库结构（SCHEMA_SQL 执行之后调用）
+
+    为 sales_data 补充 order_id 列并创建唯一索引，批量导入按 order_id 幂等更新；
+    创建或补全 sales_data 的汇总表及维护触发器，以及各表的变更计数触发器。
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sales_data)")}
+    if 'order_id' not in columns:
+        conn.execute("ALTER TABLE sales_data ADD COLUMN order_id VARCHAR(32)")
+        logger.info("sales_data 已添加 order_id 列")
+    # 唯一索引允许多个NULL，没有订单号的历史数据不受影响
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_order_id ON sales_data(order_id)")
+    # 汇总表按月份重建时按日期范围读取事实表
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_order_date ON sales_data(order_date)")
+    install_rollups(conn)
+    # 统计信息目录按各表的变更次数判断哪些表需要重新统计
+    install_change_counters(conn, exclude=SALES_ROLLUPS.rollups)
+
+def bump_data_version(conn: sqlite3.Connection) -> int:
+    """递增业务数据版本号（在写入数据的同一事务中调用）
+
+    Returns:
+        int: 新的版本号
+    """
+    conn.execute("""
+        INSERT INTO data_meta (key, value) VALUES ('data_version', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1
+    """)
+    return conn.execute("SELECT value FROM data_meta WHERE key = 'data_version'").fetchone()[0]
+
+class ConnectionPool:
+    """SQLite连接池
+    
+    连接按需创建，最多 max_size 个，用完后归还复用。每个连接启用 sqlite3 的
+    预编译语句缓存（cached_statements），重复执行的SQL无需重新解析。
+    """
+    
+    def __init__(self, db_path: str, max_size: int = 5, cached_statements: int = 128, timeout: float = 5.0):
+        """初始化连接池
+        
+        Args:
+            db_path: 数据库路径
+            max_size: 最大连接数
+            cached_statements: 每个连接缓存的预编译语句数
+            timeout: 连接耗尽时等待空闲连接的最长时间（秒）
+        """
+        self.db_path = db_path
+        self.max_size = max_size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._metrics = {'acquired': 0, 'reused': 0, 'waits': 0}
+        metrics.register_cache('connection_pool', self.cache_stats)
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借出一个连接，退出上下文时归还"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+    
+    def get_metrics(self) -> Dict[str, int]:
+        """获取连接池指标"""
+        with self._lock:
+            return dict(self._metrics, created=self._created, idle=self._idle.qsize(), max_size=self.max_size)
+    
+    def cache_stats(self) -> Tuple[int, int]:
+        """复用空闲连接的次数和需要新建或等待连接的次数"""
+        with self._lock:
+            return self._metrics['reused'], self._metrics['acquired'] - self._metrics['reused']
+    
+    def acquire(self) -> sqlite3.Connection:
+        """获取空闲连接，没有空闲连接且未达上限时新建"""
+        with self._lock:
+            self._metrics['acquired'] += 1
+            try:
+                conn = self._idle.get_nowait()
+                self._metrics['reused'] += 1
+                return conn
+            except queue.Empty:
+                pass
+            create = self._created < self.max_size
+            if create:
+                self._created += 1
+            else:
+                self._metrics['waits'] += 1
+        
+        if create:
+            try:
+                # 允许连接在不同线程间归还复用
+                return sqlite3.connect(self.db_path, check_same_thread=False,
+                                       cached_statements=self.cached_statements)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise DatabaseError(f"数据库连接池已耗尽（{self.max_size}个连接），等待超时")
+    
+    def release(self, conn: sqlite3.Connection):
+        """归还连接，未提交的事务会被回滚，避免占用写锁"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
 class DatabaseManager:
     """数据库管理器 - 统一管理所有数据库操作"""
     
-    def __init__(self, db_path: str = "data/loreal_insight.db"):
+    def __init__(self, db_path: str = "data/loreal_insight.db", pool_size: Optional[int] = None):
         self.db_path = db_path
         # 确保数据目录存在
         os.makedirs(os.path.dirname(db_path) if os.path.dirname(db_path) else "data", exist_ok=True)
+        self.pool = ConnectionPool(
+            db_path,
+            max_size=pool_size or Config.DB_POOL_SIZE,
+            cached_statements=Config.DB_STATEMENT_CACHE_SIZE
+        )
         self.init_database()
     
     def init_database(self):
         """初始化数据库表结构"""
-        conn = sqlite3.connect(self.db_path)
-        
-        schema_sql = """
-        -- 1. 用户管理表
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username VARCHAR(50) UNIQUE NOT NULL DEFAULT 'default_user',
-            email VARCHAR(100),
-            role VARCHAR(20) DEFAULT 'user',
-            department VARCHAR(50) DEFAULT 'L''Oréal',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1
-        );
-
-        -- 2. 数据源配置表
-        CREATE TABLE IF NOT EXISTS data_sources (
-            source_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source_name VARCHAR(100) NOT NULL,
-            source_type VARCHAR(20) NOT NULL DEFAULT 'sqlite',
-            connection_string TEXT,
-            description TEXT,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        -- 3. 优化的查询历史表
-        CREATE TABLE IF NOT EXISTS query_history (
-            query_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER DEFAULT 1,
-            session_id VARCHAR(50),
-            query_type VARCHAR(20) DEFAULT 'natural_language',
-            original_query TEXT NOT NULL,
-            generated_sql TEXT,
-            query_intent VARCHAR(100),
-            execution_time_ms INTEGER DEFAULT 0,
-            status VARCHAR(20) DEFAULT 'success',
-            error_message TEXT,
-            result_rows INTEGER DEFAULT 0,
-            result_size_kb REAL DEFAULT 0,
-            data_source_id INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id),
-            FOREIGN KEY (data_source_id) REFERENCES data_sources(source_id)
-        );
-
-        -- 4. 业务数据表 - 销售数据 (修复版)
-        CREATE TABLE IF NOT EXISTS sales_data (
-            sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_date DATE NOT NULL,
-            product_id VARCHAR(20),
-            product_name VARCHAR(100),
-            category VARCHAR(50),
-            brand VARCHAR(50),
-            customer_id VARCHAR(20),
-            customer_name VARCHAR(100),
-            city VARCHAR(50),
-            province VARCHAR(50),
-            sales_amount DECIMAL(10,2),
-            quantity INTEGER,
-            discount_amount DECIMAL(10,2) DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        -- 5. 产品主数据表
-        CREATE TABLE IF NOT EXISTS products (
-            product_id VARCHAR(20) PRIMARY KEY,
-            product_name VARCHAR(100) NOT NULL,
-            category VARCHAR(50),
-            sub_category VARCHAR(50),
-            brand VARCHAR(50),
-            unit_price DECIMAL(10,2),
-            cost_price DECIMAL(10,2),
-            launch_date DATE,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        -- 6. 客户主数据表
-        CREATE TABLE IF NOT EXISTS customers (
-            customer_id VARCHAR(20) PRIMARY KEY,
-            customer_name VARCHAR(100) NOT NULL,
-            customer_type VARCHAR(20) DEFAULT 'B2C',
-            city VARCHAR(50),
-            province VARCHAR(50),
-            registration_date DATE,
-            total_orders INTEGER DEFAULT 0,
-            total_amount DECIMAL(12,2) DEFAULT 0,
-            is_active BOOLEAN DEFAULT 1
-        );
-
-        -- 7. AI对话上下文表
-        CREATE TABLE IF NOT EXISTS conversation_context (
-            context_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id VARCHAR(50),
-            user_id INTEGER DEFAULT 1,
-            context_data TEXT,
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        );
-
-        -- 8. 插入默认用户
-        INSERT OR IGNORE INTO users (user_id, username, department) VALUES (1, 'loreal_user', 'L''Oréal Analytics');
-        
-        -- 9. 插入默认数据源
-        INSERT OR IGNORE INTO data_sources (source_id, source_name, source_type, description) 
-        VALUES (1, 'L''Oréal Business Database', 'sqlite', 'Main business data source');
-        """
+        conn = self.pool.acquire()
         
         try:
-            conn.executescript(schema_sql)
+            conn.executescript(SCHEMA_SQL)
+            upgrade_schema(conn)
             conn.commit()
             logger.info("数据库初始化成功")
-            self.insert_sample_data()
         except Exception as e:
             logger.error(f"数据库初始化失败: {e}")
+            return
         finally:
-            conn.close()
+            self.pool.release(conn)
+        
+        self.insert_sample_data()
     
     def insert_sample_data(self):
         """插入有意义的示例数据"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         
         try:
             # 检查是否已有数据
@@ -245,11 +394,12 @@ class DatabaseManager:
             logger.error(f"插入示例数据失败: {e}")
             conn.rollback()
         finally:
-            conn.close()
+            self.pool.release(conn)
     
     def execute_query(self, query: str, params: tuple = None) -> pd.DataFrame:
-        """执行查询并返回DataFrame"""
-        conn = sqlite3.connect(self.db_path)
+        """执行查询并返回DataFrame（可改写的聚合查询从汇总表读取）"""
+        query = get_rollup_manager(self.db_path).rewrite(query)
+        conn = self.pool.acquire()
         try:
             if params:
                 df = pd.read_sql_query(query, conn, params=params)
@@ -260,11 +410,45 @@ class DatabaseManager:
             logger.error(f"查询执行失败: {e}")
             return pd.DataFrame()
         finally:
-            conn.close()
+            self.pool.release(conn)
+    
+    def iter_query(self, query: str, params: tuple = None, chunksize: int = 10000,
+                   as_frame: bool = True) -> Iterator[Union[pd.DataFrame, Dict[str, list]]]:
+        """分块执行查询，逐块返回结果，避免一次性加载全部结果集
+        
+        遍历期间会占用一个池连接（并持有SQLite读锁），遍历结束或生成器关闭时归还。
+        
+        Args:
+            query: SQL查询
+            params: 查询参数
+            chunksize: 每块的行数
+            as_frame: True返回DataFrame块，False返回列式批次（列名 -> 值列表）
+            
+        Yields:
+            Union[pd.DataFrame, Dict[str, list]]: 一块查询结果
+        """
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute(query, params or ())
+            columns = [description[0] for description in cursor.description or ()]
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                if as_frame:
+                    yield pd.DataFrame.from_records(rows, columns=columns)
+                else:
+                    yield {column: list(values) for column, values in zip(columns, zip(*rows))}
+            cursor.close()
+        except sqlite3.Error as e:
+            logger.error(f"分块查询执行失败: {e}")
+            raise DatabaseError(f"分块查询执行失败: {e}") from e
+        finally:
+            self.pool.release(conn)
     
     def execute_update(self, query: str, params: tuple = None) -> int:
         """执行更新操作并返回影响行数"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         try:
             cursor = conn.cursor()
             if params:
@@ -277,11 +461,16 @@ class DatabaseManager:
             logger.error(f"更新操作失败: {e}")
             return 0
         finally:
-            conn.close()
+            self.pool.release(conn)
+    
+    def get_data_version(self) -> int:
+        """获取业务数据版本号（每次批量导入完成后递增）"""
+        df = self.execute_query("SELECT value FROM data_meta WHERE key = 'data_version'")
+        return int(df['value'].iloc[0]) if not df.empty else 0
     
     def get_table_info(self, table_name: str) -> Dict[str, Any]:
         """获取表信息"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         try:
             # 获取表结构
             schema_df = pd.read_sql_query(f"PRAGMA table_info({table_name})", conn)
@@ -296,37 +485,12 @@ class DatabaseManager:
         except Exception as e:
             return {'error': str(e)}
         finally:
-            conn.close()
+            self.pool.release(conn)
     
     def get_database_summary(self) -> Dict[str, Any]:
-        """获取数据库概要信息"""
+        """获取数据库概要信息（从统计信息目录读取，数据未变化时不扫描表）"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            # 获取所有表
-            tables_df = pd.read_sql_query(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'", 
-                conn
-            )
-            
-            summary = {
-                'tables': [],
-                'total_records': 0,
-                'last_updated': datetime.now().isoformat()
-            }
-            
-            for table_name in tables_df['name']:
-                table_info = self.get_table_info(table_name)
-                if 'error' not in table_info:
-                    summary['tables'].append({
-                        'name': table_name,
-                        'row_count': table_info['row_count']
-                    })
-                    summary['total_records'] += table_info['row_count']
-            
-            conn.close()
-            return summary
-            
+            return get_stats_catalog(self.db_path).get_summary()
         except Exception as e:
             logger.error(f"获取数据库概要失败: {e}")
             return {'error': str(e)}
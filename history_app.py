@@ -9,14 +9,13 @@ import gradio as gr
 import pandas as pd
 import os
 import sys
-from datetime import datetime
-import time
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from history_service import HistoryService
 from ui_translations import ui_translations
+from config import Config
 
 def create_history_app():
     """创建独立的历史记录应用"""
@@ -76,6 +75,10 @@ def create_history_app():
         
         # 状态变量
         language_state = gr.State("zh")
+        # 下一页游标（keyset分页）
+        cursor_state = gr.State(None)
+        # 变更同步状态（版本号和已加载的最大记录ID）
+        sync_state = gr.State(None)
         
         # 页面标题
         gr.HTML(
@@ -105,6 +108,16 @@ def create_history_app():
                     lines=1
                 )
                 
+                # 导出选项
+                with gr.Row():
+                    export_format = gr.Dropdown(
+                        choices=[("CSV", "csv"), ("JSON Lines", "jsonl"), ("JSON", "json"), ("Parquet", "parquet")],
+                        value="csv",
+                        label="导出格式",
+                        scale=2
+                    )
+                    export_compress = gr.Checkbox(label="gzip压缩", value=False, scale=1)
+                
                 # 操作按钮
                 with gr.Row():
                     refresh_btn = gr.Button(
@@ -112,8 +125,13 @@ def create_history_app():
                         variant="primary",
                         scale=1
                     )
+                    next_page_btn = gr.Button(
+                        "➡️ 下一页",
+                        variant="secondary",
+                        scale=1
+                    )
                     export_btn = gr.Button(
-                        "📥 导出CSV", 
+                        "📥 导出", 
                         variant="secondary",
                         scale=1
                     )
@@ -149,16 +167,34 @@ def create_history_app():
             visible=False
         )
         
-        # 自动刷新定时器
-        auto_refresh_timer = gr.Timer(value=10)  # 每10秒自动刷新
+        # 变更检查定时器：只比较版本号，有变化时才刷新
+        auto_refresh_timer = gr.Timer(value=Config.HISTORY_POLL_INTERVAL)
         
         # 功能函数
+        def get_history_page(cursor=None):
+            """获取一页历史记录数据
+            
+            Returns:
+                tuple: (DataFrame, 下一页游标)
+            """
+            try:
+                # 获取最近30天的历史记录（按游标分页）
+                page = history_service.get_recent_queries_page(
+                    days=30, limit=Config.HISTORY_PAGE_SIZE, cursor=cursor
+                )
+                return records_to_dataframe(page['items']), page['next_cursor']
+            except Exception as e:
+                print(f"获取历史记录时出错: {e}")
+                return pd.DataFrame(columns=['时间', '查询', '类型', '状态']), None
+        
         def get_history_data():
-            """获取历史记录数据"""
+            """获取第一页历史记录数据"""
+            df, _ = get_history_page()
+            return df
+        
+        def records_to_dataframe(records):
+            """将查询记录转换为表格数据"""
             try:
-                # 获取最近30天的历史记录
-                records = history_service.get_recent_queries(days=30, limit=100)
-                
                 if records:
                     df = pd.DataFrame(records)
                     # 格式化时间列
@@ -184,67 +220,98 @@ def create_history_app():
                 else:
                     return pd.DataFrame(columns=['时间', '查询', '类型', '状态'])
             except Exception as e:
-                print(f"获取历史记录时出错: {e}")
+                print(f"转换历史记录时出错: {e}")
                 return pd.DataFrame(columns=['时间', '查询', '类型', '状态'])
         
         def refresh_history():
-            """刷新历史记录"""
-            df = get_history_data()
-            stats_html = generate_stats_html(df)
-            return df, stats_html
+            """刷新历史记录（回到第一页）"""
+            # 先记录版本再读取数据，读取期间的写入会在下次同步时补上
+            state = history_service.get_sync_state()
+            df, next_cursor = get_history_page()
+            stats_html = generate_stats_html()
+            return df, stats_html, next_cursor, state
+        
+        def next_history_page(cursor, state):
+            """加载下一页历史记录，已是最后一页时保持不变"""
+            if not cursor:
+                return gr.skip(), gr.skip(), None, gr.skip()
+            df, next_cursor = get_history_page(cursor)
+            stats_html = generate_stats_html()
+            # 翻页后暂停自动同步，避免新记录插入打乱当前页
+            return df, stats_html, next_cursor, dict(state or {}, paged=True)
+        
+        def sync_history(state, search_term, current_df):
+            """定时检查历史记录变更：无变化时跳过，有新增时只拉取新记录"""
+            no_change = (gr.skip(), gr.skip(), gr.skip(), gr.skip())
+            if search_term or (state and state.get('paged')):
+                return no_change
+            
+            try:
+                changes = history_service.poll_changes(state, limit=Config.HISTORY_PAGE_SIZE)
+            except Exception as e:
+                print(f"检查历史记录变更时出错: {e}")
+                return no_change
+            
+            if changes['status'] == 'unchanged':
+                return no_change
+            if changes['status'] == 'reset':
+                return refresh_history()
+            
+            new_df = records_to_dataframe(changes['items'])
+            if current_df is not None and not current_df.empty:
+                if len(current_df) + len(new_df) > Config.HISTORY_PAGE_SIZE * 2:
+                    return refresh_history()
+                new_df = pd.concat([new_df, current_df], ignore_index=True)
+            return new_df, generate_stats_html(), gr.skip(), changes['state']
         
-        def generate_stats_html(df):
-            """生成统计信息HTML"""
-            total_queries = len(df)
-            if total_queries > 0:
-                latest_query = df.iloc[0]['时间'] if '时间' in df.columns and not df.empty else "无"
-                unique_queries = df['查询'].nunique() if '查询' in df.columns else 0
-            else:
-                latest_query = "无"
-                unique_queries = 0
+        def generate_stats_html():
+            """生成统计信息HTML（读取物化计数器）"""
+            try:
+                stats = history_service.get_history_stats()
+            except Exception as e:
+                print(f"获取统计信息时出错: {e}")
+                stats = {'total_queries': 0, 'success_rate': 0, 'today_queries': 0, 'avg_execution_time': 0}
             
             return f"""
             <div class="stats-card">
                 <h4 style="margin: 0 0 10px 0; color: #007bff;">📈 统计信息</h4>
                 <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px; font-size: 0.9rem;">
-                    <div><strong>总查询数:</strong> {total_queries}</div>
-                    <div><strong>唯一查询:</strong> {unique_queries}</div>
-                    <div style="grid-column: 1 / -1;"><strong>最新查询:</strong> {latest_query}</div>
+                    <div><strong>总查询数:</strong> {stats['total_queries']}</div>
+                    <div><strong>成功率:</strong> {stats['success_rate']:.1f}%</div>
+                    <div><strong>今日查询:</strong> {stats['today_queries']}</div>
+                    <div><strong>平均耗时:</strong> {stats['avg_execution_time']:.2f}s</div>
                 </div>
                 <p style="margin: 10px 0 0 0; font-size: 0.8rem; color: #666;">
-                    💡 数据每10秒自动刷新，确保与主应用同步
+                    💡 主应用有新查询时自动同步
                 </p>
             </div>
             """
         
         def search_history(search_term):
-            """搜索历史记录"""
-            df = get_history_data()
-            if search_term and not df.empty:
-                # 在所有列中搜索
-                mask = df.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
-                filtered_df = df[mask]
-                stats_html = generate_stats_html(filtered_df)
-                return filtered_df, stats_html
-            else:
-                stats_html = generate_stats_html(df)
-                return df, stats_html
+            """搜索历史记录（在数据库全部历史中检索，不限于当前页）"""
+            search_term = (search_term or '').strip()
+            if not search_term:
+                return get_history_data(), generate_stats_html()
+            try:
+                results = history_service.search_queries(search_term, limit=Config.HISTORY_PAGE_SIZE)
+                df = records_to_dataframe(results)
+            except Exception as e:
+                print(f"搜索历史记录时出错: {e}")
+                df = pd.DataFrame(columns=['时间', '查询', '类型', '状态'])
+            return df, generate_stats_html()
         
-        def export_history():
-            """导出历史记录为CSV"""
+        def export_history(format_type, compress, progress=gr.Progress()):
+            """流式导出最近30天的历史记录"""
+            def report(done, total):
+                progress(done / total if total else 1.0, desc=f"已导出 {done}/{total} 条记录")
+            
             try:
-                df = get_history_data()
-                if df.empty:
+                filepath = history_service.export_history(
+                    format_type, days=30, compress=compress, progress_callback=report
+                )
+                if filepath is None:
                     return None, "⚠️ 没有数据可导出"
-                
-                # 生成文件名
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"history_export_{timestamp}.csv"
-                filepath = os.path.join(os.getcwd(), filename)
-                
-                # 导出CSV
-                df.to_csv(filepath, index=False, encoding='utf-8-sig')
-                return filepath, f"✅ 成功导出 {len(df)} 条记录到 {filename}"
+                return filepath, f"✅ 成功导出到 {os.path.basename(filepath)}"
             except Exception as e:
                 return None, f"❌ 导出失败: {str(e)}"
         
@@ -253,11 +320,11 @@ def create_history_app():
             try:
                 history_service.clear_all_history()
                 empty_df = pd.DataFrame(columns=['时间', '查询', 'SQL', '结果'])
-                stats_html = generate_stats_html(empty_df)
+                stats_html = generate_stats_html()
                 return empty_df, stats_html, "✅ 历史记录已清空"
             except Exception as e:
                 df = get_history_data()
-                stats_html = generate_stats_html(df)
+                stats_html = generate_stats_html()
                 return df, stats_html, f"❌ 清空失败: {str(e)}"
         
         def update_language(language):
@@ -270,13 +337,20 @@ def create_history_app():
         # 页面加载时初始化数据
         interface.load(
             refresh_history,
-            outputs=[history_table, stats_display]
+            outputs=[history_table, stats_display, cursor_state, sync_state]
         )
         
         # 刷新按钮
         refresh_btn.click(
             refresh_history,
-            outputs=[history_table, stats_display]
+            outputs=[history_table, stats_display, cursor_state, sync_state]
+        )
+        
+        # 下一页按钮
+        next_page_btn.click(
+            next_history_page,
+            inputs=[cursor_state, sync_state],
+            outputs=[history_table, stats_display, cursor_state, sync_state]
         )
         
         # 搜索功能
@@ -289,6 +363,7 @@ def create_history_app():
         # 导出功能
         export_btn.click(
             export_history,
+            inputs=[export_format, export_compress],
             outputs=[export_file, stats_display]
         ).then(
             lambda file, msg: gr.update(visible=file is not None),
@@ -309,10 +384,11 @@ def create_history_app():
             outputs=[language_state]
         )
         
-        # 自动刷新
+        # 自动同步
         auto_refresh_timer.tick(
-            refresh_history,
-            outputs=[history_table, stats_display]
+            sync_history,
+            inputs=[sync_state, search_input, history_table],
+            outputs=[history_table, stats_display, cursor_state, sync_state]
         )
     
     return interface
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录导出模块
+以流式方式分块读取历史记录并写入CSV、JSONL、JSON或Parquet文件，内存占用与记录总数无关
+"""
+
+import csv
+import gzip
+import json
+import os
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Iterator
+from memory_manager import MemoryManager, QueryRecord
+from exceptions import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'json', 'parquet')
+
+# 导出字段及CSV表头
+EXPORT_FIELDS = [
+    ('query_text', '查询内容'),
+    ('query_type', '查询类型'),
+    ('success', '是否成功'),
+    ('execution_time', '执行时间(秒)'),
+    ('timestamp', '时间戳'),
+    ('result_summary', '结果摘要'),
+    ('sql_generated', '生成的SQL'),
+    ('language', '语言'),
+]
+
+ProgressCallback = Callable[[int, int], None]
+
+def record_to_export_row(record: QueryRecord) -> Dict[str, Any]:
+    """将查询记录转换为导出行"""
+    return {
+        'query_text': record.user_query,
+        'query_type': record.query_type,
+        'success': record.success,
+        'execution_time': record.execution_time,
+        'timestamp': record.timestamp.isoformat(),
+        'result_summary': record.result_summary,
+        'sql_generated': record.sql_generated,
+        'language': record.language
+    }
+
+class HistoryExporter:
+    """历史记录流式导出器"""
+
+    def __init__(self, memory_manager: MemoryManager, chunk_size: int = 1000):
+        """初始化导出器
+
+        Args:
+            memory_manager: 记忆管理器实例
+            chunk_size: 每次从数据库读取的记录数
+        """
+        self.memory_manager = memory_manager
+        self.chunk_size = chunk_size
+
+    def iter_rows(self, days: int = 30) -> Iterator[List[Dict[str, Any]]]:
+        """分块生成导出行
+
+        Args:
+            days: 导出最近几天的记录
+
+        Yields:
+            List[Dict[str, Any]]: 一块导出行
+        """
+        for records in self.memory_manager.iter_history(days=days, chunk_size=self.chunk_size):
+            yield [record_to_export_row(record) for record in records]
+
+    def export(self,
+               filepath: str,
+               format_type: str = 'csv',
+               days: int = 30,
+               compress: bool = False,
+               progress_callback: Optional[ProgressCallback] = None) -> int:
+        """导出历史记录到文件
+
+        Args:
+            filepath: 输出文件路径
+            format_type: 导出格式 ('csv', 'jsonl', 'json', 'parquet')
+            days: 导出最近几天的记录
+            compress: 是否gzip压缩（Parquet使用内部gzip列压缩，文件本身不再包一层gzip）
+            progress_callback: 进度回调，参数为 (已导出记录数, 记录总数)
+
+        Returns:
+            int: 导出的记录数
+        """
+        if format_type not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {format_type}")
+
+        total = self.memory_manager.count_recent_history(days)
+        chunks = self._track_progress(self.iter_rows(days), total, progress_callback)
+
+        if format_type == 'parquet':
+            return self._write_parquet(filepath, chunks, compress)
+
+        opener = gzip.open if compress else open
+        # CSV带BOM，便于Excel正确识别中文
+        encoding = 'utf-8-sig' if format_type == 'csv' else 'utf-8'
+        with opener(filepath, 'wt', encoding=encoding, newline='') as output:
+            if format_type == 'csv':
+                return self._write_csv(output, chunks)
+            if format_type == 'jsonl':
+                return self._write_jsonl(output, chunks)
+            return self._write_json_array(output, chunks)
+
+    @staticmethod
+    def _track_progress(chunks: Iterator[List[Dict[str, Any]]], total: int,
+                        progress_callback: Optional[ProgressCallback]) -> Iterator[List[Dict[str, Any]]]:
+        """在每块写入前后调用进度回调"""
+        done = 0
+        if progress_callback:
+            progress_callback(0, total)
+        for chunk in chunks:
+            yield chunk
+            done += len(chunk)
+            if progress_callback:
+                progress_callback(done, max(total, done))
+
+    @staticmethod
+    def _write_csv(output, chunks: Iterator[List[Dict[str, Any]]]) -> int:
+        """写入CSV"""
+        fields = [field for field, _ in EXPORT_FIELDS]
+        writer = csv.writer(output)
+        writer.writerow([header for _, header in EXPORT_FIELDS])
+        count = 0
+        for chunk in chunks:
+            writer.writerows([row[field] for field in fields] for row in chunk)
+            count += len(chunk)
+        return count
+
+    @staticmethod
+    def _write_jsonl(output, chunks: Iterator[List[Dict[str, Any]]]) -> int:
+        """写入JSON Lines（每行一条记录）"""
+        count = 0
+        for chunk in chunks:
+            output.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk)
+            count += len(chunk)
+        return count
+
+    @staticmethod
+    def _write_json_array(output, chunks: Iterator[List[Dict[str, Any]]]) -> int:
+        """逐条写入JSON数组，不在内存中构造完整列表"""
+        count = 0
+        output.write("[")
+        for chunk in chunks:
+            for row in chunk:
+                output.write(",\n" if count else "\n")
+                output.write(json.dumps(row, ensure_ascii=False))
+                count += 1
+        output.write("\n]\n" if count else "]\n")
+        return count
+
+    @staticmethod
+    def _write_parquet(filepath: str, chunks: Iterator[List[Dict[str, Any]]], compress: bool) -> int:
+        """按块写入Parquet行组（需要pyarrow）"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ConfigurationError("导出Parquet格式需要安装pyarrow: pip install pyarrow") from e
+
+        schema = pa.schema([
+            ('query_text', pa.string()),
+            ('query_type', pa.string()),
+            ('success', pa.bool_()),
+            ('execution_time', pa.float64()),
+            ('timestamp', pa.string()),
+            ('result_summary', pa.string()),
+            ('sql_generated', pa.string()),
+            ('language', pa.string()),
+        ])
+        count = 0
+        with pq.ParquetWriter(filepath, schema, compression='gzip' if compress else 'snappy') as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                count += len(chunk)
+        return count
+
+def build_export_path(format_type: str, compress: bool = False, output_dir: Optional[str] = None) -> str:
+    """生成带时间戳的导出文件路径
+
+    Args:
+        format_type: 导出格式
+        compress: 是否gzip压缩
+        output_dir: 输出目录，默认为当前工作目录
+
+    Returns:
+        str: 导出文件路径
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"history_export_{timestamp}.{format_type}"
+    if compress and format_type != 'parquet':
+        filename += ".gz"
+    return os.path.join(output_dir or os.getcwd(), filename)
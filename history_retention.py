@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录保留与归档模块
+按保留策略将过期的查询历史归档到按月分区的压缩文件，清理过期统计并回收数据库空间
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Callable
+from memory_manager import MemoryManager, QueryRecord
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RetentionPolicy:
+    """历史记录保留策略"""
+    max_age_days: Optional[int] = 90  # 超过该天数的记录被归档，None表示不按时间归档
+    max_rows: Optional[int] = 100000  # 数据库中最多保留的记录数，None表示不限
+    archive_dir: Optional[str] = "data/history_archive"  # 归档目录，None表示直接删除不归档
+    stats_max_age_days: Optional[int] = 180  # 超过该天数未使用的查询统计被删除
+    batch_size: int = 1000  # 每批归档的记录数
+    vacuum_pages: int = 1000  # 每次增量VACUUM最多回收的页数
+
+    @classmethod
+    def from_config(cls) -> 'RetentionPolicy':
+        """从应用配置创建保留策略（配置为0表示不限）"""
+        return cls(
+            max_age_days=Config.HISTORY_RETENTION_DAYS or None,
+            max_rows=Config.HISTORY_MAX_ROWS or None,
+            archive_dir=Config.HISTORY_ARCHIVE_DIR or None,
+            stats_max_age_days=Config.HISTORY_STATS_RETENTION_DAYS or None
+        )
+
+class HistoryRetention:
+    """历史记录维护任务
+
+    每次运行依次执行：
+    1. 将早于 max_age_days 的记录追加写入按月分区的 history_YYYY-MM.jsonl.gz 后从数据库删除
+    2. 记录数超过 max_rows 时继续归档最早的记录
+    3. 删除长期未使用的查询统计
+    4. 增量VACUUM回收空闲页
+
+    归档删除不减少统计计数器，统计数据仍包含已归档的记录。
+    先写归档文件再删除数据库记录，中途失败时重新运行可能产生重复的归档行，但不会丢失记录。
+    """
+
+    def __init__(self, memory_manager: MemoryManager, policy: Optional[RetentionPolicy] = None,
+                 on_rows_removed: Optional[Callable[[], None]] = None):
+        """初始化维护任务
+
+        Args:
+            memory_manager: 记忆管理器实例
+            policy: 保留策略，默认从配置读取
+            on_rows_removed: 本次运行归档或删除了记录后调用（如重建查询建议索引）
+        """
+        self.memory_manager = memory_manager
+        self.policy = policy or RetentionPolicy.from_config()
+        self.on_rows_removed = on_rows_removed
+
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'runs': 0,
+            'failures': 0,
+            'archived_rows': 0,
+            'deleted_rows': 0,
+            'pruned_stats': 0,
+            'freed_pages': 0,
+            'archive_files': [],
+            'last_run_at': None,
+            'last_duration_ms': 0.0,
+            'last_error': None
+        }
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """执行一次维护
+
+        Args:
+            now: 当前时间（用于计算过期时间），默认为系统时间
+
+        Returns:
+            Dict[str, Any]: 本次运行的结果
+        """
+        now = now or datetime.now()
+        start_time = time.perf_counter()
+        result = {'archived_rows': 0, 'deleted_rows': 0, 'pruned_stats': 0,
+                  'freed_pages': 0, 'archive_files': []}
+
+        with self._run_lock:
+            try:
+                if self.policy.max_age_days is not None:
+                    cutoff = now - timedelta(days=self.policy.max_age_days)
+                    self._archive_rows(result, before=cutoff)
+
+                if self.policy.max_rows is not None:
+                    excess = self.memory_manager.get_history_row_count() - self.policy.max_rows
+                    if excess > 0:
+                        self._archive_rows(result, max_rows=excess)
+
+                if self.policy.stats_max_age_days is not None:
+                    stats_cutoff = now - timedelta(days=self.policy.stats_max_age_days)
+                    result['pruned_stats'] = self.memory_manager.prune_query_stats(stats_cutoff)
+
+                vacuum = self.memory_manager.incremental_vacuum(self.policy.vacuum_pages)
+                result['freed_pages'] = vacuum['freelist_before'] - vacuum['freelist_after']
+            except Exception as e:
+                self._record_run(result, start_time, now, error=str(e))
+                logger.error(f"History maintenance failed: {e}", exc_info=True)
+                raise
+
+        self._record_run(result, start_time, now)
+        logger.info(f"History maintenance finished: {result}")
+        if self.on_rows_removed and (result['archived_rows'] or result['deleted_rows']):
+            try:
+                self.on_rows_removed()
+            except Exception as e:
+                logger.error(f"History maintenance callback failed: {e}", exc_info=True)
+        return result
+
+    def start(self, interval: Optional[float] = None):
+        """启动后台维护线程
+
+        Args:
+            interval: 运行间隔（秒），默认使用配置
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        interval = Config.HISTORY_MAINTENANCE_INTERVAL if interval is None else interval
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name="history-retention", daemon=True)
+        self._thread.start()
+        logger.info(f"History maintenance started (interval={interval}s, policy={asdict(self.policy)})")
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台维护线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取维护任务累计指标
+
+        Returns:
+            Dict[str, Any]: 运行次数、归档/删除记录数、回收页数及最近一次运行信息
+        """
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+            metrics['archive_files'] = list(metrics['archive_files'])
+        metrics['live_rows'] = self.memory_manager.get_history_row_count()
+        metrics['db_size_bytes'] = os.path.getsize(self.memory_manager.db_path) \
+            if os.path.exists(self.memory_manager.db_path) else 0
+        return metrics
+
+    def _run(self, interval: float):
+        """后台维护循环"""
+        while not self._stop_event.wait(interval):
+            try:
+                self.run_once()
+            except Exception:
+                # 错误已记录在指标和日志中，下个周期重试
+                pass
+
+    def _archive_rows(self, result: Dict[str, Any], before: Optional[datetime] = None,
+                      max_rows: Optional[int] = None):
+        """分批归档最早的记录
+
+        Args:
+            result: 本次运行结果，原地累加
+            before: 只归档早于该时间的记录
+            max_rows: 最多归档的记录数
+        """
+        remaining = max_rows
+        while remaining is None or remaining > 0:
+            limit = self.policy.batch_size if remaining is None else min(self.policy.batch_size, remaining)
+            records = self.memory_manager.get_oldest_history(limit, before=before)
+            if not records:
+                break
+
+            if self.policy.archive_dir:
+                for path in self._write_archive(records):
+                    if path not in result['archive_files']:
+                        result['archive_files'].append(path)
+            removed = self.memory_manager.archive_history([record.id for record in records])
+            result['archived_rows' if self.policy.archive_dir else 'deleted_rows'] += removed
+
+            if remaining is not None:
+                remaining -= len(records)
+            if len(records) < limit:
+                break
+
+    def _write_archive(self, records: List[QueryRecord]) -> List[str]:
+        """将记录按月追加到压缩归档文件
+
+        Returns:
+            List[str]: 写入的归档文件路径
+        """
+        os.makedirs(self.policy.archive_dir, exist_ok=True)
+        partitions: Dict[str, List[QueryRecord]] = {}
+        for record in records:
+            partitions.setdefault(record.timestamp.strftime('%Y-%m'), []).append(record)
+
+        # span随记录一起归档（删除记录时span表中的行同步删除）
+        spans_by_record = self.memory_manager.get_spans([record.id for record in records])
+        paths = []
+        for month, month_records in partitions.items():
+            path = os.path.join(self.policy.archive_dir, f"history_{month}.jsonl.gz")
+            # gzip支持多成员追加，每批作为一个新成员写入
+            with gzip.open(path, 'at', encoding='utf-8') as archive:
+                for record in month_records:
+                    record.spans = spans_by_record.get(record.id)
+                    row = asdict(record)
+                    row['timestamp'] = record.timestamp.isoformat()
+                    archive.write(json.dumps(row, ensure_ascii=False) + "\n")
+            paths.append(path)
+        return paths
+
+    def _record_run(self, result: Dict[str, Any], start_time: float, now: datetime,
+                    error: Optional[str] = None):
+        """累加本次运行的指标"""
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        with self._metrics_lock:
+            self._metrics['runs'] += 1
+            if error:
+                self._metrics['failures'] += 1
+            for key in ('archived_rows', 'deleted_rows', 'pruned_stats', 'freed_pages'):
+                self._metrics[key] += result[key]
+            for path in result['archive_files']:
+                if path not in self._metrics['archive_files']:
+                    self._metrics['archive_files'].append(path)
+            self._metrics['last_run_at'] = now.isoformat()
+            self._metrics['last_duration_ms'] = elapsed_ms
+            self._metrics['last_error'] = error
+
+def read_archive(path: str) -> List[Dict[str, Any]]:
+    """读取归档文件中的全部记录
+
+    Args:
+        path: 归档文件路径
+
+    Returns:
+        List[Dict[str, Any]]: 记录字典列表
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line) for line in archive if line.strip()]
@@ -10,7 +10,13 @@ import logging
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from memory_manager import MemoryManager, QueryRecord
+from history_writer import HistoryWriter
+from query_index import QuerySimilarityIndex
+from history_export import HistoryExporter, EXPORT_FORMATS, ProgressCallback, build_export_path
+from config import Config
 from language_utils import language_detector
+from tracing import Trace, export_traces_jsonl, build_trace_export_path
+from metrics import REQUESTS, REQUEST_DURATION
 import re
 
 logger = logging.getLogger(__name__)
@@ -18,14 +24,19 @@ logger = logging.getLogger(__name__)
 class HistoryService:
     """历史记录服务"""
     
-    def __init__(self, memory_manager: Optional[MemoryManager] = None):
+    def __init__(self, memory_manager: Optional[MemoryManager] = None, async_write: bool = False):
         """初始化历史记录服务
         
         Args:
             memory_manager: 记忆管理器实例
+            async_write: 是否启用异步批量写入（write-behind）
         """
         self.memory_manager = memory_manager or MemoryManager()
-        logger.info("HistoryService initialized")
+        self.writer = HistoryWriter(self.memory_manager) if async_write else None
+        # 查询建议使用的相似度索引：启动时从历史记录构建，之后随记录增量更新
+        self.query_index = QuerySimilarityIndex(max_size=Config.SUGGESTION_INDEX_MAX_SIZE)
+        self.query_index.build(self.memory_manager.get_successful_queries(Config.SUGGESTION_INDEX_SIZE))
+        logger.info(f"HistoryService initialized (async_write={async_write})")
     
     def record_query(self, 
                     user_query: str, 
@@ -34,9 +45,14 @@ class HistoryService:
                     result_summary: str = "",
                     success: bool = True,
                     execution_time: float = 0.0,
-                    user_feedback: Optional[str] = None) -> int:
+                    user_feedback: Optional[str] = None,
+                    language: Optional[str] = None,
+                    trace: Optional[Trace] = None) -> Optional[int]:
         """记录用户查询
         
+        启用异步写入时，记录进入写入队列后立即返回，语言检测和落盘由后台线程完成；
+        调用方已在请求上下文中检测过语言时直接传入，不再重复检测。
+        
         Args:
             user_query: 用户查询
             query_type: 查询类型 ('sql' 或 'visualization')
@@ -45,12 +61,18 @@ class HistoryService:
             success: 是否成功
             execution_time: 执行时间
             user_feedback: 用户反馈
+            language: 查询语言，为None时自动检测
+            trace: 本次请求的trace，结束其根span后随记录保存各阶段span
             
         Returns:
-            int: 记录ID
+            Optional[int]: 记录ID，异步写入时返回None
         """
-        # 检测查询语言
-        language = language_detector.detect_language(user_query)
+        REQUESTS.inc(query_type=query_type, status='success' if success else 'error')
+        REQUEST_DURATION.observe(execution_time, query_type=query_type)
+        
+        # 异步写入时语言检测推迟到后台线程
+        if language is None:
+            language = "" if self.writer else language_detector.detect_language(user_query)
         
         record = QueryRecord(
             user_query=user_query,
@@ -60,11 +82,45 @@ class HistoryService:
             language=language,
             success=success,
             execution_time=execution_time,
-            user_feedback=user_feedback
+            user_feedback=user_feedback,
+            spans=trace.finish() if trace else None
         )
         
+        if success:
+            self.query_index.add(user_query, last_used=record.timestamp.isoformat())
+        
+        if self.writer:
+            self.writer.submit(record)
+            return None
+        
         return self.memory_manager.save_query(record)
     
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待异步写入队列中的记录全部落盘
+        
+        Args:
+            timeout: 最长等待时间（秒）
+            
+        Returns:
+            bool: 是否全部落盘
+        """
+        if self.writer:
+            return self.writer.flush(timeout)
+        return True
+    
+    def close(self):
+        """关闭服务，写入剩余的历史记录"""
+        if self.writer:
+            self.writer.close()
+    
+    def get_write_metrics(self) -> Dict[str, Any]:
+        """获取历史记录写入指标
+        
+        Returns:
+            Dict[str, Any]: 写入队列指标，同步写入时返回空字典
+        """
+        return self.writer.get_metrics() if self.writer else {}
+    
     def get_conversation_history(self, limit: int = 10) -> List[Dict[str, Any]]:
         """获取对话历史记录（格式化为聊天界面使用）
         
@@ -100,20 +156,95 @@ class HistoryService:
             List[Dict]: 查询记录列表
         """
         records = self.memory_manager.get_recent_history(days=days, limit=limit)
+        return [self._record_to_dict(record) for record in records]
+    
+    def get_recent_queries_page(self, days: int = 30, limit: int = 20,
+                                cursor: Optional[str] = None) -> Dict[str, Any]:
+        """按页获取最近的查询记录
         
-        queries = []
-        for record in records:
-            queries.append({
-                'id': record.id,
-                'query': record.user_query,
-                'type': record.query_type,
-                'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                'success': record.success,
-                'language': record.language,
-                'execution_time': record.execution_time
-            })
+        Args:
+            days: 天数范围
+            limit: 每页记录数
+            cursor: 上一页返回的游标，None表示第一页
+            
+        Returns:
+            Dict: 包含 items（查询记录列表）、next_cursor 和 has_more
+        """
+        records, next_cursor = self.memory_manager.get_recent_history_page(days=days, limit=limit, cursor=cursor)
+        return {
+            'items': [self._record_to_dict(record) for record in records],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }
+    
+    def get_session_queries_page(self, session_id: Optional[str] = None, limit: int = 20,
+                                 cursor: Optional[str] = None) -> Dict[str, Any]:
+        """按页获取会话内的查询记录
+        
+        Args:
+            session_id: 会话ID，默认为当前会话
+            limit: 每页记录数
+            cursor: 上一页返回的游标，None表示第一页
+            
+        Returns:
+            Dict: 包含 items（查询记录列表）、next_cursor 和 has_more
+        """
+        records, next_cursor = self.memory_manager.get_session_history_page(session_id, limit=limit, cursor=cursor)
+        return {
+            'items': [self._record_to_dict(record) for record in records],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }
+    
+    def get_sync_state(self) -> Dict[str, int]:
+        """获取当前变更版本，作为客户端增量同步的起点
+        
+        Returns:
+            Dict[str, int]: version、reset_version 和 last_id
+        """
+        return self.memory_manager.get_history_version()
+    
+    def poll_changes(self, state: Optional[Dict[str, int]], limit: int = 100) -> Dict[str, Any]:
+        """根据客户端的同步状态拉取变更
+        
+        Args:
+            state: 上次 get_sync_state/poll_changes 返回的状态，None表示尚未同步
+            limit: 单次最多拉取的新记录数
+            
+        Returns:
+            Dict: status 为 'unchanged'（无变化）、'appended'（只有新增，items为新记录，按时间倒序）
+                  或 'reset'（有删除或新增过多，需要全量重新加载）；state 为新的同步状态
+        """
+        current = self.memory_manager.get_history_version()
+        if state and current['version'] == state.get('version'):
+            return {'status': 'unchanged', 'items': [], 'state': state}
         
-        return queries
+        if not state or current['reset_version'] != state.get('reset_version'):
+            return {'status': 'reset', 'items': [], 'state': current}
+        
+        records = self.memory_manager.get_changes_since(state.get('last_id', 0), limit=limit + 1)
+        if len(records) > limit:
+            return {'status': 'reset', 'items': [], 'state': current}
+        
+        # 只返回版本快照内的记录，之后写入的记录留到下次同步
+        records = [record for record in records if record.id <= current['last_id']]
+        return {
+            'status': 'appended',
+            'items': [self._record_to_dict(record) for record in reversed(records)],
+            'state': current
+        }
+    
+    def _record_to_dict(self, record: QueryRecord) -> Dict[str, Any]:
+        """将查询记录转换为列表展示使用的字典"""
+        return {
+            'id': record.id,
+            'query': record.user_query,
+            'type': record.query_type,
+            'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'success': record.success,
+            'language': record.language,
+            'execution_time': record.execution_time
+        }
     
     def search_queries(self, keyword: str, limit: int = 20) -> List[Dict[str, Any]]:
         """搜索查询记录
@@ -125,13 +256,14 @@ class HistoryService:
         Returns:
             List[Dict]: 匹配的查询记录
         """
-        records = self.memory_manager.search_history(keyword, limit)
+        hits = self.memory_manager.search_history_ranked(keyword, limit)
         
         results = []
-        for record in records:
-            # 高亮匹配的关键词
-            highlighted_query = self._highlight_keyword(record.user_query, keyword)
-            highlighted_summary = self._highlight_keyword(record.result_summary, keyword)
+        for hit in hits:
+            record = hit['record']
+            # 优先使用全文索引返回的匹配片段，否则手动高亮关键词
+            highlighted_query = hit['query_snippet'] or self._highlight_keyword(record.user_query, keyword)
+            highlighted_summary = hit['summary_snippet'] or self._highlight_keyword(record.result_summary, keyword)
             
             results.append({
                 'id': record.id,
@@ -142,7 +274,8 @@ class HistoryService:
                 'type': record.query_type,
                 'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
                 'success': record.success,
-                'language': record.language
+                'language': record.language,
+                'score': hit['score']
             })
         
         return results
@@ -172,23 +305,19 @@ class HistoryService:
             limit: 返回建议数限制
             
         Returns:
-            List[Dict]: 查询建议列表
+            List[Dict]: 查询建议列表，相似查询按相似度排在前面，热门查询补足剩余数量
         """
         suggestions = []
         
-        # 1. 基于关键词的相似查询
-        keywords = self._extract_keywords(current_query)
-        for keyword in keywords[:3]:  # 取前3个关键词
-            similar_records = self.memory_manager.search_history(keyword, limit=3)
-            for record in similar_records:
-                if record.user_query.lower() != current_query.lower():
-                    suggestions.append({
-                        'query': record.user_query,
-                        'type': 'similar',
-                        'reason': f'包含关键词: {keyword}',
-                        'usage_count': 1,
-                        'last_used': record.timestamp.strftime('%Y-%m-%d')
-                    })
+        # 1. 相似度索引中的相似查询
+        for hit in self.query_index.search(current_query, k=limit):
+            suggestions.append({
+                'query': hit['query'],
+                'type': 'similar',
+                'reason': f"相似查询 (相似度{hit['score']:.0%})",
+                'usage_count': hit['usage_count'],
+                'last_used': (hit['last_used'] or '')[:10]
+            })
         
         # 2. 热门查询推荐
         popular_queries = self.memory_manager.get_popular_queries(limit=5)
@@ -202,7 +331,7 @@ class HistoryService:
                     'last_used': query_info['last_used'][:10]  # 只取日期部分
                 })
         
-        # 3. 去重并排序
+        # 3. 去重
         seen_queries = set()
         unique_suggestions = []
         for suggestion in suggestions:
@@ -210,80 +339,55 @@ class HistoryService:
                 seen_queries.add(suggestion['query'])
                 unique_suggestions.append(suggestion)
         
-        # 按使用次数和类型排序
-        unique_suggestions.sort(key=lambda x: (x['type'] == 'popular', x['usage_count']), reverse=True)
-        
         return unique_suggestions[:limit]
     
-    def _extract_keywords(self, query: str) -> List[str]:
-        """从查询中提取关键词
-        
-        Args:
-            query: 查询字符串
-            
-        Returns:
-            List[str]: 关键词列表
-        """
-        # 简单的关键词提取（可以后续优化为更复杂的NLP处理）
-        # 移除常见的停用词
-        stop_words = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
-        
-        # 分词（简单按空格和标点分割）
-        words = re.findall(r'\w+', query.lower())
-        
-        # 过滤停用词和短词
-        keywords = [word for word in words if len(word) > 1 and word not in stop_words]
-        
-        return keywords[:5]  # 返回前5个关键词
-    
     def get_session_summary(self) -> Dict[str, Any]:
-        """获取当前会话摘要
+        """获取当前会话摘要（基于物化计数器，无需扫描历史记录）
         
         Returns:
             Dict[str, Any]: 会话摘要信息
         """
         stats = self.memory_manager.get_session_stats()
-        recent_queries = self.get_recent_queries(days=1, limit=10)
-        
-        # 分析查询类型分布
-        query_types = {}
-        languages = {}
-        
-        for query in recent_queries:
-            query_type = query['type']
-            language = query['language']
-            
-            query_types[query_type] = query_types.get(query_type, 0) + 1
-            languages[language] = languages.get(language, 0) + 1
+        today = self.memory_manager.get_daily_stats()
         
         return {
             'session_stats': stats,
             'recent_activity': {
-                'total_queries_today': len(recent_queries),
-                'query_types': query_types,
-                'languages': languages
+                'total_queries_today': today['total_queries'],
+                'query_types': today['query_types'],
+                'languages': today['languages']
             },
-            'recommendations': self._get_session_recommendations(recent_queries)
+            'recommendations': self._get_session_recommendations(today)
         }
     
-    def _get_session_recommendations(self, recent_queries: List[Dict[str, Any]]) -> List[str]:
-        """基于会话历史生成推荐
+    def get_history_stats(self) -> Dict[str, Any]:
+        """获取全部历史记录的统计信息（用于历史记录页面）
+        
+        Returns:
+            Dict[str, Any]: 总数、成功/失败数、平均耗时、今日查询数及分布
+        """
+        stats = self.memory_manager.get_global_stats()
+        stats['today_queries'] = self.memory_manager.get_daily_stats()['total_queries']
+        return stats
+    
+    def _get_session_recommendations(self, today: Dict[str, Any]) -> List[str]:
+        """基于今日查询统计生成推荐
         
         Args:
-            recent_queries: 最近的查询记录
+            today: 今日统计信息（get_daily_stats的返回值）
             
         Returns:
             List[str]: 推荐建议
         """
         recommendations = []
         
-        if not recent_queries:
+        if not today['total_queries']:
             recommendations.append("开始您的第一个数据查询吧！")
             return recommendations
         
         # 分析查询模式
-        sql_count = sum(1 for q in recent_queries if q['type'] == 'sql')
-        viz_count = sum(1 for q in recent_queries if q['type'] == 'visualization')
+        sql_count = today['query_types'].get('sql', 0)
+        viz_count = today['query_types'].get('visualization', 0)
         
         if sql_count > viz_count * 2:
             recommendations.append("您经常使用SQL查询，不妨尝试一些数据可视化功能")
@@ -291,100 +395,86 @@ class HistoryService:
             recommendations.append("您喜欢数据可视化，可以尝试更复杂的SQL分析")
         
         # 检查失败的查询
-        failed_queries = [q for q in recent_queries if not q['success']]
-        if failed_queries:
-            recommendations.append(f"有{len(failed_queries)}个查询未成功，您可以重新尝试或寻求帮助")
+        if today['failed_queries']:
+            recommendations.append(f"有{today['failed_queries']}个查询未成功，您可以重新尝试或寻求帮助")
         
-        # 检查执行时间
-        slow_queries = [q for q in recent_queries if q['execution_time'] > 5.0]
-        if slow_queries:
+        # 检查执行时间（耗时超过5秒的直方图桶）
+        slow_count = sum(bucket['count'] for bucket in today['latency_histogram']
+                         if bucket['le'] is None or bucket['le'] > 5.0)
+        if slow_count:
             recommendations.append("有些查询执行较慢，考虑优化查询条件")
         
         return recommendations
     
-    def export_history(self, format_type: str = 'csv', days: int = 30) -> str:
-        """导出历史记录
+    def export_history(self,
+                       format_type: str = 'csv',
+                       days: int = 30,
+                       compress: bool = False,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       output_dir: Optional[str] = None) -> Optional[str]:
+        """导出历史记录（流式分块写入，内存占用与记录数无关）
         
         Args:
-            format_type: 导出格式 ('csv', 'json')
+            format_type: 导出格式 ('csv', 'jsonl', 'json', 'parquet')
             days: 导出最近几天的记录
+            compress: 是否gzip压缩
+            progress_callback: 进度回调，参数为 (已导出记录数, 记录总数)
+            output_dir: 输出目录，默认为当前工作目录
             
         Returns:
-            str: 导出文件路径
+            Optional[str]: 导出文件路径，没有记录时返回None
         """
+        if format_type not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {format_type}")
+        
+        if self.memory_manager.count_recent_history(days) == 0:
+            logger.warning("No history records found for export")
+            return None
+        
+        filepath = build_export_path(format_type, compress, output_dir)
         try:
-            # 获取历史记录
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=days)
-            
-            query = """
-            SELECT query_text, query_type, success, execution_time, timestamp, result_summary
-            FROM query_history 
-            WHERE timestamp >= ? AND timestamp <= ?
-            ORDER BY timestamp DESC
-            """
-            
-            cursor = self.db_connection.cursor()
-            cursor.execute(query, (start_date.isoformat(), end_date.isoformat()))
-            records = cursor.fetchall()
-            
-            if not records:
-                logger.warning("No history records found for export")
-                return None
-            
-            # 生成文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"history_export_{timestamp}.{format_type}"
-            filepath = os.path.join(os.getcwd(), filename)
-            
-            if format_type == 'csv':
-                import csv
-                with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow(['查询内容', '查询类型', '是否成功', '执行时间(秒)', '时间戳', '结果摘要'])
-                    for record in records:
-                        writer.writerow(record)
-            
-            elif format_type == 'json':
-                import json
-                data = []
-                for record in records:
-                    data.append({
-                        'query_text': record[0],
-                        'query_type': record[1],
-                        'success': bool(record[2]),
-                        'execution_time': record[3],
-                        'timestamp': record[4],
-                        'result_summary': record[5]
-                    })
-                
-                with open(filepath, 'w', encoding='utf-8') as jsonfile:
-                    json.dump(data, jsonfile, ensure_ascii=False, indent=2)
-            
-            logger.info(f"History exported to {filepath}")
-            return filepath
-            
+            exporter = HistoryExporter(self.memory_manager)
+            count = exporter.export(filepath, format_type, days=days, compress=compress,
+                                    progress_callback=progress_callback)
         except Exception as e:
             logger.error(f"Error exporting history: {e}")
+            if os.path.exists(filepath):
+                os.remove(filepath)
             raise
+        
+        logger.info(f"Exported {count} history record(s) to {filepath}")
+        return filepath
     
-    def clear_history(self) -> bool:
-        """清空历史记录
+    def get_trace(self, record_id: int) -> List[Dict[str, Any]]:
+        """获取一条历史记录的各阶段span
         
+        Args:
+            record_id: 记录ID
+            
         Returns:
-            bool: 是否成功清空
+            List[Dict]: span列表（按开始时间排序），未记录trace时为空
         """
-        try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("DELETE FROM query_history")
-            self.db_connection.commit()
-            
-            logger.info("History cleared successfully")
-            return True
+        return self.memory_manager.get_spans([record_id]).get(record_id, [])
+    
+    def export_traces(self, days: int = 30, output_dir: Optional[str] = None) -> Optional[str]:
+        """将最近的trace导出为OTLP/JSON格式的JSONL文件（每行一个trace）
+        
+        Args:
+            days: 导出最近几天的记录
+            output_dir: 输出目录，默认为当前工作目录
             
-        except Exception as e:
-            logger.error(f"Error clearing history: {e}")
-            return False
+        Returns:
+            Optional[str]: 导出文件路径，没有trace时返回None
+        """
+        filepath = build_trace_export_path(output_dir)
+        count = export_traces_jsonl(self.memory_manager, filepath, days=days)
+        if count == 0:
+            os.remove(filepath)
+            logger.warning("No traces found for export")
+            return None
+        
+        logger.info(f"Exported {count} trace(s) to {filepath}")
+        return filepath
     
     def add_user_feedback(self, query_id: int, feedback: str):
         """添加用户反馈
@@ -403,9 +493,17 @@ class HistoryService:
         Args:
             days: 清除多少天前的记录，None表示清除当前会话
         """
+        # 先写入队列中的记录，否则清除之后它们才落盘，被清除的查询会重新出现
+        self.flush()
         if days is None:
             self.memory_manager.clear_session_history()
             logger.info("Current session history cleared")
         else:
-            # 这里需要在MemoryManager中添加按日期清除的方法
-            logger.info(f"History older than {days} days would be cleared")
\ No newline at end of file
+            deleted = self.memory_manager.delete_history_before(datetime.now() - timedelta(days=days))
+            logger.info(f"Cleared {deleted} history record(s) older than {days} days")
+        self.rebuild_query_index()
+    
+    def rebuild_query_index(self):
+        """按数据库中现有的历史记录重建查询建议索引（记录被清除或归档后调用）"""
+        self.flush()
+        self.query_index.rebuild(self.memory_manager.get_successful_queries(Config.SUGGESTION_INDEX_SIZE))
\ No newline at end of file
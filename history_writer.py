@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录异步写入模块
+以write-behind方式批量写入查询历史，避免请求路径等待SQLite
+"""
+
+import atexit
+import queue
+import threading
+import time
+import logging
+from typing import List, Dict, Any, Optional
+from memory_manager import MemoryManager, QueryRecord
+from language_utils import language_detector
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriter:
+    """历史记录异步写入器
+
+    请求线程只负责入队，后台线程将队列中的记录按批次合并，
+    在单个事务中提交（group commit）。队列有界，队列满时按策略处理：
+    - block: 阻塞等待（最多 block_timeout 秒），超时则丢弃新记录
+    - drop_newest: 直接丢弃新记录
+    - drop_oldest: 丢弃队列中最旧的记录，为新记录腾出空间
+    """
+
+    POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+    def __init__(self,
+                 memory_manager: MemoryManager,
+                 max_queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None,
+                 policy: Optional[str] = None,
+                 block_timeout: float = 1.0):
+        """初始化异步写入器
+
+        Args:
+            memory_manager: 记忆管理器实例
+            max_queue_size: 队列最大长度
+            batch_size: 单次提交的最大记录数
+            flush_interval: 收到首条记录后等待凑批的最长时间（秒）
+            policy: 队列满时的处理策略
+            block_timeout: block策略下的最长等待时间（秒）
+        """
+        self.memory_manager = memory_manager
+        self.max_queue_size = max_queue_size or Config.HISTORY_QUEUE_SIZE
+        self.batch_size = batch_size or Config.HISTORY_BATCH_SIZE
+        self.flush_interval = Config.HISTORY_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.policy = policy or Config.HISTORY_QUEUE_POLICY
+        self.block_timeout = block_timeout
+
+        if self.policy not in self.POLICIES:
+            raise ValueError(f"Unsupported queue policy: {self.policy}")
+
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        # 已入队但尚未落盘的记录数，用于flush等待
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'submitted': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'total_flush_time': 0.0,
+            'last_flush_time': 0.0,
+            'max_flush_time': 0.0,
+            'max_queue_depth': 0
+        }
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+        # 进程退出时将剩余记录落盘
+        atexit.register(self.close)
+        logger.info(f"HistoryWriter started (queue={self.max_queue_size}, batch={self.batch_size}, policy={self.policy})")
+
+    def submit(self, record: QueryRecord) -> bool:
+        """提交一条记录到写入队列
+
+        Args:
+            record: 查询记录对象
+
+        Returns:
+            bool: 是否成功入队（被丢弃时返回False）
+        """
+        if self._stop_event.is_set():
+            logger.warning("HistoryWriter is closed, writing record synchronously")
+            self._write_batch([record])
+            return True
+
+        with self._pending_cond:
+            self._pending += 1
+
+        try:
+            if self.policy == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            elif self.policy == 'drop_newest':
+                self._queue.put_nowait(record)
+            else:
+                self._put_dropping_oldest(record)
+        except queue.Full:
+            self._mark_done(1)
+            self._incr('dropped')
+            logger.warning("History queue full, record dropped")
+            return False
+
+        self._incr('submitted')
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            if depth > self._metrics['max_queue_depth']:
+                self._metrics['max_queue_depth'] = depth
+        return True
+
+    def _put_dropping_oldest(self, record: QueryRecord):
+        """入队，队列满时丢弃最旧的记录"""
+        while True:
+            try:
+                self._queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self._mark_done(1)
+                self._incr('dropped')
+                logger.warning("History queue full, oldest record dropped")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中的记录全部落盘
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._pending_cond:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """停止后台线程，并在退出前写入剩余记录
+
+        Args:
+            timeout: 等待后台线程退出的最长时间（秒）
+        """
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        # 后台线程未能处理完的记录在当前线程写入
+        remaining = self._drain(self._queue.qsize())
+        if remaining:
+            self._write_batch(remaining)
+        logger.info(f"HistoryWriter closed, metrics: {self.get_metrics()}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取写入器运行指标
+
+        Returns:
+            Dict[str, Any]: 队列深度、写入数量、丢弃数量及刷盘耗时等指标
+        """
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        batches = metrics['batches']
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': metrics['max_queue_depth'],
+            'queue_capacity': self.max_queue_size,
+            'policy': self.policy,
+            'submitted': metrics['submitted'],
+            'written': metrics['written'],
+            'dropped': metrics['dropped'],
+            'failed': metrics['failed'],
+            'batches': batches,
+            'avg_batch_size': metrics['written'] / batches if batches else 0.0,
+            'avg_flush_ms': metrics['total_flush_time'] / batches * 1000 if batches else 0.0,
+            'last_flush_ms': metrics['last_flush_time'] * 1000,
+            'max_flush_ms': metrics['max_flush_time'] * 1000
+        }
+
+    def _run(self):
+        """后台写入循环"""
+        while not self._stop_event.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            # 在刷盘间隔内尽量凑满一个批次
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop_event.is_set():
+                    batch.extend(self._drain(self.batch_size - len(batch)))
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write_batch(batch)
+
+    def _drain(self, max_items: int) -> List[QueryRecord]:
+        """非阻塞地取出队列中的记录"""
+        items = []
+        while len(items) < max_items:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _write_batch(self, batch: List[QueryRecord]):
+        """在单个事务中写入一批记录"""
+        start_time = time.perf_counter()
+        try:
+            for record in batch:
+                # 语言检测移出请求路径，在后台线程完成
+                if not record.language:
+                    record.language = language_detector.detect_language(record.user_query)
+            self.memory_manager.save_queries(batch)
+            elapsed = time.perf_counter() - start_time
+            with self._metrics_lock:
+                self._metrics['written'] += len(batch)
+                self._metrics['batches'] += 1
+                self._metrics['total_flush_time'] += elapsed
+                self._metrics['last_flush_time'] = elapsed
+                self._metrics['max_flush_time'] = max(self._metrics['max_flush_time'], elapsed)
+        except Exception as e:
+            self._incr('failed', len(batch))
+            logger.error(f"Failed to write {len(batch)} history record(s): {e}", exc_info=True)
+        finally:
+            self._mark_done(len(batch))
+
+    def _mark_done(self, count: int):
+        """减少待写入计数并唤醒flush等待者"""
+        with self._pending_cond:
+            self._pending = max(0, self._pending - count)
+            if self._pending == 0:
+                self._pending_cond.notify_all()
+
+    def _incr(self, key: str, value: int = 1):
+        """线程安全地累加指标"""
+        with self._metrics_lock:
+            self._metrics[key] += value
@@ -0,0 +1,644 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引建议模块
+从SQL执行日志和查询历史中提取实际执行过的SQL，用 EXPLAIN QUERY PLAN 找出全表扫描，
+在只含表结构和统计信息的内存副本上评估候选复合索引，输出建议并可直接创建、对比前后耗时
+
+用法:
+    python index_advisor.py --db data/order_database.db --log logs/sql_queries.jsonl
+    python index_advisor.py --db data/loreal_insight.db --history chat_history.db --apply
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import statistics
+import time
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Iterable, Tuple
+
+from config import Config
+from stats_catalog import get_stats_catalog, sqlite_path_from_uri
+from rollups import get_rollup_manager, tokenize_sql, SqlToken
+
+logger = logging.getLogger(__name__)
+
+# sql_logger 的JSONL日志中表示SQL执行的事件
+EXECUTED_SQL_EVENTS = ('execute', 'execution')
+# 旧版文本日志格式：时间 - 级别 - 消息（消息可能跨多行）
+LOG_ENTRY_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - \w+ - (.*)$')
+EXECUTED_SQL_PREFIX = '执行SQL: '
+# 日志文件可能由中文Windows环境写入（GBK编码）
+LOG_ENCODINGS = ('utf-8', 'gbk')
+
+_CLAUSE_KEYWORDS = {'SELECT': 'select', 'FROM': 'from', 'JOIN': 'from', 'WHERE': 'where', 'ON': 'where',
+                    'GROUP': 'group', 'HAVING': 'having', 'ORDER': 'order', 'LIMIT': 'limit'}
+_ALIAS_STOP_WORDS = {'WHERE', 'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL',
+                     'CROSS', 'NATURAL', 'OUTER', 'ON', 'USING', 'UNION', 'EXCEPT', 'INTERSECT', 'WINDOW'}
+_RANGE_OPERATORS = {'<', '>', '<=', '>='}
+_EQUALITY_OPERATORS = {'=', '=='}
+_PLAN_TABLE = re.compile(r'^(?:SCAN|SEARCH) (\S+)')
+
+def _quote(identifier: str) -> str:
+    """为SQL标识符加双引号"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+def read_log_text(path: str) -> str:
+    """读取日志文件，依次尝试UTF-8和GBK编码"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    for encoding in LOG_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode(LOG_ENCODINGS[-1], errors='replace')
+
+def normalize_sql(sql: Optional[str]) -> Optional[str]:
+    """规范化SQL文本：去掉代码块标记、多余空白和结尾分号，非查询语句返回None"""
+    if not sql:
+        return None
+    lines = [line for line in sql.strip().splitlines() if not line.strip().startswith('```')]
+    text = ' '.join(' '.join(lines).split()).rstrip(';').strip()
+    if not text or text.split(None, 1)[0].upper() not in ('SELECT', 'WITH'):
+        return None
+    return text
+
+def load_log_workload(log_path: str = Config.SQL_LOG_PATH, include_rotated: bool = True) -> List[str]:
+    """从SQL执行日志中提取执行过的SQL（支持JSONL日志和旧版文本日志）
+
+    Args:
+        log_path: sql_logger 写入的日志文件
+        include_rotated: 是否同时读取轮转出的备份文件（.1、.2 ...）
+
+    Returns:
+        List[str]: 规范化后的SQL（保留重复，用于统计执行频次）
+    """
+    paths = [log_path]
+    if include_rotated:
+        index = 1
+        while os.path.exists(f"{log_path}.{index}"):
+            paths.append(f"{log_path}.{index}")
+            index += 1
+
+    queries = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        messages: List[str] = []
+        for line in read_log_text(path).splitlines():
+            if line.startswith('{'):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if isinstance(entry, dict):
+                    if entry.get('event') in EXECUTED_SQL_EVENTS:
+                        sql = normalize_sql(entry.get('sql'))
+                        if sql:
+                            queries.append(sql)
+                    continue
+            match = LOG_ENTRY_PATTERN.match(line)
+            if match:
+                messages.append(match.group(1))
+            elif messages:
+                messages[-1] += '\n' + line
+        for message in messages:
+            if message.startswith(EXECUTED_SQL_PREFIX):
+                sql = normalize_sql(message[len(EXECUTED_SQL_PREFIX):])
+                if sql:
+                    queries.append(sql)
+    return queries
+
+def load_history_workload(history_db: str = 'chat_history.db', limit: int = 5000) -> List[str]:
+    """从查询历史库中提取执行成功的SQL
+
+    同时支持 memory_manager 的 sql_generated 列和业务库 query_history 的 generated_sql 列。
+    """
+    if not os.path.exists(history_db):
+        return []
+    conn = sqlite3.connect(history_db)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(query_history)")}
+        column = 'sql_generated' if 'sql_generated' in columns else 'generated_sql' if 'generated_sql' in columns else None
+        if column is None:
+            return []
+        condition = "success = 1 AND " if 'success' in columns else ""
+        rows = conn.execute(
+            f"SELECT {column} FROM query_history WHERE {condition}{column} IS NOT NULL "
+            f"ORDER BY rowid DESC LIMIT ?", (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [sql for sql in (normalize_sql(row[0]) for row in rows) if sql]
+
+def plan_cost(plan: List[str]) -> int:
+    """按查询计划估算相对代价：全表扫描 > 索引扫描 > 索引查找，临时B树排序额外计分"""
+    cost = 0
+    for detail in plan:
+        if detail.startswith('SCAN '):
+            cost += 30 if 'COVERING INDEX' in detail else 60 if ' USING ' in detail else 100
+        elif detail.startswith('SEARCH '):
+            if 'AUTOMATIC' in detail:
+                cost += 100
+            else:
+                cost += 5 if 'COVERING INDEX' in detail or 'PRIMARY KEY' in detail else 10
+        elif 'TEMP B-TREE' in detail:
+            cost += 20
+    return cost
+
+@dataclass
+class ColumnUsage:
+    """查询中某张表各列的使用方式（按出现顺序）"""
+    equality: List[str] = field(default_factory=list)
+    range: List[str] = field(default_factory=list)
+    group: List[str] = field(default_factory=list)
+    order: List[str] = field(default_factory=list)
+    referenced: List[str] = field(default_factory=list)
+
+    def add(self, kind: str, column: str):
+        columns = getattr(self, kind)
+        if column not in columns:
+            columns.append(column)
+
+@dataclass
+class QueryProfile:
+    """工作负载中的一条查询"""
+    sql: str
+    executed_sql: str  # 汇总表改写后实际执行的SQL
+    count: int
+    plan_before: List[str] = field(default_factory=list)
+    plan_after: List[str] = field(default_factory=list)
+
+    @property
+    def improved(self) -> bool:
+        return bool(self.plan_after) and plan_cost(self.plan_after) < plan_cost(self.plan_before)
+
+@dataclass
+class IndexRecommendation:
+    """索引建议"""
+    table: str
+    columns: Tuple[str, ...]
+    name: str
+    query_count: int = 0  # 受益查询的执行次数
+    benefit: int = 0  # 按执行次数加权的计划代价下降
+    examples: List[str] = field(default_factory=list)
+
+    @property
+    def create_sql(self) -> str:
+        return (f"CREATE INDEX IF NOT EXISTS {_quote(self.name)} ON {_quote(self.table)} "
+                f"({', '.join(_quote(column) for column in self.columns)})")
+
+@dataclass
+class IndexAdvice:
+    """索引建议结果"""
+    recommendations: List[IndexRecommendation]
+    queries: List[QueryProfile]
+
+    def improved_queries(self, limit: Optional[int] = None) -> List[QueryProfile]:
+        """计划得到改善的查询，按执行次数降序"""
+        queries = sorted((q for q in self.queries if q.improved), key=lambda q: -q.count)
+        return queries[:limit] if limit else queries
+
+class IndexAdvisor:
+    """基于工作负载的索引建议器
+
+    候选索引由查询的等值条件列、范围条件列、GROUP BY / ORDER BY 列及覆盖列组合而成，
+    在只含表结构的内存副本上创建并写入由统计信息目录估算的 sqlite_stat1，
+    由SQLite优化器为每条查询选择，只保留被选中且使计划代价下降的索引。
+    """
+
+    def __init__(self, db_path: str, min_rows: int = 10000, max_columns: int = 4, max_indexes: int = 5,
+                 rewrite: bool = True):
+        """初始化索引建议器
+
+        Args:
+            db_path: 数据库文件路径或 sqlite:/// 连接URI
+            min_rows: 只为行数不少于此值的表建议索引
+            max_columns: 单个索引的最大列数
+            max_indexes: 最多建议的索引数
+            rewrite: 评估前是否先按汇总表改写查询（与实际执行路径一致）
+        """
+        self.db_path = sqlite_path_from_uri(db_path)
+        self.min_rows = min_rows
+        self.max_columns = max_columns
+        self.max_indexes = max_indexes
+        self.rewrite = rewrite
+
+    def analyze(self, workload: Iterable[str]) -> IndexAdvice:
+        """分析工作负载并生成索引建议
+
+        Args:
+            workload: SQL列表（重复出现的SQL按次数加权）
+
+        Returns:
+            IndexAdvice: 索引建议及每条查询改善前后的计划
+        """
+        counts = Counter(sql for sql in (normalize_sql(s) for s in workload) if sql)
+        tables = get_stats_catalog(self.db_path).get_tables()
+        columns, existing = self._load_schema()
+
+        clone = self._build_clone(tables)
+        try:
+            profiles: List[QueryProfile] = []
+            candidates: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+            for sql, count in counts.most_common():
+                executed = get_rollup_manager(self.db_path).rewrite(sql) if self.rewrite else sql
+                plan = self._explain(clone, executed)
+                if plan is None:
+                    continue
+                profiles.append(QueryProfile(sql, executed, count, plan_before=plan))
+                for table, index_columns in self._candidates(executed, plan, columns, existing, tables):
+                    candidates.setdefault((table, index_columns), f"advisor_candidate_{len(candidates)}")
+
+            # 第一轮：所有候选同时存在，由优化器为每条查询选择
+            self._create_candidates(clone, candidates, tables)
+            used = set()
+            for profile in profiles:
+                plan = self._explain(clone, profile.executed_sql) or []
+                if plan_cost(plan) < plan_cost(profile.plan_before):
+                    used.update(name for name in candidates.values() if self._uses_index(plan, name))
+
+            # 第二轮：去掉未被选中的候选，以及是其他候选前缀的冗余索引
+            chosen = {key: name for key, name in candidates.items() if name in used}
+            chosen = {key: name for key, name in chosen.items() if not any(
+                other[0] == key[0] and other[1] != key[1] and other[1][:len(key[1])] == key[1] for other in chosen)}
+            for name in set(candidates.values()) - set(chosen.values()):
+                clone.execute(f"DROP INDEX {_quote(name)}")
+
+            recommendations = {name: IndexRecommendation(table, index_columns, self._index_name(table, index_columns))
+                               for (table, index_columns), name in chosen.items()}
+            for profile in profiles:
+                profile.plan_after = self._explain(clone, profile.executed_sql) or []
+                if not profile.improved:
+                    continue
+                for name, recommendation in recommendations.items():
+                    if self._uses_index(profile.plan_after, name):
+                        recommendation.query_count += profile.count
+                        recommendation.benefit += profile.count * (plan_cost(profile.plan_before) -
+                                                                   plan_cost(profile.plan_after))
+                        if len(recommendation.examples) < 3:
+                            recommendation.examples.append(profile.sql)
+        finally:
+            clone.close()
+
+        ranked = sorted((r for r in recommendations.values() if r.benefit > 0), key=lambda r: -r.benefit)
+        logger.info(f"Index advisor: {len(profiles)} distinct queries, {len(candidates)} candidates, "
+                    f"{len(ranked)} recommended")
+        return IndexAdvice(recommendations=ranked[:self.max_indexes], queries=profiles)
+
+    def apply(self, recommendations: List[IndexRecommendation]) -> List[str]:
+        """在数据库中创建建议的索引并重新采集统计信息
+
+        Returns:
+            List[str]: 已创建的索引名
+        """
+        if not recommendations:
+            return []
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for recommendation in recommendations:
+                start_time = time.perf_counter()
+                conn.execute(recommendation.create_sql)
+                logger.info(f"Created index {recommendation.name} in {time.perf_counter() - start_time:.2f}s")
+            conn.execute("PRAGMA analysis_limit = 1000")
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        return [recommendation.name for recommendation in recommendations]
+
+    def benchmark(self, queries: List[str], repeat: int = 3) -> Dict[str, Optional[float]]:
+        """以只读方式执行查询，返回每条查询耗时的中位数（毫秒），执行失败为None"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        results: Dict[str, Optional[float]] = {}
+        try:
+            conn.execute("PRAGMA query_only = 1")
+            for sql in queries:
+                timings = []
+                try:
+                    for _ in range(repeat):
+                        start_time = time.perf_counter()
+                        conn.execute(sql).fetchall()
+                        timings.append((time.perf_counter() - start_time) * 1000)
+                    results[sql] = statistics.median(timings)
+                except sqlite3.Error as e:
+                    logger.warning(f"Benchmark query failed: {e}")
+                    results[sql] = None
+        finally:
+            conn.close()
+        return results
+
+    def _load_schema(self) -> Tuple[Dict[str, Dict[str, str]], Dict[str, List[Tuple[str, ...]]]]:
+        """读取各表的列（小写名 -> 原名，不含 INTEGER PRIMARY KEY）和已有索引的列"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            columns: Dict[str, Dict[str, str]] = {}
+            existing: Dict[str, List[Tuple[str, ...]]] = {}
+            for (table,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            ).fetchall():
+                info = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+                pk_columns = [row for row in info if row[5]]
+                rowid_alias = (pk_columns[0][1] if len(pk_columns) == 1 and pk_columns[0][2].upper() == 'INTEGER'
+                               else None)
+                columns[table.lower()] = {row[1].lower(): row[1] for row in info if row[1] != rowid_alias}
+                existing[table.lower()] = [
+                    tuple(row[2].lower() for row in conn.execute(f"PRAGMA index_info({_quote(index[1])})"))
+                    for index in conn.execute(f"PRAGMA index_list({_quote(table)})").fetchall()
+                ]
+            return columns, existing
+        finally:
+            conn.close()
+
+    def _build_clone(self, tables) -> sqlite3.Connection:
+        """创建只含表结构、已有索引和估算统计信息的内存数据库"""
+        source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            objects = source.execute("""
+                SELECT type, name, tbl_name, sql FROM sqlite_master
+                WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' AND type IN ('table', 'view', 'index')
+                ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'view' THEN 1 ELSE 2 END
+            """).fetchall()
+            has_stat1 = source.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+            real_stats = source.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall() if has_stat1 else []
+        finally:
+            source.close()
+
+        # EXPLAIN 语句不会因表结构变化重新编译，关闭语句缓存以免增删候选索引后读到旧计划
+        clone = sqlite3.connect(':memory:', cached_statements=0)
+        for kind, name, _, sql in objects:
+            try:
+                clone.execute(sql)
+            except sqlite3.Error as e:
+                logger.debug(f"Skipped {kind} {name} in schema clone: {e}")
+        clone.execute("ANALYZE")  # 创建 sqlite_stat1
+
+        stat_rows = {(tbl, idx): stat for tbl, idx, stat in real_stats}
+        for kind, name, table, _ in objects:
+            if kind == 'index' and (table, name) not in stat_rows:
+                stat_rows[(table, name)] = self._estimate_stat(tables.get(table), self._index_columns(clone, name))
+        for table, stats in tables.items():
+            if not any(key[0] == table for key in stat_rows):
+                stat_rows[(table, None)] = str(max(stats.row_count, 1))
+        clone.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)",
+                          [(tbl, idx, stat) for (tbl, idx), stat in stat_rows.items() if stat])
+        clone.execute("ANALYZE sqlite_master")  # 重新载入统计信息
+        return clone
+
+    def _create_candidates(self, clone: sqlite3.Connection, candidates: Dict[Tuple[str, Tuple[str, ...]], str],
+                           tables):
+        """在内存副本中创建候选索引并写入估算的统计信息"""
+        actual_names = {name.lower(): name for name in tables}
+        for (table, index_columns), name in candidates.items():
+            table_name = actual_names.get(table, table)
+            clone.execute(f"CREATE INDEX {_quote(name)} ON {_quote(table_name)} "
+                          f"({', '.join(_quote(column) for column in index_columns)})")
+            clone.execute("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)",
+                          (table_name, name, self._estimate_stat(tables.get(table_name), index_columns)))
+        clone.execute("ANALYZE sqlite_master")
+
+    @staticmethod
+    def _index_columns(conn: sqlite3.Connection, index_name: str) -> Tuple[str, ...]:
+        return tuple(row[2] for row in conn.execute(f"PRAGMA index_info({_quote(index_name)})") if row[2])
+
+    @staticmethod
+    def _estimate_stat(table_stats, index_columns: Tuple[str, ...]) -> Optional[str]:
+        """按列基数估算 sqlite_stat1 中的索引统计（总行数 + 每个前缀平均匹配行数）"""
+        if table_stats is None:
+            return None
+        row_count = max(table_stats.row_count, 1)
+        distinct = {column.name.lower(): column.distinct_count for column in table_stats.columns}
+        parts = [str(row_count)]
+        combinations = 1
+        for column in index_columns:
+            combinations = min(row_count, combinations * max(distinct.get(column.lower(), row_count), 1))
+            parts.append(str(max(1, math.ceil(row_count / combinations))))
+        return ' '.join(parts)
+
+    @staticmethod
+    def _explain(conn: sqlite3.Connection, sql: str) -> Optional[List[str]]:
+        """返回查询计划各步骤的描述，无法解析的SQL返回None"""
+        try:
+            return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+        except sqlite3.Error as e:
+            logger.debug(f"EXPLAIN failed: {e}: {sql}")
+            return None
+
+    @staticmethod
+    def _uses_index(plan: List[str], index_name: str) -> bool:
+        return any(re.search(rf'\bINDEX {re.escape(index_name)}\b', detail) for detail in plan)
+
+    def _candidates(self, sql: str, plan: List[str], columns: Dict[str, Dict[str, str]],
+                    existing: Dict[str, List[Tuple[str, ...]]], tables) -> List[Tuple[str, Tuple[str, ...]]]:
+        """为计划中被全表扫描（或需要排序）的大表生成候选索引列组合"""
+        tokens = tokenize_sql(sql)
+        if not tokens:
+            return []
+        aliases = self._table_aliases(tokens, columns)
+        row_counts = {name.lower(): stats.row_count for name, stats in tables.items()}
+
+        scanned = set()
+        for detail in plan:
+            match = _PLAN_TABLE.match(detail)
+            if match and (detail.startswith('SCAN ') or 'AUTOMATIC' in detail):
+                table = aliases.get(match.group(1).lower())
+                if table and row_counts.get(table, 0) >= self.min_rows:
+                    scanned.add(table)
+        if not scanned:
+            return []
+
+        candidates = []
+        usages = self._column_usage(tokens, aliases, columns)
+        for table in scanned:
+            usage = usages.get(table)
+            if usage is None:
+                continue
+            table_columns = columns[table]
+            for index_columns in self._candidate_columns(usage, len(table_columns)):
+                if any(index[:len(index_columns)] == index_columns for index in existing.get(table, [])):
+                    continue  # 已有索引以这些列开头
+                candidates.append((table, tuple(table_columns[column] for column in index_columns)))
+        return candidates
+
+    def _candidate_columns(self, usage: ColumnUsage, table_width: int) -> List[Tuple[str, ...]]:
+        """候选列组合：等值列 + 范围列、等值列 + 分组/排序列，以及各自加上其余引用列的覆盖索引"""
+        equality = usage.equality
+        range_columns = [column for column in usage.range if column not in equality][:1]
+        bases = [equality + range_columns]
+        ordering = usage.group or usage.order
+        if ordering:
+            bases.append(equality + [column for column in ordering if column not in equality])
+
+        candidates = []
+        for base in bases:
+            if base and len(base) <= self.max_columns:
+                candidates.append(tuple(base))
+            covering = base + [column for column in usage.referenced if column not in base]
+            if len(covering) <= self.max_columns and len(covering) < table_width:
+                candidates.append(tuple(covering))
+        return list(dict.fromkeys(candidates))
+
+    @staticmethod
+    def _table_aliases(tokens: List[SqlToken], columns: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """解析 FROM / JOIN 中的表名及别名（小写别名 -> 小写表名）"""
+        aliases = {}
+        in_from = False
+        for i, token in enumerate(tokens):
+            if token.upper in _CLAUSE_KEYWORDS:
+                in_from = _CLAUSE_KEYWORDS[token.upper] == 'from'
+            if not in_from or (token.upper not in ('FROM', 'JOIN') and token.text != ','):
+                continue
+            j = i + 1
+            if j >= len(tokens) or not tokens[j].is_identifier() or tokens[j].name not in columns:
+                continue
+            table = tokens[j].name
+            aliases[table] = table
+            j += 1
+            if j < len(tokens) and tokens[j].upper == 'AS':
+                j += 1
+            if (j < len(tokens) and tokens[j].is_identifier()
+                    and tokens[j].upper not in _ALIAS_STOP_WORDS and tokens[j].upper not in _CLAUSE_KEYWORDS):
+                aliases[tokens[j].name] = table
+        return aliases
+
+    @staticmethod
+    def _column_usage(tokens: List[SqlToken], aliases: Dict[str, str],
+                      columns: Dict[str, Dict[str, str]]) -> Dict[str, ColumnUsage]:
+        """按子句统计每张表各列的使用方式"""
+        tables = set(aliases.values())
+        usages = {table: ColumnUsage() for table in tables}
+        clause = None
+        function_depth = []  # 括号栈：True 表示函数调用的括号
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token.upper in _CLAUSE_KEYWORDS:
+                clause = _CLAUSE_KEYWORDS[token.upper]
+            elif token.text == '(':
+                function_depth.append(i > 0 and tokens[i - 1].kind == 'word')
+            elif token.text == ')':
+                if function_depth:
+                    function_depth.pop()
+            elif token.is_identifier() and clause not in (None, 'from', 'limit'):
+                # 解析 [别名.]列名
+                table = column = None
+                end = i
+                if i + 2 < len(tokens) and tokens[i + 1].text == '.' and tokens[i + 2].is_identifier():
+                    table = aliases.get(token.name)
+                    column = tokens[i + 2].name
+                    end = i + 2
+                elif i + 1 < len(tokens) and tokens[i + 1].text == '(':
+                    pass  # 函数名
+                else:
+                    owners = [t for t in tables if token.name in columns[t]]
+                    if len(owners) == 1:
+                        table, column = owners[0], token.name
+                if table and column in columns.get(table, {}):
+                    usage = usages[table]
+                    usage.add('referenced', column)
+                    in_function = any(function_depth)
+                    if clause == 'where' and not in_function:
+                        following = tokens[end + 1] if end + 1 < len(tokens) else None
+                        preceding = tokens[i - 1] if i > 0 else None
+                        if following is not None and (following.text in _EQUALITY_OPERATORS
+                                                      or following.upper in ('IN', 'IS')):
+                            usage.add('equality', column)
+                        elif following is not None and (following.text in _RANGE_OPERATORS
+                                                        or following.upper == 'BETWEEN'):
+                            usage.add('range', column)
+                        elif preceding is not None and preceding.text in _EQUALITY_OPERATORS:
+                            usage.add('equality', column)
+                        elif preceding is not None and preceding.text in _RANGE_OPERATORS:
+                            usage.add('range', column)
+                    elif clause in ('group', 'order') and not in_function:
+                        usage.add(clause, column)
+                i = end
+            i += 1
+        return usages
+
+    @staticmethod
+    def _index_name(table: str, index_columns: Tuple[str, ...]) -> str:
+        """生成索引名，过长时截断并附加哈希"""
+        name = re.sub(r'\W+', '_', f"idx_advisor_{table}_{'_'.join(index_columns)}").lower()
+        if len(name) > 60:
+            digest = hashlib.md5(name.encode('utf-8')).hexdigest()[:8]
+            name = f"{name[:51]}_{digest}"
+        return name
+
+def format_recommendations(advice: IndexAdvice) -> str:
+    """生成索引建议的文本报告"""
+    if not advice.recommendations:
+        return f"分析了 {len(advice.queries)} 条不同的查询，没有需要新建的索引。"
+    lines = [f"分析了 {len(advice.queries)} 条不同的查询，建议创建 {len(advice.recommendations)} 个索引：", ""]
+    for recommendation in advice.recommendations:
+        lines.append(f"{recommendation.create_sql};")
+        lines.append(f"  -- 受益查询执行次数: {recommendation.query_count}，加权代价下降: {recommendation.benefit}")
+        for example in recommendation.examples:
+            lines.append(f"  -- 例: {example[:160]}")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+def format_latency_report(queries: List[QueryProfile], before: Dict[str, Optional[float]],
+                          after: Dict[str, Optional[float]]) -> str:
+    """生成创建索引前后的耗时对比报告"""
+    lines = [f"{'次数':>6} {'创建前(ms)':>12} {'创建后(ms)':>12} {'加速':>8}  SQL"]
+    total_before = total_after = 0.0
+    for query in queries:
+        before_ms, after_ms = before.get(query.executed_sql), after.get(query.executed_sql)
+        if before_ms is None or after_ms is None:
+            continue
+        total_before += before_ms * query.count
+        total_after += after_ms * query.count
+        speedup = before_ms / after_ms if after_ms > 0 else float('inf')
+        lines.append(f"{query.count:>6} {before_ms:>12.2f} {after_ms:>12.2f} {speedup:>7.1f}x  {query.sql[:100]}")
+    if total_after > 0:
+        lines.append(f"按执行次数加权合计: {total_before:.1f} ms -> {total_after:.1f} ms "
+                     f"({total_before / total_after:.1f}x)")
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="根据实际执行的SQL工作负载建议（并创建）索引")
+    parser.add_argument('--db', default=Config.DATABASE_URL, help='数据库路径或 sqlite:/// URI')
+    parser.add_argument('--log', default=Config.SQL_LOG_PATH, help='SQL执行日志，为空表示不读取')
+    parser.add_argument('--history', default=None, help='查询历史数据库（如 chat_history.db）')
+    parser.add_argument('--min-rows', type=int, default=10000, help='只为行数不少于此值的表建议索引')
+    parser.add_argument('--max-indexes', type=int, default=5, help='最多建议的索引数')
+    parser.add_argument('--apply', action='store_true', help='创建建议的索引并输出前后耗时对比')
+    parser.add_argument('--top', type=int, default=20, help='耗时对比的查询数')
+    parser.add_argument('--repeat', type=int, default=3, help='每条查询的执行次数（取中位数）')
+    args = parser.parse_args(argv)
+
+    workload = load_log_workload(args.log) if args.log else []
+    if args.history:
+        workload += load_history_workload(args.history)
+    if not workload:
+        print("没有找到可分析的SQL。")
+        return
+
+    advisor = IndexAdvisor(args.db, min_rows=args.min_rows, max_indexes=args.max_indexes)
+    advice = advisor.analyze(workload)
+    print(format_recommendations(advice))
+    if not args.apply or not advice.recommendations:
+        return
+
+    queries = advice.improved_queries(args.top)
+    sqls = [query.executed_sql for query in queries]
+    before = advisor.benchmark(sqls, repeat=args.repeat)
+    advisor.apply(advice.recommendations)
+    after = advisor.benchmark(sqls, repeat=args.repeat)
+    print()
+    print(format_latency_report(queries, before, after))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
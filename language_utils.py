@@ -5,9 +5,12 @@
 """
 
 import re
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, FrozenSet
 import logging
 
+from langchain_core.prompts import PromptTemplate
+
 logger = logging.getLogger(__name__)
 
 class LanguageDetector:
@@ -29,14 +32,11 @@ class LanguageDetector:
         Returns:
             'zh' for Chinese, 'en' for English, 'mixed' for mixed languages
         """
-        chinese_chars = len(self.chinese_pattern.findall(text))
-        english_words = len(self.english_pattern.findall(text))
-        
-        # 语言检测逻辑
+        # 只需判断是否出现，search 找到第一处即返回，不构造 findall 列表
         languages_detected = []
-        if chinese_chars > 0:
+        if self.chinese_pattern.search(text):
             languages_detected.append('zh')
-        if english_words > 0:
+        if self.english_pattern.search(text):
             languages_detected.append('en')
         
         if len(languages_detected) == 0:
@@ -46,6 +46,76 @@ class LanguageDetector:
         else:
             return 'mixed'
 
+def _trie_regex(keywords: List[str]) -> str:
+    """将关键词列表编译为按公共前缀分解的正则（如 chart|create chart → c(?:hart|reate\ chart)）
+
+    与简单的 a|b|c 相比，每个位置只需沿前缀树匹配一次，而不是依次尝试所有关键词。
+    """
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}  # 关键词结束标记
+
+    def build(node: Dict[str, dict]) -> str:
+        # 较短的关键词已在此结束时不再展开更长的关键词（只判断是否命中，不需要最长匹配）
+        if '' in node:
+            return ''
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+class KeywordMatcher:
+    """编译后的多意图关键词匹配器
+
+    每个意图的关键词在加载时编译为一个按前缀分解的正则（另按语言各编译一个，用于指定语言的匹配），
+    一次 match 调用返回查询命中的全部意图。关键词为子串匹配、不区分大小写，与逐个 `in` 判断的结果一致。
+
+    没有把所有意图合成一个正则：顺序扫描会漏掉相互重叠的关键词（show 中的 how、histogram 开头的 hi），
+    在每个位置加前瞻又会使正则引擎无法按首字符跳过不可能匹配的位置，反而更慢。
+    """
+
+    def __init__(self, keywords: Dict[str, Dict[str, List[str]]]):
+        """初始化匹配器
+
+        Args:
+            keywords: 意图 -> 语言代码 -> 关键词列表
+        """
+        self.keywords = keywords
+        self._patterns: Dict[str, re.Pattern] = {}
+        self._language_patterns: Dict[Tuple[str, str], re.Pattern] = {}
+        for intent, by_language in keywords.items():
+            words = [word.lower() for language_words in by_language.values() for word in language_words]
+            if words:
+                self._patterns[intent] = re.compile(_trie_regex(words))
+            for language, language_words in by_language.items():
+                if language_words:
+                    self._language_patterns[(intent, language)] = re.compile(
+                        _trie_regex([word.lower() for word in language_words]))
+
+    def match(self, query: str, language: str = None) -> FrozenSet[str]:
+        """返回查询命中的所有意图
+
+        Args:
+            query: 查询文本
+            language: 只匹配该语言的关键词（'mixed' 匹配中英文），为None时匹配所有语言
+
+        Returns:
+            命中的意图集合
+        """
+        if not query:
+            return frozenset()
+        query_lower = query.lower()
+        if language is None:
+            return frozenset(intent for intent, pattern in self._patterns.items() if pattern.search(query_lower))
+        languages = ('zh', 'en') if language == 'mixed' else (language,)
+        return frozenset(
+            intent for (intent, keyword_language), pattern in self._language_patterns.items()
+            if keyword_language in languages and pattern.search(query_lower)
+        )
+
 class MultilingualKeywords:
     """多语言关键词管理"""
     
@@ -78,66 +148,43 @@ class MultilingualKeywords:
                 "identity", "name", "who are you", "what can you do"
             ]
         }
+        
+        # 所有调用方共用的编译匹配器
+        self.matcher = KeywordMatcher({'visualization': self.viz_keywords, 'general': self.general_keywords})
+    
+    def match_intents(self, query: str, language: str = None) -> FrozenSet[str]:
+        """一次调用返回查询命中的意图（'visualization' / 'general'）
+        
+        Args:
+            query: 查询文本
+            language: 语言代码，为None时匹配所有语言的关键词
+                （中文关键词只可能出现在检测为中文/混合的文本中，英文同理，因此无需先检测语言）
+        """
+        return self.matcher.match(query, language)
     
     def is_visualization_query(self, query: str, language: str = None) -> bool:
         """检测是否为可视化查询
         
         Args:
             query: 查询文本
-            language: 语言代码，如果为None则自动检测
+            language: 语言代码，如果为None则匹配所有语言
             
         Returns:
             是否为可视化查询
         """
-        if language is None:
-            detector = LanguageDetector()
-            language = detector.detect_language(query)
-        
-        query_lower = query.lower()
-        
-        # 检查中文关键词
-        if language in ['zh', 'mixed']:
-            for keyword in self.viz_keywords['zh']:
-                if keyword in query_lower:
-                    return True
-        
-        # 检查英文关键词
-        if language in ['en', 'mixed']:
-            for keyword in self.viz_keywords['en']:
-                if keyword in query_lower:
-                    return True
-        
-        return False
+        return 'visualization' in self.match_intents(query, language)
     
     def is_general_conversation(self, query: str, language: str = None) -> bool:
         """检测是否为普通对话
         
         Args:
             query: 查询文本
-            language: 语言代码，如果为None则自动检测
+            language: 语言代码，如果为None则匹配所有语言
             
         Returns:
             是否为普通对话
         """
-        if language is None:
-            detector = LanguageDetector()
-            language = detector.detect_language(query)
-        
-        query_lower = query.lower()
-        
-        # 检查中文关键词
-        if language in ['zh', 'mixed']:
-            for keyword in self.general_keywords['zh']:
-                if keyword in query_lower:
-                    return True
-        
-        # 检查英文关键词
-        if language in ['en', 'mixed']:
-            for keyword in self.general_keywords['en']:
-                if keyword in query_lower:
-                    return True
-        
-        return False
+        return 'general' in self.match_intents(query, language)
 
 class MultilingualPrompts:
     """多语言提示模板管理"""
@@ -246,6 +293,12 @@ Response requirements:
 Please respond:"""
         }
     
+        # 回答提示模板在启动时按语言预编译，每个请求直接使用
+        self.sql_answer_templates = {
+            language: PromptTemplate.from_template(template)
+            for language, template in self.sql_answer_prompts.items()
+        }
+    
     def get_prompts(self, language: str) -> Dict[str, str]:
         """获取指定语言的所有提示模板
         
@@ -269,6 +322,10 @@ Please respond:"""
         """获取SQL回答提示模板"""
         return self.sql_answer_prompts.get(language, self.sql_answer_prompts['zh'])
     
+    def get_sql_answer_template(self, language: str) -> PromptTemplate:
+        """获取预编译的SQL回答提示模板"""
+        return self.sql_answer_templates.get(language, self.sql_answer_templates['zh'])
+    
     def get_classify_prompt(self, language: str) -> str:
         """获取对话分类提示模板"""
         return self.conversation_classification_prompts.get(language, self.conversation_classification_prompts['zh'])
@@ -277,6 +334,27 @@ Please respond:"""
         """获取普通对话提示模板"""
         return self.chat_prompts.get(language, self.chat_prompts['zh'])
 
+@dataclass(frozen=True)
+class RequestContext:
+    """单个问题的请求上下文
+
+    语言和意图在请求开始时计算一次，沿对话分类、SQL回答生成和历史记录各步骤传递，
+    各步骤不再各自检测语言。
+    """
+    question: str
+    language: str
+    intents: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_question(cls, question: str) -> 'RequestContext':
+        """检测问题的语言并匹配意图"""
+        return cls(question, language_detector.detect_language(question), multilingual_keywords.match_intents(question))
+
+    @property
+    def is_visualization(self) -> bool:
+        """是否为可视化查询"""
+        return 'visualization' in self.intents
+
 # 全局实例
 language_detector = LanguageDetector()
 multilingual_keywords = MultilingualKeywords()
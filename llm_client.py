@@ -5,7 +5,9 @@ from langchain.llms.base import LLM
 from openai import OpenAI
 from langchain.callbacks.manager import CallbackManagerForLLMRun
 from langchain_community.llms.utils import enforce_stop_tokens
-from language_utils import language_detector, multilingual_prompts
+from language_utils import language_detector, multilingual_prompts, RequestContext
+from tracing import tracer
+from metrics import LLM_CALLS, LLM_TOKENS
 from dotenv import load_dotenv
 
 # 加载 .env 文件中的环境变量
@@ -42,17 +44,26 @@ class SiliconFlow(LLM):
                 base_url=os.environ.get("BASE_URL", "https://api.siliconflow.cn/v1")
             )
             
-            response = client.chat.completions.create(
-                model='Qwen/Qwen2.5-Coder-32B-Instruct',
-                messages=[
-                    {'role': 'user', 'content': prompt}
-                ],
-                stream=False,
-                max_tokens=512,
-                temperature=0.7,
-                top_p=0.7,
-                frequency_penalty=0.5
-            )
+            model = 'Qwen/Qwen2.5-Coder-32B-Instruct'
+            with tracer.span('llm.chat', kind='client', **{'gen_ai.request.model': model}) as span:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {'role': 'user', 'content': prompt}
+                    ],
+                    stream=False,
+                    max_tokens=512,
+                    temperature=0.7,
+                    top_p=0.7,
+                    frequency_penalty=0.5
+                )
+                LLM_CALLS.inc(status='ok')
+                # 记录接口返回的token用量，并累加到所在阶段的span
+                usage = getattr(response, 'usage', None)
+                if usage is not None:
+                    span.add_tokens(usage.prompt_tokens or 0, usage.completion_tokens or 0)
+                    LLM_TOKENS.inc(usage.prompt_tokens or 0, type='prompt')
+                    LLM_TOKENS.inc(usage.completion_tokens or 0, type='completion')
             
             content = ""
             if hasattr(response, 'choices') and response.choices:
@@ -68,6 +79,7 @@ class SiliconFlow(LLM):
             
             return content
         except Exception as e:
+            LLM_CALLS.inc(status='error')
             logger.error(f"API call error: {str(e)}", exc_info=True)
             raise
     
@@ -75,11 +87,12 @@ class SiliconFlow(LLM):
         """简化的调用方法，直接返回文本响应"""
         return self._call(prompt)
     
-    def classify_conversation(self, question: str) -> Tuple[str, str]:
+    def classify_conversation(self, question: str, context: Optional[RequestContext] = None) -> Tuple[str, str]:
         """判断对话类型并返回相应的回答
         
         Args:
             question: 用户的问题
+            context: 请求上下文（已检测的语言），为None时自行检测
             
         Returns:
             Tuple[str, str]: (对话类型, 回答)
@@ -89,7 +102,7 @@ class SiliconFlow(LLM):
         logger.info(f"判断对话类型: {question}")
         try:
             # 检测语言并获取相应的分类提示模板
-            detected_language = language_detector.detect_language(question)
+            detected_language = context.language if context else language_detector.detect_language(question)
             classify_template = multilingual_prompts.get_classify_prompt(detected_language)
             classify_prompt = classify_template.format(question=question)
             
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地LLM替身模块
+提供OpenAI兼容的 /v1/chat/completions 桩服务：record 模式把未录制过的请求转发到真实接口并把
+prompt→completion 写入录制文件（JSONL），replay 模式只从录制文件回放，可注入固定延迟并支持流式输出。
+将 BASE_URL 指向桩服务即可在无网络的环境下运行完整流水线（API_KEY 可为任意非占位值）
+
+用法:
+    python llm_stub.py record --upstream https://api.siliconflow.cn/v1 --cassette data/llm_cassette.jsonl
+    python llm_stub.py replay --cassette data/llm_cassette.jsonl --port 8400 --latency 0.8 --token-latency 0.02
+    BASE_URL=http://127.0.0.1:8400/v1 API_KEY=stub python app.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CASSETTE = 'data/llm_cassette.jsonl'
+DEFAULT_PORT = 8400
+# 流式输出时每个chunk的字符数
+STREAM_CHUNK_CHARS = 8
+
+class CassetteMiss(Exception):
+    """回放时录制文件中没有对应的请求"""
+
+def request_key(messages: List[Dict[str, Any]]) -> str:
+    """按消息内容计算录制键（不含模型和采样参数，更换模型后录制仍可回放）"""
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def estimate_tokens(text: str) -> int:
+    """录制中没有用量时粗略估算token数"""
+    return max(1, len(text) // 4) if text else 0
+
+class Cassette:
+    """prompt→completion 录制文件（每行一个JSON）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        # 同一请求录制了多条时按调用次数轮流回放
+        self._replay_counts: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry['key'], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def __contains__(self, messages: List[Dict[str, Any]]) -> bool:
+        return request_key(messages) in self._entries
+
+    def add(self, messages: List[Dict[str, Any]], content: str, usage: Optional[Dict[str, int]] = None,
+            model: Optional[str] = None, duration_ms: Optional[float] = None) -> Dict[str, Any]:
+        """追加一条录制并写入文件"""
+        entry = {
+            'key': request_key(messages),
+            'model': model,
+            'messages': messages,
+            'content': content,
+            'usage': usage or {'prompt_tokens': estimate_tokens(' '.join(str(m.get('content', '')) for m in messages)),
+                               'completion_tokens': estimate_tokens(content)},
+            'duration_ms': duration_ms
+        }
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._entries.setdefault(entry['key'], []).append(entry)
+        return entry
+
+    def lookup(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """查找录制，没有时抛出 CassetteMiss"""
+        key = request_key(messages)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recording for request {key}")
+            index = self._replay_counts.get(key, 0)
+            self._replay_counts[key] = index + 1
+            return entries[index % len(entries)]
+
+class LLMStub:
+    """桩服务的请求处理逻辑（与HTTP层分开，便于在进程内使用）"""
+
+    def __init__(self, cassette: Cassette, mode: str = 'replay', upstream: Optional[str] = None,
+                 api_key: Optional[str] = None, latency: float = 0.0, token_latency: float = 0.0,
+                 use_recorded_latency: bool = False, timeout: float = 120.0,
+                 responder: Optional[Callable[[List[Dict[str, Any]]], Optional[str]]] = None):
+        """初始化桩服务
+
+        Args:
+            cassette: 录制文件
+            mode: replay 只回放；record 回放已录制的请求，其余转发到 upstream 并录制
+            upstream: 真实接口的基础URL（record 模式必需）
+            api_key: 转发时使用的API密钥，默认沿用客户端请求中的密钥
+            latency: 回放时首个字节前注入的延迟（秒）
+            token_latency: 流式回放时每个chunk之间的延迟（秒）
+            use_recorded_latency: 回放时使用录制时的真实耗时代替 latency
+            timeout: 转发请求的超时时间（秒）
+            responder: replay 模式下未录制的请求交给此函数按消息生成确定性回答，返回None视为未录制
+        """
+        if mode not in ('replay', 'record'):
+            raise ValueError(f"Unknown stub mode: {mode}")
+        if mode == 'record' and not upstream:
+            raise ValueError("record mode requires an upstream URL")
+        self.cassette = cassette
+        self.mode = mode
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.api_key = api_key
+        self.latency = latency
+        self.token_latency = token_latency
+        self.use_recorded_latency = use_recorded_latency
+        self.timeout = timeout
+        self.responder = responder
+
+    def complete(self, body: Dict[str, Any], authorization: Optional[str] = None) -> Dict[str, Any]:
+        """返回一条录制（record 模式下未命中时转发并录制）"""
+        messages = body.get('messages') or []
+        try:
+            entry = self.cassette.lookup(messages)
+        except CassetteMiss:
+            if self.mode == 'record':
+                return self._record(body, authorization)
+            entry = self._respond(messages)
+            if entry is None:
+                raise
+        delay = (entry.get('duration_ms') or 0) / 1000 if self.use_recorded_latency else self.latency
+        if delay > 0:
+            time.sleep(delay)
+        return entry
+
+    def _respond(self, messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """由 responder 生成回答（不写入录制文件）"""
+        if self.responder is None:
+            return None
+        content = self.responder(messages)
+        if content is None:
+            return None
+        prompt = ' '.join(str(message.get('content', '')) for message in messages)
+        return {'content': content, 'usage': {'prompt_tokens': estimate_tokens(prompt),
+                                              'completion_tokens': estimate_tokens(content)}}
+
+    def _record(self, body: Dict[str, Any], authorization: Optional[str]) -> Dict[str, Any]:
+        request_body = dict(body, stream=False)
+        request_body.pop('stream_options', None)
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        elif authorization:
+            headers['Authorization'] = authorization
+        request = urllib.request.Request(self.upstream + '/chat/completions',
+                                         data=json.dumps(request_body).encode('utf-8'), headers=headers)
+        start_time = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read().decode('utf-8'))
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        content = ''.join((choice.get('message') or {}).get('content') or '' for choice in result.get('choices', []))
+        usage = result.get('usage') or {}
+        usage = {'prompt_tokens': usage.get('prompt_tokens', 0), 'completion_tokens': usage.get('completion_tokens', 0)}
+        logger.info(f"Recorded completion ({duration_ms:.0f}ms, {len(content)} chars)")
+        return self.cassette.add(body.get('messages') or [], content, usage,
+                                 model=result.get('model') or body.get('model'), duration_ms=round(duration_ms, 3))
+
+def completion_response(entry: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """构造 chat.completion 响应"""
+    usage = entry['usage']
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': entry['content']},
+                     'finish_reason': 'stop'}],
+        'usage': dict(usage, total_tokens=usage['prompt_tokens'] + usage['completion_tokens'])
+    }
+
+def completion_chunks(entry: Dict[str, Any], model: str, include_usage: bool = False) -> List[Dict[str, Any]]:
+    """构造流式输出的 chat.completion.chunk 序列"""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def chunk(delta, finish_reason=None):
+        return {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+
+    content = entry['content']
+    chunks = [chunk({'role': 'assistant', 'content': ''})]
+    chunks.extend(chunk({'content': content[i:i + STREAM_CHUNK_CHARS]})
+                  for i in range(0, len(content), STREAM_CHUNK_CHARS))
+    chunks.append(chunk({}, 'stop'))
+    if include_usage:
+        usage = entry['usage']
+        chunks.append({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                       'choices': [],
+                       'usage': dict(usage, total_tokens=usage['prompt_tokens'] + usage['completion_tokens'])})
+    return chunks
+
+class _StubHandler(BaseHTTPRequestHandler):
+    stub: LLMStub = None
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'llm-stub', 'object': 'model'}]})
+        else:
+            self._send_error(404, 'not_found', f"Unknown path: {self.path}")
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_error(404, 'not_found', f"Unknown path: {self.path}")
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            self._send_error(400, 'invalid_request_error', f"Invalid JSON body: {e}")
+            return
+        try:
+            entry = self.stub.complete(body, self.headers.get('Authorization'))
+        except CassetteMiss as e:
+            self._send_error(404, 'cassette_miss', str(e))
+            return
+        except urllib.error.HTTPError as e:
+            self._send_error(e.code, 'upstream_error', e.read().decode('utf-8', errors='replace'))
+            return
+        except Exception as e:
+            logger.error(f"LLM stub error: {e}", exc_info=True)
+            self._send_error(502, 'upstream_error', str(e))
+            return
+
+        model = body.get('model') or entry.get('model') or 'llm-stub'
+        if body.get('stream'):
+            include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+            self._send_stream(completion_chunks(entry, model, include_usage))
+        else:
+            self._send_json(200, completion_response(entry, model))
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, code: str, message: str):
+        self._send_json(status, {'error': {'message': message, 'type': code, 'code': code}})
+
+    def _send_stream(self, chunks: List[Dict[str, Any]]):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        for index, chunk in enumerate(chunks):
+            if index and self.stub.token_latency > 0:
+                time.sleep(self.stub.token_latency)
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        logger.debug(f"llm stub {self.address_string()} {format % args}")
+
+def start_stub_server(stub: LLMStub, port: int = DEFAULT_PORT, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """在后台线程启动桩服务
+
+    Args:
+        stub: 请求处理逻辑
+        port: 监听端口，0表示随机端口
+        host: 监听地址
+
+    Returns:
+        ThreadingHTTPServer: 服务实例（shutdown() 停止），BASE_URL 为 http://host:port/v1
+    """
+    handler = type('StubHandler', (_StubHandler,), {'stub': stub})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    logger.info(f"LLM stub ({stub.mode}) listening on http://{host}:{server.server_address[1]}/v1")
+    return server
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="OpenAI兼容的LLM录制/回放桩服务")
+    parser.add_argument('mode', choices=('record', 'replay'), help='record: 转发并录制；replay: 只回放')
+    parser.add_argument('--cassette', default=DEFAULT_CASSETTE, help='录制文件（JSONL）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--upstream', default=Config.BASE_URL, help='record 模式转发的真实接口地址')
+    parser.add_argument('--latency', type=float, default=0.0, help='回放时注入的响应延迟（秒）')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='流式回放时每个chunk的间隔（秒）')
+    parser.add_argument('--recorded-latency', action='store_true', help='回放时使用录制时的真实耗时')
+    args = parser.parse_args(argv)
+
+    cassette = Cassette(args.cassette)
+    stub = LLMStub(cassette, args.mode, upstream=args.upstream, api_key=Config.API_KEY or None,
+                   latency=args.latency, token_latency=args.token_latency,
+                   use_recorded_latency=args.recorded_latency)
+    server = start_stub_server(stub, args.port, args.host)
+    print(f"已载入 {len(cassette)} 条录制，设置 BASE_URL=http://{args.host}:{server.server_address[1]}/v1 使用桩服务")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gradio应用并发会话负载生成器
+在进程内构建 app 的Gradio界面，取出实际注册的事件处理函数（user_input→bot_response、历史记录刷新、搜索、导出），
+按各事件的Gradio队列并发限制执行。会话按泊松过程到达，动作之间有随机思考时间，可同时模拟数百个浏览器会话。
+逐级提高会话到达率，找出对话延迟曲线的拐点，并判断Gradio队列、SQLite、GIL和图表渲染中最先饱和的环节。
+LLM和业务库与 benchmark_pipeline 相同（进程内确定性桩LLM + 生成的业务库）
+
+用法:
+    python load_generator.py --rates 0.5,1,2,4,8 --step-duration 30 --rows 20000 --llm-latency 0.3
+    python load_generator.py --rates 1,2,4 --gradio-concurrency 8 --output load.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmark_pipeline import CORPUS, BenchmarkQuestion, build_database, start_llm_stub, summarize, use_database
+from metrics import STAGE_DURATION, HISTORY_WRITE_DURATION, histogram_quantile
+
+logger = logging.getLogger(__name__)
+
+# bot_response 出错时写入对话的回复开头
+ERROR_PREFIXES = ('抱歉，处理您的请求时发生错误', 'Sorry, an error occurred')
+SEARCH_KEYWORDS = ('销售', '品牌', 'sales', 'brand')
+# 按直方图快照统计的处理阶段（与trace的span名称一致）
+STAGES = ('classify', 'llm.chat', 'sql.generate', 'sql.execute', 'sql.answer', 'viz.render')
+# 各环节判定为饱和的阈值
+QUEUE_SHARE_THRESHOLD = 0.5
+GIL_LATENESS_THRESHOLD_MS = 20.0
+GIL_CPU_CORES_THRESHOLD = 0.9
+
+class GradioHandlers:
+    """Blocks 中实际注册的事件处理函数，按各事件的Gradio队列并发限制执行"""
+
+    # 负载动作 -> 事件处理函数名
+    HANDLERS = {
+        'page_load': 'load_initial_history',
+        'user_input': 'user_input',
+        'bot_response': 'bot_response',
+        'refresh': 'refresh_history',
+        'search': 'search_history',
+        'export': 'handle_export',
+    }
+
+    def __init__(self, blocks, default_concurrency_limit: Optional[int] = 1):
+        """从界面中取出事件处理函数
+
+        Args:
+            blocks: app.create_combined_interface() 返回的 gr.Blocks
+            default_concurrency_limit: 队列默认并发数（concurrency_limit 为 "default" 的事件使用），None表示不限制
+        """
+        fns = blocks.fns.values() if isinstance(blocks.fns, dict) else blocks.fns
+        names = set(self.HANDLERS.values())
+        semaphores: Dict[Any, threading.BoundedSemaphore] = {}
+        self._handlers: Dict[str, Tuple[Any, Optional[threading.BoundedSemaphore]]] = {}
+        self.limits: Dict[str, Optional[int]] = {}
+        for block_fn in fns:
+            name = getattr(block_fn.fn, '__name__', None)
+            if name not in names or name in self._handlers:
+                continue
+            limit = self._resolve_limit(block_fn, default_concurrency_limit)
+            semaphore = None
+            if limit is not None:
+                # 同一 concurrency_id 的事件共享并发限制
+                key = getattr(block_fn, 'concurrency_id', None) or id(block_fn.fn)
+                semaphore = semaphores.setdefault(key, threading.BoundedSemaphore(limit))
+            self._handlers[name] = (block_fn.fn, semaphore)
+            self.limits[name] = limit
+        missing = names - set(self._handlers)
+        if missing:
+            raise ValueError(f"Event handlers not found in interface: {sorted(missing)}")
+
+    @staticmethod
+    def _resolve_limit(block_fn, default_limit: Optional[int]) -> Optional[int]:
+        """queue=False 的事件不排队；concurrency_limit 为 "default" 时使用队列默认值"""
+        if not getattr(block_fn, 'queue', True):
+            return None
+        limit = getattr(block_fn, 'concurrency_limit', 'default')
+        return default_limit if limit == 'default' else limit
+
+    def call(self, action: str, *args) -> Tuple[Any, float, float]:
+        """执行一个动作对应的事件处理函数
+
+        Returns:
+            Tuple[Any, float, float]: (返回值, 排队等待毫秒, 执行毫秒)
+        """
+        fn, semaphore = self._handlers[self.HANDLERS[action]]
+        queued_at = time.perf_counter()
+        if semaphore is not None:
+            semaphore.acquire()
+        started_at = time.perf_counter()
+        try:
+            return fn(*args), (started_at - queued_at) * 1000, (time.perf_counter() - started_at) * 1000
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+class GilProbe:
+    """后台线程反复短暂休眠并记录唤醒迟到时间
+
+    休眠结束后线程必须重新拿到GIL才能继续执行，可运行的Python线程越多，迟到越久，
+    因此迟到时间反映GIL争用程度。
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._samples: List[float] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gil-probe", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            start_time = time.perf_counter()
+            time.sleep(self.interval)
+            lateness_ms = (time.perf_counter() - start_time - self.interval) * 1000
+            with self._lock:
+                self._samples.append(max(lateness_ms, 0.0))
+
+    def drain(self) -> List[float]:
+        """取出并清空上次调用以来的样本（毫秒）"""
+        with self._lock:
+            samples, self._samples = self._samples, []
+        return samples
+
+@dataclass
+class SessionProfile:
+    """一个模拟浏览器会话的行为"""
+    turns: int = 2
+    think_time: float = 1.0
+    refresh_prob: float = 0.5
+    search_prob: float = 0.3
+    export_prob: float = 0.05
+
+def _histogram_stats(before: Tuple[List[int], float, int], after: Tuple[List[int], float, int],
+                     buckets: Tuple[float, ...]) -> Dict[str, Any]:
+    """两次直方图快照之间的次数和分位数（毫秒）"""
+    counts = [new - old for new, old in zip(after[0], before[0])]
+    result = {'count': after[2] - before[2]}
+    for q in (50, 95, 99):
+        value = histogram_quantile(q / 100, buckets, counts)
+        result[f'p{q}'] = round(value * 1000, 3) if value is not None else None
+    return result
+
+class LoadGenerator:
+    """按逐级提高的会话到达率驱动事件处理函数"""
+
+    def __init__(self, app_module, handlers: GradioHandlers, corpus: List[BenchmarkQuestion] = CORPUS,
+                 profile: Optional[SessionProfile] = None, max_sessions: int = 500, seed: int = 42):
+        """初始化负载生成器
+
+        Args:
+            app_module: 已导入的 app 模块（读取历史记录写入指标）
+            handlers: 事件处理函数
+            corpus: 会话提问的问题集
+            profile: 会话行为
+            max_sessions: 同时进行的会话数上限，超过后新会话等待
+            seed: 随机种子（到达间隔、思考时间和提问顺序）
+        """
+        self.app = app_module
+        self.handlers = handlers
+        self.corpus = corpus
+        self.profile = profile or SessionProfile()
+        self.max_sessions = max_sessions
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._active = 0
+        self._max_active = 0
+        self._session_count = 0
+        self.probe = GilProbe()
+
+    def _think(self, rng: random.Random):
+        if self.profile.think_time > 0:
+            time.sleep(rng.expovariate(1 / self.profile.think_time))
+
+    def _record(self, samples: Dict[str, List], key: str, value: Any):
+        with self._lock:
+            samples[key].append(value)
+
+    def _timed(self, samples: Dict[str, List], action: str, *args) -> Any:
+        result, wait_ms, run_ms = self.handlers.call(action, *args)
+        self._record(samples, action, wait_ms + run_ms)
+        return result
+
+    def run_session(self, session_id: int, submitted_at: float, samples: Dict[str, List]):
+        """一个浏览器会话：打开页面，多轮提问，按概率刷新、搜索和导出历史记录"""
+        self._record(samples, 'session_start_wait', (time.perf_counter() - submitted_at) * 1000)
+        with self._lock:
+            self._active += 1
+            self._max_active = max(self._max_active, self._active)
+        rng = random.Random(self.seed * 100003 + session_id)
+        try:
+            self._timed(samples, 'page_load')
+            history: List[Dict[str, Any]] = []
+            for _ in range(self.profile.turns):
+                self._think(rng)
+                question = rng.choice(self.corpus).question
+                (_, history), input_wait, input_ms = self.handlers.call('user_input', question, history)
+                (history, _, _), queue_ms, run_ms = self.handlers.call('bot_response', history)
+                self._record(samples, 'chat', input_wait + input_ms + queue_ms + run_ms)
+                self._record(samples, 'gradio_queue_wait', queue_ms)
+                reply = history[-1].get('content') if history else None
+                if isinstance(reply, str) and reply.startswith(ERROR_PREFIXES):
+                    self._record(samples, 'errors', reply)
+                if rng.random() < self.profile.refresh_prob:
+                    self._think(rng)
+                    self._timed(samples, 'refresh')
+                if rng.random() < self.profile.search_prob:
+                    self._think(rng)
+                    self._timed(samples, 'search', rng.choice(SEARCH_KEYWORDS))
+            if rng.random() < self.profile.export_prob:
+                self._timed(samples, 'export')
+        except Exception as e:
+            logger.error(f"Session {session_id} failed: {e}", exc_info=True)
+            self._record(samples, 'errors', str(e))
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            'stages': {stage: STAGE_DURATION.snapshot(stage=stage) for stage in STAGES},
+            'history_write': HISTORY_WRITE_DURATION.snapshot(),
+            'writer': dict(self.app.history_service.get_write_metrics()),
+            'cpu': time.process_time(),
+        }
+
+    def run_step(self, executor: ThreadPoolExecutor, rate: float, duration: float) -> Dict[str, Any]:
+        """以 rate 个会话/秒的到达率产生 duration 秒的会话，等全部会话结束后汇总"""
+        samples: Dict[str, List] = defaultdict(list)
+        rng = random.Random(f"{self.seed}-{rate}")
+        with self._lock:
+            self._max_active = self._active
+        self.probe.drain()
+        before = self._snapshot()
+        start_time = time.perf_counter()
+
+        futures = []
+        offset = rng.expovariate(rate)
+        while offset < duration:
+            delay = start_time + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._session_count += 1
+            futures.append(executor.submit(self.run_session, self._session_count, time.perf_counter(), samples))
+            offset += rng.expovariate(rate)
+        for future in futures:
+            future.result()
+
+        elapsed = time.perf_counter() - start_time
+        self.app.history_service.flush(timeout=30)
+        after = self._snapshot()
+        writer_before, writer_after = before['writer'], after['writer']
+        chats = len(samples['chat'])
+        errors = samples['errors']
+        return {
+            'rate': rate,
+            'sessions': len(futures),
+            'max_active_sessions': self._max_active,
+            'duration_s': round(elapsed, 3),
+            'chats': chats,
+            'throughput_chats_per_s': round(chats / elapsed, 3) if elapsed > 0 else None,
+            'latency_ms': {action: summarize(samples[action])
+                           for action in ('chat', 'page_load', 'refresh', 'search', 'export') if samples[action]},
+            'gradio_queue_wait_ms': summarize(samples['gradio_queue_wait']),
+            'session_start_wait_ms': summarize(samples['session_start_wait']),
+            'stages_ms': {stage: _histogram_stats(before['stages'][stage], after['stages'][stage],
+                                                  STAGE_DURATION.buckets) for stage in STAGES},
+            'history_write_ms': _histogram_stats(before['history_write'], after['history_write'],
+                                                 HISTORY_WRITE_DURATION.buckets),
+            'history_write_failures': writer_after.get('failed', 0) - writer_before.get('failed', 0)
+                                      + writer_after.get('dropped', 0) - writer_before.get('dropped', 0),
+            'cpu_cores': round((after['cpu'] - before['cpu']) / elapsed, 3) if elapsed > 0 else None,
+            'gil_lateness_ms': summarize(self.probe.drain()),
+            'errors': len(errors),
+            'lock_errors': sum(1 for error in errors if 'locked' in error),
+        }
+
+    def run(self, rates: List[float], step_duration: float) -> List[Dict[str, Any]]:
+        """依次运行各级到达率"""
+        steps = []
+        self.probe.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_sessions, thread_name_prefix='session') as executor:
+                for rate in rates:
+                    step = self.run_step(executor, rate, step_duration)
+                    steps.append(step)
+                    chat = step['latency_ms'].get('chat', {})
+                    print(f"rate={rate}/s sessions={step['sessions']} active<={step['max_active_sessions']} "
+                          f"chat p50={chat.get('p50')}ms p95={chat.get('p95')}ms "
+                          f"queue p95={step['gradio_queue_wait_ms']['p95']}ms cpu={step['cpu_cores']} "
+                          f"errors={step['errors']}")
+        finally:
+            self.probe.stop()
+        return steps
+
+def _p95(stats: Optional[Dict[str, Any]]) -> Optional[float]:
+    return stats.get('p95') if stats else None
+
+def _inflation(value: Optional[float], base: Optional[float]) -> Optional[float]:
+    if value is None or not base:
+        return None
+    return value / base
+
+def find_knee(steps: List[Dict[str, Any]], knee_factor: float = 2.0) -> Dict[str, Any]:
+    """对话p95延迟首次超过最低负载时 knee_factor 倍的那一级即为拐点"""
+    base = _p95(steps[0]['latency_ms'].get('chat')) if steps else None
+    for index, step in enumerate(steps):
+        inflation = _inflation(_p95(step['latency_ms'].get('chat')), base)
+        if inflation is not None and inflation >= knee_factor:
+            return {'knee_rate': step['rate'],
+                    'max_sustainable_rate': steps[index - 1]['rate'] if index > 0 else None,
+                    'chat_p95_inflation': round(inflation, 2)}
+    return {'knee_rate': None, 'max_sustainable_rate': steps[-1]['rate'] if steps else None,
+            'chat_p95_inflation': None}
+
+def saturation_signals(step: Dict[str, Any], base: Dict[str, Any], knee_factor: float = 2.0) -> Dict[str, bool]:
+    """按一级负载的指标判断各环节是否饱和（启发式）
+
+    - gradio_queue: bot_response 的排队等待占对话p95延迟一半以上
+    - sqlite: 出现 database is locked / 历史记录写入失败，或历史记录读写、SQL执行的p95相对最低负载膨胀
+    - gil: GIL探测线程的唤醒迟到p95超过阈值，或进程CPU接近单核满载（多核机器上）
+    - chart_render: 图表渲染p95相对最低负载膨胀
+    """
+    chat_p95 = _p95(step['latency_ms'].get('chat'))
+    queue_p95 = _p95(step['gradio_queue_wait_ms'])
+    queue_share = queue_p95 / chat_p95 if chat_p95 and queue_p95 is not None else 0.0
+
+    def inflated(getter) -> bool:
+        inflation = _inflation(getter(step), getter(base))
+        return inflation is not None and inflation >= knee_factor
+
+    sqlite_getters = [lambda s, action=action: _p95(s['latency_ms'].get(action))
+                      for action in ('refresh', 'search', 'export')]
+    sqlite_getters += [lambda s: _p95(s['stages_ms']['sql.execute']), lambda s: _p95(s['history_write_ms'])]
+    multi_core = (os.cpu_count() or 1) > 1
+    return {
+        'gradio_queue': queue_share >= QUEUE_SHARE_THRESHOLD,
+        'sqlite': step['lock_errors'] > 0 or step['history_write_failures'] > 0
+                  or any(inflated(getter) for getter in sqlite_getters),
+        'gil': (_p95(step['gil_lateness_ms']) or 0.0) >= GIL_LATENESS_THRESHOLD_MS
+               or (multi_core and (step['cpu_cores'] or 0.0) >= GIL_CPU_CORES_THRESHOLD),
+        'chart_render': inflated(lambda s: _p95(s['stages_ms']['viz.render'])),
+    }
+
+def analyze_saturation(steps: List[Dict[str, Any]], knee_factor: float = 2.0) -> Dict[str, Any]:
+    """找出各环节首次饱和的到达率，按先后排序"""
+    first: Dict[str, Optional[float]] = {}
+    if steps:
+        for step in steps:
+            step['saturated'] = [name for name, saturated in
+                                 saturation_signals(step, steps[0], knee_factor).items() if saturated]
+            for name in step['saturated']:
+                first.setdefault(name, step['rate'])
+    order = sorted(first, key=lambda name: first[name])
+    return {'first_saturated_rate': first, 'order': order, 'first': order[0] if order else None}
+
+def format_report(steps: List[Dict[str, Any]], knee: Dict[str, Any], saturation: Dict[str, Any]) -> str:
+    """格式化为文本报告"""
+    lines = ["到达率/s  会话  并发峰值  对话p50  对话p95  排队p95  SQL p95  渲染p95  CPU核  GIL迟到p95  错误  饱和"]
+    for step in steps:
+        chat = step['latency_ms'].get('chat', {})
+        values = [step['rate'], step['sessions'], step['max_active_sessions'], chat.get('p50'), chat.get('p95'),
+                  step['gradio_queue_wait_ms']['p95'], step['stages_ms']['sql.execute']['p95'],
+                  step['stages_ms']['viz.render']['p95'], step['cpu_cores'], step['gil_lateness_ms']['p95'],
+                  step['errors']]
+        lines.append('  '.join('-' if value is None else str(value) for value in values)
+                     + '  ' + (','.join(step.get('saturated', [])) or '-'))
+    lines.append("")
+    if knee['knee_rate'] is not None:
+        lines.append(f"拐点: {knee['knee_rate']} 会话/秒（对话p95为最低负载的 {knee['chat_p95_inflation']} 倍），"
+                     f"可持续到达率: {knee['max_sustainable_rate'] or '-'} 会话/秒")
+    else:
+        lines.append(f"在测试的到达率范围内没有出现拐点（最高 {knee['max_sustainable_rate']} 会话/秒）")
+    if saturation['order']:
+        lines.append("最先饱和: " + ' → '.join(
+            f"{name}@{saturation['first_saturated_rate'][name]}/s" for name in saturation['order']))
+    return '\n'.join(lines)
+
+def run_load_test(rates: List[float], step_duration: float = 30.0, rows: int = 20000,
+                  profile: Optional[SessionProfile] = None, llm_latency: float = 0.0,
+                  gradio_concurrency: Optional[int] = 1, max_sessions: int = 500, knee_factor: float = 2.0,
+                  seed: int = 42, work_dir: Optional[str] = None) -> Dict[str, Any]:
+    """生成业务库、启动桩LLM、构建界面并逐级运行负载，返回可写入JSON的结果
+
+    导出的历史记录文件写入工作目录（运行期间切换当前目录），未指定 work_dir 时结束后删除。
+    """
+    profile = profile or SessionProfile()
+    cleanup = work_dir is None
+    work_dir = os.path.abspath(work_dir or tempfile.mkdtemp(prefix='loreal_load_'))
+    os.makedirs(work_dir, exist_ok=True)
+    stub_server = start_llm_stub(work_dir, llm_latency)
+    original_cwd = os.getcwd()
+    try:
+        import app
+        from tracing import tracer
+        tracer.enabled = True
+        logging.disable(logging.WARNING)
+
+        db_path = os.path.join(work_dir, 'bench.db')
+        build_database(db_path, rows, seed)
+        use_database(app, db_path, work_dir)
+        handlers = GradioHandlers(app.create_combined_interface(), gradio_concurrency)
+        os.chdir(work_dir)
+
+        generator = LoadGenerator(app, handlers, profile=profile, max_sessions=max_sessions, seed=seed)
+        steps = generator.run(rates, step_duration)
+        app.history_service.close()
+    finally:
+        os.chdir(original_cwd)
+        logging.disable(logging.NOTSET)
+        stub_server.shutdown()
+        stub_server.server_close()
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'rows': rows,
+            'step_duration_s': step_duration,
+            'llm_latency_s': llm_latency,
+            'gradio_concurrency_limits': handlers.limits,
+            'max_sessions': max_sessions,
+            'cpu_count': os.cpu_count(),
+            'profile': asdict(profile),
+            'seed': seed,
+        },
+        'steps': steps,
+        'knee': find_knee(steps, knee_factor),
+        'saturation': analyze_saturation(steps, knee_factor),
+    }
+
+def _default_gradio_concurrency() -> Optional[int]:
+    """与Gradio相同：读取 GRADIO_DEFAULT_CONCURRENCY_LIMIT，未设置时为1"""
+    value = os.getenv('GRADIO_DEFAULT_CONCURRENCY_LIMIT', '1')
+    return None if value.lower() == 'none' else int(value)
+
+def _float_list(value: str) -> List[float]:
+    return [float(item) for item in value.split(',') if item.strip()]
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="Gradio应用并发会话负载生成器（寻找延迟拐点和饱和环节）")
+    parser.add_argument('--rates', type=_float_list, default=[0.5, 1, 2, 4, 8], help='会话到达率（个/秒），逗号分隔')
+    parser.add_argument('--step-duration', type=float, default=30.0, help='每级产生会话的时长（秒）')
+    parser.add_argument('--rows', type=int, default=20000, help='生成的业务库行数')
+    parser.add_argument('--turns', type=int, default=2, help='每个会话的提问轮数')
+    parser.add_argument('--think-time', type=float, default=1.0, help='动作之间的平均思考时间（秒，指数分布）')
+    parser.add_argument('--refresh-prob', type=float, default=0.5, help='每轮提问后刷新历史记录的概率')
+    parser.add_argument('--search-prob', type=float, default=0.3, help='每轮提问后搜索历史记录的概率')
+    parser.add_argument('--export-prob', type=float, default=0.05, help='会话结束前导出历史记录的概率')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='桩LLM每次调用注入的延迟（秒）')
+    parser.add_argument('--gradio-concurrency', type=lambda v: None if v.lower() == 'none' else int(v),
+                        default=_default_gradio_concurrency(),
+                        help='排队事件的默认并发数（与Gradio队列一致，默认1；none表示不限制）')
+    parser.add_argument('--max-sessions', type=int, default=500, help='同时进行的会话数上限')
+    parser.add_argument('--knee-factor', type=float, default=2.0, help='p95延迟膨胀到最低负载的多少倍视为拐点/饱和')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--work-dir', default=None, help='保留生成的数据库、历史库和导出文件的目录（默认临时目录）')
+    parser.add_argument('--output', default=None, help='结果JSON路径')
+    args = parser.parse_args(argv)
+
+    profile = SessionProfile(turns=args.turns, think_time=args.think_time, refresh_prob=args.refresh_prob,
+                             search_prob=args.search_prob, export_prob=args.export_prob)
+    result = run_load_test(args.rates, args.step_duration, args.rows, profile, llm_latency=args.llm_latency,
+                           gradio_concurrency=args.gradio_concurrency, max_sessions=args.max_sessions,
+                           knee_factor=args.knee_factor, seed=args.seed, work_dir=args.work_dir)
+    print()
+    print(format_report(result['steps'], result['knee'], result['saturation']))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+if __name__ == "__main__":
+    main()
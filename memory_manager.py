@@ -9,13 +9,79 @@ import sqlite3
 import json
 import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from dataclasses import dataclass, asdict
 from pathlib import Path
 import hashlib
+import re
+import time
+
+from metrics import HISTORY_WRITE_DURATION, HISTORY_WRITE_RECORDS
 
 logger = logging.getLogger(__name__)
 
+# 全文索引分词：中文按单字切分，配合短语查询实现任意长度的中文子串匹配
+_CJK_CHAR_PATTERN = re.compile(r'([\u4e00-\u9fff])')
+_CJK_RANGE = '\u3000-\u303f\u4e00-\u9fff\uff00-\uffef'
+_FTS_TERM_PATTERN = re.compile(r'[\u4e00-\u9fff]+|[^\W\u4e00-\u9fff]+')
+
+# 执行耗时直方图的桶上界（秒），超过最后一个上界的记录计入溢出桶
+LATENCY_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+# 物化计数器的维度：(scope, 计算scope_key的SQL表达式)，row为new或old
+_COUNTER_SCOPES = (
+    ('global', "''"),
+    ('session', "{row}.session_id"),
+    ('day', "substr({row}.timestamp, 1, 10)"),
+    ('query_type', "{row}.query_type"),
+    ('language', "{row}.language"),
+    ('session_type', "{row}.session_id || '|' || {row}.query_type"),
+    ('day_type', "substr({row}.timestamp, 1, 10) || '|' || {row}.query_type"),
+    ('day_language', "substr({row}.timestamp, 1, 10) || '|' || {row}.language"),
+)
+# 维护耗时直方图的维度
+_HISTOGRAM_SCOPES = ('global', 'session', 'day', 'query_type')
+
+def segment_for_fts(text: Optional[str]) -> str:
+    """将文本转换为全文索引使用的分词形式（中文单字之间插入空格）
+    
+    Args:
+        text: 原始文本
+        
+    Returns:
+        str: 分词后的文本
+    """
+    if not text:
+        return ""
+    return re.sub(r' {2,}', ' ', _CJK_CHAR_PATTERN.sub(r' \1 ', text)).strip()
+
+def desegment_fts_text(text: Optional[str]) -> str:
+    """去除分词时在中文字符之间插入的空格（用于展示snippet）"""
+    if not text:
+        return ""
+    text = re.sub(f'(?<=[{_CJK_RANGE}]) (?=\\**[{_CJK_RANGE}])', '', text)
+    return re.sub(f'(?<=[{_CJK_RANGE}]\\*\\*) (?=[{_CJK_RANGE}])', '', text)
+
+def build_fts_query(keyword: str) -> str:
+    """将用户关键词转换为FTS5查询表达式
+    
+    中文连续片段转换为单字短语查询（等价于子串匹配），英文/数字词使用前缀匹配，
+    多个片段之间为AND关系。
+    
+    Args:
+        keyword: 用户输入的关键词
+        
+    Returns:
+        str: FTS5 MATCH表达式，无有效词时返回空字符串
+    """
+    terms = []
+    for term in _FTS_TERM_PATTERN.findall(keyword or ""):
+        if _CJK_CHAR_PATTERN.match(term):
+            terms.append('"' + ' '.join(term) + '"')
+        else:
+            terms.append(f'"{term.lower()}"*')
+    return ' '.join(terms)
+
 @dataclass
 class QueryRecord:
     """查询记录数据类"""
@@ -30,6 +96,7 @@ class QueryRecord:
     success: bool = True
     execution_time: float = 0.0
     user_feedback: Optional[str] = None
+    spans: Optional[List[Dict[str, Any]]] = None  # 处理流水线各阶段的span（见 tracing.py），保存在query_spans表
     
     def __post_init__(self):
         if self.timestamp is None:
@@ -65,6 +132,7 @@ class MemoryManager:
         else:
             self.db_path = db_path
         self.current_session_id = self._generate_session_id()
+        self.fts_enabled = False
         self._init_database()
         logger.info(f"MemoryManager initialized with session: {self.current_session_id}")
     
@@ -74,12 +142,16 @@ class MemoryManager:
         hash_obj = hashlib.md5(timestamp.encode())
         return f"session_{timestamp}_{hash_obj.hexdigest()[:8]}"
     
+    def _connect(self) -> sqlite3.Connection:
+        """创建数据库连接"""
+        return sqlite3.connect(self.db_path)
+    
     def _init_database(self):
         """初始化数据库表"""
         # 确保数据目录存在
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # 创建查询历史表
@@ -125,9 +197,338 @@ class MemoryManager:
                 )
             """)
             
+            # 历史列表按时间倒序分页，索引末尾带上id保证排序稳定。
+            # 这两个索引只用于定位和排序，不是覆盖索引：分页查询读取整行（SELECT *），
+            # 每条命中的记录还要按rowid回表一次，每页开销为一次索引查找加 页大小 次回表
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_query_history_timestamp
+                ON query_history (timestamp, id)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_query_history_session
+                ON query_history (session_id, timestamp, id)
+            """)
+            
+            conn.commit()
+            self.fts_enabled = self._init_fts(cursor)
+            self._init_change_feed(cursor)
+            self._init_counters(cursor)
+            self._init_spans(cursor)
             conn.commit()
             logger.info("Database tables initialized successfully")
     
+    def _init_fts(self, cursor: sqlite3.Cursor) -> bool:
+        """初始化历史记录全文索引（FTS5虚拟表 + 待索引队列）
+        
+        触发器只使用SQL：插入或修改查询文本时把记录id写入待索引队列，删除时同步删除索引行，
+        因此任何连接（包括未经MemoryManager的普通sqlite3连接）都可以写入query_history。
+        中文分词在Python中完成，由 _sync_fts 在保存记录和搜索前处理队列中的记录。
+        
+        Args:
+            cursor: 数据库游标
+            
+        Returns:
+            bool: 全文索引是否可用
+        """
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS query_history_fts USING fts5(
+                    user_query, result_summary,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 not available, falling back to LIKE search: {e}")
+            return False
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS query_history_fts_pending (
+                id INTEGER PRIMARY KEY
+            )
+        """)
+        # 旧版本的触发器调用连接上注册的fts_segment函数，其他连接写入会失败，这里统一替换
+        for trigger in ('query_history_fts_insert', 'query_history_fts_update', 'query_history_fts_delete'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute("""
+            CREATE TRIGGER query_history_fts_insert
+            AFTER INSERT ON query_history BEGIN
+                INSERT OR IGNORE INTO query_history_fts_pending (id) VALUES (new.id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER query_history_fts_update
+            AFTER UPDATE OF user_query, result_summary ON query_history BEGIN
+                INSERT OR IGNORE INTO query_history_fts_pending (id) VALUES (new.id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER query_history_fts_delete
+            AFTER DELETE ON query_history BEGIN
+                DELETE FROM query_history_fts WHERE rowid = old.id;
+                DELETE FROM query_history_fts_pending WHERE id = old.id;
+            END
+        """)
+        self._sync_fts(cursor)
+        
+        # 已有历史数据但索引不完整时重建索引
+        history_count = cursor.execute("SELECT COUNT(*) FROM query_history").fetchone()[0]
+        fts_count = cursor.execute("SELECT COUNT(*) FROM query_history_fts").fetchone()[0]
+        if history_count != fts_count:
+            logger.info(f"Rebuilding history full-text index ({history_count} rows)")
+            cursor.execute("DELETE FROM query_history_fts")
+            rows = cursor.execute("SELECT id, user_query, result_summary FROM query_history").fetchall()
+            cursor.executemany(
+                "INSERT INTO query_history_fts (rowid, user_query, result_summary) VALUES (?, ?, ?)",
+                [(row_id, segment_for_fts(query), segment_for_fts(summary)) for row_id, query, summary in rows]
+            )
+        return True
+    
+    def _sync_fts(self, cursor: sqlite3.Cursor) -> int:
+        """为待索引队列中的记录分词并写入全文索引（调用方负责提交）
+        
+        Args:
+            cursor: 数据库游标
+            
+        Returns:
+            int: 写入索引的记录数
+        """
+        rows = cursor.execute("""
+            SELECT h.id, h.user_query, h.result_summary
+            FROM query_history_fts_pending p
+            JOIN query_history h ON h.id = p.id
+        """).fetchall()
+        if not rows:
+            return 0
+        
+        ids = [(row[0],) for row in rows]
+        cursor.executemany("DELETE FROM query_history_fts WHERE rowid = ?", ids)
+        cursor.executemany(
+            "INSERT INTO query_history_fts (rowid, user_query, result_summary) VALUES (?, ?, ?)",
+            [(row_id, segment_for_fts(query), segment_for_fts(summary)) for row_id, query, summary in rows]
+        )
+        # 只删除本次处理的id，期间其他连接新加入队列的记录留到下次处理
+        cursor.executemany("DELETE FROM query_history_fts_pending WHERE id = ?", ids)
+        return len(rows)
+    
+    def _init_counters(self, cursor: sqlite3.Cursor):
+        """初始化物化统计计数器和耗时直方图
+        
+        计数器由query_history上的触发器维护，与插入/删除处于同一事务，
+        统计查询只需按主键读取，无需重新聚合历史记录。
+        归档删除（history_meta中archiving为1）时不减少计数器，归档后统计仍包含这些记录。
+        
+        Args:
+            cursor: 数据库游标
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS history_counters (
+                scope TEXT NOT NULL,
+                scope_key TEXT NOT NULL,
+                total_queries INTEGER NOT NULL DEFAULT 0,
+                successful_queries INTEGER NOT NULL DEFAULT 0,
+                total_execution_time REAL NOT NULL DEFAULT 0.0,
+                PRIMARY KEY (scope, scope_key)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS history_latency_histogram (
+                scope TEXT NOT NULL,
+                scope_key TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, scope_key, bucket)
+            ) WITHOUT ROWID
+        """)
+        
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS query_history_counters_insert
+            AFTER INSERT ON query_history BEGIN
+                INSERT INTO history_counters
+                    (scope, scope_key, total_queries, successful_queries, total_execution_time)
+                VALUES {self._counter_values_sql('new')}
+                ON CONFLICT (scope, scope_key) DO UPDATE SET
+                    total_queries = total_queries + excluded.total_queries,
+                    successful_queries = successful_queries + excluded.successful_queries,
+                    total_execution_time = total_execution_time + excluded.total_execution_time;
+                INSERT INTO history_latency_histogram (scope, scope_key, bucket, count)
+                VALUES {self._histogram_values_sql('new')}
+                ON CONFLICT (scope, scope_key, bucket) DO UPDATE SET count = count + 1;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS query_history_counters_delete
+            AFTER DELETE ON query_history
+            WHEN (SELECT value FROM history_meta WHERE key = 'archiving') = 0 BEGIN
+                UPDATE history_counters SET
+                    total_queries = total_queries - 1,
+                    successful_queries = successful_queries - (CASE WHEN old.success THEN 1 ELSE 0 END),
+                    total_execution_time = total_execution_time - COALESCE(old.execution_time, 0)
+                WHERE (scope, scope_key) IN (VALUES {self._scope_keys_sql('old')});
+                UPDATE history_latency_histogram SET count = count - 1
+                WHERE (scope, scope_key, bucket) IN (VALUES {self._histogram_keys_sql('old')});
+            END
+        """)
+        
+        # 已有历史数据（升级前创建的数据库）或计数不一致时回填计数器
+        history_count = cursor.execute("SELECT COUNT(*) FROM query_history").fetchone()[0]
+        counted = cursor.execute(
+            "SELECT total_queries FROM history_counters WHERE scope = 'global' AND scope_key = ''"
+        ).fetchone()
+        archived = cursor.execute(
+            "SELECT value FROM history_meta WHERE key = 'archived_rows'"
+        ).fetchone()[0]
+        if history_count + archived != (counted[0] if counted else 0):
+            self._rebuild_counters(cursor)
+            # 重建后的计数器只包含现存记录
+            cursor.execute("UPDATE history_meta SET value = 0 WHERE key = 'archived_rows'")
+    
+    def _init_change_feed(self, cursor: sqlite3.Cursor):
+        """初始化历史记录变更版本号
+        
+        version在每次插入或删除时递增，reset_version只在删除时递增。
+        客户端比较版本号即可判断是否需要刷新，reset_version变化时需要全量重新加载，
+        否则只需拉取id大于本地游标的新记录。
+        同一张表还保存归档状态：archiving（归档删除进行中）和 archived_rows（已归档记录数）。
+        
+        Args:
+            cursor: 数据库游标
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS history_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO history_meta (key, value)
+            VALUES ('version', 0), ('reset_version', 0), ('archiving', 0), ('archived_rows', 0)
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS query_history_version_insert
+            AFTER INSERT ON query_history BEGIN
+                UPDATE history_meta SET value = value + 1 WHERE key = 'version';
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS query_history_version_delete
+            AFTER DELETE ON query_history BEGIN
+                UPDATE history_meta SET value = value + 1 WHERE key IN ('version', 'reset_version');
+            END
+        """)
+    
+    def _init_spans(self, cursor: sqlite3.Cursor):
+        """初始化查询流水线span表，记录删除（包括归档）时同步删除其span
+        
+        Args:
+            cursor: 数据库游标
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS query_spans (
+                record_id INTEGER NOT NULL,
+                span_id TEXT NOT NULL,
+                trace_id TEXT NOT NULL,
+                parent_span_id TEXT,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL DEFAULT 'internal',
+                start_time_ns INTEGER NOT NULL,
+                end_time_ns INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'OK',
+                status_message TEXT,
+                attributes TEXT,
+                PRIMARY KEY (record_id, span_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS query_history_spans_delete
+            AFTER DELETE ON query_history BEGIN
+                DELETE FROM query_spans WHERE record_id = old.id;
+            END
+        """)
+    
+    def _rebuild_counters(self, cursor: sqlite3.Cursor):
+        """根据query_history全量重建计数器和直方图"""
+        logger.info("Rebuilding history counters")
+        cursor.execute("DELETE FROM history_counters")
+        cursor.execute("DELETE FROM history_latency_histogram")
+        for scope, key_sql in _COUNTER_SCOPES:
+            key_expr = key_sql.format(row='query_history')
+            cursor.execute(f"""
+                INSERT INTO history_counters
+                    (scope, scope_key, total_queries, successful_queries, total_execution_time)
+                SELECT '{scope}', {key_expr}, COUNT(*),
+                       SUM(CASE WHEN success THEN 1 ELSE 0 END),
+                       SUM(COALESCE(execution_time, 0))
+                FROM query_history GROUP BY {key_expr}
+            """)
+            if scope in _HISTOGRAM_SCOPES:
+                bucket_expr = self._bucket_sql('query_history')
+                cursor.execute(f"""
+                    INSERT INTO history_latency_histogram (scope, scope_key, bucket, count)
+                    SELECT '{scope}', {key_expr}, {bucket_expr}, COUNT(*)
+                    FROM query_history GROUP BY {key_expr}, {bucket_expr}
+                """)
+    
+    @staticmethod
+    def _bucket_sql(row: str) -> str:
+        """生成计算耗时直方图桶编号的SQL表达式"""
+        cases = ' '.join(
+            f"WHEN COALESCE({row}.execution_time, 0) <= {bound} THEN {i}"
+            for i, bound in enumerate(LATENCY_BUCKETS)
+        )
+        return f"(CASE {cases} ELSE {len(LATENCY_BUCKETS)} END)"
+    
+    @staticmethod
+    def _scope_values_sql(row: str, scopes: Tuple[str, ...], extra: str = "") -> str:
+        """生成各维度 (scope, scope_key[, extra]) 的VALUES列表
+        
+        Args:
+            row: 触发器中的行别名（new或old）
+            scopes: 维度名称列表
+            extra: 追加在每行末尾的SQL表达式
+        """
+        key_sqls = dict(_COUNTER_SCOPES)
+        return ', '.join(
+            f"('{scope}', {key_sqls[scope].format(row=row)}{extra})" for scope in scopes
+        )
+    
+    @classmethod
+    def _scope_keys_sql(cls, row: str) -> str:
+        """生成计数器主键的VALUES列表"""
+        return cls._scope_values_sql(row, tuple(dict(_COUNTER_SCOPES)))
+    
+    @classmethod
+    def _counter_values_sql(cls, row: str) -> str:
+        """生成计数器增量的VALUES列表"""
+        increment = (f", 1, CASE WHEN {row}.success THEN 1 ELSE 0 END, "
+                     f"COALESCE({row}.execution_time, 0)")
+        return cls._scope_values_sql(row, tuple(dict(_COUNTER_SCOPES)), increment)
+    
+    @classmethod
+    def _histogram_keys_sql(cls, row: str) -> str:
+        """生成直方图主键的VALUES列表"""
+        return cls._scope_values_sql(row, _HISTOGRAM_SCOPES, f", {cls._bucket_sql(row)}")
+    
+    @classmethod
+    def _histogram_values_sql(cls, row: str) -> str:
+        """生成直方图增量的VALUES列表"""
+        return cls._scope_values_sql(row, _HISTOGRAM_SCOPES, f", {cls._bucket_sql(row)}, 1")
+    
+    def _row_to_record(self, row: tuple) -> QueryRecord:
+        """将query_history行转换为QueryRecord"""
+        return QueryRecord(
+            id=row[0],
+            session_id=row[1],
+            timestamp=datetime.fromisoformat(row[2]),
+            user_query=row[3],
+            query_type=row[4],
+            sql_generated=row[5],
+            result_summary=row[6],
+            language=row[7],
+            success=bool(row[8]),
+            execution_time=row[9],
+            user_feedback=row[10]
+        )
+    
     def save_query(self, record: QueryRecord) -> int:
         """保存查询记录
         
@@ -137,72 +538,195 @@ class MemoryManager:
         Returns:
             int: 记录ID
         """
-        record.session_id = self.current_session_id
+        return self.save_queries([record])[0]
+    
+    def save_queries(self, records: List[QueryRecord]) -> List[int]:
+        """批量保存查询记录（单个事务内完成写入和统计更新）
+        
+        Args:
+            records: 查询记录列表
+            
+        Returns:
+            List[int]: 记录ID列表，顺序与输入一致
+        """
+        if not records:
+            return []
         
-        with sqlite3.connect(self.db_path) as conn:
+        start_time = time.perf_counter()
+        record_ids = []
+        with self._connect() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                INSERT INTO query_history (
-                    session_id, timestamp, user_query, query_type,
-                    sql_generated, result_summary, language, success,
-                    execution_time, user_feedback
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                record.session_id,
-                record.timestamp.isoformat(),
-                record.user_query,
-                record.query_type,
-                record.sql_generated,
-                record.result_summary,
-                record.language,
-                record.success,
-                record.execution_time,
-                record.user_feedback
-            ))
-            
-            record_id = cursor.lastrowid
-            conn.commit()
+            for record in records:
+                record.session_id = self.current_session_id
+                cursor.execute("""
+                    INSERT INTO query_history (
+                        session_id, timestamp, user_query, query_type,
+                        sql_generated, result_summary, language, success,
+                        execution_time, user_feedback
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    record.session_id,
+                    record.timestamp.isoformat(),
+                    record.user_query,
+                    record.query_type,
+                    record.sql_generated,
+                    record.result_summary,
+                    record.language,
+                    record.success,
+                    record.execution_time,
+                    record.user_feedback
+                ))
+                record.id = cursor.lastrowid
+                record_ids.append(record.id)
+                if record.spans:
+                    self._insert_spans(cursor, record.id, record.spans)
+                
+                # 更新查询统计（与插入处于同一事务）
+                self._update_query_stats(cursor, record)
             
-            # 更新查询统计
-            self._update_query_stats(record)
+            if self.fts_enabled:
+                self._sync_fts(cursor)
+            conn.commit()
+        
+        HISTORY_WRITE_DURATION.observe(time.perf_counter() - start_time)
+        HISTORY_WRITE_RECORDS.inc(len(record_ids))
+        logger.info(f"Saved {len(record_ids)} query record(s), last ID: {record_ids[-1]}")
+        return record_ids
+    
+    def _insert_spans(self, cursor: sqlite3.Cursor, record_id: int, spans: List[Dict[str, Any]]):
+        """写入一条记录的span（与记录插入处于同一事务）"""
+        cursor.executemany("""
+            INSERT OR REPLACE INTO query_spans (
+                record_id, span_id, trace_id, parent_span_id, name, kind,
+                start_time_ns, end_time_ns, status, status_message, attributes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            record_id,
+            span['span_id'],
+            span['trace_id'],
+            span.get('parent_span_id'),
+            span['name'],
+            span.get('kind', 'internal'),
+            span['start_time_ns'],
+            span['end_time_ns'],
+            span.get('status', 'OK'),
+            span.get('status_message', ''),
+            json.dumps(span.get('attributes') or {}, ensure_ascii=False)
+        ) for span in spans])
+    
+    def get_spans(self, record_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """获取记录的span
+        
+        Args:
+            record_ids: 记录ID列表
             
-            logger.info(f"Query record saved with ID: {record_id}")
-            return record_id
+        Returns:
+            Dict[int, List[Dict]]: 记录ID到span列表（按开始时间排序）的映射，没有span的记录不在其中
+        """
+        spans_by_record: Dict[int, List[Dict[str, Any]]] = {}
+        if not record_ids:
+            return spans_by_record
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # 分批查询，避免超出SQLite的参数个数上限
+            for start in range(0, len(record_ids), 500):
+                batch = record_ids[start:start + 500]
+                cursor.execute(f"""
+                    SELECT record_id, span_id, trace_id, parent_span_id, name, kind,
+                           start_time_ns, end_time_ns, status, status_message, attributes
+                    FROM query_spans
+                    WHERE record_id IN ({','.join('?' * len(batch))})
+                    ORDER BY record_id, start_time_ns
+                """, batch)
+                for row in cursor.fetchall():
+                    spans_by_record.setdefault(row[0], []).append({
+                        'span_id': row[1],
+                        'trace_id': row[2],
+                        'parent_span_id': row[3],
+                        'name': row[4],
+                        'kind': row[5],
+                        'start_time_ns': row[6],
+                        'end_time_ns': row[7],
+                        'status': row[8],
+                        'status_message': row[9] or '',
+                        'attributes': json.loads(row[10]) if row[10] else {}
+                    })
+        return spans_by_record
     
-    def _update_query_stats(self, record: QueryRecord):
-        """更新查询统计信息"""
+    def _update_query_stats(self, cursor: sqlite3.Cursor, record: QueryRecord):
+        """更新查询统计信息
+        
+        Args:
+            cursor: 当前事务的游标
+            record: 查询记录对象
+        """
         query_hash = hashlib.md5(record.user_query.lower().encode()).hexdigest()
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 检查是否已存在
-            cursor.execute(
-                "SELECT usage_count, avg_execution_time FROM query_stats WHERE query_hash = ?",
-                (query_hash,)
-            )
-            result = cursor.fetchone()
+        # 检查是否已存在
+        cursor.execute(
+            "SELECT usage_count, avg_execution_time FROM query_stats WHERE query_hash = ?",
+            (query_hash,)
+        )
+        result = cursor.fetchone()
+        
+        if result:
+            # 更新现有记录
+            usage_count, avg_time = result
+            new_count = usage_count + 1
+            new_avg_time = (avg_time * usage_count + record.execution_time) / new_count
             
-            if result:
-                # 更新现有记录
-                usage_count, avg_time = result
-                new_count = usage_count + 1
-                new_avg_time = (avg_time * usage_count + record.execution_time) / new_count
-                
-                cursor.execute("""
-                    UPDATE query_stats 
-                    SET usage_count = ?, avg_execution_time = ?, last_used = ?
-                    WHERE query_hash = ?
-                """, (new_count, new_avg_time, datetime.now().isoformat(), query_hash))
-            else:
-                # 插入新记录
-                cursor.execute("""
-                    INSERT INTO query_stats (query_hash, query_pattern, usage_count, avg_execution_time)
-                    VALUES (?, ?, 1, ?)
-                """, (query_hash, record.user_query, record.execution_time))
+            cursor.execute("""
+                UPDATE query_stats 
+                SET usage_count = ?, avg_execution_time = ?, last_used = ?
+                WHERE query_hash = ?
+            """, (new_count, new_avg_time, datetime.now().isoformat(), query_hash))
+        else:
+            # 插入新记录
+            cursor.execute("""
+                INSERT INTO query_stats (query_hash, query_pattern, usage_count, avg_execution_time)
+                VALUES (?, ?, 1, ?)
+            """, (query_hash, record.user_query, record.execution_time))
+    
+    def get_history_version(self) -> Dict[str, int]:
+        """获取历史记录当前的变更版本
+        
+        Returns:
+            Dict[str, int]: version、reset_version 和当前最大记录ID（last_id）
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # 单条语句读取，保证三个值来自同一快照
+            cursor.execute("""
+                SELECT
+                    (SELECT value FROM history_meta WHERE key = 'version'),
+                    (SELECT value FROM history_meta WHERE key = 'reset_version'),
+                    (SELECT MAX(id) FROM query_history)
+            """)
+            version, reset_version, last_id = cursor.fetchone()
+            return {
+                'version': version or 0,
+                'reset_version': reset_version or 0,
+                'last_id': last_id or 0
+            }
+    
+    def get_changes_since(self, last_id: int, limit: int = 100) -> List[QueryRecord]:
+        """获取ID大于last_id的新记录（按ID升序）
+        
+        Args:
+            last_id: 客户端已拥有的最大记录ID
+            limit: 返回记录数限制
             
-            conn.commit()
+        Returns:
+            List[QueryRecord]: 新增的查询记录
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM query_history WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, limit))
+            return [self._row_to_record(row) for row in cursor.fetchall()]
     
     def get_session_history(self, session_id: Optional[str] = None, limit: int = 50) -> List[QueryRecord]:
         """获取会话历史记录
@@ -214,37 +738,8 @@ class MemoryManager:
         Returns:
             List[QueryRecord]: 查询记录列表
         """
-        if session_id is None:
-            session_id = self.current_session_id
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT * FROM query_history 
-                WHERE session_id = ? 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            """, (session_id, limit))
-            
-            records = []
-            for row in cursor.fetchall():
-                record = QueryRecord(
-                    id=row[0],
-                    session_id=row[1],
-                    timestamp=datetime.fromisoformat(row[2]),
-                    user_query=row[3],
-                    query_type=row[4],
-                    sql_generated=row[5],
-                    result_summary=row[6],
-                    language=row[7],
-                    success=bool(row[8]),
-                    execution_time=row[9],
-                    user_feedback=row[10]
-                )
-                records.append(record)
-            
-            return records
+        records, _ = self.get_session_history_page(session_id, limit=limit)
+        return records
     
     def get_recent_history(self, days: int = 7, limit: int = 100) -> List[QueryRecord]:
         """获取最近的历史记录
@@ -256,36 +751,128 @@ class MemoryManager:
         Returns:
             List[QueryRecord]: 查询记录列表
         """
+        records, _ = self.get_recent_history_page(days, limit=limit)
+        return records
+    
+    def get_session_history_page(self, session_id: Optional[str] = None, limit: int = 50,
+                                 cursor: Optional[str] = None) -> Tuple[List[QueryRecord], Optional[str]]:
+        """按页获取会话历史记录（基于游标的keyset分页）
+        
+        Args:
+            session_id: 会话ID，默认为当前会话
+            limit: 每页记录数
+            cursor: 上一页返回的游标，None表示第一页
+            
+        Returns:
+            Tuple[List[QueryRecord], Optional[str]]: (当前页记录, 下一页游标)，没有更多记录时游标为None
+        """
+        if session_id is None:
+            session_id = self.current_session_id
+        return self._fetch_history_page("session_id = ?", [session_id], limit, cursor)
+    
+    def get_recent_history_page(self, days: int = 7, limit: int = 50,
+                                cursor: Optional[str] = None) -> Tuple[List[QueryRecord], Optional[str]]:
+        """按页获取最近的历史记录（基于游标的keyset分页）
+        
+        Args:
+            days: 天数范围
+            limit: 每页记录数
+            cursor: 上一页返回的游标，None表示第一页
+            
+        Returns:
+            Tuple[List[QueryRecord], Optional[str]]: (当前页记录, 下一页游标)，没有更多记录时游标为None
+        """
         since_date = datetime.now() - timedelta(days=days)
+        return self._fetch_history_page("timestamp >= ?", [since_date.isoformat()], limit, cursor)
+    
+    def iter_history(self, days: int = 30, chunk_size: int = 1000) -> Iterator[List[QueryRecord]]:
+        """按时间倒序分块遍历最近的历史记录
+        
+        每块是一次独立的keyset分页查询，不会在遍历期间长时间持有数据库读锁。
         
-        with sqlite3.connect(self.db_path) as conn:
+        Args:
+            days: 天数范围
+            chunk_size: 每块记录数
+            
+        Yields:
+            List[QueryRecord]: 一块查询记录
+        """
+        since = [(datetime.now() - timedelta(days=days)).isoformat()]
+        cursor = None
+        while True:
+            records, cursor = self._fetch_history_page("timestamp >= ?", since, chunk_size, cursor)
+            if records:
+                yield records
+            if cursor is None:
+                break
+    
+    def count_recent_history(self, days: int = 30) -> int:
+        """统计最近几天的历史记录数（时间索引范围计数）"""
+        since_date = datetime.now() - timedelta(days=days)
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM query_history WHERE timestamp >= ?", (since_date.isoformat(),))
+            return cursor.fetchone()[0]
+    
+    def _fetch_history_page(self, condition: str, params: List[Any], limit: int,
+                            cursor: Optional[str]) -> Tuple[List[QueryRecord], Optional[str]]:
+        """按 (timestamp, id) 倒序获取一页记录
+        
+        游标记录上一页最后一条的 (timestamp, id)，下一页直接从索引中该位置之后开始读取，
+        每页的代价与翻页深度无关。
+        
+        Args:
+            condition: 额外的WHERE条件
+            params: 条件参数
+            limit: 每页记录数
+            cursor: 分页游标
             
-            cursor.execute("""
+        Returns:
+            Tuple[List[QueryRecord], Optional[str]]: (当前页记录, 下一页游标)
+        """
+        conditions = [condition]
+        params = list(params)
+        if cursor:
+            last_timestamp, last_id = self._decode_cursor(cursor)
+            conditions.append("timestamp <= ? AND (timestamp < ? OR id < ?)")
+            params.extend([last_timestamp, last_timestamp, last_id])
+        
+        with self._connect() as conn:
+            db_cursor = conn.cursor()
+            
+            # 多取一条用于判断是否还有下一页
+            db_cursor.execute(f"""
                 SELECT * FROM query_history 
-                WHERE timestamp >= ? 
-                ORDER BY timestamp DESC 
+                WHERE {' AND '.join(conditions)}
+                ORDER BY timestamp DESC, id DESC 
                 LIMIT ?
-            """, (since_date.isoformat(), limit))
+            """, params + [limit + 1])
             
-            records = []
-            for row in cursor.fetchall():
-                record = QueryRecord(
-                    id=row[0],
-                    session_id=row[1],
-                    timestamp=datetime.fromisoformat(row[2]),
-                    user_query=row[3],
-                    query_type=row[4],
-                    sql_generated=row[5],
-                    result_summary=row[6],
-                    language=row[7],
-                    success=bool(row[8]),
-                    execution_time=row[9],
-                    user_feedback=row[10]
-                )
-                records.append(record)
-            
-            return records
+            rows = db_cursor.fetchall()
+        
+        records = [self._row_to_record(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit and records:
+            next_cursor = self._encode_cursor(records[-1])
+        return records, next_cursor
+    
+    @staticmethod
+    def _encode_cursor(record: QueryRecord) -> str:
+        """将记录位置编码为分页游标"""
+        return f"{record.timestamp.isoformat()}|{record.id}"
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[str, int]:
+        """解析分页游标
+        
+        Raises:
+            ValueError: 游标格式无效
+        """
+        try:
+            timestamp, record_id = cursor.rsplit('|', 1)
+            return timestamp, int(record_id)
+        except (AttributeError, ValueError):
+            raise ValueError(f"Invalid history cursor: {cursor!r}")
     
     def get_popular_queries(self, limit: int = 10) -> List[Dict[str, Any]]:
         """获取热门查询
@@ -296,7 +883,7 @@ class MemoryManager:
         Returns:
             List[Dict]: 热门查询列表
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -317,8 +904,29 @@ class MemoryManager:
             
             return results
     
+    def get_successful_queries(self, limit: int = 5000) -> List[Tuple[str, int, str]]:
+        """获取成功执行过的不同查询（用于构建相似度索引）
+        
+        Args:
+            limit: 返回的查询数上限，优先保留最近使用的查询
+            
+        Returns:
+            List[Tuple[str, int, str]]: (查询文本, 使用次数, 最后使用时间)
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT user_query, COUNT(*), MAX(timestamp) AS last_used
+                FROM query_history
+                WHERE success = 1
+                GROUP BY lower(user_query)
+                ORDER BY last_used DESC
+                LIMIT ?
+            """, (limit,))
+            return cursor.fetchall()
+    
     def search_history(self, keyword: str, limit: int = 20) -> List[QueryRecord]:
-        """搜索历史记录
+        """搜索历史记录（按BM25相关度排序）
         
         Args:
             keyword: 搜索关键词
@@ -327,7 +935,59 @@ class MemoryManager:
         Returns:
             List[QueryRecord]: 匹配的查询记录列表
         """
-        with sqlite3.connect(self.db_path) as conn:
+        return [hit['record'] for hit in self.search_history_ranked(keyword, limit)]
+    
+    def search_history_ranked(self, keyword: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """全文搜索历史记录，返回相关度得分和匹配片段
+        
+        Args:
+            keyword: 搜索关键词
+            limit: 返回记录数限制
+            
+        Returns:
+            List[Dict]: 每项包含 record、score（BM25，越小越相关）、
+                query_snippet 和 summary_snippet（匹配处以**标记）
+        """
+        fts_query = build_fts_query(keyword) if self.fts_enabled else ""
+        if not fts_query:
+            return self._search_history_like(keyword, limit)
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                # 先索引其他连接写入、尚未分词的记录
+                if self._sync_fts(cursor):
+                    conn.commit()
+                # 查询内容的权重高于结果摘要
+                cursor.execute("""
+                    SELECT h.*,
+                           bm25(query_history_fts, 10.0, 1.0) AS score,
+                           snippet(query_history_fts, 0, '**', '**', '...', 24),
+                           snippet(query_history_fts, 1, '**', '**', '...', 24)
+                    FROM query_history_fts
+                    JOIN query_history h ON h.id = query_history_fts.rowid
+                    WHERE query_history_fts MATCH ?
+                    ORDER BY score
+                    LIMIT ?
+                """, (fts_query, limit))
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Full-text search failed for '{keyword}', falling back to LIKE: {e}")
+                return self._search_history_like(keyword, limit)
+            
+            hits = []
+            for row in cursor.fetchall():
+                hits.append({
+                    'record': self._row_to_record(row[:11]),
+                    'score': row[-3],
+                    'query_snippet': desegment_fts_text(row[-2]),
+                    'summary_snippet': desegment_fts_text(row[-1])
+                })
+            return hits
+    
+    def _search_history_like(self, keyword: str, limit: int) -> List[Dict[str, Any]]:
+        """使用LIKE扫描搜索历史记录（全文索引不可用时的回退方案）"""
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -337,24 +997,11 @@ class MemoryManager:
                 LIMIT ?
             """, (f"%{keyword}%", f"%{keyword}%", limit))
             
-            records = []
-            for row in cursor.fetchall():
-                record = QueryRecord(
-                    id=row[0],
-                    session_id=row[1],
-                    timestamp=datetime.fromisoformat(row[2]),
-                    user_query=row[3],
-                    query_type=row[4],
-                    sql_generated=row[5],
-                    result_summary=row[6],
-                    language=row[7],
-                    success=bool(row[8]),
-                    execution_time=row[9],
-                    user_feedback=row[10]
-                )
-                records.append(record)
-            
-            return records
+            return [
+                {'record': self._row_to_record(row), 'score': 0.0,
+                 'query_snippet': '', 'summary_snippet': ''}
+                for row in cursor.fetchall()
+            ]
     
     def save_user_preference(self, user_id: str, key: str, value: str):
         """保存用户偏好
@@ -364,7 +1011,7 @@ class MemoryManager:
             key: 偏好键
             value: 偏好值
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -386,7 +1033,7 @@ class MemoryManager:
         Returns:
             Optional[str]: 偏好值
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute(
@@ -406,7 +1053,7 @@ class MemoryManager:
         if session_id is None:
             session_id = self.current_session_id
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("DELETE FROM query_history WHERE session_id = ?", (session_id,))
@@ -414,8 +1061,129 @@ class MemoryManager:
             
             logger.info(f"Session history cleared: {session_id}")
     
+    def delete_history_before(self, before: datetime) -> int:
+        """删除某一时间之前的历史记录（统计计数器同步减少）
+        
+        Args:
+            before: 截止时间，早于该时间的记录被删除
+            
+        Returns:
+            int: 删除的记录数
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM query_history WHERE timestamp < ?", (before.isoformat(),))
+            deleted = cursor.rowcount
+            conn.commit()
+        
+        logger.info(f"Deleted {deleted} history record(s) before {before.isoformat()}")
+        return deleted
+    
+    def get_history_row_count(self) -> int:
+        """获取当前保存在数据库中的历史记录数（读取计数器，不扫描表）"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT
+                    (SELECT total_queries FROM history_counters WHERE scope = 'global' AND scope_key = ''),
+                    (SELECT value FROM history_meta WHERE key = 'archived_rows')
+            """)
+            total, archived = cursor.fetchone()
+            return (total or 0) - (archived or 0)
+    
+    def get_oldest_history(self, limit: int, before: Optional[datetime] = None) -> List[QueryRecord]:
+        """按时间升序获取最早的历史记录（用于归档）
+        
+        Args:
+            limit: 返回记录数限制
+            before: 只返回早于该时间的记录，None表示不限
+            
+        Returns:
+            List[QueryRecord]: 查询记录列表
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM query_history
+                WHERE timestamp < ?
+                ORDER BY timestamp, id
+                LIMIT ?
+            """, ((before or datetime.max).isoformat(), limit))
+            return [self._row_to_record(row) for row in cursor.fetchall()]
+    
+    def archive_history(self, record_ids: List[int]) -> int:
+        """删除已归档的历史记录，统计计数器保持不变
+        
+        Args:
+            record_ids: 已写入归档文件的记录ID
+            
+        Returns:
+            int: 删除的记录数
+        """
+        if not record_ids:
+            return 0
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # archiving标志只在本事务内可见，删除触发器据此跳过计数器递减
+            cursor.execute("UPDATE history_meta SET value = 1 WHERE key = 'archiving'")
+            cursor.executemany("DELETE FROM query_history WHERE id = ?", [(i,) for i in record_ids])
+            archived = cursor.rowcount
+            cursor.execute("UPDATE history_meta SET value = 0 WHERE key = 'archiving'")
+            cursor.execute("""
+                UPDATE history_meta SET value = value + ? WHERE key = 'archived_rows'
+            """, (archived,))
+            conn.commit()
+        return archived
+    
+    def prune_query_stats(self, before: datetime) -> int:
+        """删除最后使用时间早于before的查询统计
+        
+        Args:
+            before: 截止时间
+            
+        Returns:
+            int: 删除的统计条目数
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # last_used 可能是 CURRENT_TIMESTAMP 格式（空格分隔）或ISO格式，统一转换后比较
+            cursor.execute("""
+                DELETE FROM query_stats WHERE datetime(last_used) < datetime(?)
+            """, (before.isoformat(),))
+            deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+    
+    def incremental_vacuum(self, max_pages: int = 1000) -> Dict[str, int]:
+        """回收空闲页，首次调用时将数据库切换为增量VACUUM模式
+        
+        Args:
+            max_pages: 本次最多回收的页数
+            
+        Returns:
+            Dict[str, int]: 回收前后的空闲页数和页大小
+        """
+        conn = self._connect()
+        conn.isolation_level = None  # VACUUM不能在事务中执行
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.info("Switching history database to incremental auto_vacuum")
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            freelist_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            freelist_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return {
+                'freelist_before': freelist_before,
+                'freelist_after': freelist_after,
+                'page_size': conn.execute("PRAGMA page_size").fetchone()[0]
+            }
+        finally:
+            conn.close()
+    
     def get_session_stats(self, session_id: Optional[str] = None) -> Dict[str, Any]:
-        """获取会话统计信息
+        """获取会话统计信息（读取物化计数器）
         
         Args:
             session_id: 会话ID，默认为当前会话
@@ -426,26 +1194,101 @@ class MemoryManager:
         if session_id is None:
             session_id = self.current_session_id
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
+            stats = self._read_counter(cursor, 'session', session_id)
+            stats['session_id'] = session_id
+            stats['query_types'] = len(self._read_breakdown(cursor, 'session_type', session_id))
+            stats['latency_histogram'] = self._read_histogram(cursor, 'session', session_id)
+            return stats
+    
+    def get_daily_stats(self, day: Optional[str] = None) -> Dict[str, Any]:
+        """获取某一天的统计信息（读取物化计数器）
+        
+        Args:
+            day: 日期（YYYY-MM-DD），默认为今天
             
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_queries,
-                    SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_queries,
-                    AVG(execution_time) as avg_execution_time,
-                    COUNT(DISTINCT query_type) as query_types
-                FROM query_history 
-                WHERE session_id = ?
-            """, (session_id,))
-            
-            result = cursor.fetchone()
+        Returns:
+            Dict[str, Any]: 统计信息，包含查询类型和语言分布
+        """
+        if day is None:
+            day = datetime.now().strftime('%Y-%m-%d')
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            stats = self._read_counter(cursor, 'day', day)
+            stats['day'] = day
+            stats['query_types'] = self._read_breakdown(cursor, 'day_type', day)
+            stats['languages'] = self._read_breakdown(cursor, 'day_language', day)
+            stats['latency_histogram'] = self._read_histogram(cursor, 'day', day)
+            return stats
+    
+    def get_global_stats(self) -> Dict[str, Any]:
+        """获取全部历史记录的统计信息（读取物化计数器）
+        
+        Returns:
+            Dict[str, Any]: 统计信息，包含查询类型和语言分布
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            stats = self._read_counter(cursor, 'global', '')
+            stats['query_types'] = self._read_breakdown(cursor, 'query_type')
+            stats['languages'] = self._read_breakdown(cursor, 'language')
+            stats['latency_histogram'] = self._read_histogram(cursor, 'global', '')
+            return stats
+    
+    def _read_counter(self, cursor: sqlite3.Cursor, scope: str, scope_key: str) -> Dict[str, Any]:
+        """按主键读取单个计数器"""
+        cursor.execute("""
+            SELECT total_queries, successful_queries, total_execution_time
+            FROM history_counters WHERE scope = ? AND scope_key = ?
+        """, (scope, scope_key))
+        total, successful, total_time = cursor.fetchone() or (0, 0, 0.0)
+        return {
+            'total_queries': total,
+            'successful_queries': successful,
+            'failed_queries': total - successful,
+            'success_rate': (successful / total * 100) if total > 0 else 0,
+            'avg_execution_time': (total_time / total) if total > 0 else 0
+        }
+    
+    def _read_breakdown(self, cursor: sqlite3.Cursor, scope: str,
+                        parent_key: Optional[str] = None) -> Dict[str, int]:
+        """读取某一维度下各取值的查询数量
+        
+        Args:
+            cursor: 数据库游标
+            scope: 维度名称
+            parent_key: 组合维度（如session_type）的前缀键，只返回该前缀下的取值
             
-            return {
-                'session_id': session_id,
-                'total_queries': result[0] or 0,
-                'successful_queries': result[1] or 0,
-                'success_rate': (result[1] / result[0] * 100) if result[0] > 0 else 0,
-                'avg_execution_time': result[2] or 0,
-                'query_types': result[3] or 0
-            }
\ No newline at end of file
+        Returns:
+            Dict[str, int]: 取值 -> 查询数量
+        """
+        if parent_key is None:
+            cursor.execute("""
+                SELECT scope_key, total_queries FROM history_counters
+                WHERE scope = ? AND total_queries > 0
+            """, (scope,))
+            return dict(cursor.fetchall())
+        
+        # '|'之后的下一个字符是'}'，用主键范围扫描代替LIKE
+        prefix = f"{parent_key}|"
+        cursor.execute("""
+            SELECT scope_key, total_queries FROM history_counters
+            WHERE scope = ? AND scope_key >= ? AND scope_key < ? AND total_queries > 0
+        """, (scope, prefix, f"{parent_key}}}"))
+        return {key[len(prefix):]: count for key, count in cursor.fetchall()}
+    
+    def _read_histogram(self, cursor: sqlite3.Cursor, scope: str, scope_key: str) -> List[Dict[str, Any]]:
+        """读取耗时直方图
+        
+        Returns:
+            List[Dict[str, Any]]: 每个桶的上界（溢出桶为None）和数量
+        """
+        cursor.execute("""
+            SELECT bucket, count FROM history_latency_histogram
+            WHERE scope = ? AND scope_key = ?
+        """, (scope, scope_key))
+        counts = dict(cursor.fetchall())
+        bounds = list(LATENCY_BUCKETS) + [None]
+        return [{'le': bound, 'count': counts.get(i, 0)} for i, bound in enumerate(bounds)]
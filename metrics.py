@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标模块
+提供计数器、直方图和缓存命中率采集，以Prometheus文本格式在独立端口的 /metrics 上暴露（不依赖 prometheus_client）
+"""
+
+import math
+import threading
+import time
+import weakref
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 耗时直方图的默认桶上界（秒），覆盖毫秒级的SQL执行到数十秒的LLM调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+class _Metric:
+    """指标基类：按标签值分别保存样本"""
+    type_name = ''
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, items) -> List[str]:
+        return [f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+                for key, value in items]
+
+class Histogram(_Metric):
+    """耗时直方图（累计桶 + 总和 + 次数）"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各桶的非累计计数（最后一个为溢出桶）、总和、次数
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """记录代码块的耗时"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def get_count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def snapshot(self, **labels) -> Tuple[List[int], float, int]:
+        """返回 (各桶非累计计数, 总和, 次数) 的副本，两次快照相减即为期间的分布"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return [0] * (len(self.buckets) + 1), 0.0, 0
+            return list(state[0]), state[1], state[2]
+
+    def _render_samples(self, items) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+def histogram_quantile(q: float, buckets: Tuple[float, ...], counts: List[int]) -> Optional[float]:
+    """按桶计数估算分位数（与Prometheus的 histogram_quantile 相同，桶内线性插值）
+
+    Args:
+        q: 分位数（0~1）
+        buckets: 桶上界
+        counts: 各桶非累计计数（最后一个为溢出桶）
+
+    Returns:
+        Optional[float]: 估算值，没有样本时返回None；落在溢出桶时返回最大的桶上界
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            if index == len(buckets):
+                return buckets[-1]
+            lower = buckets[index - 1] if index > 0 else 0.0
+            return lower + (buckets[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return buckets[-1]
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self, prefix: str = 'loreal_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        # 缓存名称 -> 返回 (命中数, 未命中数) 的函数（弱引用，实例释放后自动移除）
+        self._caches: List[Tuple[str, Any]] = []
+
+    def counter(self, name: str, description: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, description, labelnames))
+
+    def histogram(self, name: str, description: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, description, labelnames, buckets))
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_cache(self, cache: str, stats_func: Callable[[], Tuple[int, int]]):
+        """登记一个缓存，抓取时调用 stats_func 读取其 (命中数, 未命中数)
+
+        同名缓存的多个实例（如不同数据库的汇总表管理器）合并统计。
+        """
+        ref = weakref.WeakMethod(stats_func) if hasattr(stats_func, '__self__') else (lambda: stats_func)
+        with self._lock:
+            self._caches = [(name, r) for name, r in self._caches if r() is not None]
+            self._caches.append((cache, ref))
+
+    def collect_caches(self) -> Dict[str, Tuple[int, int]]:
+        """汇总各缓存的命中数和未命中数"""
+        with self._lock:
+            caches = list(self._caches)
+        totals: Dict[str, Tuple[int, int]] = {}
+        for cache, ref in caches:
+            stats_func = ref()
+            if stats_func is None:
+                continue
+            try:
+                hits, misses = stats_func()
+            except Exception as e:
+                logger.warning(f"Failed to collect cache stats for {cache}: {e}")
+                continue
+            total_hits, total_misses = totals.get(cache, (0, 0))
+            totals[cache] = (total_hits + hits, total_misses + misses)
+        return totals
+
+    def render(self) -> str:
+        """按Prometheus文本格式输出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        caches = sorted(self.collect_caches().items())
+        lines.append(f"# HELP {self.prefix}cache_requests_total 缓存查找次数（result=hit/miss）")
+        lines.append(f"# TYPE {self.prefix}cache_requests_total counter")
+        for cache, (hits, misses) in caches:
+            lines.append(f'{self.prefix}cache_requests_total{{cache="{_escape(cache)}",result="hit"}} {hits}')
+            lines.append(f'{self.prefix}cache_requests_total{{cache="{_escape(cache)}",result="miss"}} {misses}')
+        lines.append(f"# HELP {self.prefix}cache_hit_ratio 缓存命中率")
+        lines.append(f"# TYPE {self.prefix}cache_hit_ratio gauge")
+        for cache, (hits, misses) in caches:
+            ratio = hits / (hits + misses) if hits + misses else 0.0
+            lines.append(f'{self.prefix}cache_hit_ratio{{cache="{_escape(cache)}"}} {_format_value(ratio)}')
+        return '\n'.join(lines) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = None
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"metrics {self.address_string()} {format % args}")
+
+def start_metrics_server(port: int, host: str = '127.0.0.1',
+                         registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """在后台线程启动 /metrics HTTP服务
+
+    Args:
+        port: 监听端口，0表示随机端口
+        host: 监听地址（端点无认证，默认只监听本机）
+        registry: 指标注册表，默认为全局实例
+
+    Returns:
+        ThreadingHTTPServer: 服务实例（shutdown() 停止）
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry or metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+# 全局实例
+metrics = MetricsRegistry()
+
+# 请求与处理阶段
+REQUESTS = metrics.counter('requests_total', '已处理的查询请求数', ('query_type', 'status'))
+REQUEST_DURATION = metrics.histogram('request_duration_seconds', '查询请求端到端耗时', ('query_type',))
+STAGE_DURATION = metrics.histogram('stage_duration_seconds', '处理阶段耗时（与trace的span名称一致）', ('stage',))
+
+# LLM调用
+LLM_CALLS = metrics.counter('llm_calls_total', 'LLM接口调用次数', ('status',))
+LLM_TOKENS = metrics.counter('llm_tokens_total', 'LLM接口返回的token用量', ('type',))
+
+# SQL执行、图表渲染与历史记录写入
+SQL_DURATION = metrics.histogram('sql_duration_seconds', '生成SQL的执行耗时（按实际执行引擎）', ('engine',))
+CHART_RENDER_DURATION = metrics.histogram('chart_render_duration_seconds', '图表渲染耗时（含保存图片）')
+HISTORY_WRITE_DURATION = metrics.histogram('history_write_duration_seconds', '历史记录批量写入事务耗时')
+HISTORY_WRITE_RECORDS = metrics.counter('history_written_records_total', '写入的历史记录数')
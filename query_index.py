@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询相似度索引模块
+基于字符n-gram TF-IDF向量的内存索引，用于快速查找相似的历史查询
+"""
+
+import math
+import re
+import threading
+import zlib
+import logging
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def normalize_query(text: Optional[str]) -> str:
+    """规范化查询文本（小写、合并空白），用作去重键"""
+    if not text:
+        return ""
+    return _WHITESPACE_PATTERN.sub(' ', text.lower()).strip()
+
+class QuerySimilarityIndex:
+    """历史查询相似度索引
+
+    每条查询按字符n-gram（默认1~3字符）哈希到固定维度，保存对数词频矩阵；
+    检索时只取查询向量非零的列计算IDF加权余弦相似度。
+    按字符切分，中文无需分词即可匹配。
+
+    IDF在文档数增长到上次计算时的 reweight_ratio 倍后重新计算，
+    其间新增的文档使用当前IDF计算向量长度。
+
+    设置 max_size 后，记录数超过上限时按最后使用时间淘汰最久未使用的查询
+    （每次淘汰 evict_ratio 比例，避免每次新增都压缩矩阵）。
+    """
+
+    def __init__(self,
+                 n_features: int = 1024,
+                 ngram_range: Tuple[int, int] = (1, 3),
+                 reweight_ratio: float = 1.25,
+                 initial_capacity: int = 256,
+                 max_size: int = 0,
+                 evict_ratio: float = 0.1):
+        """初始化相似度索引
+
+        Args:
+            n_features: 哈希特征维度
+            ngram_range: 字符n-gram长度范围（包含两端）
+            reweight_ratio: 文档数增长到该倍数时重新计算IDF
+            initial_capacity: 初始矩阵行数，不足时按倍数扩容
+            max_size: 最大记录数（0表示不限）
+            evict_ratio: 超过上限时一次淘汰的记录比例
+        """
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.reweight_ratio = reweight_ratio
+        self.max_size = max_size
+        self.evict_ratio = evict_ratio
+        if max_size:
+            initial_capacity = min(initial_capacity, max_size + 1)
+
+        self._lock = threading.Lock()
+        self._tf = np.zeros((initial_capacity, n_features), dtype=np.float32)
+        self._norms = np.zeros(initial_capacity, dtype=np.float32)
+        self._doc_freq = np.zeros(n_features, dtype=np.int32)
+        self._idf = np.ones(n_features, dtype=np.float32)
+        self._idf_doc_count = 0
+
+        self._queries: List[str] = []
+        self._usage_counts: List[int] = []
+        self._last_used: List[Optional[str]] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def add(self, query: str, usage_count: int = 1, last_used: Optional[str] = None) -> bool:
+        """添加一条查询，已存在时只累加使用次数
+
+        Args:
+            query: 查询文本
+            usage_count: 使用次数
+            last_used: 最后使用时间（ISO格式字符串）
+
+        Returns:
+            bool: 是否新增了一条索引记录
+        """
+        with self._lock:
+            added = self._add_locked(query, usage_count, last_used)
+            if added and self.max_size and len(self._queries) > self.max_size:
+                self._evict_locked()
+                self._reweight()
+            elif added and len(self._queries) >= self._idf_doc_count * self.reweight_ratio:
+                self._reweight()
+            return added
+
+    def build(self, items: Iterable[Tuple[str, int, Optional[str]]]) -> int:
+        """批量添加查询，全部添加后统一计算一次IDF
+
+        Args:
+            items: (查询文本, 使用次数, 最后使用时间) 序列
+
+        Returns:
+            int: 新增的索引记录数
+        """
+        with self._lock:
+            added = 0
+            for query, usage_count, last_used in items:
+                if self._add_locked(query, usage_count, last_used):
+                    added += 1
+                    if self.max_size and len(self._queries) > self.max_size:
+                        self._evict_locked()
+            self._reweight()
+        logger.info(f"Query similarity index built with {len(self._queries)} queries")
+        return added
+
+    def rebuild(self, items: Iterable[Tuple[str, int, Optional[str]]]) -> int:
+        """清空索引后按给定查询重新构建（历史记录被删除或归档后调用）
+
+        Args:
+            items: (查询文本, 使用次数, 最后使用时间) 序列
+
+        Returns:
+            int: 重建后的索引记录数
+        """
+        items = list(items)
+        with self._lock:
+            self._tf = np.zeros_like(self._tf)
+            self._norms = np.zeros_like(self._norms)
+            self._doc_freq = np.zeros(self.n_features, dtype=np.int32)
+            self._idf = np.ones(self.n_features, dtype=np.float32)
+            self._idf_doc_count = 0
+            self._queries, self._usage_counts, self._last_used = [], [], []
+            self._positions = {}
+            for query, usage_count, last_used in items:
+                if self._add_locked(query, usage_count, last_used) and \
+                        self.max_size and len(self._queries) > self.max_size:
+                    self._evict_locked()
+            self._reweight()
+            count = len(self._queries)
+        logger.info(f"Query similarity index rebuilt with {count} queries")
+        return count
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.2) -> List[Dict[str, Any]]:
+        """查找与给定查询最相似的历史查询（不包含查询本身）
+
+        Args:
+            query: 查询文本
+            k: 返回结果数
+            min_score: 最低相似度（0~1）
+
+        Returns:
+            List[Dict]: 按相似度降序排列，包含 query、score、usage_count 和 last_used
+        """
+        key = normalize_query(query)
+        columns, weights = self._vectorize(key)
+        if not columns.size:
+            return []
+
+        with self._lock:
+            count = len(self._queries)
+            if count == 0:
+                return []
+
+            query_weights = weights * self._idf[columns]
+            query_norm = float(np.linalg.norm(query_weights))
+            # 只读取查询向量非零的列：scores = (D·idf)·(q·idf) / (|D·idf| |q·idf|)
+            scores = self._tf[:count, columns] @ (query_weights * self._idf[columns])
+            scores /= np.maximum(self._norms[:count], 1e-12) * query_norm
+
+            own_position = self._positions.get(key)
+            if own_position is not None:
+                scores[own_position] = -1.0
+
+            if count > k:
+                top = np.argpartition(-scores, k)[:k]
+            else:
+                top = np.arange(count)
+            top = top[np.argsort(-scores[top], kind='stable')]
+
+            return [
+                {
+                    'query': self._queries[i],
+                    'score': float(scores[i]),
+                    'usage_count': self._usage_counts[i],
+                    'last_used': self._last_used[i]
+                }
+                for i in top if scores[i] >= min_score
+            ]
+
+    def _add_locked(self, query: str, usage_count: int, last_used: Optional[str]) -> bool:
+        """添加查询（调用方持有锁）"""
+        key = normalize_query(query)
+        if not key:
+            return False
+
+        position = self._positions.get(key)
+        if position is not None:
+            self._usage_counts[position] += usage_count
+            if last_used and (self._last_used[position] or "") < last_used:
+                self._last_used[position] = last_used
+            return False
+
+        columns, weights = self._vectorize(key)
+        row = len(self._queries)
+        if row >= self._tf.shape[0]:
+            self._grow()
+
+        self._tf[row, columns] = weights
+        self._doc_freq[columns] += 1
+        query_weights = weights * self._idf[columns]
+        self._norms[row] = np.linalg.norm(query_weights)
+
+        self._positions[key] = row
+        self._queries.append(query)
+        self._usage_counts.append(usage_count)
+        self._last_used.append(last_used)
+        return True
+
+    def _vectorize(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """将文本转换为稀疏的对数词频向量
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (非零特征列号, 1 + log(tf))
+        """
+        counts = Counter()
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if gram.strip():
+                    counts[zlib.crc32(gram.encode('utf-8')) % self.n_features] += 1
+
+        columns = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.fromiter((1.0 + math.log(c) for c in counts.values()),
+                              dtype=np.float32, count=len(counts))
+        return columns, weights
+
+    def _grow(self):
+        """矩阵容量翻倍（设置上限时不超过 max_size + 1 行）"""
+        capacity = self._tf.shape[0] * 2
+        if self.max_size:
+            capacity = max(min(capacity, self.max_size + 1), self._tf.shape[0] + 1)
+        tf = np.zeros((capacity, self.n_features), dtype=np.float32)
+        tf[:self._tf.shape[0]] = self._tf
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:self._norms.shape[0]] = self._norms
+        self._tf, self._norms = tf, norms
+
+    def _evict_locked(self, count: Optional[int] = None):
+        """淘汰最久未使用的查询（调用方持有锁，之后需重新计算IDF）
+
+        Args:
+            count: 淘汰条数，默认淘汰 max_size 的 evict_ratio 比例（至少1条）
+        """
+        total = len(self._queries)
+        if count is None:
+            count = total - self.max_size + int(self.max_size * self.evict_ratio)
+        count = min(max(count, 1), total)
+        # 按 (最后使用时间, 使用次数) 升序淘汰，其余记录保持原有顺序
+        order = sorted(range(total), key=lambda i: (self._last_used[i] or "", self._usage_counts[i]))
+        keep = np.array(sorted(order[count:]), dtype=np.int64)
+
+        kept = len(keep)
+        self._tf[:kept] = self._tf[keep]
+        self._tf[kept:total] = 0.0
+        self._norms[:kept] = self._norms[keep]
+        self._norms[kept:total] = 0.0
+        self._doc_freq = np.count_nonzero(self._tf[:kept], axis=0).astype(np.int32)
+
+        self._queries = [self._queries[i] for i in keep]
+        self._usage_counts = [self._usage_counts[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
+        self._positions = {normalize_query(query): row for row, query in enumerate(self._queries)}
+        logger.debug(f"Query similarity index evicted {count} least recently used queries")
+
+    def _reweight(self):
+        """根据当前文档频率重新计算IDF和向量长度"""
+        count = len(self._queries)
+        self._idf = (np.log((1.0 + count) / (1.0 + self._doc_freq)) + 1.0).astype(np.float32)
+        if count:
+            self._norms[:count] = np.sqrt((self._tf[:count] ** 2) @ (self._idf ** 2))
+        self._idf_doc_count = count
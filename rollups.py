@@ -0,0 +1,666 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+汇总表（rollup）模块
+为 sales_data 维护按常用维度组合预聚合的汇总表，并将符合条件的聚合查询改写到最小的匹配汇总表
+"""
+
+import calendar
+import re
+import sqlite3
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Set
+
+from config import Config
+from metrics import metrics
+from stats_catalog import sqlite_path_from_uri, CHANGES_TABLE
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RollupSpec:
+    """汇总表定义"""
+    fact_table: str
+    date_column: str
+    month_column: str  # 由日期列派生的月份维度（YYYY-MM）
+    measures: Tuple[str, ...]
+    rollups: Dict[str, Tuple[str, ...]]  # 汇总表名 -> 维度列
+    key_columns: Tuple[str, ...] = ()  # 非空键列，COUNT(key) 等价于 COUNT(*)
+    defer_key: str = 'rollup_deferred'  # data_meta 中暂停触发器维护的标记
+
+    def dimension_sql(self, dimension: str, row: Optional[str] = None) -> str:
+        """维度在事实表上的取值表达式"""
+        prefix = f"{row}." if row else ""
+        if dimension == self.month_column:
+            return f"substr({prefix}{self.date_column}, 1, 7)"
+        return f"{prefix}{dimension}"
+
+SALES_ROLLUPS = RollupSpec(
+    fact_table='sales_data',
+    date_column='order_date',
+    month_column='order_month',
+    measures=('sales_amount', 'quantity', 'discount_amount'),
+    rollups={
+        'rollup_sales_month': ('order_month',),
+        'rollup_sales_province_month': ('province', 'order_month'),
+        'rollup_sales_brand_month': ('brand', 'order_month'),
+        'rollup_sales_category_month': ('category', 'order_month'),
+        'rollup_sales_province_brand_month': ('province', 'brand', 'order_month'),
+        'rollup_sales_brand_category_month': ('brand', 'category', 'order_month'),
+        'rollup_sales_product_month': ('product_id', 'product_name', 'brand', 'category', 'order_month'),
+    },
+    key_columns=('sale_id',)
+)
+
+# ---------------------------------------------------------------------------
+# 汇总表维护
+# ---------------------------------------------------------------------------
+
+def _measure_columns(spec: RollupSpec) -> List[str]:
+    """汇总表的度量列"""
+    columns = ['row_count']
+    for measure in spec.measures:
+        columns.extend([f"{measure}_sum", f"{measure}_count"])
+    return columns
+
+def _group_match_sql(spec: RollupSpec, dims: Tuple[str, ...], row: str) -> str:
+    """按维度定位汇总行的条件（IS 比较，NULL 维度值也能匹配）"""
+    return " AND ".join(f"{dim} IS {spec.dimension_sql(dim, row)}" for dim in dims)
+
+def _add_row_sql(spec: RollupSpec, name: str, dims: Tuple[str, ...]) -> str:
+    """触发器中把 NEW 行累加到汇总表的语句"""
+    sets = ["row_count = row_count + 1"]
+    values = ["1"]
+    for m in spec.measures:
+        sets.append(f"{m}_sum = CASE WHEN NEW.{m} IS NULL THEN {m}_sum ELSE COALESCE({m}_sum, 0) + NEW.{m} END")
+        sets.append(f"{m}_count = {m}_count + (NEW.{m} IS NOT NULL)")
+        values.extend([f"NEW.{m}", f"NEW.{m} IS NOT NULL"])
+    dim_values = [spec.dimension_sql(dim, 'NEW') for dim in dims]
+    return (
+        f"UPDATE {name} SET {', '.join(sets)} WHERE {_group_match_sql(spec, dims, 'NEW')};\n"
+        f"INSERT INTO {name} ({', '.join(list(dims) + _measure_columns(spec))}) "
+        f"SELECT {', '.join(dim_values + values)} WHERE changes() = 0;"
+    )
+
+def _remove_row_sql(spec: RollupSpec, name: str, dims: Tuple[str, ...]) -> str:
+    """触发器中从汇总表扣减 OLD 行的语句（度量全部为空时 _sum 置为 NULL，与 SUM 语义一致）"""
+    sets = ["row_count = row_count - 1"]
+    for m in spec.measures:
+        sets.append(f"{m}_sum = CASE WHEN OLD.{m} IS NULL THEN {m}_sum "
+                    f"WHEN {m}_count = 1 THEN NULL ELSE {m}_sum - OLD.{m} END")
+        sets.append(f"{m}_count = {m}_count - (OLD.{m} IS NOT NULL)")
+    match = _group_match_sql(spec, dims, 'OLD')
+    return (
+        f"UPDATE {name} SET {', '.join(sets)} WHERE {match};\n"
+        f"DELETE FROM {name} WHERE row_count <= 0 AND {match};"
+    )
+
+def install_rollups(conn: sqlite3.Connection, spec: RollupSpec = SALES_ROLLUPS) -> bool:
+    """创建汇总表和维护触发器，汇总数据与事实表不一致时全量重建
+
+    Args:
+        conn: 数据库连接（需已存在 data_meta 表）
+        spec: 汇总表定义
+
+    Returns:
+        bool: 是否执行了全量重建
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if spec.fact_table not in tables:
+        return False
+
+    for name, dims in spec.rollups.items():
+        # 维度列不声明类型，按原值存储，触发器中的 IS 比较与事实表取值一致
+        columns = list(dims) + ["row_count INTEGER NOT NULL DEFAULT 0"]
+        for m in spec.measures:
+            columns.extend([f"{m}_sum NUMERIC", f"{m}_count INTEGER NOT NULL DEFAULT 0"])
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(columns)})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name} ON {name}({', '.join(dims)})")
+
+    conn.execute("INSERT OR IGNORE INTO data_meta (key, value) VALUES (?, 0)", (spec.defer_key,))
+    # 每次重新创建触发器，汇总表定义变化后触发器随之更新
+    gate = f"WHEN COALESCE((SELECT value FROM data_meta WHERE key = '{spec.defer_key}'), 0) = 0"
+    add = "\n".join(_add_row_sql(spec, name, dims) for name, dims in spec.rollups.items())
+    remove = "\n".join(_remove_row_sql(spec, name, dims) for name, dims in spec.rollups.items())
+    tracked = sorted({spec.date_column, *spec.measures,
+                      *(dim for dims in spec.rollups.values() for dim in dims if dim != spec.month_column)})
+    triggers = {
+        'insert': (f"AFTER INSERT ON {spec.fact_table}", add),
+        'delete': (f"AFTER DELETE ON {spec.fact_table}", remove),
+        'update': (f"AFTER UPDATE OF {', '.join(tracked)} ON {spec.fact_table}", remove + "\n" + add),
+    }
+    for event, (timing, body) in triggers.items():
+        trigger = f"{spec.fact_table}_rollup_{event}"
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute(f"CREATE TRIGGER {trigger} {timing} {gate} BEGIN\n{body}\nEND")
+
+    # 最粗的汇总表行数合计应等于事实表行数
+    coarsest = min(spec.rollups, key=lambda name: len(spec.rollups[name]))
+    rolled = conn.execute(f"SELECT COALESCE(SUM(row_count), 0) FROM {coarsest}").fetchone()[0]
+    actual = conn.execute(f"SELECT COUNT(*) FROM {spec.fact_table}").fetchone()[0]
+    if rolled != actual:
+        rebuild_rollups(conn, spec)
+        return True
+    return False
+
+_MONTH_VALUE = re.compile(r'^\d{4}-\d{2}$')
+
+def rebuild_rollups(conn: sqlite3.Connection, spec: RollupSpec = SALES_ROLLUPS,
+                    months: Optional[Set[str]] = None):
+    """重建汇总表（调用方负责提交事务）
+
+    维度最多的汇总表从事实表聚合，其余汇总表从已建好的、包含其全部维度的最小汇总表再聚合，
+    减少对事实表的扫描次数。
+
+    Args:
+        conn: 数据库连接
+        spec: 汇总表定义
+        months: 只重建这些月份（YYYY-MM），None表示全量重建
+    """
+    start_time = time.perf_counter()
+    month = spec.month_column
+    if months is not None:
+        months = sorted(m for m in months if m)
+        if not months:
+            return
+        placeholders = ', '.join('?' * len(months))
+        rollup_filter = f"WHERE {month} IN ({placeholders})"
+        params = tuple(months)
+        fact_filter = f"WHERE {spec.dimension_sql(month)} IN ({placeholders})"
+        fact_params = params
+        if all(_MONTH_VALUE.match(m) for m in months):
+            # 附加日期范围条件，可以使用日期列索引
+            last_year, last_month = (int(part) for part in months[-1].split('-'))
+            next_month = f"{last_year + last_month // 12:04d}-{last_month % 12 + 1:02d}"
+            fact_filter += f" AND {spec.date_column} >= ? AND {spec.date_column} < ?"
+            fact_params = params + (f"{months[0]}-01", f"{next_month}-01")
+    else:
+        fact_filter = rollup_filter = ""
+        params = fact_params = ()
+
+    built: Dict[str, int] = {}
+    for name, dims in sorted(spec.rollups.items(), key=lambda item: -len(item[1])):
+        conn.execute(f"DELETE FROM {name} {rollup_filter}", params)
+        sources = [source for source in built if set(dims) <= set(spec.rollups[source])]
+        if sources:
+            source = min(sources, key=built.get)
+            source_filter, source_params = rollup_filter, params
+            aggregates = ["SUM(row_count)"]
+            for m in spec.measures:
+                aggregates.extend([f"SUM({m}_sum)", f"SUM({m}_count)"])
+            select_dims = list(dims)
+        else:
+            source = spec.fact_table
+            source_filter, source_params = fact_filter, fact_params
+            aggregates = ["COUNT(*)"]
+            for m in spec.measures:
+                aggregates.extend([f"SUM({m})", f"COUNT({m})"])
+            select_dims = [spec.dimension_sql(dim) for dim in dims]
+
+        conn.execute(
+            f"INSERT INTO {name} ({', '.join(list(dims) + _measure_columns(spec))}) "
+            f"SELECT {', '.join(select_dims + aggregates)} FROM {source} {source_filter} "
+            f"GROUP BY {', '.join(str(i + 1) for i in range(len(dims)))}",
+            source_params
+        )
+        built[name] = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+    scope = f"{len(months)} month(s)" if months is not None else "all months"
+    logger.info(f"Rollups rebuilt for {scope} in {time.perf_counter() - start_time:.2f}s")
+
+def set_rollups_deferred(conn: sqlite3.Connection, deferred: bool, spec: RollupSpec = SALES_ROLLUPS):
+    """暂停/恢复触发器维护（批量导入期间暂停，导入后调用 rebuild_rollups）"""
+    conn.execute("UPDATE data_meta SET value = ? WHERE key = ?", (1 if deferred else 0, spec.defer_key))
+
+# ---------------------------------------------------------------------------
+# 查询改写
+# ---------------------------------------------------------------------------
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<op><=|>=|<>|!=|==|\|\||[(),.;*+\-/%<>=])
+""", re.VERBOSE | re.DOTALL)
+
+# 出现这些关键字的查询不改写（多表、子查询、窗口函数或写操作）
+_UNSUPPORTED_KEYWORDS = {'JOIN', 'UNION', 'INTERSECT', 'EXCEPT', 'WITH', 'OVER', 'WINDOW', 'EXISTS',
+                         'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER', 'PRAGMA'}
+_CLAUSE_KEYWORDS = {'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT'}
+_ROLLUP_AGGREGATES = {'SUM', 'TOTAL', 'COUNT', 'AVG'}
+_OTHER_AGGREGATES = {'MIN', 'MAX', 'GROUP_CONCAT', 'STRING_AGG', 'MEDIAN'}
+_MONTH_START = re.compile(r"^'(\d{4})-(\d{2})-01'$")
+_FULL_DATE = re.compile(r"^'(\d{4})-(\d{2})-(\d{2})'$")
+_DATE_PREFIX = re.compile(r"^'(\d{4}(?:-\d{2})?)%'$")
+
+@dataclass
+class SqlToken:
+    """SQL词法单元"""
+    kind: str
+    text: str
+
+    @property
+    def name(self) -> str:
+        """标识符的规范化名称（去引号、小写）"""
+        if self.kind == 'quoted':
+            return self.text[1:-1].lower()
+        return self.text.lower()
+
+    @property
+    def upper(self) -> str:
+        return self.text.upper() if self.kind == 'word' else ""
+
+    def is_identifier(self) -> bool:
+        return self.kind in ('word', 'quoted')
+
+def tokenize_sql(sql: str) -> Optional[List[SqlToken]]:
+    """切分SQL，遇到无法识别的字符（如参数占位符）返回None"""
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = _TOKEN_PATTERN.match(sql, position)
+        if not match:
+            return None
+        if match.lastgroup not in ('space', 'comment'):
+            tokens.append(SqlToken(match.lastgroup, match.group()))
+        position = match.end()
+    return tokens
+
+def closing_paren(tokens: List[SqlToken], open_index: int) -> int:
+    """返回与 open_index 处左括号匹配的右括号位置，不匹配时返回-1"""
+    depth = 0
+    for i in range(open_index, len(tokens)):
+        if tokens[i].text == '(':
+            depth += 1
+        elif tokens[i].text == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+def _month_end(year: str, month: str) -> int:
+    return calendar.monthrange(int(year), int(month))[1]
+
+class _Ineligible(Exception):
+    """查询不能改写到汇总表"""
+
+class RollupRewriter:
+    """聚合查询改写器
+
+    只改写单表查询：FROM 事实表（可带别名），不含JOIN、子查询、窗口函数；
+    聚合只能是 SUM / TOTAL / AVG（度量列）和 COUNT(*) / COUNT(度量列或键列)；
+    非聚合位置只能引用汇总表维度，日期列只能以月粒度使用
+    （strftime('%Y-%m' / '%Y' / '%m')、substr、按整月边界比较、BETWEEN 或 LIKE 'YYYY%'）。
+    不满足条件时保持原查询不变。
+    """
+
+    def __init__(self, spec: RollupSpec, fact_columns: Set[str]):
+        """初始化改写器
+
+        Args:
+            spec: 汇总表定义
+            fact_columns: 事实表全部列名（小写）
+        """
+        self.spec = spec
+        self.fact_columns = {column.lower() for column in fact_columns}
+        self.dimensions = {dim for dims in spec.rollups.values() for dim in dims if dim != spec.month_column}
+
+    def rewrite(self, sql: str, rollup_sizes: Dict[str, int]) -> Optional[Tuple[str, str]]:
+        """尝试改写查询
+
+        Args:
+            sql: 原始SQL
+            rollup_sizes: 可用的汇总表及其行数
+
+        Returns:
+            Optional[Tuple[str, str]]: (改写后的SQL, 使用的汇总表)，不能改写时返回None
+        """
+        tokens = tokenize_sql(sql)
+        if not tokens:
+            return None
+        try:
+            output, needed = self._rewrite_tokens(tokens)
+        except _Ineligible:
+            return None
+
+        candidates = [name for name in rollup_sizes if set(needed) <= set(self.spec.rollups.get(name, ()))]
+        if not candidates:
+            return None
+        rollup = min(candidates, key=lambda name: (rollup_sizes[name], len(self.spec.rollups[name])))
+        return " ".join(rollup if text is None else text for text in output), rollup
+
+    def _rewrite_tokens(self, tokens: List[SqlToken]) -> Tuple[List[Optional[str]], Set[str]]:
+        """逐个改写记号，返回输出片段（None为汇总表名占位）和用到的维度"""
+        if tokens[-1].text == ';':
+            tokens = tokens[:-1]
+        if not tokens or tokens[0].upper != 'SELECT':
+            raise _Ineligible()
+        for token in tokens:
+            if token.text == ';' or token.upper in _UNSUPPORTED_KEYWORDS:
+                raise _Ineligible()
+        if sum(1 for token in tokens if token.upper == 'SELECT') != 1:
+            raise _Ineligible()
+
+        from_index, after_from, qualifiers = self._parse_from(tokens)
+        distinct = len(tokens) > 1 and tokens[1].upper == 'DISTINCT'
+        grouped = any(token.upper == 'GROUP' for token in tokens)
+
+        aliases = {tokens[i + 1].name for i in range(from_index) if tokens[i].upper == 'AS'
+                   and i + 1 < len(tokens) and tokens[i + 1].is_identifier()}
+
+        output: List[Optional[str]] = []
+        needed: Set[str] = set()
+        aggregated = False
+        in_order_by = False
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+
+            if i == from_index:
+                output.extend(['FROM', None])
+                i = after_from
+                continue
+
+            if token.upper == 'AS' and following is not None and following.is_identifier():
+                output.extend([token.text, following.text])
+                i += 2
+                continue
+            if token.upper == 'ORDER':
+                in_order_by = True
+            elif token.upper == 'LIMIT':
+                in_order_by = False
+            # ORDER BY 中的名称优先解析为 SELECT 别名
+            if in_order_by and token.is_identifier() and token.name in aliases:
+                output.append(token.text)
+                i += 1
+                continue
+
+            if token.kind == 'word' and following is not None and following.text == '(':
+                close = closing_paren(tokens, i + 1)
+                if close < 0:
+                    raise _Ineligible()
+                args = self._strip_qualifiers(tokens[i + 2:close], qualifiers)
+                function = token.upper
+                if function in _ROLLUP_AGGREGATES:
+                    output.append(self._rewrite_aggregate(function, args))
+                    aggregated = True
+                    i = close + 1
+                    continue
+                if function in _OTHER_AGGREGATES:
+                    raise _Ineligible()
+                month_expr = self._rewrite_month_function(function, args)
+                if month_expr:
+                    output.append(month_expr)
+                    needed.add(self.spec.month_column)
+                    i = close + 1
+                    continue
+                output.append(token.text)
+                i += 1
+                continue
+
+            if token.is_identifier():
+                column, i = self._read_column(tokens, i, qualifiers)
+                if column is None:
+                    output.append(token.text)
+                elif column == self.spec.date_column:
+                    predicate, i = self._rewrite_date_predicate(tokens, i)
+                    output.append(predicate)
+                    needed.add(self.spec.month_column)
+                elif column in self.dimensions:
+                    output.append(column)
+                    needed.add(column)
+                elif column in self.fact_columns:
+                    raise _Ineligible()
+                else:
+                    output.append(token.text)
+                continue
+
+            if token.text == '*' and i > 0 and (tokens[i - 1].text == ',' or tokens[i - 1].upper in ('SELECT', 'DISTINCT')):
+                raise _Ineligible()
+            output.append(token.text)
+            i += 1
+
+        if not (aggregated or grouped or distinct):
+            raise _Ineligible()
+        return output, needed
+
+    def _parse_from(self, tokens: List[SqlToken]) -> Tuple[int, int, Set[str]]:
+        """定位 FROM 子句，返回 (FROM位置, FROM子句之后的位置, 可用的列限定名)"""
+        depth = 0
+        for i, token in enumerate(tokens):
+            if token.text == '(':
+                depth += 1
+            elif token.text == ')':
+                depth -= 1
+            elif depth == 0 and token.upper == 'FROM':
+                break
+        else:
+            raise _Ineligible()
+
+        if i + 1 >= len(tokens) or not tokens[i + 1].is_identifier() or tokens[i + 1].name != self.spec.fact_table:
+            raise _Ineligible()
+        qualifiers = {self.spec.fact_table}
+        end = i + 2
+        if end < len(tokens) and tokens[end].upper == 'AS':
+            end += 1
+        if end < len(tokens) and tokens[end].is_identifier() and tokens[end].upper not in _CLAUSE_KEYWORDS:
+            qualifiers.add(tokens[end].name)
+            end += 1
+        if end < len(tokens) and tokens[end].upper not in _CLAUSE_KEYWORDS:
+            raise _Ineligible()
+        return i, end, qualifiers
+
+    def _read_column(self, tokens: List[SqlToken], i: int, qualifiers: Set[str]) -> Tuple[Optional[str], int]:
+        """读取（可带限定名的）列引用，返回 (事实表列名或None, 下一位置)"""
+        token = tokens[i]
+        if (token.name in qualifiers and i + 2 < len(tokens)
+                and tokens[i + 1].text == '.' and tokens[i + 2].is_identifier()):
+            column = tokens[i + 2].name
+            if column not in self.fact_columns:
+                raise _Ineligible()
+            return column, i + 3
+        if token.name in self.fact_columns:
+            return token.name, i + 1
+        return None, i + 1
+
+    def _strip_qualifiers(self, args: List[SqlToken], qualifiers: Set[str]) -> List[SqlToken]:
+        """去掉函数参数中的表限定名"""
+        stripped = []
+        i = 0
+        while i < len(args):
+            if (args[i].is_identifier() and args[i].name in qualifiers
+                    and i + 2 < len(args) and args[i + 1].text == '.'):
+                i += 2
+                continue
+            stripped.append(args[i])
+            i += 1
+        return stripped
+
+    def _rewrite_aggregate(self, function: str, args: List[SqlToken]) -> str:
+        """改写 SUM / TOTAL / AVG / COUNT"""
+        if len(args) != 1:
+            raise _Ineligible()
+        arg = args[0]
+        if function == 'COUNT':
+            if arg.text == '*' or arg.kind == 'number' or arg.name in self.spec.key_columns:
+                return "COALESCE(SUM(row_count), 0)"
+            if arg.is_identifier() and arg.name in self.spec.measures:
+                return f"COALESCE(SUM({arg.name}_count), 0)"
+            raise _Ineligible()
+        if not arg.is_identifier() or arg.name not in self.spec.measures:
+            raise _Ineligible()
+        if function == 'AVG':
+            return f"(SUM({arg.name}_sum) * 1.0 / SUM({arg.name}_count))"
+        return f"{function}({arg.name}_sum)"
+
+    def _rewrite_month_function(self, function: str, args: List[SqlToken]) -> Optional[str]:
+        """把日期列上的年/月提取函数改写为月份维度表达式"""
+        month = self.spec.month_column
+        texts = [arg.text if arg.kind != 'quoted' else arg.name for arg in args]
+        lowered = [text.lower() for text in texts]
+        date = self.spec.date_column
+        if function == 'STRFTIME' and len(args) == 3 and lowered[1:] == [',', date]:
+            return {"'%y-%m'": month, "'%y'": f"substr({month}, 1, 4)",
+                    "'%m'": f"substr({month}, 6, 2)"}.get(lowered[0])
+        if function in ('SUBSTR', 'SUBSTRING') and len(args) == 5 and lowered[:2] == [date, ','] and lowered[3] == ',':
+            return {('1', '7'): month, ('1', '4'): f"substr({month}, 1, 4)",
+                    ('6', '2'): f"substr({month}, 6, 2)"}.get((lowered[2], lowered[4]))
+        return None
+
+    def _rewrite_date_predicate(self, tokens: List[SqlToken], i: int) -> Tuple[str, int]:
+        """改写日期列上按整月边界的比较，返回 (改写后的条件, 下一位置)"""
+        month = self.spec.month_column
+        op = tokens[i].text if i < len(tokens) else ""
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+
+        if op in ('>=', '<') and value is not None and value.kind == 'string':
+            match = _MONTH_START.match(value.text)
+            if match:
+                return f"{month} {op} '{match.group(1)}-{match.group(2)}'", i + 2
+        if op in ('<=', '>') and value is not None and value.kind == 'string':
+            match = _FULL_DATE.match(value.text)
+            if match and int(match.group(3)) == _month_end(match.group(1), match.group(2)):
+                return f"{month} {op} '{match.group(1)}-{match.group(2)}'", i + 2
+        if tokens[i].upper == 'LIKE' and value is not None and value.kind == 'string':
+            match = _DATE_PREFIX.match(value.text)
+            if match:
+                return f"{month} LIKE '{match.group(1)}%'", i + 2
+        if tokens[i].upper == 'BETWEEN' and i + 3 < len(tokens) and tokens[i + 2].upper == 'AND':
+            start = _MONTH_START.match(tokens[i + 1].text)
+            end = _FULL_DATE.match(tokens[i + 3].text)
+            if start and end and int(end.group(3)) == _month_end(end.group(1), end.group(2)):
+                return (f"{month} BETWEEN '{start.group(1)}-{start.group(2)}' "
+                        f"AND '{end.group(1)}-{end.group(2)}'"), i + 4
+        raise _Ineligible()
+
+class RollupManager:
+    """汇总表查询改写入口
+
+    缓存数据库中可用的汇总表及行数（data_version 变化或超过 refresh_interval 秒后重新读取），
+    查询执行前调用 rewrite，不能改写或数据库中没有汇总表时原样返回。
+    """
+
+    def __init__(self, db_path: str, spec: RollupSpec = SALES_ROLLUPS, refresh_interval: float = 60.0):
+        """初始化
+
+        Args:
+            db_path: 数据库文件路径
+            spec: 汇总表定义
+            refresh_interval: 汇总表信息的最长缓存时间（秒）
+        """
+        self.db_path = db_path
+        self.spec = spec
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._rewriter: Optional[RollupRewriter] = None
+        self._sizes: Dict[str, int] = {}
+        self._meta_tables: List[str] = []
+        self._data_version = None
+        self._refreshed_at = 0.0
+        self._metrics = {'rewritten': 0, 'passthrough': 0}
+        metrics.register_cache('rollup_rewrite', self.cache_stats)
+
+    def rewrite(self, sql: str) -> str:
+        """将可改写的聚合查询改写到最小的匹配汇总表
+
+        Args:
+            sql: 原始SQL
+
+        Returns:
+            str: 改写后的SQL，不能改写时为原SQL
+        """
+        if not Config.ROLLUP_REWRITE or not isinstance(sql, str):
+            return sql
+        self._refresh()
+        if not self._sizes:
+            return sql
+
+        result = self._rewriter.rewrite(sql, self._sizes)
+        with self._lock:
+            self._metrics['rewritten' if result else 'passthrough'] += 1
+        if not result:
+            return sql
+        rewritten, rollup = result
+        logger.info(f"Query rewritten to rollup {rollup}: {rewritten}")
+        return rewritten
+
+    def get_metrics(self) -> Dict[str, int]:
+        """获取改写次数统计"""
+        with self._lock:
+            return dict(self._metrics)
+
+    def cache_stats(self) -> Tuple[int, int]:
+        """改写到汇总表的查询数和未改写的查询数"""
+        with self._lock:
+            return self._metrics['rewritten'], self._metrics['passthrough']
+
+    def internal_tables(self) -> List[str]:
+        """数据库中已存在的汇总表和元数据表（不应出现在SQL生成提示中）"""
+        self._refresh()
+        with self._lock:
+            return list(self._sizes) + self._meta_tables
+
+    def invalidate(self):
+        """清除缓存的汇总表信息"""
+        with self._lock:
+            self._refreshed_at = 0.0
+            self._data_version = None
+
+    def _refresh(self):
+        """按需重新读取可用汇总表、行数和事实表列"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+        except sqlite3.Error:
+            return
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            data_version = None
+            if 'data_meta' in tables:
+                row = conn.execute("SELECT value FROM data_meta WHERE key = 'data_version'").fetchone()
+                data_version = row[0] if row else None
+
+            with self._lock:
+                fresh = time.monotonic() - self._refreshed_at < self.refresh_interval
+                if fresh and data_version == self._data_version:
+                    return
+
+            sizes = {}
+            rewriter = None
+            if self.spec.fact_table in tables:
+                for name in self.spec.rollups:
+                    if name in tables:
+                        sizes[name] = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({self.spec.fact_table})")}
+                rewriter = RollupRewriter(self.spec, columns)
+
+            with self._lock:
+                self._sizes = sizes
+                self._meta_tables = [name for name in ('data_meta', CHANGES_TABLE) if name in tables]
+                self._rewriter = rewriter
+                self._data_version = data_version
+                self._refreshed_at = time.monotonic()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to load rollup info for {self.db_path}: {e}")
+        finally:
+            conn.close()
+
+_managers: Dict[str, RollupManager] = {}
+_managers_lock = threading.Lock()
+
+def get_rollup_manager(db_path: str) -> RollupManager:
+    """获取（按数据库路径共享的）汇总表改写器
+
+    Args:
+        db_path: 数据库文件路径或 sqlite:/// 连接URI
+    """
+    path = sqlite_path_from_uri(db_path)
+    with _managers_lock:
+        if path not in _managers:
+            _managers[path] = RollupManager(path)
+        return _managers[path]
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL日志分析模块
+逐行流式读取 sql_logger 写入的JSONL日志（含轮转备份），按请求ID关联用户问题与SQL执行记录，
+按SQL形状（字面量替换为 ? 后的指纹）汇总执行次数、耗时分位数、失败率、返回行数和对应问题，
+并按累计耗时列出最值得建索引或预计算的查询形状
+
+用法:
+    python sql_log_analyzer.py --log logs/sql_queries.jsonl --top 10
+    python sql_log_analyzer.py --json > sql_report.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import logging
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from config import Config
+from rollups import tokenize_sql
+
+logger = logging.getLogger(__name__)
+
+# 报告中的耗时分位数
+PERCENTILES = (50, 95, 99)
+# QuerySQLDataBaseTool 把执行异常转换为以此开头的结果字符串
+ERROR_RESULT_PREFIX = 'Error'
+# 已由汇总表或列式引擎回答的执行不再建议优化
+ACCELERATED_ENGINES = ('rollup', 'columnar')
+_AGGREGATE_PATTERN = re.compile(r'\b(?:GROUP BY|SUM|COUNT|AVG|TOTAL|MIN|MAX)\b')
+_IN_LIST = re.compile(r'\bIN \(\?(?:, \?)*\)')
+
+def sql_shape(sql: str) -> str:
+    """将SQL规范化为形状：字符串和数字字面量替换为 ?，关键字和标识符转大写，IN 列表折叠"""
+    text = ' '.join(sql.split()).rstrip(';').strip()
+    tokens = tokenize_sql(text)
+    if tokens is None:
+        return text
+    parts = []
+    for token in tokens:
+        if token.kind in ('string', 'number'):
+            parts.append('?')
+        elif token.kind == 'word':
+            parts.append(token.upper)
+        else:
+            parts.append(token.text)
+    shape = ' '.join(parts).replace('( ', '(').replace(' )', ')').replace(' ,', ',').replace(' .', '.').replace('. ', '.')
+    return _IN_LIST.sub('IN (?, ...)', shape)
+
+def shape_fingerprint(shape: str) -> str:
+    """SQL形状的指纹"""
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:16]
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """已排序数值的分位数（线性插值）"""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+def latency_percentiles(sorted_values: List[float]) -> Dict[str, Optional[float]]:
+    """报告用的耗时分位数（毫秒，保留3位小数）"""
+    result = {}
+    for q in PERCENTILES:
+        value = percentile(sorted_values, q)
+        result[f'p{q}'] = round(value, 3) if value is not None else None
+    return result
+
+def log_file_paths(log_path: str = Config.SQL_LOG_PATH) -> List[str]:
+    """返回日志文件及其轮转备份，按从旧到新排列（.3、.2、.1、当前文件）"""
+    paths = []
+    index = 1
+    while os.path.exists(f"{log_path}.{index}"):
+        paths.append(f"{log_path}.{index}")
+        index += 1
+    paths.reverse()
+    if os.path.exists(log_path):
+        paths.append(log_path)
+    return paths
+
+def iter_log_entries(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """逐行读取JSONL日志，跳过无法解析的行（如旧版文本日志）"""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.startswith('{'):
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict):
+                    yield entry
+
+@dataclass
+class QueryShapeStats:
+    """一种SQL形状的执行统计"""
+    fingerprint: str
+    shape: str
+    example_sql: str
+    durations_ms: List[float] = field(default_factory=list)
+    executions: int = 0
+    failures: int = 0
+    total_rows: int = 0
+    max_rows: int = 0
+    engines: Counter = field(default_factory=Counter)
+    questions: Counter = field(default_factory=Counter)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(self.durations_ms)
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.executions if self.executions else 0.0
+
+    @property
+    def avg_rows(self) -> float:
+        successes = self.executions - self.failures
+        return self.total_rows / successes if successes > 0 else 0.0
+
+    @property
+    def accelerated(self) -> bool:
+        """是否全部由汇总表或列式引擎回答"""
+        return bool(self.engines) and all(engine in ACCELERATED_ENGINES for engine in self.engines)
+
+    def suggestion(self) -> str:
+        """优化建议：聚合查询建议预计算（汇总表），带过滤条件的明细查询建议索引"""
+        if self.accelerated:
+            return 'accelerated'
+        if _AGGREGATE_PATTERN.search(self.shape):
+            return 'precompute'
+        if ' WHERE ' in self.shape:
+            return 'index'
+        return 'none'
+
+    def to_dict(self, max_questions: int = 5) -> Dict[str, Any]:
+        result = {
+            'fingerprint': self.fingerprint,
+            'shape': self.shape,
+            'example_sql': self.example_sql,
+            'executions': self.executions,
+            'failures': self.failures,
+            'failure_rate': round(self.failure_rate, 4),
+            'total_ms': round(self.total_ms, 3),
+            'avg_rows': round(self.avg_rows, 2),
+            'max_rows': self.max_rows,
+            'engines': dict(self.engines),
+            'suggestion': self.suggestion(),
+            'questions': [question for question, _ in self.questions.most_common(max_questions)]
+        }
+        result.update(latency_percentiles(sorted(self.durations_ms)))
+        return result
+
+class SQLLogAnalyzer:
+    """按请求ID关联问题、生成的SQL和执行结果，按SQL形状汇总"""
+
+    def __init__(self, max_pending_requests: int = 10000):
+        """初始化分析器
+
+        Args:
+            max_pending_requests: 同时保留关联状态的请求数上限，超过后丢弃最早的请求
+        """
+        self.max_pending_requests = max_pending_requests
+        self.shapes: Dict[str, QueryShapeStats] = {}
+        # 请求ID -> {'question', 'sql', 'executed'}
+        self._requests: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.requests = 0
+        self.generation_failures = 0
+        self.entries = 0
+
+    def analyze(self, entries: Iterable[Dict[str, Any]]) -> 'SQLLogAnalyzer':
+        for entry in entries:
+            self.add_entry(entry)
+        return self
+
+    def analyze_files(self, paths: Iterable[str]) -> 'SQLLogAnalyzer':
+        return self.analyze(iter_log_entries(paths))
+
+    def add_entry(self, entry: Dict[str, Any]):
+        """处理一条日志记录"""
+        self.entries += 1
+        event = entry.get('event')
+        request = self._request(entry.get('request_id'), create=event == 'request')
+        if event == 'request':
+            self.requests += 1
+            if request is not None:
+                request['question'] = entry.get('question')
+        elif event == 'cleaned':
+            if request is not None:
+                request['sql'] = entry.get('sql')
+        elif event == 'execute':
+            self._add_execution(entry, request)
+        elif event == 'error' and request is not None and not request.get('executed'):
+            # 执行前出错：已生成SQL的计为该形状失败，否则计为SQL生成失败
+            if request.get('sql'):
+                stats = self._shape_stats(request['sql'])
+                stats.executions += 1
+                stats.failures += 1
+                self._add_question(stats, request)
+            else:
+                self.generation_failures += 1
+            request['executed'] = True
+
+    def _request(self, request_id: Optional[str], create: bool = False) -> Optional[Dict[str, Any]]:
+        if not request_id:
+            return None
+        request = self._requests.get(request_id)
+        if request is None and create:
+            request = self._requests[request_id] = {}
+            while len(self._requests) > self.max_pending_requests:
+                self._requests.popitem(last=False)
+        return request
+
+    def _shape_stats(self, sql: str) -> QueryShapeStats:
+        shape = sql_shape(sql)
+        fingerprint = shape_fingerprint(shape)
+        stats = self.shapes.get(fingerprint)
+        if stats is None:
+            stats = self.shapes[fingerprint] = QueryShapeStats(fingerprint, shape, ' '.join(sql.split()))
+        return stats
+
+    @staticmethod
+    def _add_question(stats: QueryShapeStats, request: Optional[Dict[str, Any]]):
+        if request and request.get('question'):
+            stats.questions[request['question']] += 1
+
+    def _add_execution(self, entry: Dict[str, Any], request: Optional[Dict[str, Any]]):
+        sql = entry.get('sql')
+        if not sql:
+            return
+        stats = self._shape_stats(sql)
+        stats.executions += 1
+        if entry.get('duration_ms') is not None:
+            stats.durations_ms.append(float(entry['duration_ms']))
+        if entry.get('engine'):
+            stats.engines[entry['engine']] += 1
+        row_count = entry.get('row_count')
+        if row_count is None and str(entry.get('result_preview') or '').startswith(ERROR_RESULT_PREFIX):
+            stats.failures += 1
+        elif row_count is not None:
+            stats.total_rows += row_count
+            stats.max_rows = max(stats.max_rows, row_count)
+        self._add_question(stats, request)
+        if request is not None:
+            request['executed'] = True
+
+    def ranked_shapes(self) -> List[QueryShapeStats]:
+        """按累计耗时从高到低排列的SQL形状"""
+        return sorted(self.shapes.values(), key=lambda stats: (stats.total_ms, stats.executions), reverse=True)
+
+    def candidates(self, top: int = 10, min_executions: int = 2) -> List[QueryShapeStats]:
+        """最值得建索引或预计算的SQL形状（累计耗时最高、执行多次且未被加速）"""
+        return [stats for stats in self.ranked_shapes()
+                if stats.executions >= min_executions and stats.suggestion() in ('index', 'precompute')][:top]
+
+    def report(self, top: int = 10, min_executions: int = 2) -> Dict[str, Any]:
+        """生成可序列化为JSON的报告"""
+        all_durations = sorted(d for stats in self.shapes.values() for d in stats.durations_ms)
+        executions = sum(stats.executions for stats in self.shapes.values())
+        failures = sum(stats.failures for stats in self.shapes.values())
+        return {
+            'summary': {
+                'entries': self.entries,
+                'requests': self.requests,
+                'executions': executions,
+                'failures': failures,
+                'failure_rate': round(failures / executions, 4) if executions else 0.0,
+                'generation_failures': self.generation_failures,
+                'shapes': len(self.shapes),
+                **latency_percentiles(all_durations)
+            },
+            'shapes': [stats.to_dict() for stats in self.ranked_shapes()[:top]],
+            'candidates': [{'fingerprint': stats.fingerprint, 'suggestion': stats.suggestion(),
+                            'total_ms': round(stats.total_ms, 3), 'executions': stats.executions,
+                            'example_sql': stats.example_sql}
+                           for stats in self.candidates(top, min_executions)]
+        }
+
+_SUGGESTION_LABELS = {'precompute': '预计算（汇总表）', 'index': '建索引（index_advisor.py）',
+                      'accelerated': '已加速', 'none': '-'}
+
+def _format_ms(value: Optional[float]) -> str:
+    return f"{value:.1f}" if value is not None else '-'
+
+def format_report(report: Dict[str, Any]) -> str:
+    """格式化为文本报告"""
+    summary = report['summary']
+    lines = [
+        f"日志记录 {summary['entries']} 条，请求 {summary['requests']} 个，SQL执行 {summary['executions']} 次，"
+        f"失败率 {summary['failure_rate']:.1%}，SQL生成失败 {summary['generation_failures']} 次，"
+        f"SQL形状 {summary['shapes']} 种",
+        "执行耗时(ms): " + ', '.join(f"p{q}={_format_ms(summary[f'p{q}'])}" for q in PERCENTILES),
+    ]
+    if not report['shapes']:
+        return '\n'.join(lines)
+
+    lines.append("")
+    lines.append("按累计耗时排序的SQL形状:")
+    for index, shape in enumerate(report['shapes'], 1):
+        latency = ' / '.join(_format_ms(shape[f'p{q}']) for q in PERCENTILES)
+        lines.append(f"{index:>2}. [{shape['fingerprint']}] 执行 {shape['executions']} 次，"
+                     f"累计 {shape['total_ms']:.1f}ms，p50/p95/p99 {latency}ms，"
+                     f"失败率 {shape['failure_rate']:.1%}，平均行数 {shape['avg_rows']:.1f}，"
+                     f"建议: {_SUGGESTION_LABELS[shape['suggestion']]}")
+        lines.append(f"    {shape['shape']}")
+        for question in shape['questions'][:3]:
+            lines.append(f"    问题: {question}")
+
+    if report['candidates']:
+        lines.append("")
+        lines.append("最值得优化的SQL形状:")
+        for candidate in report['candidates']:
+            lines.append(f"  - [{candidate['fingerprint']}] {_SUGGESTION_LABELS[candidate['suggestion']]}，"
+                         f"累计 {candidate['total_ms']:.1f}ms: {candidate['example_sql']}")
+    return '\n'.join(lines)
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="分析SQL执行日志：按SQL形状统计耗时分位数、失败率和返回行数")
+    parser.add_argument('--log', default=Config.SQL_LOG_PATH, help='SQL执行日志（自动包含轮转备份）')
+    parser.add_argument('--top', type=int, default=10, help='输出的SQL形状数')
+    parser.add_argument('--min-executions', type=int, default=2, help='优化建议要求的最少执行次数')
+    parser.add_argument('--json', action='store_true', help='输出JSON报告')
+    args = parser.parse_args(argv)
+
+    paths = log_file_paths(args.log)
+    if not paths:
+        print(f"没有找到日志文件: {args.log}")
+        return
+    report = SQLLogAnalyzer().analyze_files(paths).report(args.top, args.min_executions)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+
+if __name__ == "__main__":
+    main()
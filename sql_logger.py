@@ -1,48 +1,190 @@
+"""SQL执行日志模块
+
+日志记录经 QueueHandler 入队后立即返回，由 QueueListener 后台线程格式化为JSONL并写入轮转文件，
+请求线程不再等待文件IO。每条记录带请求ID；SQL执行记录带SQL哈希、耗时、结果行数和结果大小，
+结果只截取预览，不对完整结果重新转换字符串。
+"""
+
+import atexit
+import contextvars
+import hashlib
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Iterator, Optional
+
+from config import Config
+from tracing import current_trace_id
 
 # 创建专门的SQL查询日志器
 sql_logger = logging.getLogger('sql_query')
 sql_logger.setLevel(logging.DEBUG)
+# 设置为不向父日志器传播日志
+sql_logger.propagate = False
 
-# 确保日志目录存在
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
+# 当前请求的ID（LangChain 并行分支复制上下文，同一请求的记录共享ID）
+_request_id: contextvars.ContextVar = contextvars.ContextVar('sql_request_id', default=None)
 
-# 创建文件处理器，使用循环日志文件
-file_handler = RotatingFileHandler(
-    os.path.join(log_dir, 'sql_queries.log'),
-    maxBytes=5*1024*1024,  # 5MB
-    backupCount=3
-)
+_log_queue: queue.Queue = queue.Queue(-1)
+_queue_handler = QueueHandler(_log_queue)
+sql_logger.addHandler(_queue_handler)
+_listener: Optional[QueueListener] = None
 
-# 设置格式
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
+class JsonLineFormatter(logging.Formatter):
+    """将日志记录格式化为一行JSON（在监听线程中执行）"""
 
-# 添加处理器到日志器
-sql_logger.addHandler(file_handler)
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': getattr(record, 'event', 'message'),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry['message'] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
-# 设置为不向父日志器传播日志
-sql_logger.propagate = False
+def start_sql_logging(log_path: Optional[str] = None) -> QueueListener:
+    """启动（或切换到新文件重新启动）后台写日志线程
+
+    Args:
+        log_path: JSONL日志文件路径，默认使用 Config.SQL_LOG_PATH
+    """
+    global _listener
+    stop_sql_logging()
+    log_path = log_path or Config.SQL_LOG_PATH
+    log_dir = os.path.dirname(log_path)
+    # 确保日志目录存在
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    # 创建文件处理器，使用循环日志文件
+    file_handler = RotatingFileHandler(
+        log_path,
+        maxBytes=5*1024*1024,  # 5MB
+        backupCount=3,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonLineFormatter())
+    _listener = QueueListener(_log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_sql_logging():
+    """写完队列中剩余的记录并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def sql_hash(sql: Optional[str]) -> Optional[str]:
+    """忽略空白差异的SQL指纹"""
+    if not sql:
+        return None
+    return hashlib.sha1(' '.join(sql.split()).encode('utf-8')).hexdigest()[:16]
+
+def count_result_rows(result: Any) -> Optional[int]:
+    """从 SQLDatabase.run 格式的结果字符串统计行数（按元组分隔符计数，不解析结果）
+
+    Returns:
+        Optional[int]: 行数，结果不是行列表（如错误信息）时返回None
+    """
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if not isinstance(result, str):
+        return None
+    if result == '':
+        return 0
+    if result.startswith('[(') and result.endswith(')]'):
+        return result.count('), (') + 1
+    return None
+
+@contextmanager
+def sql_request(request_id: Optional[str] = None) -> Iterator[str]:
+    """标记一次请求，块内的SQL日志带同一个请求ID
+
+    Args:
+        request_id: 请求ID，默认使用当前trace的ID，没有trace时随机生成
+    """
+    request_id = request_id or current_trace_id() or uuid.uuid4().hex
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+def _log(level: int, event: str, **fields):
+    """入队一条结构化记录（请求线程只构造字典，不做格式化和IO）"""
+    if sql_logger.isEnabledFor(level):
+        sql_logger.log(level, event, extra={'event': event, 'request_id': _request_id.get(), 'fields': fields})
 
 # 便捷日志函数
 def log_sql_request(question):
-    sql_logger.info(f"SQL请求: {question}")
+    _log(logging.INFO, 'request', question=question)
 
 def log_sql_response(response):
-    sql_logger.info(f"SQL响应: {response}")
-    
+    _log(logging.INFO, 'response', response=response)
+
 def log_sql_cleaned(cleaned_sql):
-    sql_logger.info(f"清洗后的SQL: {cleaned_sql}")
-    
+    _log(logging.INFO, 'cleaned', sql=cleaned_sql, sql_hash=sql_hash(cleaned_sql))
+
 def log_sql_execution(sql):
-    sql_logger.info(f"执行SQL: {sql}")
-    
+    _log(logging.INFO, 'execution', sql=sql, sql_hash=sql_hash(sql))
+
 def log_sql_result(result):
-    sql_logger.info(f"SQL结果: {result[:500]}" + ("..." if len(str(result)) > 500 else ""))
-    
+    _log(logging.INFO, 'result', **_result_fields(result))
+
+def log_sql_executed(sql: str, result: Any, duration: float, engine: Optional[str] = None,
+                     executed_sql: Optional[str] = None):
+    """记录一次SQL执行（执行结束后调用）
+
+    Args:
+        sql: 生成的SQL
+        result: 执行结果（结果字符串只计算长度并截取预览）
+        duration: 执行耗时（秒）
+        engine: 实际执行的引擎（sqlite / rollup / columnar）
+        executed_sql: 改写后实际执行的SQL，与原SQL相同时不记录
+    """
+    fields: Dict[str, Any] = {
+        'sql': sql,
+        'sql_hash': sql_hash(sql),
+        'duration_ms': round(duration * 1000, 3),
+        'engine': engine,
+    }
+    if executed_sql and executed_sql != sql:
+        fields['executed_sql'] = executed_sql
+    fields.update(_result_fields(result))
+    _log(logging.INFO, 'execute', **fields)
+
 def log_sql_error(error):
-    sql_logger.error(f"SQL错误: {error}")
\ No newline at end of file
+    _log(logging.ERROR, 'error', error=str(error))
+
+def _result_fields(result: Any) -> Dict[str, Any]:
+    """结果行数、大小和截断预览"""
+    preview_size = Config.SQL_LOG_RESULT_PREVIEW
+    if isinstance(result, str):
+        size = len(result)
+        preview = result[:preview_size]
+    else:
+        size = None
+        preview = None
+    return {
+        'row_count': count_result_rows(result),
+        'result_size': size,
+        'result_preview': preview,
+        'result_truncated': size is not None and size > preview_size,
+    }
+
+start_sql_logging()
+# 进程退出时写完队列中剩余的日志
+atexit.register(stop_sql_logging)
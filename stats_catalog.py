@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库统计信息目录模块
+缓存各表的行数、列基数、最值、空值比例和样例行，供数据库概要和SQL生成提示使用
+"""
+
+import sqlite3
+import threading
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ColumnStats:
+    """列统计信息"""
+    name: str
+    type: str = ""
+    distinct_count: int = 0
+    null_fraction: float = 0.0
+    min_value: Any = None
+    max_value: Any = None
+
+@dataclass
+class TableStats:
+    """表统计信息"""
+    name: str
+    row_count: int = 0
+    columns: List[ColumnStats] = field(default_factory=list)
+    create_sql: str = ""
+    sample_rows: List[tuple] = field(default_factory=list)
+    refreshed_at: Optional[str] = None
+
+def sqlite_path_from_uri(uri: str) -> str:
+    """将 sqlite:/// 形式的连接URI转换为数据库文件路径"""
+    prefix = "sqlite:///"
+    return uri[len(prefix):] if uri.startswith(prefix) else uri
+
+def _quote(identifier: str) -> str:
+    """为SQL标识符加双引号"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+# 各表的变更计数（由触发器维护，统计信息目录据此判断哪些表需要重新统计）
+CHANGES_TABLE = 'table_changes'
+# data_meta 中批量导入进行中的标记（与汇总表触发器共用，见 rollups.set_rollups_deferred）；
+# 批量导入期间不逐行计数，导入结束时递增的 data_version 已表明数据有变化
+BULK_LOAD_KEY = 'rollup_deferred'
+
+def install_change_counters(conn: sqlite3.Connection, exclude: Iterable[str] = ()) -> int:
+    """为各普通表创建 AFTER INSERT/UPDATE/DELETE 触发器，在 table_changes 中累加变更次数
+
+    已有的触发器保持不变，可重复调用（新建的表在下次调用时补上触发器）。调用方负责提交事务。
+
+    Args:
+        conn: 数据库连接
+        exclude: 不计数的表（如汇总表）
+
+    Returns:
+        int: 新创建的触发器数
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            changes INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    objects = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE type IN ('table', 'trigger')").fetchall()
+    triggers = {name for kind, name, _ in objects if kind == 'trigger'}
+    tables = {name: sql or '' for kind, name, sql in objects if kind == 'table'}
+    virtual = [name for name, sql in tables.items() if sql.upper().startswith('CREATE VIRTUAL')]
+    gate = ""
+    if 'data_meta' in tables:
+        gate = f"WHEN COALESCE((SELECT value FROM data_meta WHERE key = '{BULK_LOAD_KEY}'), 0) = 0"
+
+    skipped = set(exclude) | {CHANGES_TABLE, 'data_meta'} | set(virtual)
+    created = 0
+    for name in sorted(tables):
+        # 虚拟表及其影子表由扩展模块维护，不能或不应创建触发器
+        if name in skipped or name.startswith('sqlite_') or any(name.startswith(v + '_') for v in virtual):
+            continue
+        literal = name.replace("'", "''")
+        conn.execute(f"INSERT OR IGNORE INTO {CHANGES_TABLE} (table_name, changes) VALUES (?, 0)", (name,))
+        for event in ('insert', 'update', 'delete'):
+            trigger = f"{name}_changes_{event}"
+            if trigger in triggers:
+                continue
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {_quote(trigger)} AFTER {event.upper()} ON {_quote(name)} "
+                         f"{gate} BEGIN UPDATE {CHANGES_TABLE} SET changes = changes + 1 "
+                         f"WHERE table_name = '{literal}'; END")
+            created += 1
+    return created
+
+class StatsCatalog:
+    """数据库统计信息目录
+
+    统计信息保存在内存中，读取时只执行一次 PRAGMA data_version 检查。其他连接修改过数据库后，
+    只重新统计内容有变化的表（按建表语句、table_changes 中触发器维护的变更次数和 data_meta 中的
+    data_version 判断；无法创建触发器的只读数据库退回到 max(rowid)），汇总表和 data_meta 不统计。首次统计在调用线程完成，之后的重新统计交给后台线程，
+    期间读取方继续使用旧的统计信息，不在请求路径上等待全表扫描。
+    """
+
+    def __init__(self, db_path: str, sample_rows: int = 3, max_string_length: int = 100):
+        """初始化统计信息目录
+
+        Args:
+            db_path: 数据库文件路径
+            sample_rows: 每张表缓存的样例行数
+            max_string_length: 提示文本中样例值的最大长度
+        """
+        self.db_path = db_path
+        self.sample_rows = sample_rows
+        self.max_string_length = max_string_length
+
+        self._lock = threading.RLock()
+        # 同一时间只有一个线程扫描表
+        self._collect_lock = threading.Lock()
+        # 长期持有的只读连接：data_version 只反映其他连接的提交
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._data_version: Optional[int] = None
+        self._tables: Dict[str, TableStats] = {}
+        self._fingerprints: Dict[str, tuple] = {}
+        self._loaded = threading.Event()
+        self._pending = False
+        self._worker: Optional[threading.Thread] = None
+        self.refresh_count = 0
+        self.hit_count = 0
+        self.scanned_tables = 0
+        metrics.register_cache('stats_catalog', self.cache_stats)
+
+    def refresh(self, force: bool = False, wait: bool = False) -> bool:
+        """数据库有变化时重新统计有变化的表
+
+        Args:
+            force: 是否忽略版本检查，重新统计所有表
+            wait: 是否在当前线程完成统计（否则已有统计信息时交给后台线程）
+
+        Returns:
+            bool: 是否执行或安排了重新统计
+        """
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if not force and data_version == self._data_version:
+                self.hit_count += 1
+                return False
+            self._data_version = data_version
+            if self._loaded.is_set() and not (wait or force):
+                self._pending = True
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._refresh_worker, name="stats-catalog-refresh",
+                                                    daemon=True)
+                    self._worker.start()
+                return True
+        try:
+            self._collect(force)
+        except Exception:
+            with self._lock:
+                self._data_version = None  # 下次读取时重试
+            raise
+        return True
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """等待后台重新统计完成
+
+        Returns:
+            bool: 是否已完成
+        """
+        with self._lock:
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+        with self._lock:
+            return self._worker is None
+
+    def _refresh_worker(self):
+        """后台线程：统计到没有新的变化为止"""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                self._pending = False
+            try:
+                self._collect()
+            except Exception as e:
+                with self._lock:
+                    self._data_version = None
+                logger.warning(f"Background stats refresh failed for {self.db_path}: {e}")
+
+    def _collect(self, force: bool = False):
+        """用独立连接重新统计内容有变化的表，完成后替换缓存"""
+        with self._collect_lock:
+            try:
+                self._collect_tables(force)
+            finally:
+                # 首次统计失败时也不让读取方一直等待
+                self._loaded.set()
+
+    def _collect_tables(self, force: bool):
+        """扫描内容有变化的业务表，未变化的表沿用上一次的统计"""
+        internal = self.internal_tables()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            changes = self._load_change_counters(conn, internal)
+            with self._lock:
+                previous, fingerprints = dict(self._tables), dict(self._fingerprints)
+            try:
+                # 批量导入（按 order_id 更新已有行时 max(rowid) 不变）会递增 data_version
+                version_row = conn.execute("SELECT value FROM data_meta WHERE key = 'data_version'").fetchone()
+            except sqlite3.Error:
+                version_row = None
+            data_version = version_row[0] if version_row else None
+
+            tables, new_fingerprints, scanned = {}, {}, 0
+            for name, create_sql in conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            ).fetchall():
+                if name in internal:
+                    continue
+                try:
+                    marker = changes[name] if name in changes else ('rowid', self._table_marker(conn, name))
+                    fingerprint = (create_sql, marker, data_version)
+                    if not force and name in previous and fingerprints.get(name) == fingerprint:
+                        tables[name] = previous[name]
+                    else:
+                        tables[name] = self._collect_table_stats(conn, name, create_sql)
+                        scanned += 1
+                    new_fingerprints[name] = fingerprint
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to collect stats for table {name}: {e}")
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._tables = tables
+            self._fingerprints = new_fingerprints
+            self.refresh_count += 1
+            self.scanned_tables += scanned
+        logger.info(f"Stats catalog refreshed: {scanned} of {len(tables)} table(s) rescanned in {self.db_path}")
+
+    def _load_change_counters(self, conn: sqlite3.Connection, internal: Set[str]) -> Dict[str, int]:
+        """读取各表的变更次数，缺少触发器的表先补上（只读数据库返回已有的计数）"""
+        try:
+            if install_change_counters(conn, exclude=internal):
+                conn.commit()
+                from rollups import get_rollup_manager
+                get_rollup_manager(self.db_path).invalidate()  # internal_tables 需要包含新建的 table_changes
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.debug(f"Change counters not installed in {self.db_path}: {e}")
+        try:
+            return dict(conn.execute(f"SELECT table_name, changes FROM {CHANGES_TABLE}").fetchall())
+        except sqlite3.Error:
+            return {}
+
+    @staticmethod
+    def _table_marker(conn: sqlite3.Connection, table_name: str):
+        """没有变更计数时的廉价标记：max(rowid)（B树最右路径，不扫描表）；WITHOUT ROWID 表用行数
+
+        只反映新增，删除和更新要等到 data_version 变化后才会重新统计。
+        """
+        table = _quote(table_name)
+        try:
+            return conn.execute(f"SELECT max(rowid) FROM {table}").fetchone()[0]
+        except sqlite3.OperationalError:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def cache_stats(self) -> Tuple[int, int]:
+        """缓存命中数（数据未变化直接返回）和重新统计次数"""
+        return self.hit_count, self.refresh_count
+
+    def get_tables(self) -> Dict[str, TableStats]:
+        """获取所有业务表的统计信息（后台重新统计期间返回上一次的结果）"""
+        self.refresh()
+        self._loaded.wait()
+        with self._lock:
+            return dict(self._tables)
+
+    def get_table_stats(self, table_name: str) -> Optional[TableStats]:
+        """获取单张表的统计信息"""
+        return self.get_tables().get(table_name)
+
+    def get_summary(self) -> Dict[str, Any]:
+        """获取数据库概要（表名和行数）
+
+        Returns:
+            Dict[str, Any]: tables、total_records 和 last_updated
+        """
+        tables = self.get_tables()
+        return {
+            'tables': [{'name': stats.name, 'row_count': stats.row_count} for stats in tables.values()],
+            'total_records': sum(stats.row_count for stats in tables.values()),
+            'last_updated': max((stats.refreshed_at for stats in tables.values()), default=None)
+        }
+
+    def internal_tables(self) -> Set[str]:
+        """汇总表和元数据表（与 SQLDatabase 的 ignore_tables 一致）"""
+        from rollups import get_rollup_manager  # rollups 依赖本模块，延迟导入
+        return set(get_rollup_manager(self.db_path).internal_tables()) | {'data_meta', CHANGES_TABLE}
+
+    def get_table_info_text(self, table_name: str) -> str:
+        """生成SQL生成提示中使用的表描述（建表语句、样例行和列统计）
+
+        格式与 langchain SQLDatabase.get_table_info 的输出保持一致，并追加列统计。
+        """
+        stats = self.get_table_stats(table_name)
+        if stats is None:
+            return ""
+
+        column_names = [column.name for column in stats.columns]
+        rows_text = "\n".join(
+            "\t".join(self._truncate(value) for value in row) for row in stats.sample_rows
+        )
+        text = (f"{stats.create_sql.rstrip()}\n\n/*\n{len(stats.sample_rows)} rows from {stats.name} table:\n"
+                f"{chr(9).join(column_names)}\n{rows_text}\n*/")
+
+        column_lines = []
+        for column in stats.columns:
+            line = f"{column.name}: distinct={column.distinct_count}, nulls={column.null_fraction:.0%}"
+            if column.min_value is not None:
+                line += f", min={self._truncate(column.min_value)}, max={self._truncate(column.max_value)}"
+            column_lines.append(line)
+        text += f"\n\n/*\nColumn statistics ({stats.row_count} rows):\n" + "\n".join(column_lines) + "\n*/"
+        return text
+
+    def get_custom_table_info(self) -> Dict[str, str]:
+        """生成 SQLDatabase 的 custom_table_info（表名 -> 表描述）"""
+        return {name: self.get_table_info_text(name) for name in self.get_tables()}
+
+    def apply_to(self, sql_database) -> bool:
+        """统计信息有变化时更新 SQLDatabase 使用的表描述
+
+        SQLDatabase 只在构造时接收 custom_table_info，这里直接替换其内部字典，
+        使生成SQL时不再为每次提示反射表结构和查询样例行。后台重新统计完成后的下一次调用才会更新。
+
+        Args:
+            sql_database: langchain SQLDatabase 实例
+
+        Returns:
+            bool: 是否更新了表描述
+        """
+        self.refresh()
+        self._loaded.wait()
+        with self._lock:
+            generation = self.refresh_count
+        if getattr(sql_database, '_stats_catalog_generation', None) == generation \
+                and getattr(sql_database, '_custom_table_info', None):
+            return False
+        usable = set(sql_database.get_usable_table_names())
+        sql_database._custom_table_info = {
+            name: text for name, text in self.get_custom_table_info().items() if name in usable
+        }
+        sql_database._stats_catalog_generation = generation
+        return True
+
+    def close(self):
+        """等待后台统计结束并关闭目录持有的连接"""
+        self.wait_idle()
+        with self._lock:
+            self._conn.close()
+
+    def _collect_table_stats(self, conn: sqlite3.Connection, table_name: str, create_sql: str) -> TableStats:
+        """一次聚合扫描收集表的行数和各列统计"""
+        table = _quote(table_name)
+        columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+
+        aggregates = ["COUNT(*)"]
+        for column in columns:
+            name = _quote(column[1])
+            aggregates.extend([f"COUNT(DISTINCT {name})", f"SUM({name} IS NULL)",
+                               f"MIN({name})", f"MAX({name})"])
+        values = conn.execute(f"SELECT {', '.join(aggregates)} FROM {table}").fetchone()
+
+        row_count = values[0]
+        column_stats = []
+        for i, column in enumerate(columns):
+            distinct_count, null_count, min_value, max_value = values[1 + i * 4: 5 + i * 4]
+            column_stats.append(ColumnStats(
+                name=column[1],
+                type=column[2],
+                distinct_count=distinct_count,
+                null_fraction=(null_count or 0) / row_count if row_count else 0.0,
+                min_value=min_value,
+                max_value=max_value
+            ))
+
+        sample_rows = conn.execute(f"SELECT * FROM {table} LIMIT {int(self.sample_rows)}").fetchall()
+        return TableStats(
+            name=table_name,
+            row_count=row_count,
+            columns=column_stats,
+            create_sql=create_sql or "",
+            sample_rows=sample_rows,
+            refreshed_at=datetime.now().isoformat()
+        )
+
+    def _truncate(self, value: Any) -> str:
+        """截断过长的值"""
+        text = str(value)
+        return text[:self.max_string_length]
+
+_catalogs: Dict[str, StatsCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+def get_stats_catalog(db_path: str) -> StatsCatalog:
+    """获取（按数据库路径共享的）统计信息目录实例
+
+    Args:
+        db_path: 数据库文件路径或 sqlite:/// 连接URI
+    """
+    path = sqlite_path_from_uri(db_path)
+    with _catalogs_lock:
+        if path not in _catalogs:
+            _catalogs[path] = StatsCatalog(path)
+        return _catalogs[path]
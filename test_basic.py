@@ -5,6 +5,7 @@
 
 import os
 import sys
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 import pandas as pd
@@ -22,6 +23,14 @@ from utils import (
 )
 from config import Config
 from exceptions import APIError, DatabaseError
+from ui_render_cache import UIRenderCache, ui_render_cache
+from metrics import MetricsRegistry, start_metrics_server, histogram_quantile
+import sql_logger
+from benchmark_pipeline import CORPUS, CorpusResponder, compare_results
+from load_generator import GradioHandlers, find_knee, analyze_saturation
+from llm_stub import Cassette, LLMStub, start_stub_server
+from sql_log_analyzer import SQLLogAnalyzer, log_file_paths, sql_shape, percentile
+from language_utils import KeywordMatcher, RequestContext, multilingual_keywords, multilingual_prompts
 
 class TestUtils(unittest.TestCase):
     """工具函数测试类"""
@@ -89,6 +98,459 @@ class TestUtils(unittest.TestCase):
         valid, msg = validate_dataframe_for_visualization(valid_df)
         self.assertTrue(valid)
 
+class TestKeywordMatcher(unittest.TestCase):
+    """关键词意图匹配测试类"""
+    
+    def test_all_intents_in_one_pass(self):
+        """测试一次匹配返回全部意图，重叠的关键词（show / how）都能命中"""
+        self.assertEqual(multilingual_keywords.match_intents("Hello, show me a chart"),
+                         frozenset({'visualization', 'general'}))
+        self.assertEqual(multilingual_keywords.match_intents("SHOW sales"), frozenset({'visualization', 'general'}))
+        self.assertEqual(multilingual_keywords.match_intents("你好"), frozenset({'general'}))
+        self.assertEqual(multilingual_keywords.match_intents("查询销售总额"), frozenset())
+        self.assertEqual(multilingual_keywords.match_intents(""), frozenset())
+    
+    def test_language_filter(self):
+        """测试指定语言时只匹配该语言的关键词"""
+        self.assertFalse(multilingual_keywords.is_visualization_query("show chart", language='zh'))
+        self.assertTrue(multilingual_keywords.is_visualization_query("show chart", language='en'))
+        self.assertTrue(multilingual_keywords.is_visualization_query("销售 chart", language='mixed'))
+    
+    def test_prefix_keywords(self):
+        """测试前缀相同的关键词（trend / trend analysis，chart / create chart）"""
+        matcher = KeywordMatcher({'a': {'en': ['trend analysis', 'trend', 'create chart']}, 'b': {'en': ['chart']}})
+        self.assertEqual(matcher.match("a trend"), frozenset({'a'}))
+        self.assertEqual(matcher.match("Create Chart"), frozenset({'a', 'b'}))
+        self.assertEqual(matcher.match("create"), frozenset())
+        self.assertEqual(matcher.match("a.b*c"), frozenset())
+
+class TestRequestContext(unittest.TestCase):
+    """请求上下文测试类"""
+    
+    def test_language_and_intents(self):
+        """测试请求上下文一次得到语言和意图"""
+        context = RequestContext.from_question("Show me a chart of sales")
+        self.assertEqual(context.language, 'en')
+        self.assertTrue(context.is_visualization)
+        self.assertFalse(RequestContext.from_question("查询销售总额").is_visualization)
+        self.assertEqual(RequestContext.from_question("Hello 你好").language, 'mixed')
+    
+    def test_precompiled_answer_templates(self):
+        """测试回答提示模板预编译后复用，混合语言使用中文模板"""
+        template = multilingual_prompts.get_sql_answer_template('en')
+        self.assertIs(template, multilingual_prompts.get_sql_answer_template('en'))
+        self.assertIs(multilingual_prompts.get_sql_answer_template('mixed'), multilingual_prompts.get_sql_answer_template('zh'))
+        prompt = template.format(question="Total sales?", clean_query="SELECT 1", result="[(1,)]")
+        self.assertIn("SELECT 1", prompt)
+        self.assertEqual(prompt, multilingual_prompts.get_sql_answer_prompt('en').format(
+            question="Total sales?", clean_query="SELECT 1", result="[(1,)]"))
+
+class TestUIRenderCache(unittest.TestCase):
+    """界面片段缓存测试类"""
+    
+    def test_fragments_per_language(self):
+        """测试每种语言的片段预先渲染，切换时返回同一对象"""
+        zh = ui_render_cache.get('zh')
+        en = ui_render_cache.get('en')
+        self.assertIs(zh, ui_render_cache.get('zh'))
+        self.assertIn(zh.texts['app_title'], zh.main_header)
+        self.assertIn(en.texts['smart_query_title'], en.feature_cards)
+        self.assertNotEqual(zh.feature_cards, en.feature_cards)
+        self.assertEqual(len(en.language_outputs()), 7)
+        self.assertTrue(all('\n' not in fragment for fragment in en.language_outputs()))
+        self.assertIs(ui_render_cache.get('fr'), zh)
+    
+    def test_cache_is_read_only(self):
+        """测试缓存内容只读"""
+        fragments = UIRenderCache().get('en')
+        with self.assertRaises(TypeError):
+            fragments.texts['app_title'] = 'changed'
+        with self.assertRaises(AttributeError):
+            fragments.main_header = ''
+        self.assertIsInstance(fragments.texts['examples_precise'], tuple)
+
+class TestMetrics(unittest.TestCase):
+    """运行指标测试类"""
+    
+    def setUp(self):
+        self.registry = MetricsRegistry(prefix='test_')
+    
+    def test_counter_and_histogram_exposition(self):
+        """测试计数器和直方图的Prometheus文本格式"""
+        calls = self.registry.counter('llm_calls_total', 'LLM调用次数', ('status',))
+        duration = self.registry.histogram('stage_duration_seconds', '阶段耗时', ('stage',), buckets=(0.1, 1.0))
+        calls.inc(status='ok')
+        calls.inc(2, status='ok')
+        duration.observe(0.05, stage='sql.execute')
+        duration.observe(0.5, stage='sql.execute')
+        duration.observe(3.0, stage='sql.execute')
+        with self.assertRaises(ValueError):
+            calls.inc(stage='ok')
+        
+        lines = self.registry.render().splitlines()
+        self.assertIn('# TYPE test_llm_calls_total counter', lines)
+        self.assertIn('test_llm_calls_total{status="ok"} 3', lines)
+        self.assertIn('# TYPE test_stage_duration_seconds histogram', lines)
+        self.assertIn('test_stage_duration_seconds_bucket{stage="sql.execute",le="0.1"} 1', lines)
+        self.assertIn('test_stage_duration_seconds_bucket{stage="sql.execute",le="1"} 2', lines)
+        self.assertIn('test_stage_duration_seconds_bucket{stage="sql.execute",le="+Inf"} 3', lines)
+        self.assertIn('test_stage_duration_seconds_sum{stage="sql.execute"} 3.55', lines)
+        self.assertIn('test_stage_duration_seconds_count{stage="sql.execute"} 3', lines)
+    
+    def test_histogram_snapshot_quantile(self):
+        """测试直方图快照和按桶插值的分位数"""
+        duration = self.registry.histogram('latency_seconds', '耗时', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.6, 3.0):
+            duration.observe(value)
+        counts, total, count = duration.snapshot()
+        self.assertEqual((counts, count), ([1, 2, 1], 4))
+        self.assertAlmostEqual(total, 4.15)
+        self.assertAlmostEqual(histogram_quantile(0.5, duration.buckets, counts), 0.55)
+        self.assertEqual(histogram_quantile(0.99, duration.buckets, counts), 1.0)
+        self.assertIsNone(histogram_quantile(0.5, duration.buckets, [0, 0, 0]))
+    
+    def test_cache_hit_ratio(self):
+        """测试同名缓存合并统计，实例释放后不再采集"""
+        class FakeCache:
+            def __init__(self, hits, misses):
+                self.stats = (hits, misses)
+            
+            def cache_stats(self):
+                return self.stats
+        
+        first, second = FakeCache(3, 1), FakeCache(1, 3)
+        self.registry.register_cache('rollup_rewrite', first.cache_stats)
+        self.registry.register_cache('rollup_rewrite', second.cache_stats)
+        self.assertEqual(self.registry.collect_caches(), {'rollup_rewrite': (4, 4)})
+        self.assertIn('test_cache_hit_ratio{cache="rollup_rewrite"} 0.5', self.registry.render())
+        
+        del second
+        self.assertEqual(self.registry.collect_caches(), {'rollup_rewrite': (3, 1)})
+    
+    def test_metrics_endpoint(self):
+        """测试 /metrics HTTP端点"""
+        import urllib.request
+        import urllib.error
+        self.registry.counter('requests_total', '请求数').inc()
+        server = start_metrics_server(0, '127.0.0.1', registry=self.registry)
+        try:
+            base_url = f'http://127.0.0.1:{server.server_address[1]}'
+            with urllib.request.urlopen(base_url + '/metrics') as response:
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+                self.assertIn('test_requests_total 1', response.read().decode('utf-8'))
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(base_url + '/other')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class TestSQLLogger(unittest.TestCase):
+    """SQL执行日志测试类"""
+    
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, 'sql_queries.jsonl')
+        sql_logger.start_sql_logging(self.log_path)
+    
+    def tearDown(self):
+        import shutil
+        # 恢复默认日志文件
+        sql_logger.start_sql_logging()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def read_entries(self):
+        import json
+        sql_logger.stop_sql_logging()
+        with open(self.log_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    
+    def test_execute_record(self):
+        """测试SQL执行记录的请求ID、哈希、耗时、行数和截断预览"""
+        result = str([('广东', 100), ('上海', 80), ('北京', 60)] * 20)
+        with sql_logger.sql_request('rid-1'):
+            sql_logger.log_sql_request('各省份销售额')
+            sql_logger.log_sql_executed('SELECT province,  SUM(sales) FROM t', result, 0.0125, engine='sqlite')
+        sql_logger.log_sql_error('boom')
+        
+        request, executed, error = self.read_entries()
+        self.assertEqual((request['event'], request['request_id'], request['question']),
+                         ('request', 'rid-1', '各省份销售额'))
+        self.assertEqual(executed['event'], 'execute')
+        self.assertEqual(executed['request_id'], 'rid-1')
+        self.assertEqual(executed['sql_hash'], sql_logger.sql_hash('SELECT province, SUM(sales)\nFROM t'))
+        self.assertEqual(executed['duration_ms'], 12.5)
+        self.assertEqual(executed['engine'], 'sqlite')
+        self.assertNotIn('executed_sql', executed)
+        self.assertEqual(executed['row_count'], 60)
+        self.assertEqual(executed['result_size'], len(result))
+        self.assertEqual(executed['result_preview'], result[:Config.SQL_LOG_RESULT_PREVIEW])
+        self.assertTrue(executed['result_truncated'])
+        self.assertEqual((error['level'], error['request_id'], error['error']), ('ERROR', None, 'boom'))
+    
+    def test_count_result_rows(self):
+        """测试按结果字符串统计行数"""
+        self.assertEqual(sql_logger.count_result_rows(''), 0)
+        self.assertEqual(sql_logger.count_result_rows("[('a, b', 1)]"), 1)
+        self.assertEqual(sql_logger.count_result_rows("[(1,), (2,)]"), 2)
+        self.assertIsNone(sql_logger.count_result_rows('Error: no such table'))
+
+class TestSQLLogAnalyzer(unittest.TestCase):
+    """SQL日志分析测试类"""
+    
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, 'sql_queries.jsonl')
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def write_log(self, path, entries):
+        import json
+        with open(path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    
+    @staticmethod
+    def request(request_id, question, sql, duration_ms=None, row_count=None, preview='', engine='sqlite'):
+        entries = [{'event': 'request', 'request_id': request_id, 'question': question},
+                   {'event': 'cleaned', 'request_id': request_id, 'sql': sql}]
+        if duration_ms is not None:
+            entries.append({'event': 'execute', 'request_id': request_id, 'sql': sql, 'duration_ms': duration_ms,
+                            'engine': engine, 'row_count': row_count, 'result_preview': preview})
+        return entries
+    
+    def test_sql_shape(self):
+        """测试字面量替换为占位符、IN 列表折叠"""
+        self.assertEqual(sql_shape("select city from sales_data where brand in ('a', 'b') and year = 2023;"),
+                         sql_shape("SELECT city  FROM sales_data WHERE brand IN ('c') AND year = 2024"))
+        self.assertEqual(sql_shape("SELECT a FROM t WHERE b = 'x'"), "SELECT A FROM T WHERE B = ?")
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 50), 2.5)
+        self.assertIsNone(percentile([], 95))
+    
+    def test_aggregate_by_shape(self):
+        """测试跨轮转文件关联请求与执行记录，按形状汇总分位数、失败率、行数和问题"""
+        city_sql = "SELECT order_date, SUM(sales_amount) FROM sales_data WHERE city = '{}' GROUP BY order_date"
+        # 轮转备份中的请求在当前文件中执行
+        self.write_log(self.log_path + '.1', self.request('r1', '上海每日销售额', city_sql.format('上海'))[:2])
+        entries = [{'event': 'execute', 'request_id': 'r1', 'sql': city_sql.format('上海'), 'duration_ms': 10.0,
+                    'engine': 'sqlite', 'row_count': 30, 'result_preview': '[(...)]'}]
+        entries += self.request('r2', '北京每日销售额', city_sql.format('北京'), 30.0, 10)
+        entries += self.request('r3', '深圳每日销售额', city_sql.format('深圳'), 20.0, None, 'Error: no such column')
+        entries += self.request('r4', '订单明细', "SELECT * FROM sales_data WHERE order_id = 'X1'", 1.0, 1)
+        entries += self.request('r5', '各品牌销售额', "SELECT brand, SUM(sales_amount) FROM sales_data GROUP BY brand",
+                                0.5, 5, engine='rollup')
+        entries += self.request('r6', '按月汇总', "SELECT month FROM t")
+        entries.append({'event': 'error', 'request_id': 'r6', 'error': 'boom'})
+        entries.append({'event': 'error', 'request_id': None, 'error': '无法清洗SQL响应'})
+        entries.append({'event': 'request', 'request_id': 'r7', 'question': '你好'})
+        entries.append({'event': 'error', 'request_id': 'r7', 'error': '无法清洗SQL响应'})
+        self.write_log(self.log_path, entries)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write('2025-06-20 22:17:18,242 - INFO - SQL请求: 旧版文本日志\n')
+        
+        paths = log_file_paths(self.log_path)
+        self.assertEqual(paths, [self.log_path + '.1', self.log_path])
+        report = SQLLogAnalyzer().analyze_files(paths).report(top=10)
+        
+        summary = report['summary']
+        self.assertEqual((summary['requests'], summary['executions'], summary['failures']), (7, 6, 2))
+        self.assertEqual(summary['generation_failures'], 1)
+        self.assertEqual(summary['shapes'], 4)
+        
+        city = report['shapes'][0]
+        self.assertEqual(city['executions'], 3)
+        self.assertEqual((city['p50'], city['p95']), (20.0, 29.0))
+        self.assertAlmostEqual(city['failure_rate'], 1 / 3, places=4)
+        self.assertEqual((city['avg_rows'], city['max_rows']), (20.0, 30))
+        self.assertEqual(sorted(city['questions']), ['上海每日销售额', '北京每日销售额', '深圳每日销售额'])
+        self.assertEqual(city['suggestion'], 'precompute')
+        
+        suggestions = {shape['example_sql']: shape['suggestion'] for shape in report['shapes']}
+        self.assertEqual(suggestions["SELECT * FROM sales_data WHERE order_id = 'X1'"], 'index')
+        self.assertEqual(suggestions["SELECT brand, SUM(sales_amount) FROM sales_data GROUP BY brand"], 'accelerated')
+        self.assertEqual([candidate['fingerprint'] for candidate in report['candidates']], [city['fingerprint']])
+
+class TestLLMStub(unittest.TestCase):
+    """LLM录制/回放桩服务测试类"""
+    
+    MESSAGES = [{'role': 'user', 'content': '各省份销售额'}]
+    
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+        self.cassette_path = os.path.join(self.temp_dir, 'cassette.jsonl')
+        self.servers = []
+    
+    def tearDown(self):
+        import shutil
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def start(self, stub):
+        server = start_stub_server(stub, port=0)
+        self.servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}/v1'
+    
+    def client(self, base_url):
+        from openai import OpenAI
+        return OpenAI(api_key='stub', base_url=base_url, max_retries=0)
+    
+    def test_replay(self):
+        """测试回放录制、注入延迟、流式输出和未录制请求的错误"""
+        import time
+        import openai
+        cassette = Cassette(self.cassette_path)
+        cassette.add(self.MESSAGES, 'SELECT province, SUM(sales) FROM t GROUP BY province',
+                     usage={'prompt_tokens': 12, 'completion_tokens': 9})
+        client = self.client(self.start(LLMStub(Cassette(self.cassette_path), latency=0.05)))
+        
+        start_time = time.perf_counter()
+        response = client.chat.completions.create(model='m', messages=self.MESSAGES)
+        self.assertGreaterEqual(time.perf_counter() - start_time, 0.05)
+        self.assertEqual(response.choices[0].message.content, 'SELECT province, SUM(sales) FROM t GROUP BY province')
+        self.assertEqual((response.usage.prompt_tokens, response.usage.completion_tokens), (12, 9))
+        
+        stream = client.chat.completions.create(model='m', messages=self.MESSAGES, stream=True,
+                                                stream_options={'include_usage': True})
+        chunks = list(stream)
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(''.join(chunk.choices[0].delta.content or '' for chunk in chunks if chunk.choices),
+                         'SELECT province, SUM(sales) FROM t GROUP BY province')
+        self.assertEqual(chunks[-1].usage.completion_tokens, 9)
+        
+        with self.assertRaises(openai.NotFoundError):
+            client.chat.completions.create(model='m', messages=[{'role': 'user', 'content': '未录制'}])
+    
+    def test_record_then_replay(self):
+        """测试 record 模式转发未录制的请求并写入录制文件"""
+        upstream_path = os.path.join(self.temp_dir, 'upstream.jsonl')
+        Cassette(upstream_path).add(self.MESSAGES, '广东省销售额最高')
+        upstream = self.start(LLMStub(Cassette(upstream_path)))
+        
+        recorder = self.client(self.start(LLMStub(Cassette(self.cassette_path), 'record', upstream=upstream)))
+        self.assertEqual(recorder.chat.completions.create(model='m', messages=self.MESSAGES)
+                         .choices[0].message.content, '广东省销售额最高')
+        
+        cassette = Cassette(self.cassette_path)
+        self.assertEqual(len(cassette), 1)
+        self.assertIn(self.MESSAGES, cassette)
+        replay = self.client(self.start(LLMStub(cassette)))
+        self.assertEqual(replay.chat.completions.create(model='m', messages=self.MESSAGES)
+                         .choices[0].message.content, '广东省销售额最高')
+
+class TestPipelineBenchmark(unittest.TestCase):
+    """端到端基准测试类（不运行完整基准）"""
+    
+    def test_corpus_responder(self):
+        """测试按提示类型和问题给出确定性回答"""
+        from language_utils import multilingual_prompts
+        responder = CorpusResponder(CORPUS)
+        data, chat = CORPUS[0], CORPUS[-1]
+        
+        def ask(prompt):
+            return responder([{'role': 'user', 'content': prompt}])
+        
+        classify = multilingual_prompts.get_classify_prompt('zh')
+        self.assertEqual(ask(classify.format(question=data.question)), 'data_query')
+        self.assertEqual(ask(classify.format(question=chat.question)), 'general_conversation')
+        self.assertIn('BeautyInsight', ask(multilingual_prompts.get_chat_prompt('en').format(question=chat.question)))
+        self.assertEqual(ask(f"Given an input question...\nQuestion: {data.question}\nSQLQuery: "),
+                         f"SQLQuery: {data.sql}")
+        answer = multilingual_prompts.get_sql_answer_template('zh').format(
+            question=data.question, clean_query=data.sql, result='[]')
+        self.assertIn(data.question, ask(answer))
+        self.assertIsNone(ask('未知问题'))
+    
+    def test_compare_results(self):
+        """测试按p95耗时和吞吐量判定回退"""
+        def result(p95, throughput, render_p95):
+            return {'scales': [{'rows': 1000, 'levels': [{
+                'concurrency': 4, 'throughput_rps': throughput, 'latency_ms': {'p95': p95},
+                'stages': {'viz.render': {'p95': render_p95}}}]}]}
+        
+        baseline = result(100.0, 10.0, 50.0)
+        self.assertEqual(compare_results(baseline, result(110.0, 9.0, 55.0)), [])
+        regressions = compare_results(baseline, result(150.0, 5.0, 50.0))
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('rows=1000 concurrency=4 p95'))
+        self.assertIn('throughput', regressions[1])
+
+class TestLoadGenerator(unittest.TestCase):
+    """并发会话负载生成器测试类（不运行完整负载）"""
+    
+    @staticmethod
+    def step(rate, chat_p95, queue_p95=0.0, render_p95=100.0, lock_errors=0):
+        return {'rate': rate, 'latency_ms': {'chat': {'p95': chat_p95}, 'refresh': {'p95': 10.0}},
+                'gradio_queue_wait_ms': {'p95': queue_p95},
+                'stages_ms': {'sql.execute': {'p95': 5.0}, 'viz.render': {'p95': render_p95}},
+                'history_write_ms': {'p95': 2.0}, 'history_write_failures': 0,
+                'gil_lateness_ms': {'p95': 1.0}, 'cpu_cores': 0.3, 'lock_errors': lock_errors}
+    
+    def test_knee_and_saturation(self):
+        """测试拐点和最先饱和环节的判定"""
+        steps = [self.step(1, 400.0), self.step(2, 500.0, render_p95=250.0),
+                 self.step(4, 1200.0, queue_p95=800.0, render_p95=300.0), self.step(8, 3000.0, lock_errors=1)]
+        self.assertEqual(find_knee(steps), {'knee_rate': 4, 'max_sustainable_rate': 2, 'chat_p95_inflation': 3.0})
+        saturation = analyze_saturation(steps)
+        self.assertEqual(saturation['order'], ['chart_render', 'gradio_queue', 'sqlite'])
+        self.assertEqual(saturation['first_saturated_rate']['gradio_queue'], 4)
+        self.assertEqual(steps[0]['saturated'], [])
+        self.assertEqual(find_knee(steps[:2])['knee_rate'], None)
+    
+    def test_gradio_handlers_concurrency(self):
+        """测试按事件的并发限制执行处理函数"""
+        import threading
+        import gradio as gr
+        running, peak, lock = [0], [0], threading.Lock()
+        
+        def bot_response(history):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return history, "", ""
+        
+        def user_input(message, history):
+            return "", history + [{"role": "user", "content": message}]
+        
+        def named(name):
+            def handler(*args):
+                return None
+            handler.__name__ = name
+            return handler
+        
+        with gr.Blocks() as blocks:
+            box = gr.Textbox()
+            btn = gr.Button()
+            box.submit(user_input, [box, box], [box, box], queue=False)
+            btn.click(bot_response, box, box)
+            for name in ('load_initial_history', 'refresh_history', 'search_history', 'handle_export'):
+                btn.click(named(name), None, None, concurrency_limit=None)
+        
+        handlers = GradioHandlers(blocks, default_concurrency_limit=1)
+        self.assertIsNone(handlers.limits['user_input'])
+        self.assertEqual(handlers.limits['bot_response'], 1)
+        self.assertIsNone(handlers.limits['refresh_history'])
+        (_, history), _, _ = handlers.call('user_input', '你好', [])
+        self.assertEqual(history, [{"role": "user", "content": "你好"}])
+        
+        threads = [threading.Thread(target=handlers.call, args=('bot_response', [])) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 1)
+        
+        with self.assertRaises(ValueError):
+            GradioHandlers(gr.Blocks())
+
 class TestConfig(unittest.TestCase):
     """配置测试类"""
     
@@ -152,6 +614,15 @@ def run_basic_tests():
     
     # 添加测试用例
     test_suite.addTest(unittest.makeSuite(TestUtils))
+    test_suite.addTest(unittest.makeSuite(TestKeywordMatcher))
+    test_suite.addTest(unittest.makeSuite(TestRequestContext))
+    test_suite.addTest(unittest.makeSuite(TestUIRenderCache))
+    test_suite.addTest(unittest.makeSuite(TestMetrics))
+    test_suite.addTest(unittest.makeSuite(TestSQLLogger))
+    test_suite.addTest(unittest.makeSuite(TestSQLLogAnalyzer))
+    test_suite.addTest(unittest.makeSuite(TestLLMStub))
+    test_suite.addTest(unittest.makeSuite(TestPipelineBenchmark))
+    test_suite.addTest(unittest.makeSuite(TestLoadGenerator))
     test_suite.addTest(unittest.makeSuite(TestConfig))
     test_suite.addTest(unittest.makeSuite(TestExceptions))
     test_suite.addTest(unittest.makeSuite(TestIntegration))
@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库管理器测试
+测试连接池、分块查询、统计信息目录、合成数据生成、批量导入、汇总表和索引建议等数据库管理功能
+"""
+
+import os
+import json
+import sys
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database_manager import DatabaseManager, ConnectionPool, bump_data_version
+from exceptions import DatabaseError, DataProcessingError
+from stats_catalog import StatsCatalog
+from data_generator import SyntheticDataGenerator, load_synthetic_data
+from data_ingest import SalesIngestor, prepare_chunk
+from rollups import SALES_ROLLUPS, RollupManager, rebuild_rollups, set_rollups_deferred
+from index_advisor import IndexAdvisor, load_log_workload, load_history_workload
+from columnar_engine import ColumnarEngine, sqlite_round
+from config import Config
+
+class DatabaseManagerTestCase(unittest.TestCase):
+    """使用临时数据库的测试基类"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'loreal_insight.db')
+        self.manager = DatabaseManager(self.db_path, pool_size=2)
+
+    def tearDown(self):
+        self.manager.pool.close_all()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+class TestConnectionPool(DatabaseManagerTestCase):
+    """连接池测试类"""
+
+    def test_connections_are_reused(self):
+        """测试连接被复用且数量不超过上限"""
+        for _ in range(20):
+            self.manager.execute_query("SELECT COUNT(*) FROM sales_data")
+        metrics = self.manager.pool.get_metrics()
+        self.assertLessEqual(metrics['created'], 2)
+        self.assertGreater(metrics['reused'], 0)
+
+    def test_pool_exhausted(self):
+        """测试连接耗尽时等待超时"""
+        pool = ConnectionPool(self.db_path, max_size=1, timeout=0.1)
+        conn = pool.acquire()
+        with self.assertRaises(DatabaseError):
+            pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+
+    def test_connection_shared_across_threads(self):
+        """测试连接可在不同线程间复用"""
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(10):
+                    self.manager.execute_query("SELECT 1")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_failed_update_does_not_hold_lock(self):
+        """测试失败的写操作不会让连接带着未提交事务归还"""
+        self.manager.execute_update("INSERT INTO users (user_id, username) VALUES (1, 'dup')")
+        self.assertEqual(self.manager.execute_update("UPDATE users SET email = 'a@b.c' WHERE user_id = 1"), 1)
+
+class TestIterQuery(DatabaseManagerTestCase):
+    """分块查询测试类"""
+
+    def test_dataframe_chunks(self):
+        """测试按块返回DataFrame"""
+        chunks = list(self.manager.iter_query("SELECT sale_id, sales_amount FROM sales_data ORDER BY sale_id",
+                                              chunksize=200))
+        self.assertEqual([len(chunk) for chunk in chunks], [200, 200, 100])
+        self.assertEqual(list(chunks[0].columns), ['sale_id', 'sales_amount'])
+        self.assertEqual(chunks[2]['sale_id'].iloc[-1], 500)
+
+    def test_column_batches(self):
+        """测试按块返回列式批次"""
+        batches = list(self.manager.iter_query("SELECT brand, quantity FROM sales_data WHERE quantity >= ?",
+                                               params=(1,), chunksize=300, as_frame=False))
+        self.assertEqual(set(batches[0].keys()), {'brand', 'quantity'})
+        self.assertEqual(sum(len(batch['brand']) for batch in batches), 500)
+
+    def test_connection_released_when_closed_early(self):
+        """测试提前结束遍历时归还连接"""
+        iterator = self.manager.iter_query("SELECT * FROM sales_data", chunksize=10)
+        next(iterator)
+        iterator.close()
+        self.assertEqual(self.manager.pool.get_metrics()['idle'],
+                         self.manager.pool.get_metrics()['created'])
+
+    def test_invalid_query(self):
+        """测试无效查询抛出DatabaseError"""
+        with self.assertRaises(DatabaseError):
+            list(self.manager.iter_query("SELECT * FROM missing_table"))
+
+class TestStatsCatalog(DatabaseManagerTestCase):
+    """统计信息目录测试类"""
+
+    def setUp(self):
+        super().setUp()
+        self.manager.insert_sample_data()
+        self.catalog = StatsCatalog(self.db_path)
+
+    def tearDown(self):
+        self.catalog.close()
+        super().tearDown()
+
+    def test_summary_matches_row_counts(self):
+        """测试概要中的行数与实际行数一致"""
+        summary = self.catalog.get_summary()
+        counts = {table['name']: table['row_count'] for table in summary['tables']}
+        expected = self.manager.execute_query("SELECT COUNT(*) AS n FROM sales_data")['n'].iloc[0]
+        self.assertEqual(counts['sales_data'], expected)
+        self.assertEqual(summary['total_records'], sum(counts.values()))
+        self.assertEqual(self.manager.get_database_summary()['total_records'], summary['total_records'])
+
+    def test_summary_excludes_internal_tables(self):
+        """测试汇总表和 data_meta 不计入概要"""
+        names = {table['name'] for table in self.catalog.get_summary()['tables']}
+        self.assertIn('sales_data', names)
+        self.assertNotIn('data_meta', names)
+        self.assertFalse(any(name.startswith('rollup_') for name in names))
+
+    def test_refresh_only_after_data_change(self):
+        """测试数据未变化时不重新统计，其他连接写入后在后台只重新统计有变化的表"""
+        self.catalog.get_summary()
+        self.catalog.get_summary()
+        self.assertEqual(self.catalog.refresh_count, 1)
+        scanned = self.catalog.scanned_tables
+
+        before = self.catalog.get_table_stats('users').row_count
+        self.manager.execute_update("INSERT INTO users (username) VALUES (?)", ('catalog_user',))
+        self.catalog.get_summary()
+        self.assertTrue(self.catalog.wait_idle(timeout=10))
+        self.assertEqual(self.catalog.get_table_stats('users').row_count, before + 1)
+        self.assertEqual(self.catalog.refresh_count, 2)
+        self.assertEqual(self.catalog.scanned_tables, scanned + 1)
+
+    def test_background_refresh_serves_stale_stats(self):
+        """测试后台重新统计期间读取方拿到旧的统计信息而不等待扫描"""
+        before = self.catalog.get_table_stats('users').row_count
+        release = threading.Event()
+        original = self.catalog._collect_table_stats
+
+        def slow_collect(*args):
+            release.wait(10)
+            return original(*args)
+
+        self.catalog._collect_table_stats = slow_collect
+        self.manager.execute_update("INSERT INTO users (username) VALUES (?)", ('catalog_user',))
+        self.assertEqual(self.catalog.get_table_stats('users').row_count, before)
+        release.set()
+        self.assertTrue(self.catalog.wait_idle(timeout=10))
+        self.assertEqual(self.catalog.get_table_stats('users').row_count, before + 1)
+
+    def test_delete_and_update_trigger_rescan(self):
+        """测试删除和更新（不改变 max(rowid)）后重新统计"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)")
+            conn.executemany("INSERT INTO t (v) VALUES (?)", [(i,) for i in range(100)])
+        self.catalog.refresh(wait=True)
+        self.assertEqual(self.catalog.get_table_stats('t').row_count, 100)
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM t WHERE id < 50")
+        self.catalog.refresh(wait=True)
+        counts = {table['name']: table['row_count'] for table in self.catalog.get_summary()['tables']}
+        self.assertEqual(counts['t'], 51)
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE t SET v = NULL")
+        self.catalog.refresh(wait=True)
+        columns = {column.name: column for column in self.catalog.get_table_stats('t').columns}
+        self.assertEqual(columns['v'].null_fraction, 1.0)
+        self.assertNotIn('table_changes', self.catalog.get_tables())
+
+    def test_ingest_version_triggers_rescan(self):
+        """测试批量导入（暂停逐行计数）结束时递增 data_version 后重新统计"""
+        self.catalog.get_summary()
+        counter_sql = "SELECT changes FROM table_changes WHERE table_name = 'sales_data'"
+        with sqlite3.connect(self.db_path) as conn:
+            before = conn.execute(counter_sql).fetchone()[0]
+            set_rollups_deferred(conn, True)
+            conn.execute("UPDATE sales_data SET quantity = 9999 WHERE sale_id = 1")
+            set_rollups_deferred(conn, False)
+            self.assertEqual(conn.execute(counter_sql).fetchone()[0], before)
+            bump_data_version(conn)
+        self.catalog.refresh(wait=True)
+        columns = {column.name: column for column in self.catalog.get_table_stats('sales_data').columns}
+        self.assertEqual(columns['quantity'].max_value, 9999)
+
+    def test_column_stats(self):
+        """测试列基数、空值比例和最值"""
+        stats = self.catalog.get_table_stats('sales_data')
+        columns = {column.name: column for column in stats.columns}
+        quantity = self.manager.execute_query(
+            "SELECT COUNT(DISTINCT quantity) AS d, MIN(quantity) AS lo, MAX(quantity) AS hi FROM sales_data")
+        self.assertEqual(columns['quantity'].distinct_count, quantity['d'].iloc[0])
+        self.assertEqual(columns['quantity'].min_value, quantity['lo'].iloc[0])
+        self.assertEqual(columns['quantity'].max_value, quantity['hi'].iloc[0])
+        self.assertEqual(columns['sale_id'].null_fraction, 0.0)
+
+    def test_table_info_text(self):
+        """测试生成的表描述包含建表语句、样例行和列统计"""
+        text = self.catalog.get_table_info_text('sales_data')
+        self.assertTrue(text.startswith('CREATE TABLE'))
+        self.assertIn('3 rows from sales_data table:', text)
+        self.assertIn('Column statistics', text)
+        self.assertIn('quantity: distinct=', text)
+        self.assertEqual(self.catalog.get_table_info_text('missing_table'), "")
+
+class TestSyntheticData(unittest.TestCase):
+    """合成数据生成测试类"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'synthetic.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_same_seed_same_data(self):
+        """测试相同种子生成相同数据"""
+        first = SyntheticDataGenerator(n_products=20, n_customers=100, seed=7).generate_sales(1000)
+        second = SyntheticDataGenerator(n_products=20, n_customers=100, seed=7).generate_sales(1000)
+        self.assertEqual(first['order_date'].tolist(), second['order_date'].tolist())
+        self.assertEqual(first['sales_amount'].tolist(), second['sales_amount'].tolist())
+
+    def test_sales_amount_consistent(self):
+        """测试销售额 = 单价 × 数量 - 折扣，且日期在范围内"""
+        generator = SyntheticDataGenerator(n_products=20, n_customers=100, seed=1,
+                                           start_date='2024-01-01', end_date='2024-12-31')
+        batch = generator.generate_sales(5000)
+        prices = dict(zip(generator.products['product_id'], generator.products['unit_price']))
+        gross = [prices[pid] * qty for pid, qty in zip(batch['product_id'], batch['quantity'])]
+        for expected, amount, discount in zip(gross, batch['sales_amount'], batch['discount_amount']):
+            self.assertAlmostEqual(amount + discount, expected, places=1)
+        self.assertGreaterEqual(min(batch['order_date']), '2024-01-01')
+        self.assertLessEqual(max(batch['order_date']), '2024-12-31')
+
+    def test_promotion_day_peak(self):
+        """测试大促日订单量明显高于平均水平"""
+        generator = SyntheticDataGenerator(n_products=20, n_customers=100, seed=3,
+                                           start_date='2024-01-01', end_date='2024-12-31')
+        dates = generator.generate_sales(100000)['order_date'].tolist()
+        self.assertGreater(dates.count('2024-11-11'), 3 * len(dates) / 366)
+
+    def test_bulk_load(self):
+        """测试批量导入行数、维表和延迟创建的索引"""
+        generator = SyntheticDataGenerator(n_products=30, n_customers=200, seed=5)
+        progress = []
+        metrics = load_synthetic_data(self.db_path, 2500, generator, batch_size=1000,
+                                      progress_callback=lambda done, total: progress.append(done))
+        self.assertEqual(metrics['rows'], 2500)
+        self.assertEqual(progress, [0, 1000, 2000, 2500])
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM sales_data").fetchone()[0], 2500)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM products").fetchone()[0], 30)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0], 200)
+            indexes = {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'sales_data'")}
+            self.assertIn('idx_sales_order_date', indexes)
+        finally:
+            conn.close()
+
+        load_synthetic_data(self.db_path, 100, generator, replace=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM sales_data").fetchone()[0], 100)
+        finally:
+            conn.close()
+
+    def test_bulk_load_keeps_custom_indexes(self):
+        """测试重新导入后保留用户自建的 sales_data 索引"""
+        generator = SyntheticDataGenerator(n_products=20, n_customers=100, seed=5)
+        load_synthetic_data(self.db_path, 200, generator)
+        custom_sql = "CREATE INDEX idx_sales_customer_amount ON sales_data(customer_id, sales_amount) WHERE quantity > 1"
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(custom_sql)
+            conn.commit()
+        finally:
+            conn.close()
+
+        load_synthetic_data(self.db_path, 300, generator, replace=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            indexes = dict(conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'sales_data'"))
+        finally:
+            conn.close()
+        self.assertEqual(indexes.get('idx_sales_customer_amount'), custom_sql)
+        self.assertIn('idx_sales_order_date', indexes)
+
+class TestSalesIngest(DatabaseManagerTestCase):
+    """销售数据批量导入测试类"""
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.temp_dir, name)
+        pd.DataFrame(rows).to_csv(path, index=False)
+        return path
+
+    def count_orders(self):
+        return self.manager.execute_query(
+            "SELECT COUNT(*) AS n FROM sales_data WHERE order_id IS NOT NULL")['n'].iloc[0]
+
+    def test_validation_rejects(self):
+        """测试无效行被拒绝并记录原因"""
+        clean, rejects = prepare_chunk(pd.DataFrame({
+            'order_id': ['A1', '', 'A3', 'A4', 'A5', 'A5'],
+            'order_date': ['2024-01-02', '2024-01-03', 'bad', '2024-01-05', '2024-01-06', '2024-01-07'],
+            'sales_amount': ['10.5', '1', '2', 'x', '5', '6'],
+            'quantity': ['1', '1', '1', '1', '1.5', '2'],
+            'brand': [' 兰蔻 ', 'a', 'b', 'c', 'd', 'e'],
+        }))
+        self.assertEqual(clean['order_id'].tolist(), ['A1', 'A5'])
+        self.assertEqual(clean['brand'].tolist(), ['兰蔻', 'e'])
+        self.assertEqual(clean['discount_amount'].tolist(), [0.0, 0.0])
+        self.assertEqual(rejects, {'order_id: missing': 1, 'order_date: invalid date': 1,
+                                   'sales_amount: invalid float': 1, 'quantity: not an integer': 1})
+
+    def test_mixed_date_formats(self):
+        """测试同一文件中混用的日期写法都能解析，指定格式时按格式校验"""
+        chunk = pd.DataFrame({'order_id': ['D1', 'D2', 'D3', 'D4'],
+                              'order_date': ['2019-03-05', '2020/1/2', '2020-01-02 13:45:00', 'not a date'],
+                              'sales_amount': ['1', '2', '3', '4']})
+        clean, rejects = prepare_chunk(chunk)
+        self.assertEqual(clean['order_date'].tolist(), ['2019-03-05', '2020-01-02', '2020-01-02'])
+        self.assertEqual(rejects, {'order_date: invalid date': 1})
+
+        clean, rejects = prepare_chunk(chunk, date_format='%Y/%m/%d')
+        self.assertEqual(clean['order_id'].tolist(), ['D2'])
+        self.assertEqual(rejects, {'order_date: invalid date': 3})
+
+    def test_missing_required_column(self):
+        """测试缺少必填列时报错"""
+        path = self.write_csv('bad.csv', {'order_id': ['A1'], 'sales_amount': [1]})
+        with self.assertRaises(DataProcessingError):
+            SalesIngestor(self.db_path).ingest([path])
+
+    def test_upsert_is_idempotent(self):
+        """测试按order_id幂等导入，重复导入更新已有行"""
+        rows = {'order_id': ['O1', 'O2', 'O3'], 'order_date': ['2024-05-01'] * 3,
+                'sales_amount': [100, 200, 300], 'quantity': [1, 2, 3], 'province': ['广东省'] * 3}
+        path = self.write_csv('day1.csv', rows)
+        ingestor = SalesIngestor(self.db_path, chunk_size=2)
+        result = ingestor.ingest([path])[0]
+        self.assertEqual((result.rows_read, result.rows_loaded, result.rows_rejected), (3, 3, 0))
+
+        ingestor.ingest([path])
+        self.assertEqual(self.count_orders(), 3)
+
+        updated = self.write_csv('day2.csv', {'order_id': ['O2', 'O4'], 'order_date': ['2024-05-02'] * 2,
+                                              'sales_amount': [250, 400]})
+        ingestor.ingest([updated])
+        self.assertEqual(self.count_orders(), 4)
+        amount = self.manager.execute_query("SELECT sales_amount FROM sales_data WHERE order_id = 'O2'")
+        self.assertEqual(amount['sales_amount'].iloc[0], 250)
+
+    def test_data_version_bumped(self):
+        """测试每个导入文件递增数据版本"""
+        before = self.manager.get_data_version()
+        paths = [self.write_csv(f'f{i}.csv', {'order_id': [f'V{i}'], 'order_date': ['2024-05-01'],
+                                               'sales_amount': [1]}) for i in range(2)]
+        results = SalesIngestor(self.db_path).ingest([self.temp_dir])
+        self.assertEqual([result.path for result in results], sorted(paths))
+        self.assertEqual(self.manager.get_data_version(), before + 2)
+        self.assertEqual(results[-1].data_version, before + 2)
+
+        # 全部行被拒绝的文件不递增版本
+        rejected = self.write_csv('rejected.csv', {'order_id': ['V9'], 'order_date': ['bad'], 'sales_amount': [1]})
+        result = SalesIngestor(self.db_path).ingest([rejected])[0]
+        self.assertEqual((result.rows_loaded, result.data_version), (0, None))
+        self.assertEqual(self.manager.get_data_version(), before + 2)
+
+    def test_failed_file_rolled_back(self):
+        """测试导入失败时整个文件回滚"""
+        path = os.path.join(self.temp_dir, 'broken.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("order_id,order_date,sales_amount\nB1,2024-05-01,1\nB2,2024-05-01,2\n")
+        # 第二块是格式错误的CSV（引号未闭合）
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('B3,"2024-05-01\n')
+        with self.assertRaises(Exception):
+            SalesIngestor(self.db_path, chunk_size=2).ingest([path])
+        self.assertEqual(self.count_orders(), 0)
+
+class TestRollups(DatabaseManagerTestCase):
+    """汇总表及查询改写测试类"""
+
+    ELIGIBLE_QUERIES = [
+        "SELECT province, SUM(sales_amount) AS total FROM sales_data GROUP BY province ORDER BY total DESC",
+        "SELECT brand, COUNT(*), AVG(sales_amount) FROM sales_data GROUP BY brand ORDER BY brand",
+        "SELECT strftime('%Y-%m', order_date) AS month, SUM(quantity) FROM sales_data GROUP BY month ORDER BY month",
+        "SELECT s.category, SUM(s.discount_amount) FROM sales_data s WHERE s.brand = '兰蔻' GROUP BY s.category",
+        "SELECT SUM(sales_amount) FROM sales_data WHERE order_date >= '2024-02-01' AND order_date < '2024-04-01'",
+        "SELECT COUNT(*) FROM sales_data WHERE province = '不存在'",
+    ]
+    INELIGIBLE_QUERIES = [
+        "SELECT * FROM sales_data LIMIT 5",
+        "SELECT city, SUM(sales_amount) FROM sales_data GROUP BY city",
+        "SELECT COUNT(DISTINCT customer_id) FROM sales_data",
+        "SELECT SUM(sales_amount) FROM sales_data WHERE order_date >= '2024-02-15'",
+        "SELECT MAX(sales_amount) FROM sales_data",
+        "SELECT province FROM sales_data WHERE brand = '兰蔻'",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.rollups = RollupManager(self.db_path)
+
+    def raw(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return [tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+                    for row in conn.execute(sql).fetchall()]
+        finally:
+            conn.close()
+
+    def snapshot(self):
+        return {name: sorted(self.raw(f"SELECT * FROM {name}"), key=repr) for name in SALES_ROLLUPS.rollups}
+
+    def assert_rollups_consistent(self):
+        """增量维护的汇总表与全量重建结果一致"""
+        incremental = self.snapshot()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rebuild_rollups(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_rewritten_results_match(self):
+        """测试改写后的查询结果与原查询一致"""
+        for sql in self.ELIGIBLE_QUERIES:
+            rewritten = self.rollups.rewrite(sql)
+            self.assertIn('rollup_sales_', rewritten, sql)
+            self.assertNotIn('sales_data', rewritten)
+            self.assertEqual(self.raw(rewritten), self.raw(sql), sql)
+
+    def test_smallest_rollup_chosen(self):
+        """测试选择包含所需维度的最小汇总表"""
+        self.assertIn('FROM rollup_sales_month',
+                      self.rollups.rewrite("SELECT SUM(sales_amount) FROM sales_data"))
+        self.assertIn('FROM rollup_sales_province_brand_month', self.rollups.rewrite(
+            "SELECT province, brand, SUM(sales_amount) FROM sales_data GROUP BY province, brand"))
+
+    def test_ineligible_queries_unchanged(self):
+        """测试不满足条件的查询保持不变"""
+        for sql in self.INELIGIBLE_QUERIES:
+            self.assertEqual(self.rollups.rewrite(sql), sql)
+
+    def test_rewrite_disabled(self):
+        """测试关闭改写配置"""
+        original = Config.ROLLUP_REWRITE
+        Config.ROLLUP_REWRITE = False
+        try:
+            sql = self.ELIGIBLE_QUERIES[0]
+            self.assertEqual(self.rollups.rewrite(sql), sql)
+        finally:
+            Config.ROLLUP_REWRITE = original
+
+    def test_triggers_maintain_rollups(self):
+        """测试插入、更新、删除事实表后汇总表保持一致"""
+        self.manager.execute_update(
+            "INSERT INTO sales_data (order_date, brand, province, category, sales_amount, quantity) "
+            "VALUES ('2024-03-01', '新品牌', NULL, '彩妆', NULL, 2)")
+        self.manager.execute_update("UPDATE sales_data SET province = '海南省', order_date = '2023-12-31' "
+                                    "WHERE sale_id % 7 = 0")
+        self.manager.execute_update("UPDATE sales_data SET sales_amount = NULL WHERE sale_id % 11 = 0")
+        self.manager.execute_update("DELETE FROM sales_data WHERE sale_id % 5 = 0")
+        self.assert_rollups_consistent()
+
+    def test_ingest_rebuilds_touched_months(self):
+        """测试批量导入（暂停触发器、按月份重建）后汇总表保持一致"""
+        first = os.path.join(self.temp_dir, 'first.csv')
+        pd.DataFrame({'order_id': ['R1', 'R2', 'R3'], 'order_date': ['2024-01-05', '2024-02-05', '2024-03-05'],
+                      'sales_amount': [10, 20, 30], 'brand': ['兰蔻', '兰蔻', '欧莱雅']}).to_csv(first, index=False)
+        # R2 移到另一个月份
+        second = os.path.join(self.temp_dir, 'second.csv')
+        pd.DataFrame({'order_id': ['R2', 'R4'], 'order_date': ['2023-06-01', '2024-03-10'],
+                      'sales_amount': [25, 40], 'brand': ['美宝莲', '兰蔻']}).to_csv(second, index=False)
+        SalesIngestor(self.db_path).ingest([first, second])
+        self.assert_rollups_consistent()
+        self.assertEqual(self.manager.execute_query(
+            "SELECT SUM(sales_amount) AS total FROM sales_data WHERE brand = '美宝莲' "
+            "AND strftime('%Y', order_date) = '2023'")['total'].iloc[0], 25)
+
+class TestIndexAdvisor(DatabaseManagerTestCase):
+    """索引建议测试类"""
+
+    CITY_QUERY = "SELECT order_date, SUM(sales_amount) AS total FROM sales_data WHERE city = '上海' GROUP BY order_date"
+
+    def test_log_workload(self):
+        """测试从GBK编码、含多行记录和轮转备份的日志中提取执行的SQL"""
+        log_path = os.path.join(self.temp_dir, 'sql_queries.log')
+        with open(log_path, 'w', encoding='gbk') as f:
+            f.write("2025-06-20 22:17:18,242 - INFO - SQL请求: 各省份销售额\n"
+                    "2025-06-20 22:17:22,300 - INFO - 执行SQL: SELECT province FROM sales_data\n"
+                    "2025-06-20 22:17:23,300 - INFO - 执行SQL: \n```sql\nSELECT city\nFROM sales_data;\n```\n"
+                    "2025-06-20 22:17:24,300 - INFO - 执行SQL: DELETE FROM sales_data\n")
+        with open(log_path + '.1', 'w', encoding='utf-8') as f:
+            f.write("2025-06-19 10:00:00,000 - INFO - 执行SQL: SELECT province FROM sales_data\n")
+
+        self.assertEqual(load_log_workload(log_path), [
+            "SELECT province FROM sales_data", "SELECT city FROM sales_data", "SELECT province FROM sales_data"])
+        self.assertEqual(load_log_workload(os.path.join(self.temp_dir, 'missing.log')), [])
+
+    def test_jsonl_log_workload(self):
+        """测试从JSONL日志中只提取SQL执行记录"""
+        log_path = os.path.join(self.temp_dir, 'sql_queries.jsonl')
+        entries = [
+            {'event': 'request', 'request_id': 'r1', 'question': '各城市销售额'},
+            {'event': 'cleaned', 'request_id': 'r1', 'sql': 'SELECT city FROM sales_data'},
+            {'event': 'execute', 'request_id': 'r1', 'sql': 'SELECT city\nFROM sales_data;', 'engine': 'sqlite'},
+            {'event': 'execute', 'request_id': 'r2', 'sql': 'DROP TABLE sales_data'},
+        ]
+        with open(log_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.write('{not json\n')
+        self.assertEqual(load_log_workload(log_path), ["SELECT city FROM sales_data"])
+
+    def test_history_workload(self):
+        """测试从查询历史库中提取执行成功的SQL"""
+        history_db = os.path.join(self.temp_dir, 'chat_history.db')
+        conn = sqlite3.connect(history_db)
+        conn.execute("CREATE TABLE query_history (id INTEGER PRIMARY KEY, sql_generated TEXT, success BOOLEAN)")
+        conn.executemany("INSERT INTO query_history (sql_generated, success) VALUES (?, ?)",
+                         [("SELECT 1", 1), ("SELECT 2", 0), (None, 1), ("SELECT 3;", 1)])
+        conn.commit()
+        conn.close()
+        self.assertEqual(load_history_workload(history_db), ["SELECT 3", "SELECT 1"])
+
+    def test_recommend_and_apply(self):
+        """测试为全表扫描的查询建议索引，创建后计划改为索引查找"""
+        advisor = IndexAdvisor(self.db_path, min_rows=0)
+        advice = advisor.analyze([self.CITY_QUERY] * 3 + ["SELECT COUNT(*) FROM sales_data WHERE order_id = 'X'"])
+
+        self.assertEqual(len(advice.recommendations), 1)
+        recommendation = advice.recommendations[0]
+        self.assertEqual(recommendation.table, 'sales_data')
+        self.assertEqual(recommendation.columns[0], 'city')
+        self.assertEqual(recommendation.query_count, 3)
+        self.assertEqual([query.sql for query in advice.improved_queries()], [self.CITY_QUERY])
+
+        before = advisor.benchmark([self.CITY_QUERY], repeat=1)
+        self.assertEqual(advisor.apply(advice.recommendations), [recommendation.name])
+        after = advisor.benchmark([self.CITY_QUERY], repeat=1)
+        self.assertIsNotNone(before[self.CITY_QUERY])
+        self.assertIsNotNone(after[self.CITY_QUERY])
+
+        conn = sqlite3.connect(self.db_path)
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {self.CITY_QUERY}")]
+        conn.close()
+        self.assertTrue(any(recommendation.name in detail for detail in plan))
+        # 已创建的索引不会被再次建议
+        self.assertEqual(IndexAdvisor(self.db_path, min_rows=0).analyze([self.CITY_QUERY]).recommendations, [])
+
+    def test_small_tables_and_invalid_sql_skipped(self):
+        """测试小表和无法解析的SQL不产生建议"""
+        advice = IndexAdvisor(self.db_path, min_rows=10000).analyze([self.CITY_QUERY, "SELECT * FROM missing_table"])
+        self.assertEqual(advice.recommendations, [])
+        self.assertEqual(len(advice.queries), 1)
+
+class TestColumnarEngine(DatabaseManagerTestCase):
+    """列式内存引擎测试类"""
+
+    SUPPORTED_QUERIES = [
+        "SELECT province, SUM(sales_amount) AS total FROM sales_data GROUP BY province ORDER BY total DESC",
+        "SELECT city, brand, COUNT(*), AVG(quantity), MIN(sales_amount), MAX(sales_amount) "
+        "FROM sales_data GROUP BY city, brand ORDER BY city, brand",
+        "SELECT strftime('%Y-%m', order_date) AS month, ROUND(SUM(sales_amount), 2) FROM sales_data "
+        "WHERE order_date >= '2024-03-01' AND order_date < '2024-07-01' GROUP BY month ORDER BY month",
+        "SELECT COUNT(DISTINCT customer_id), COUNT(*) FROM sales_data WHERE city IN ('上海', '北京')",
+        "SELECT s.category, SUM(s.discount_amount) FROM sales_data s WHERE s.product_name LIKE '%口红%' "
+        "AND s.quantity BETWEEN 2 AND 4 GROUP BY 1 ORDER BY 2 DESC LIMIT 3",
+        "SELECT brand, COUNT(*) AS n FROM sales_data WHERE brand != '兰蔻' GROUP BY brand HAVING n > 10 ORDER BY n",
+        "SELECT SUM(sales_amount) FROM sales_data WHERE province = '不存在'",
+        "SELECT sales_amount, COUNT(*) FROM sales_data GROUP BY sales_amount ORDER BY 2 DESC, 1 LIMIT 5",
+        "SELECT MIN(order_date), MAX(order_date) FROM sales_data WHERE order_id IS NULL",
+    ]
+    UNSUPPORTED_QUERIES = [
+        "SELECT * FROM sales_data LIMIT 5",
+        "SELECT province FROM sales_data WHERE brand = '兰蔻'",
+        "SELECT brand, SUM(sales_amount * quantity) FROM sales_data GROUP BY brand",
+        "SELECT COUNT(*) FROM sales_data WHERE city = '上海' OR city = '北京'",
+        "SELECT s.city, COUNT(*) FROM sales_data s JOIN sales_data t ON s.sale_id = t.sale_id GROUP BY s.city",
+        "SELECT COUNT(*) FROM missing_table",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.engine = ColumnarEngine(self.db_path, tables=['sales_data'])
+        self.assertTrue(self.engine.load())
+
+    def tearDown(self):
+        self.engine.close()
+        super().tearDown()
+
+    def raw(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def assert_same_as_sqlite(self, sql):
+        result = self.engine.query(sql)
+        expected = self.raw(sql)
+        self.assertIsNotNone(result, sql)
+        self.assertEqual(result, expected, sql)
+        # 整数和实数的类型也与SQLite一致
+        self.assertEqual([tuple(map(type, row)) for row in result], [tuple(map(type, row)) for row in expected], sql)
+
+    def test_results_match_sqlite(self):
+        """测试支持的查询结果（含值类型和排序）与SQLite完全一致"""
+        for sql in self.SUPPORTED_QUERIES:
+            self.assert_same_as_sqlite(sql)
+        for value, digits in [(2.675, 2), (0.5, 0), (-1.25, 1), (2.0499999999999998, 1)]:
+            self.assertEqual(sqlite_round(value, digits), self.raw(f"SELECT round({value!r}, {digits})")[0][0])
+
+    def test_unsupported_queries_fall_back(self):
+        """测试不支持的查询返回None，由SQLite执行"""
+        for sql in self.UNSUPPORTED_QUERIES:
+            self.assertIsNone(self.engine.query(sql), sql)
+
+    def test_execute_formats_like_sql_database(self):
+        """测试 execute 仅在启用时回答，结果格式与 SQLDatabase.run 一致"""
+        sql = self.SUPPORTED_QUERIES[0]
+        original = Config.COLUMNAR_ENGINE
+        try:
+            Config.COLUMNAR_ENGINE = False
+            self.assertIsNone(self.engine.execute(sql))
+            Config.COLUMNAR_ENGINE = True
+            self.assertEqual(self.engine.execute(sql), str(self.raw(sql)))
+            self.assertEqual(self.engine.execute("SELECT COUNT(*) FROM sales_data WHERE brand = '不存在' GROUP BY brand"), "")
+            self.assertIsNone(self.engine.execute(self.UNSUPPORTED_QUERIES[0]))
+        finally:
+            Config.COLUMNAR_ENGINE = original
+        self.assertEqual(self.engine.get_metrics()['hits'], 2)
+        self.assertEqual(self.engine.get_metrics()['fallbacks'], 1)
+
+    def test_reload_after_data_change(self):
+        """测试数据被修改后不再使用旧数据，后台重新载入后结果与SQLite一致"""
+        sql = "SELECT brand, COUNT(*), SUM(sales_amount) FROM sales_data GROUP BY brand"
+        self.manager.execute_update(
+            "INSERT INTO sales_data (order_date, brand, sales_amount, quantity) VALUES ('2024-12-31', '新品牌', 99.5, 1)")
+        self.assertFalse(self.engine.is_fresh())
+        self.assertIsNone(self.engine.query(sql))
+
+        original = Config.COLUMNAR_ENGINE
+        Config.COLUMNAR_ENGINE = True
+        try:
+            self.assertIsNone(self.engine.execute(sql))
+            self.engine._reload_thread.join(timeout=30)
+        finally:
+            Config.COLUMNAR_ENGINE = original
+        self.assertTrue(self.engine.is_fresh())
+        self.assert_same_as_sqlite(sql)
+
+if __name__ == "__main__":
+    unittest.main()
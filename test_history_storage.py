@@ -0,0 +1,685 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录存储测试
+测试异步写入、检索和统计等历史记录存储功能
+"""
+
+import os
+import sys
+import csv
+import gzip
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from memory_manager import MemoryManager, QueryRecord
+from history_service import HistoryService
+from history_writer import HistoryWriter
+from query_index import QuerySimilarityIndex
+from history_export import HistoryExporter
+from history_retention import HistoryRetention, RetentionPolicy, read_archive
+from tracing import Tracer, PROMPT_TOKENS, COMPLETION_TOKENS
+
+class HistoryStorageTestCase(unittest.TestCase):
+    """使用临时数据库的测试基类"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'chat_history.db')
+        self.memory_manager = MemoryManager(self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def count_rows(self, table: str = 'query_history') -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+class TestHistoryWriter(HistoryStorageTestCase):
+    """异步写入测试类"""
+
+    def test_async_record_and_flush(self):
+        """测试异步记录在flush后全部落盘"""
+        service = HistoryService(self.memory_manager, async_write=True)
+        for i in range(20):
+            record_id = service.record_query(f"查询销售额 {i}", "sql", execution_time=0.1)
+            self.assertIsNone(record_id)
+
+        self.assertTrue(service.flush(timeout=5))
+        self.assertEqual(self.count_rows(), 20)
+
+        metrics = service.get_write_metrics()
+        self.assertEqual(metrics['written'], 20)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertGreaterEqual(metrics['batches'], 1)
+        service.close()
+
+    def test_language_detected_in_background(self):
+        """测试语言检测在后台线程完成"""
+        service = HistoryService(self.memory_manager, async_write=True)
+        service.record_query("Show total sales by brand", "sql")
+        service.flush(timeout=5)
+        records = self.memory_manager.get_session_history()
+        self.assertEqual(records[0].language, 'en')
+        service.close()
+
+    def test_language_from_request_context(self):
+        """测试传入请求上下文中的语言时不再重复检测"""
+        service = HistoryService(self.memory_manager, async_write=True)
+        with patch('history_writer.language_detector.detect_language') as detect:
+            service.record_query("Show total sales by brand", "sql", language='mixed')
+            service.flush(timeout=5)
+        detect.assert_not_called()
+        self.assertEqual(self.memory_manager.get_session_history()[0].language, 'mixed')
+        service.close()
+
+    def test_close_flushes_remaining(self):
+        """测试关闭时写入剩余记录"""
+        writer = HistoryWriter(self.memory_manager, batch_size=5, flush_interval=0.5)
+        for i in range(12):
+            writer.submit(QueryRecord(user_query=f"q{i}", query_type="sql"))
+        writer.close()
+        self.assertEqual(self.count_rows(), 12)
+
+    def test_drop_newest_policy(self):
+        """测试队列满时丢弃新记录"""
+        writer = HistoryWriter(self.memory_manager, max_queue_size=1, policy='drop_newest')
+        # 暂停后台线程消费，制造队列满的情况
+        writer._stop_event.set()
+        writer._thread.join()
+        self.assertTrue(writer._queue.empty())
+        writer._stop_event.clear()
+
+        self.assertTrue(writer.submit(QueryRecord(user_query="a", query_type="sql")))
+        self.assertFalse(writer.submit(QueryRecord(user_query="b", query_type="sql")))
+        self.assertEqual(writer.get_metrics()['dropped'], 1)
+        writer.close()
+        self.assertEqual(self.count_rows(), 1)
+
+    def test_clear_flushes_pending_records(self):
+        """测试清除历史记录前先写入队列中的记录，清除后不再出现"""
+        service = HistoryService(self.memory_manager, async_write=True)
+        service.writer.close()
+        service.writer = HistoryWriter(self.memory_manager, flush_interval=1.0)
+        for i in range(3):
+            service.record_query(f"查询销售额 {i}", "sql")
+        service.clear_history()
+        service.flush(timeout=5)
+        self.assertEqual(self.count_rows(), 0)
+        service.close()
+
+    def test_invalid_policy(self):
+        """测试不支持的队列策略"""
+        with self.assertRaises(ValueError):
+            HistoryWriter(self.memory_manager, policy='unknown')
+
+    def test_batch_save_updates_stats(self):
+        """测试批量写入同时更新查询统计"""
+        records = [QueryRecord(user_query="各省份销售额", query_type="sql", execution_time=1.0)
+                   for _ in range(3)]
+        ids = self.memory_manager.save_queries(records)
+        self.assertEqual(len(ids), 3)
+        popular = self.memory_manager.get_popular_queries(limit=1)
+        self.assertEqual(popular[0]['usage_count'], 3)
+
+class TestHistorySearch(HistoryStorageTestCase):
+    """全文搜索测试类"""
+
+    def setUp(self):
+        super().setUp()
+        self.memory_manager.save_queries([
+            QueryRecord(user_query="各省份销售额排名统计", query_type="sql",
+                        result_summary="广东省销售额最高"),
+            QueryRecord(user_query="Show total sales by brand", query_type="sql",
+                        result_summary="L'Oreal leads"),
+            QueryRecord(user_query="绘制月度订单趋势图", query_type="visualization",
+                        result_summary="已生成图表"),
+        ])
+
+    def test_chinese_substring_search(self):
+        """测试中文子串匹配"""
+        records = self.memory_manager.search_history("销售")
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].user_query, "各省份销售额排名统计")
+
+        # 单字查询
+        self.assertEqual(len(self.memory_manager.search_history("图")), 1)
+
+    def test_english_prefix_search(self):
+        """测试英文前缀匹配（不区分大小写）"""
+        records = self.memory_manager.search_history("SAL")
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].query_type, "sql")
+
+    def test_snippets_and_ranking(self):
+        """测试匹配片段和BM25排序"""
+        hits = self.memory_manager.search_history_ranked("省份")
+        self.assertEqual(len(hits), 1)
+        self.assertIn("**省份**", hits[0]['query_snippet'])
+
+        service = HistoryService(self.memory_manager)
+        results = service.search_queries("销售额")
+        self.assertIn("**销售额**", results[0]['highlighted_query'])
+
+    def test_index_follows_deletes(self):
+        """测试删除记录后索引同步"""
+        self.memory_manager.clear_session_history()
+        self.assertEqual(self.memory_manager.search_history("销售"), [])
+        self.assertEqual(self.count_rows('query_history_fts'), 0)
+
+    def test_index_rebuilt_for_existing_rows(self):
+        """测试已有数据的数据库在初始化时重建索引"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM query_history_fts")
+        reopened = MemoryManager(self.db_path)
+        self.assertEqual(len(reopened.search_history("趋势")), 1)
+
+    def test_plain_connection_writes(self):
+        """测试普通sqlite3连接也能写入和修改历史记录，搜索前补建索引"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO query_history (session_id, timestamp, user_query, query_type, result_summary)
+                VALUES ('external', '2026-01-01T00:00:00', '各渠道退货率分析', 'sql', '线上渠道最高')
+            """)
+            conn.execute("UPDATE query_history SET user_query = '各品类库存周转' "
+                         "WHERE user_query = '绘制月度订单趋势图'")
+        self.assertEqual([r.user_query for r in self.memory_manager.search_history("退货")], ["各渠道退货率分析"])
+        self.assertEqual([r.user_query for r in self.memory_manager.search_history("周转")], ["各品类库存周转"])
+        self.assertEqual(self.memory_manager.search_history("趋势"), [])
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM query_history WHERE session_id = 'external'")
+        self.assertEqual(self.memory_manager.search_history("退货"), [])
+        self.assertEqual(self.count_rows('query_history_fts_pending'), 0)
+
+    def test_legacy_triggers_replaced(self):
+        """测试初始化时替换调用fts_segment的旧触发器"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DROP TRIGGER query_history_fts_insert")
+            conn.execute("""
+                CREATE TRIGGER query_history_fts_insert AFTER INSERT ON query_history BEGIN
+                    INSERT INTO query_history_fts (rowid, user_query, result_summary)
+                    VALUES (new.id, fts_segment(new.user_query), fts_segment(new.result_summary));
+                END
+            """)
+        reopened = MemoryManager(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO query_history (session_id, timestamp, user_query, query_type) "
+                         "VALUES ('external', '2026-01-01T00:00:00', '各城市客单价', 'sql')")
+        self.assertEqual(len(reopened.search_history("客单价")), 1)
+
+    def test_punctuation_only_keyword(self):
+        """测试无有效词的关键词回退到LIKE搜索"""
+        self.assertEqual(self.memory_manager.search_history("？？"), [])
+
+class TestHistoryPagination(HistoryStorageTestCase):
+    """游标分页测试类"""
+
+    def setUp(self):
+        super().setUp()
+        base = datetime(2026, 1, 1, 12, 0, 0)
+        # 部分记录时间戳相同，验证游标在并列时不会丢失或重复记录
+        self.memory_manager.save_queries([
+            QueryRecord(user_query=f"q{i}", query_type="sql",
+                        timestamp=base + timedelta(minutes=i // 2))
+            for i in range(25)
+        ])
+
+    def test_pages_cover_all_records_once(self):
+        """测试逐页读取覆盖所有记录且无重复"""
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            records, cursor = self.memory_manager.get_session_history_page(limit=10, cursor=cursor)
+            seen.extend(record.id for record in records)
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_service_page_format(self):
+        """测试服务层分页结果格式"""
+        service = HistoryService(self.memory_manager)
+        page = service.get_session_queries_page(limit=20)
+        self.assertEqual(len(page['items']), 20)
+        self.assertTrue(page['has_more'])
+        last_page = service.get_session_queries_page(limit=20, cursor=page['next_cursor'])
+        self.assertEqual(len(last_page['items']), 5)
+        self.assertFalse(last_page['has_more'])
+        self.assertIsNone(last_page['next_cursor'])
+
+    def test_invalid_cursor(self):
+        """测试无效游标"""
+        with self.assertRaises(ValueError):
+            self.memory_manager.get_recent_history_page(cursor="not-a-cursor")
+
+    def test_listing_uses_index(self):
+        """测试分页查询使用索引而不是全表扫描"""
+        with sqlite3.connect(self.db_path) as conn:
+            plan = conn.execute("""
+                EXPLAIN QUERY PLAN SELECT * FROM query_history
+                WHERE session_id = ? AND timestamp <= ? AND (timestamp < ? OR id < ?)
+                ORDER BY timestamp DESC, id DESC LIMIT 10
+            """, ("s", "t", "t", 1)).fetchall()
+        detail = " ".join(row[-1] for row in plan)
+        self.assertIn("idx_query_history_session", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+class TestHistoryCounters(HistoryStorageTestCase):
+    """物化统计计数器测试类"""
+
+    def setUp(self):
+        super().setUp()
+        self.memory_manager.save_queries([
+            QueryRecord(user_query="各省份销售额", query_type="sql", execution_time=0.3),
+            QueryRecord(user_query="Show sales trend", query_type="visualization",
+                        language="en", execution_time=7.0),
+            QueryRecord(user_query="无效查询", query_type="sql", success=False, execution_time=1.5),
+        ])
+
+    def test_session_and_daily_stats(self):
+        """测试会话和按天统计"""
+        stats = self.memory_manager.get_session_stats()
+        self.assertEqual(stats['total_queries'], 3)
+        self.assertEqual(stats['successful_queries'], 2)
+        self.assertEqual(stats['query_types'], 2)
+        self.assertAlmostEqual(stats['avg_execution_time'], 8.8 / 3)
+
+        today = self.memory_manager.get_daily_stats()
+        self.assertEqual(today['query_types'], {'sql': 2, 'visualization': 1})
+        self.assertEqual(today['languages'], {'zh': 2, 'en': 1})
+
+    def test_latency_histogram(self):
+        """测试耗时直方图分桶"""
+        histogram = self.memory_manager.get_global_stats()['latency_histogram']
+        counts = {bucket['le']: bucket['count'] for bucket in histogram}
+        self.assertEqual(counts[0.5], 1)
+        self.assertEqual(counts[2.0], 1)
+        self.assertEqual(counts[10.0], 1)
+        self.assertEqual(sum(counts.values()), 3)
+
+    def test_counters_follow_deletes(self):
+        """测试删除记录后计数器同步减少"""
+        self.memory_manager.clear_session_history()
+        stats = self.memory_manager.get_global_stats()
+        self.assertEqual(stats['total_queries'], 0)
+        self.assertEqual(stats['query_types'], {})
+        self.assertEqual(sum(b['count'] for b in stats['latency_histogram']), 0)
+
+    def test_counters_backfilled_on_init(self):
+        """测试已有数据的数据库在初始化时回填计数器"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM history_counters")
+            conn.execute("DELETE FROM history_latency_histogram")
+        reopened = MemoryManager(self.db_path)
+        stats = reopened.get_global_stats()
+        self.assertEqual(stats['total_queries'], 3)
+        self.assertEqual(stats['failed_queries'], 1)
+        self.assertEqual(sum(b['count'] for b in stats['latency_histogram']), 3)
+
+    def test_session_summary(self):
+        """测试会话摘要基于计数器生成"""
+        summary = HistoryService(self.memory_manager).get_session_summary()
+        self.assertEqual(summary['recent_activity']['total_queries_today'], 3)
+        self.assertEqual(summary['recent_activity']['query_types']['sql'], 2)
+        self.assertTrue(any("未成功" in r for r in summary['recommendations']))
+        self.assertTrue(any("较慢" in r for r in summary['recommendations']))
+
+class TestHistoryChangeFeed(HistoryStorageTestCase):
+    """变更同步测试类"""
+
+    def setUp(self):
+        super().setUp()
+        self.service = HistoryService(self.memory_manager)
+        self.service.record_query("q1", "sql")
+        self.state = self.service.get_sync_state()
+
+    def test_unchanged(self):
+        """测试没有写入时版本号不变"""
+        changes = self.service.poll_changes(self.state)
+        self.assertEqual(changes['status'], 'unchanged')
+        self.assertIs(changes['state'], self.state)
+
+    def test_appended_returns_only_new_rows(self):
+        """测试只返回新增记录（按时间倒序）"""
+        self.service.record_query("q2", "sql")
+        self.service.record_query("q3", "visualization")
+        changes = self.service.poll_changes(self.state)
+        self.assertEqual(changes['status'], 'appended')
+        self.assertEqual([item['query'] for item in changes['items']], ["q3", "q2"])
+        self.assertEqual(self.service.poll_changes(changes['state'])['status'], 'unchanged')
+
+    def test_delete_requires_reset(self):
+        """测试删除记录后要求全量重新加载"""
+        self.memory_manager.clear_session_history()
+        self.assertEqual(self.service.poll_changes(self.state)['status'], 'reset')
+        self.assertEqual(self.service.poll_changes(None)['status'], 'reset')
+
+    def test_too_many_changes_require_reset(self):
+        """测试新增记录过多时要求全量重新加载"""
+        for i in range(5):
+            self.service.record_query(f"new {i}", "sql")
+        self.assertEqual(self.service.poll_changes(self.state, limit=3)['status'], 'reset')
+
+class TestQuerySuggestions(HistoryStorageTestCase):
+    """相似查询索引测试类"""
+
+    def test_chinese_similarity(self):
+        """测试中文查询按字符n-gram匹配"""
+        index = QuerySimilarityIndex()
+        index.build([("各省份销售额排名", 3, "2026-01-01"),
+                     ("各渠道的订单数量", 1, "2026-01-02"),
+                     ("Show total sales by brand", 2, "2026-01-03")])
+        hits = index.search("各省份的销售额")
+        self.assertEqual(hits[0]['query'], "各省份销售额排名")
+        self.assertEqual(hits[0]['usage_count'], 3)
+        self.assertNotIn("Show total sales by brand", [hit['query'] for hit in hits])
+
+    def test_dedupe_and_exclude_self(self):
+        """测试重复查询只索引一次且结果不包含查询本身"""
+        index = QuerySimilarityIndex()
+        self.assertTrue(index.add("Sales by Brand"))
+        self.assertFalse(index.add("sales  by brand"))
+        index.add("sales by brand and month")
+        self.assertEqual(len(index), 2)
+        hits = index.search("SALES BY BRAND")
+        self.assertEqual([hit['query'] for hit in hits], ["sales by brand and month"])
+
+    def test_index_grows(self):
+        """测试超过初始容量后自动扩容"""
+        index = QuerySimilarityIndex(initial_capacity=4)
+        for i in range(50):
+            index.add(f"查询第{i}个省份的销售额")
+        self.assertEqual(len(index), 50)
+        self.assertEqual(len(index.search("查询第7个省份的销售额", k=3)), 3)
+
+    def test_index_capacity_cap(self):
+        """测试超过最大记录数后淘汰最久未使用的查询"""
+        index = QuerySimilarityIndex(initial_capacity=4, max_size=20)
+        index.build([(f"查询第{i}个省份的销售额", 1, f"2026-01-{i + 1:02d}") for i in range(25)])
+        self.assertLessEqual(len(index), 20)
+        for i in range(25, 100):
+            index.add(f"查询第{i}个城市的订单数", last_used=f"2026-02-01T{i:03d}")
+            self.assertLessEqual(len(index), 20)
+        self.assertLessEqual(index._tf.shape[0], 21)
+
+        queries = [hit['query'] for hit in index.search("查询第99个城市的订单数", k=20, min_score=0.0)]
+        self.assertIn("查询第98个城市的订单数", queries)
+        self.assertNotIn("查询第0个省份的销售额", queries)
+        # 淘汰后仍能去重，检索结果只来自保留的记录
+        self.assertFalse(index.add("查询第99个城市的订单数"))
+        hits = index.search("查询第8个城市的订单数", k=20, min_score=0.0)
+        self.assertEqual(len(hits), len(index))
+        self.assertNotIn("查询第8个城市的订单数", [hit['query'] for hit in hits])
+
+    def test_service_suggestions(self):
+        """测试服务层只索引成功的查询并增量更新"""
+        service = HistoryService(self.memory_manager)
+        service.record_query("各省份销售额排名", "sql")
+        service.record_query("各省份销售额趋势", "sql", success=False)
+
+        # 重新创建服务时从数据库构建索引
+        reopened = HistoryService(self.memory_manager)
+        self.assertEqual(len(reopened.query_index), 1)
+
+        reopened.record_query("各渠道销售额排名", "sql")
+        suggestions = reopened.get_query_suggestions("各省份销售额")
+        similar = [s['query'] for s in suggestions if s['type'] == 'similar']
+        self.assertEqual(similar[0], "各省份销售额排名")
+        self.assertIn("各渠道销售额排名", similar)
+        self.assertNotIn("各省份销售额趋势", similar)
+
+    def test_suggestions_forget_removed_queries(self):
+        """测试清除或归档历史记录后不再推荐被删除的查询"""
+        service = HistoryService(self.memory_manager)
+        service.record_query("各省份销售额排名", "sql")
+        service.clear_history()
+        self.assertEqual(len(service.query_index), 0)
+        suggestions = service.get_query_suggestions("各省份销售额")
+        self.assertEqual([s for s in suggestions if s['type'] == 'similar'], [])
+
+        self.memory_manager.save_queries([QueryRecord(user_query="各省份销售额排名", query_type="sql",
+                                                      timestamp=datetime(2020, 1, 1))])
+        service.rebuild_query_index()
+        self.assertEqual(len(service.query_index), 1)
+        retention = HistoryRetention(self.memory_manager,
+                                     RetentionPolicy(max_age_days=30, max_rows=None, archive_dir=None,
+                                                     stats_max_age_days=None),
+                                     on_rows_removed=service.rebuild_query_index)
+        retention.run_once()
+        self.assertEqual(len(service.query_index), 0)
+
+class TestHistoryRetention(HistoryStorageTestCase):
+    """历史记录保留与归档测试类"""
+
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = os.path.join(self.temp_dir, 'archive')
+        self.now = datetime(2026, 3, 15, 12, 0, 0)
+        # 1月和2月各10条旧记录，3月5条新记录
+        records = []
+        for month, count in ((1, 10), (2, 10), (3, 5)):
+            for i in range(count):
+                records.append(QueryRecord(user_query=f"{month}月查询{i}", query_type="sql",
+                                           execution_time=1.0,
+                                           timestamp=datetime(2026, month, 1 + i, 9, 0, 0)))
+        self.memory_manager.save_queries(records)
+
+    def make_retention(self, **kwargs):
+        policy = RetentionPolicy(max_age_days=30, max_rows=None, archive_dir=self.archive_dir,
+                                 stats_max_age_days=None, batch_size=7)
+        for key, value in kwargs.items():
+            setattr(policy, key, value)
+        return HistoryRetention(self.memory_manager, policy)
+
+    def test_archive_by_age(self):
+        """测试过期记录按月归档并从数据库删除"""
+        result = self.make_retention().run_once(now=self.now)
+        # 早于2月13日的记录：1月10条 + 2月1~12日的10条
+        self.assertEqual(result['archived_rows'], 20)
+        self.assertEqual(self.count_rows(), 5)
+        self.assertEqual(self.count_rows('query_history_fts'), 5)
+
+        january = read_archive(os.path.join(self.archive_dir, 'history_2026-01.jsonl.gz'))
+        february = read_archive(os.path.join(self.archive_dir, 'history_2026-02.jsonl.gz'))
+        self.assertEqual(len(january), 10)
+        self.assertEqual(len(february), 10)
+        self.assertEqual(january[0]['user_query'], "1月查询0")
+
+    def test_stats_kept_after_archive(self):
+        """测试归档后统计计数器保持不变"""
+        self.make_retention().run_once(now=self.now)
+        stats = self.memory_manager.get_global_stats()
+        self.assertEqual(stats['total_queries'], 25)
+        self.assertEqual(self.memory_manager.get_daily_stats('2026-01-01')['total_queries'], 1)
+        self.assertEqual(self.memory_manager.get_history_row_count(), 5)
+
+        # 重新打开数据库时不会因记录数变化而重建计数器
+        reopened = MemoryManager(self.db_path)
+        self.assertEqual(reopened.get_global_stats()['total_queries'], 25)
+
+    def test_archive_by_row_limit(self):
+        """测试超过最大记录数时归档最早的记录"""
+        retention = self.make_retention(max_age_days=None, max_rows=8)
+        result = retention.run_once(now=self.now)
+        self.assertEqual(result['archived_rows'], 17)
+        self.assertEqual(self.count_rows(), 8)
+        remaining = self.memory_manager.get_oldest_history(limit=1)
+        self.assertEqual(remaining[0].user_query, "2月查询7")
+
+    def test_delete_without_archive_and_vacuum(self):
+        """测试不归档直接删除，并启用增量VACUUM"""
+        retention = self.make_retention(archive_dir=None)
+        result = retention.run_once(now=self.now)
+        self.assertEqual(result['deleted_rows'], 20)
+        self.assertFalse(os.path.exists(self.archive_dir))
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+        metrics = retention.get_metrics()
+        self.assertEqual(metrics['runs'], 1)
+        self.assertEqual(metrics['live_rows'], 5)
+
+    def test_prune_query_stats(self):
+        """测试清理长期未使用的查询统计"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE query_stats SET last_used = '2025-01-01 00:00:00' WHERE query_pattern LIKE '1月%'")
+        result = self.make_retention(max_age_days=None, stats_max_age_days=180).run_once(now=self.now)
+        self.assertEqual(result['pruned_stats'], 10)
+        self.assertEqual(self.count_rows('query_stats'), 15)
+
+    def test_clear_history_by_days(self):
+        """测试按天数清除历史记录"""
+        service = HistoryService(self.memory_manager)
+        service.clear_history(days=3650)
+        self.assertEqual(self.count_rows(), 25)
+        service.clear_history(days=0)
+        self.assertEqual(self.count_rows(), 0)
+        self.assertEqual(self.memory_manager.get_global_stats()['total_queries'], 0)
+
+class TestHistoryExport(HistoryStorageTestCase):
+    """历史记录流式导出测试类"""
+
+    def setUp(self):
+        super().setUp()
+        self.memory_manager.save_queries([
+            QueryRecord(user_query=f"查询{i}", query_type="sql", result_summary=f"结果{i}",
+                        timestamp=datetime.now() - timedelta(minutes=i))
+            for i in range(25)
+        ])
+        self.service = HistoryService(self.memory_manager)
+
+    def test_csv_export_in_chunks(self):
+        """测试CSV分块导出和进度回调"""
+        progress = []
+        exporter = HistoryExporter(self.memory_manager, chunk_size=10)
+        path = os.path.join(self.temp_dir, 'out.csv')
+        count = exporter.export(path, 'csv', progress_callback=lambda done, total: progress.append((done, total)))
+        self.assertEqual(count, 25)
+        self.assertEqual(progress, [(0, 25), (10, 25), (20, 25), (25, 25)])
+
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0][0], '查询内容')
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(rows[1][0], '查询0')
+
+    def test_jsonl_gzip_export(self):
+        """测试gzip压缩的JSONL导出"""
+        path = self.service.export_history('jsonl', compress=True, output_dir=self.temp_dir)
+        self.assertTrue(path.endswith('.jsonl.gz'))
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[-1]['query_text'], '查询24')
+
+    def test_json_array_export(self):
+        """测试JSON数组导出格式有效"""
+        path = self.service.export_history('json', output_dir=self.temp_dir)
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+        self.assertEqual(len(rows), 25)
+        self.assertTrue(rows[0]['success'])
+
+    def test_empty_and_invalid_export(self):
+        """测试无记录和不支持的格式"""
+        self.memory_manager.clear_session_history()
+        self.assertIsNone(self.service.export_history('csv', output_dir=self.temp_dir))
+        with self.assertRaises(ValueError):
+            self.service.export_history('xml', output_dir=self.temp_dir)
+
+class TestQueryTracing(HistoryStorageTestCase):
+    """查询流水线追踪测试类"""
+
+    def setUp(self):
+        super().setUp()
+        self.service = HistoryService(self.memory_manager)
+        self.tracer = Tracer(enabled=True)
+
+    def record_traced_query(self, query: str = "各省销售额") -> int:
+        with self.tracer.start_trace('bot_response') as trace:
+            with self.tracer.span('text2sql'):
+                with self.tracer.span('sql.generate'):
+                    with self.tracer.span('llm.chat', kind='client') as llm_span:
+                        llm_span.add_tokens(120, 30)
+                with self.tracer.span('sql.execute', **{'db.engine': 'sqlite'}):
+                    pass
+            return self.service.record_query(query, 'sql', trace=trace)
+
+    def test_spans_nested_and_tokens_aggregated(self):
+        """测试span层级随记录保存，token数累加到上层span"""
+        spans = self.service.get_trace(self.record_traced_query())
+        by_name = {span['name']: span for span in spans}
+        self.assertEqual([span['name'] for span in spans][0], 'bot_response')
+        self.assertEqual(len({span['trace_id'] for span in spans}), 1)
+        self.assertEqual(by_name['sql.generate']['parent_span_id'], by_name['text2sql']['span_id'])
+        self.assertIsNone(by_name['bot_response']['parent_span_id'])
+        for name in ('bot_response', 'text2sql', 'sql.generate', 'llm.chat'):
+            self.assertEqual(by_name[name]['attributes'][PROMPT_TOKENS], 120)
+            self.assertEqual(by_name[name]['attributes'][COMPLETION_TOKENS], 30)
+        self.assertNotIn(PROMPT_TOKENS, by_name['sql.execute']['attributes'])
+        self.assertEqual(by_name['sql.execute']['attributes']['db.engine'], 'sqlite')
+        self.assertTrue(all(span['end_time_ns'] >= span['start_time_ns'] for span in spans))
+
+    def test_error_and_disabled_tracing(self):
+        """测试异常标记span失败，追踪关闭或不在trace内时不记录"""
+        with self.assertRaises(ValueError):
+            with self.tracer.start_trace('bot_response') as trace:
+                with self.tracer.span('classify'):
+                    raise ValueError("boom")
+        statuses = {span['name']: span['status'] for span in trace.finish()}
+        self.assertEqual(statuses, {'bot_response': 'ERROR', 'classify': 'ERROR'})
+
+        with Tracer(enabled=False).start_trace('bot_response') as disabled:
+            self.assertIsNone(disabled)
+        with self.tracer.span('orphan') as span:
+            self.assertFalse(span.is_recording)
+        record_id = self.service.record_query("无trace查询", 'sql')
+        self.assertEqual(self.service.get_trace(record_id), [])
+
+    def test_spans_deleted_with_records(self):
+        """测试删除历史记录时同步删除span"""
+        self.record_traced_query()
+        self.assertEqual(self.count_rows('query_spans'), 5)
+        self.memory_manager.clear_session_history()
+        self.assertEqual(self.count_rows('query_spans'), 0)
+
+    def test_otlp_jsonl_export(self):
+        """测试导出为每行一个trace的OTLP/JSON"""
+        self.assertIsNone(self.service.export_traces(output_dir=self.temp_dir))
+        first_id = self.record_traced_query("查询一")
+        self.record_traced_query("查询二")
+        path = self.service.export_traces(output_dir=self.temp_dir)
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 2)
+
+        resource_spans = lines[-1]['resourceSpans'][0]
+        resource = {attr['key']: attr['value'] for attr in resource_spans['resource']['attributes']}
+        self.assertEqual(resource['history.record_id'], {'intValue': str(first_id)})
+        spans = resource_spans['scopeSpans'][0]['spans']
+        self.assertEqual(len(spans), 5)
+        root = spans[0]
+        self.assertEqual(len(root['traceId']), 32)
+        self.assertEqual(len(root['spanId']), 16)
+        self.assertNotIn('parentSpanId', root)
+        self.assertEqual(root['kind'], 2)
+        self.assertEqual(root['status'], {'code': 1})
+        self.assertIsInstance(root['startTimeUnixNano'], str)
+        tokens = {attr['key']: attr['value'] for attr in root['attributes']}
+        self.assertEqual(tokens[PROMPT_TOKENS], {'intValue': '120'})
+        self.assertTrue(all(span['traceId'] == root['traceId'] for span in spans))
+
+if __name__ == "__main__":
+    unittest.main()
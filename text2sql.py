@@ -1,15 +1,21 @@
 import os
+import time
 import logging
 from typing import Optional, List, Any
 from langchain_community.utilities import SQLDatabase
 from operator import itemgetter
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain.chains import create_sql_query_chain
 from langchain_community.tools import QuerySQLDataBaseTool
+from stats_catalog import get_stats_catalog
+from rollups import get_rollup_manager
+from columnar_engine import get_columnar_engine
 from llm_client import SiliconFlow  # 使用独立的LLM模块
-from language_utils import language_detector, multilingual_prompts
+from language_utils import multilingual_prompts, RequestContext
+from tracing import tracer, traced_runnable
+from metrics import SQL_DURATION
+from sql_logger import sql_request, log_sql_request, log_sql_response, log_sql_cleaned, log_sql_executed
 from dotenv import load_dotenv
 
 # 加载 .env 文件中的环境变量
@@ -22,6 +28,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def execute_generated_sql(sql: str, execute_query: QuerySQLDataBaseTool, rollups, columnar) -> str:
+    """执行LLM生成的SQL：优先改写到汇总表，其次尝试列式引擎，最后由SQLite执行
+
+    Text2SQL 和 Text2Viz 的处理链共用，记录 sql.execute span、SQL执行耗时指标和执行日志。
+
+    Args:
+        sql: 清洗后的SQL
+        execute_query: 在SQLite上执行SQL的工具
+        rollups: 汇总表改写器（RollupManager）
+        columnar: 列式内存引擎（ColumnarEngine）
+
+    Returns:
+        str: 执行结果
+    """
+    with tracer.span('sql.execute', **{'db.statement': sql}) as span:
+        start_time = time.perf_counter()
+        rewritten = rollups.rewrite(sql)
+        result = columnar.execute(sql) if rewritten == sql else None
+        engine = 'columnar' if result is not None else ('sqlite' if rewritten == sql else 'rollup')
+        if result is None:
+            result = execute_query.invoke(rewritten)
+        duration = time.perf_counter() - start_time
+        span.set_attribute('db.engine', engine)
+        SQL_DURATION.observe(duration, engine=engine)
+        log_sql_executed(sql, result, duration, engine=engine, executed_sql=rewritten)
+        return result
+
 class Text2SQL:
     def __init__(self, db_path="sqlite:///data/order_database.db"):
         """初始化Text2SQL类
@@ -29,7 +62,16 @@ class Text2SQL:
         Args:
             db_path: 数据库连接URI
         """
-        self.db = SQLDatabase.from_uri(db_path)
+        # 表结构、样例行和列统计从统计信息目录读取，生成提示时不再逐表反射和查询
+        self.stats_catalog = get_stats_catalog(db_path)
+        # 执行前将可改写的聚合查询改写到汇总表
+        self.rollups = get_rollup_manager(db_path)
+        # 未改写的简单聚合查询由列式内存引擎回答（COLUMNAR_ENGINE 启用时）
+        self.columnar = get_columnar_engine(db_path)
+        # 先统计（首次统计会创建 table_changes），再取需要忽略的内部表
+        custom_table_info = self.stats_catalog.get_custom_table_info()
+        self.db = SQLDatabase.from_uri(
+            db_path, ignore_tables=self.rollups.internal_tables(), custom_table_info=custom_table_info)
         self.llm = SiliconFlow()  # 使用独立的LLM实例
         self.chain = self._build_chain()
         self.chat_history = []
@@ -37,8 +79,10 @@ class Text2SQL:
     
     def _clean_sql_response(self, response: str) -> str:
         """清洗 SQL 前缀"""
+        log_sql_response(response)
         if response.startswith("SQLQuery:"):
             cleaned_response = response.split("SQLQuery:", 1)[1].strip()
+            log_sql_cleaned(cleaned_response)
             logger.debug(f"Cleaned SQL: {cleaned_response}")
             return cleaned_response
         logger.warning(f"SQL response did not start with 'SQLQuery:': {response[:100]}...")
@@ -58,21 +102,23 @@ class Text2SQL:
         logger.debug(f"Formatted SQL result: {result_str[:200]}...")
         return {"raw_result": result_str}
     
+    def _execute_sql(self, sql: str, execute_query: QuerySQLDataBaseTool) -> str:
+        """执行生成的SQL（汇总表改写 → 列式引擎 → SQLite）"""
+        return execute_generated_sql(sql, execute_query, self.rollups, self.columnar)
+    
     def _build_chain(self):
         """构建完整的处理链"""
         # SQL 生成链（原始输出含 "SQLQuery: " 前缀）
         write_query = create_sql_query_chain(self.llm, self.db)
         execute_query = QuerySQLDataBaseTool(db=self.db)
         
-        # 检测语言并选择合适的提示模板
-        def get_answer_prompt(inputs):
-            question = inputs.get('question', '')
-            detected_language = language_detector.detect_language(question)
-            prompt_template = multilingual_prompts.get_sql_answer_prompt(detected_language)
-            return PromptTemplate.from_template(prompt_template)
+        # 按请求上下文中的语言选择启动时预编译的回答提示模板
+        def format_answer_prompt(inputs):
+            template = multilingual_prompts.get_sql_answer_template(inputs['context'].language)
+            return template.format(question=inputs['question'], clean_query=inputs['clean_query'],
+                                   result=inputs['result'])
         
-        # 动态获取回答生成提示模板
-        answer_prompt_func = RunnableLambda(lambda x: get_answer_prompt(x).format(**x))
+        answer_prompt_func = RunnableLambda(format_answer_prompt)
         
         # 构建完整链
         chain = (
@@ -80,22 +126,25 @@ class Text2SQL:
             RunnablePassthrough.assign(question=lambda x: x["question"])
             # 第二步：生成并清洗 SQL
             .assign(
-                clean_query=write_query | RunnableLambda(self._clean_sql_response)
+                clean_query=traced_runnable('sql.generate', write_query) | RunnableLambda(self._clean_sql_response)
             )
             # 第三步：执行 SQL 并包装结果
             .assign(
-                result=itemgetter("clean_query") | execute_query | RunnableLambda(self._format_result_wrapper)
+                result=itemgetter("clean_query") | RunnableLambda(lambda sql: self._execute_sql(sql, execute_query))
+                | RunnableLambda(self._format_result_wrapper)
             )
             # 第四步：组合所有数据到提示模板并生成回答
             .assign(
                 response={
                     "question": itemgetter("question"),
                     "clean_query": itemgetter("clean_query"),
-                    "result": itemgetter("result")
+                    "result": itemgetter("result"),
+                    "context": itemgetter("context")
                 }
-                | answer_prompt_func  # 使用动态提示模板
-                | self.llm  # 生成自然语言回答
-                | StrOutputParser()  # 解析输出
+                | traced_runnable('sql.answer',
+                                  answer_prompt_func  # 使用动态提示模板
+                                  | self.llm  # 生成自然语言回答
+                                  | StrOutputParser())  # 解析输出
             )
             # 第五步：返回包含回答、SQL查询和执行结果的字典
             | {
@@ -107,19 +156,24 @@ class Text2SQL:
         logger.info("Text2SQL chain built successfully.")
         return chain
     
-    def query(self, question: str) -> tuple[str, str, str]:
+    def query(self, question: str, context: Optional[RequestContext] = None) -> tuple[str, str, str]:
         """处理自然语言问题并返回回答、SQL查询和SQL执行结果
         
         Args:
             question: 用户的自然语言问题
+            context: 请求上下文，为None时根据问题新建
             
         Returns:
             tuple[str, str, str]: 返回一个元组，包含(自然语言回答, SQL查询, SQL执行结果)
         """
         logger.info(f"Processing query: {question}")
         try:
+            self.stats_catalog.apply_to(self.db)
             # 执行chain并获取结果
-            result = self.chain.invoke({"question": question})
+            context = context or RequestContext.from_question(question)
+            with tracer.span('text2sql'), sql_request():
+                log_sql_request(question)
+                result = self.chain.invoke({"question": question, "context": context})
             # 从result中获取response、clean_query和sql_result
             answer = result["response"]
             clean_query = result["clean_query"]
@@ -4,6 +4,7 @@ from matplotlib import font_manager
 import seaborn as sns
 import ast
 import os
+import time
 import logging # 保留 logging
 import io
 import contextlib
@@ -15,11 +16,14 @@ from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain.chains import create_sql_query_chain
 from langchain_community.tools import QuerySQLDataBaseTool
 from langchain_community.utilities import SQLDatabase
+from stats_catalog import get_stats_catalog
+from rollups import get_rollup_manager
+from columnar_engine import get_columnar_engine
+from text2sql import execute_generated_sql
 from llm_client import SiliconFlow  # 替换原来的导入
-from sql_logger import (
-    log_sql_request, log_sql_response, log_sql_cleaned, 
-    log_sql_execution, log_sql_result, log_sql_error
-)
+from tracing import tracer, traced_runnable
+from metrics import CHART_RENDER_DURATION
+from sql_logger import sql_request, log_sql_request, log_sql_response, log_sql_cleaned, log_sql_error
 
 # 配置中文字体支持
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS', 'DejaVu Sans']
@@ -42,7 +46,16 @@ class Text2Viz:
         Args:
             db_path: 数据库连接URI
         """
-        self.db = SQLDatabase.from_uri(db_path)
+        # 表结构、样例行和列统计从统计信息目录读取，生成提示时不再逐表反射和查询
+        self.stats_catalog = get_stats_catalog(db_path)
+        # 执行前将可改写的聚合查询改写到汇总表
+        self.rollups = get_rollup_manager(db_path)
+        # 未改写的简单聚合查询由列式内存引擎回答（COLUMNAR_ENGINE 启用时）
+        self.columnar = get_columnar_engine(db_path)
+        # 先统计（首次统计会创建 table_changes），再取需要忽略的内部表
+        custom_table_info = self.stats_catalog.get_custom_table_info()
+        self.db = SQLDatabase.from_uri(
+            db_path, ignore_tables=self.rollups.internal_tables(), custom_table_info=custom_table_info)
         self.llm = SiliconFlow()  # 使用独立的LLM实例
         self.chain = self._build_chain()
         self.viz_history = []
@@ -163,6 +176,7 @@ class Text2Viz:
                 return df, None
 
         # 创建图表
+        render_start = time.perf_counter()
         fig, ax = plt.subplots(figsize=(12, 8))
         
         try:
@@ -216,6 +230,7 @@ class Text2Viz:
             plt.savefig(img_filename, dpi=150, bbox_inches='tight', 
                        facecolor='white', edgecolor='none')
             plt.close()
+            CHART_RENDER_DURATION.observe(time.perf_counter() - render_start)
 
             logger.info(f"可视化图表已保存: {img_filename}")
             return df, img_filename
@@ -231,6 +246,11 @@ class Text2Viz:
             logger.error(f"创建可视化图表时发生错误: {str(e)}")
             plt.close() # 确保关闭图形，以防错误
             return df, None
+
+    def _execute_sql(self, sql: str, execute_query: QuerySQLDataBaseTool) -> str:
+        """执行生成的SQL（汇总表改写 → 列式引擎 → SQLite）"""
+        return execute_generated_sql(sql, execute_query, self.rollups, self.columnar)
+    
     def _build_chain(self):
         """构建完整的处理链"""
         # SQL生成和执行组件
@@ -241,28 +261,20 @@ class Text2Viz:
         chain = (
         # 第一步：接收原始输入，保留问题字段
         RunnablePassthrough.assign(question=lambda x: x["question"])
-        # 添加日志记录原始问题
-        | RunnableLambda(lambda x: {**x, "_debug": log_sql_request(x['question']) or True})
-        # 第二步：生成并清洗 SQL
+        # 第二步：生成并清洗 SQL（原始响应和清洗结果在 _clean_sql_response 中记录日志）
         .assign(
-            clean_query=write_query 
-            | RunnableLambda(lambda x: log_sql_response(x) or x)
+            clean_query=traced_runnable('sql.generate', write_query)
             | RunnableLambda(self._clean_sql_response)
         )
-        # 添加SQL执行前的日志
-        | RunnableLambda(lambda x: {**x, "_debug2": log_sql_execution(x['clean_query']) or True})
-        # 第三步：执行SQL并转换为DataFrame，生成可视化
+        # 第三步：执行SQL（_execute_sql 记录执行日志）并转换为DataFrame，生成可视化
         .assign(
             result=RunnableLambda(lambda x: {
                 "sql_query": x["clean_query"],
-                "query_result": execute_query.invoke(x["clean_query"])
-            })
-            | RunnableLambda(lambda x: {
-                "sql_query": x["sql_query"],
-                "query_result": log_sql_result(x["query_result"]) or x["query_result"]
+                "query_result": self._execute_sql(x["clean_query"], execute_query)
             })
-            | RunnableLambda(lambda x: self._convert_to_dataframe(x["query_result"], x["sql_query"]))
-            | RunnableLambda(self._create_visualization)
+            | traced_runnable('viz.dataframe',
+                              RunnableLambda(lambda x: self._convert_to_dataframe(x["query_result"], x["sql_query"])))
+            | traced_runnable('viz.render', RunnableLambda(self._create_visualization))
         )
         # 第四步：使用RunnableLambda包装返回值，确保正确返回
         | RunnableLambda(lambda x: {
@@ -288,8 +300,11 @@ class Text2Viz:
         """
         try:
             logger.info(f"处理可视化查询: {question}")
+            self.stats_catalog.apply_to(self.db)
             # 调用处理链，传入问题
-            chain_result = self.chain.invoke({"question": question})
+            with tracer.span('text2viz'), sql_request():
+                log_sql_request(question)
+                chain_result = self.chain.invoke({"question": question})
             # 正确处理返回值
             if isinstance(chain_result, dict):
                 result = chain_result.get("result")
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询流水线分阶段耗时追踪模块
+为 bot_response 及 Text2SQL/Text2Viz 处理链的各阶段记录嵌套的span（含LLM的prompt/completion token数），
+随历史记录一起保存，并可导出为OpenTelemetry OTLP/JSON格式的JSONL文件（每行一个trace），无需部署collector
+
+用法:
+    python tracing.py --days 7 --output traces.jsonl
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import Config
+from metrics import STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "loreal-insight"
+SCOPE_NAME = "loreal_insight.tracing"
+
+# token数属性名（OpenTelemetry GenAI语义约定），阶段span上为其下所有LLM调用的合计
+PROMPT_TOKENS = "gen_ai.usage.input_tokens"
+COMPLETION_TOKENS = "gen_ai.usage.output_tokens"
+
+# span类型与OTLP SpanKind 的对应关系
+SPAN_KINDS = {'internal': 1, 'server': 2, 'client': 3}
+
+# 当前线程/协程所在的span；LangChain 并行分支使用复制上下文的线程池，子span能找到父span
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """一个处理阶段的耗时记录"""
+
+    def __init__(self, trace: 'Trace', name: str, parent: Optional['Span'] = None,
+                 kind: str = 'internal', attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.kind = kind
+        self.span_id = secrets.token_hex(8)
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = 'OK'
+        self.status_message = ''
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+
+    @property
+    def is_recording(self) -> bool:
+        return self.end_time_ns is None
+
+    @property
+    def duration_ms(self) -> float:
+        end_time_ns = self.end_time_ns or time.time_ns()
+        return (end_time_ns - self.start_time_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        """设置属性，值为None时忽略"""
+        if value is not None:
+            self.attributes[key] = value
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        """记录LLM调用的token数，并累加到所有上层span"""
+        with self.trace.lock:
+            span = self
+            while span is not None:
+                span.attributes[PROMPT_TOKENS] = span.attributes.get(PROMPT_TOKENS, 0) + prompt_tokens
+                span.attributes[COMPLETION_TOKENS] = span.attributes.get(COMPLETION_TOKENS, 0) + completion_tokens
+                span = span.parent
+
+    def record_error(self, error: BaseException):
+        """标记span失败"""
+        self.status = 'ERROR'
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        """结束span（重复调用无效）"""
+        if self.end_time_ns is None:
+            self.end_time_ns = time.time_ns()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为保存到历史数据库的字典"""
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'kind': self.kind,
+            'start_time_ns': self.start_time_ns,
+            'end_time_ns': self.end_time_ns or time.time_ns(),
+            'status': self.status,
+            'status_message': self.status_message,
+            'attributes': dict(self.attributes)
+        }
+
+class _NoopSpan:
+    """没有进行中的trace或追踪关闭时返回的空span"""
+    is_recording = False
+    duration_ms = 0.0
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    """一次请求的全部span"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = secrets.token_hex(16)
+        self.lock = threading.Lock()
+        self.spans: List[Span] = []
+        self.root = self.add_span(name, None, 'server', attributes)
+
+    def add_span(self, name: str, parent: Optional[Span], kind: str = 'internal',
+                 attributes: Optional[Dict[str, Any]] = None) -> Span:
+        span = Span(self, name, parent, kind, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """结束根span并返回全部span的字典（按开始时间排序）"""
+        self.root.end()
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span.start_time_ns)
+        return [span.to_dict() for span in spans]
+
+class Tracer:
+    """span的创建入口"""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        """初始化追踪器
+
+        Args:
+            enabled: 是否记录span，默认读取 Config.TRACING_ENABLED
+        """
+        self.enabled = Config.TRACING_ENABLED if enabled is None else enabled
+
+    @contextmanager
+    def start_trace(self, name: str, **attributes) -> Iterator[Optional[Trace]]:
+        """开始一次请求的trace，块内创建的span都挂在其根span下
+
+        Yields:
+            Optional[Trace]: 追踪关闭时为None
+        """
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(name, attributes)
+        token = _current_span.set(trace.root)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.root.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            trace.root.end()
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'internal', **attributes) -> Iterator[Any]:
+        """在当前span下记录一个子阶段，没有进行中的trace时不记录span
+
+        无论是否记录span，阶段耗时都计入 stage_duration_seconds 指标。
+
+        Yields:
+            Span: 新span，不记录时为空span
+        """
+        start_time = time.perf_counter()
+        parent = _current_span.get()
+        if parent is None:
+            try:
+                yield NOOP_SPAN
+            finally:
+                STAGE_DURATION.observe(time.perf_counter() - start_time, stage=name)
+            return
+        span = parent.trace.add_span(name, parent, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            STAGE_DURATION.observe(time.perf_counter() - start_time, stage=name)
+
+    def current_span(self) -> Any:
+        """返回当前span，没有时返回空span"""
+        return _current_span.get() or NOOP_SPAN
+
+def current_trace_id() -> Optional[str]:
+    """返回进行中的trace的ID，没有时返回None"""
+    span = _current_span.get()
+    return span.trace.trace_id if span is not None else None
+
+def traced_runnable(name: str, runnable: Any, **attributes) -> Any:
+    """将LangChain Runnable包装为在span内执行的RunnableLambda"""
+    from langchain_core.runnables import RunnableLambda
+
+    def invoke(inputs, config):
+        with tracer.span(name, **attributes):
+            return runnable.invoke(inputs, config)
+    return RunnableLambda(invoke, name=name)
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """转换为OTLP/JSON的AnyValue"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()]
+
+def span_to_otlp(span: Dict[str, Any]) -> Dict[str, Any]:
+    """将保存的span字典转换为OTLP/JSON的Span"""
+    otlp_span = {
+        'traceId': span['trace_id'],
+        'spanId': span['span_id'],
+        'name': span['name'],
+        'kind': SPAN_KINDS.get(span['kind'], 1),
+        'startTimeUnixNano': str(span['start_time_ns']),
+        'endTimeUnixNano': str(span['end_time_ns']),
+        'attributes': _otlp_attributes(span['attributes']),
+        'status': {'code': 2, 'message': span['status_message']} if span['status'] == 'ERROR' else {'code': 1}
+    }
+    if span['parent_span_id']:
+        otlp_span['parentSpanId'] = span['parent_span_id']
+    return otlp_span
+
+def trace_to_otlp(spans: List[Dict[str, Any]], resource_attributes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """将一个trace的span转换为OTLP/JSON的TracesData（otlpjsonfile receiver 可直接读取）"""
+    resource = {'service.name': SERVICE_NAME}
+    resource.update(resource_attributes or {})
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes(resource)},
+            'scopeSpans': [{
+                'scope': {'name': SCOPE_NAME},
+                'spans': [span_to_otlp(span) for span in spans]
+            }]
+        }]
+    }
+
+def build_trace_export_path(output_dir: Optional[str] = None) -> str:
+    """生成带时间戳的trace导出文件路径"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(output_dir or os.getcwd(), f"traces_{timestamp}.jsonl")
+
+def export_traces_jsonl(memory_manager, filepath: str, days: int = 30, chunk_size: int = 500) -> int:
+    """将最近的历史记录的trace导出为JSONL，每行一个OTLP/JSON TracesData
+
+    Args:
+        memory_manager: 记忆管理器实例
+        filepath: 输出文件路径
+        days: 导出最近几天的记录
+        chunk_size: 每次从数据库读取的记录数
+
+    Returns:
+        int: 导出的trace数
+    """
+    count = 0
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for records in memory_manager.iter_history(days=days, chunk_size=chunk_size):
+            spans_by_record = memory_manager.get_spans([record.id for record in records])
+            for record in records:
+                spans = spans_by_record.get(record.id)
+                if not spans:
+                    continue
+                resource = {'session.id': record.session_id, 'history.record_id': record.id,
+                            'history.query_type': record.query_type}
+                f.write(json.dumps(trace_to_otlp(spans, resource), ensure_ascii=False) + '\n')
+                count += 1
+    return count
+
+# 全局实例
+tracer = Tracer()
+
+def main(argv: Optional[List[str]] = None):
+    """命令行入口：导出历史记录中的trace"""
+    from memory_manager import MemoryManager
+
+    parser = argparse.ArgumentParser(description="导出查询流水线trace（OTLP/JSON JSONL）")
+    parser.add_argument('--db', default='chat_history.db', help='历史记录数据库路径')
+    parser.add_argument('--days', type=int, default=30, help='导出最近几天的记录')
+    parser.add_argument('--output', help='输出文件路径，默认在当前目录按时间戳命名')
+    args = parser.parse_args(argv)
+
+    filepath = args.output or build_trace_export_path()
+    count = export_traces_jsonl(MemoryManager(args.db), filepath, days=args.days)
+    print(f"已导出 {count} 个trace到 {filepath}")
+
+if __name__ == "__main__":
+    main()
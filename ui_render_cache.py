@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+界面静态片段缓存模块
+启动时为每种语言预先渲染页头、功能卡片、示例标题和历史页片段，切换语言时直接查表
+"""
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple
+import logging
+
+from ui_translations import ui_translations, UITranslations
+
+logger = logging.getLogger(__name__)
+
+# 界面使用的文本键
+INTERFACE_TEXT_KEYS = (
+    'app_title', 'app_description',
+    'smart_query_title', 'smart_query_desc', 'data_viz_title', 'data_viz_desc',
+    'smart_insight_title', 'smart_insight_desc',
+    'chat_history', 'input_placeholder', 'send_button', 'clear_button',
+    'tech_details', 'sql_query_label', 'sql_placeholder', 'result_label', 'result_placeholder',
+    'precise_query', 'visual_display', 'smart_insights',
+    'examples_precise', 'examples_visual', 'examples_insights',
+    'language_setting', 'theme_setting', 'light_theme', 'dark_theme', 'system_theme',
+    # 历史记录相关
+    'history_title', 'search_placeholder', 'search_button', 'refresh_button', 'export_history',
+    'clear_history', 'back_to_chat', 'query_time', 'query_type', 'total_queries', 'success', 'failed', 'avg_time',
+)
+
+# 片段模板（紧凑的单行HTML，不含缩进空白，减少切换语言时发送到浏览器的字节数）
+MAIN_HEADER_TEMPLATE = (
+    '<div class="main-header">'
+    '<h1 style="margin:0;font-size:2rem;font-weight:700;">{app_title}</h1>'
+    '<p style="margin:0.5rem 0 0 0;font-size:1rem;opacity:0.9;">{app_description}</p>'
+    '</div>'
+)
+FEATURE_CARD_TEMPLATE = (
+    '<div class="feature-card" style="flex:1;">'
+    '<h3 style="margin-top:0;margin-bottom:0.5rem;font-size:1.1rem;">{title}</h3>'
+    '<p style="margin:0;font-size:0.9rem;">{desc}</p>'
+    '</div>'
+)
+SECTION_TITLE_TEMPLATE = "<h4 style='margin-bottom:1rem;color:var(--loreal-gold);font-size:1.1rem;'>{title}</h4>"
+HISTORY_TITLE_TEMPLATE = (
+    '<div style="text-align:center;margin-bottom:30px;padding:20px;'
+    'background:linear-gradient(135deg,#667eea 0%,#764ba2 100%);border-radius:15px;color:white;">'
+    '<h1 style="margin:0;font-size:2.5rem;font-weight:700;">📊 {history_title}</h1>'
+    '<p style="margin:10px 0 0 0;font-size:1.1rem;opacity:0.9;">实时同步 • 智能搜索 • 数据导出</p>'
+    '</div>'
+)
+EMPTY_STATS_TEMPLATE = (
+    '<div style="margin-top:20px;padding:15px;background:#f8f9fa;border-radius:10px;font-size:1rem;">'
+    '<span style="margin-right:30px;">📊 {total_queries}: 0</span> '
+    '<span style="margin-right:30px;">✅ {success}: 0</span> '
+    '<span style="margin-right:30px;">❌ {failed}: 0</span> '
+    '<span>⏱️ {avg_time}: 0.0s</span>'
+    '</div>'
+)
+
+@dataclass(frozen=True)
+class UIFragments:
+    """一种语言的界面文本和预渲染片段"""
+    language: str
+    texts: Mapping[str, Any]  # 只读的界面文本（示例查询为元组）
+    main_header: str
+    feature_cards: str
+    precise_title: str
+    visual_title: str
+    insights_title: str
+    history_page_title: str
+    stats_display: str
+
+    def language_outputs(self) -> Tuple[str, ...]:
+        """切换语言时更新的HTML片段（顺序与 app.py 中的 outputs 一致）"""
+        return (self.main_header, self.feature_cards, self.precise_title, self.visual_title,
+                self.insights_title, self.history_page_title, self.stats_display)
+
+def render_fragments(language: str, translations: UITranslations = ui_translations) -> UIFragments:
+    """渲染一种语言的全部静态片段"""
+    texts: Dict[str, Any] = {}
+    for key in INTERFACE_TEXT_KEYS:
+        value = translations.get_text(key, language)
+        texts[key] = tuple(value) if isinstance(value, list) else value
+
+    cards = ''.join(
+        FEATURE_CARD_TEMPLATE.format(title=texts[f'{name}_title'], desc=texts[f'{name}_desc'])
+        for name in ('smart_query', 'data_viz', 'smart_insight')
+    )
+    return UIFragments(
+        language=language,
+        texts=MappingProxyType(texts),
+        main_header=MAIN_HEADER_TEMPLATE.format(**texts),
+        feature_cards=f'<div style="display:flex;gap:1rem;margin:1rem 0;">{cards}</div>',
+        precise_title=SECTION_TITLE_TEMPLATE.format(title=texts['precise_query']),
+        visual_title=SECTION_TITLE_TEMPLATE.format(title=texts['visual_display']),
+        insights_title=SECTION_TITLE_TEMPLATE.format(title=texts['smart_insights']),
+        history_page_title=HISTORY_TITLE_TEMPLATE.format(**texts),
+        stats_display=EMPTY_STATS_TEMPLATE.format(**texts),
+    )
+
+class UIRenderCache:
+    """按语言预渲染的界面片段缓存（创建后只读）"""
+
+    def __init__(self, translations: UITranslations = ui_translations):
+        """为所有可用语言渲染片段
+
+        Args:
+            translations: 界面文本来源
+        """
+        self._default = 'zh'
+        self._fragments = MappingProxyType({
+            language: render_fragments(language, translations)
+            for language in translations.get_available_languages()
+        })
+        logger.info(f"UI fragments rendered for languages: {list(self._fragments)}")
+
+    def get(self, language: str) -> UIFragments:
+        """获取指定语言的片段，不支持的语言回退到中文"""
+        return self._fragments.get(language) or self._fragments[self._default]
+
+    @property
+    def languages(self) -> Tuple[str, ...]:
+        return tuple(self._fragments)
+
+# 全局实例
+ui_render_cache = UIRenderCache()
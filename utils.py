@@ -11,6 +11,8 @@ from typing import List, Dict, Any, Optional, Tuple
 import logging
 from pathlib import Path
 
+from language_utils import multilingual_keywords
+
 logger = logging.getLogger(__name__)
 
 def ensure_directory_exists(directory: str) -> None:
@@ -26,14 +28,7 @@ def is_visualization_query(query: str) -> bool:
     Returns:
         bool: 是否为可视化查询
     """
-    viz_keywords = [
-        "可视化", "图表", "图形", "绘制", "画图", "展示", "趋势", "变化", 
-        "统计图", "柱状图", "折线图", "饼图", "直方图", "散点图", "分布图",
-        "visualize", "visualization", "chart", "plot", "graph", "trend", "变化情况"
-    ]
-    
-    query_lower = query.lower()
-    return any(keyword in query_lower for keyword in viz_keywords)
+    return multilingual_keywords.is_visualization_query(query)
 
 def clean_sql_query(sql_response: str) -> str:
     """清洗SQL响应，移除前缀和格式化